@@ -1,10 +1,14 @@
 from fastapi import APIRouter
 
-from app.api.v1.endpoints import dashboard, warehouse, orders
+from app.api.v1.endpoints import dashboard, warehouse, orders, jobs, procurement, production, planning
 
 api_router = APIRouter()
 
 # Include all endpoint routers
 api_router.include_router(dashboard.router, prefix="/dashboard", tags=["dashboard"])
 api_router.include_router(warehouse.router, prefix="/warehouse", tags=["warehouse"])
-api_router.include_router(orders.router, prefix="/orders", tags=["orders"])
\ No newline at end of file
+api_router.include_router(orders.router, prefix="/orders", tags=["orders"])
+api_router.include_router(jobs.router, prefix="/jobs", tags=["jobs"])
+api_router.include_router(procurement.router, prefix="/procurement", tags=["procurement"])
+api_router.include_router(production.router, prefix="/production", tags=["production"])
+api_router.include_router(planning.router, prefix="/planning", tags=["planning"])
\ No newline at end of file
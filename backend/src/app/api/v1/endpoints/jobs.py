@@ -0,0 +1,31 @@
+from fastapi import APIRouter, Depends, HTTPException, Query
+from sqlalchemy.ext.asyncio import AsyncSession
+from typing import List, Optional
+
+from app.db.database import get_db
+from app.models.base import JobStatus
+from app.schemas.jobs import BackgroundJob
+from app.services.jobs import JobService
+
+router = APIRouter()
+
+
+@router.get("/", response_model=List[BackgroundJob])
+async def get_jobs(
+    job_type: Optional[str] = Query(None),
+    status: Optional[JobStatus] = Query(None),
+    skip: int = Query(0, ge=0),
+    limit: int = Query(50, ge=1, le=500),
+    db: AsyncSession = Depends(get_db)
+):
+    """List background jobs, newest first"""
+    return await JobService.get_jobs(db, skip=skip, limit=limit, job_type=job_type, status=status)
+
+
+@router.get("/{job_id}", response_model=BackgroundJob)
+async def get_job(job_id: int, db: AsyncSession = Depends(get_db)):
+    """Poll job progress: rows processed, errors and throughput"""
+    job = await JobService.get_job(db, job_id)
+    if not job:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return job
@@ -11,7 +11,9 @@ from app.schemas.orders import (
     OrderResponse, 
     OrderListResponse,
     OrderStatusUpdate,
-    OrderFilter
+    OrderFilter,
+    DeliveryPromiseRequest,
+    DeliveryPromise
 )
 from app.services.orders import OrderService
 
@@ -141,6 +143,44 @@ async def create_order(
         )
 
 
+@router.post("/promise", response_model=DeliveryPromise)
+async def quote_delivery(
+    request: DeliveryPromiseRequest,
+    db: Session = Depends(get_db)
+):
+    """
+    Quote the earliest feasible delivery date (available/capable to promise)
+    
+    - **product_id**: Product code
+    - **quantity**: Quantity in the product's unit
+    - Checks flattened BOM material availability and free line capacity
+    """
+    try:
+        order_service = OrderService(db)
+        promise = order_service.quote_delivery(request)
+        
+        if not promise:
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND,
+                detail=f"Product {request.product_id} not found"
+            )
+        
+        return promise
+        
+    except HTTPException:
+        raise
+    except ValueError as e:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=str(e)
+        )
+    except Exception as e:
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"Error quoting delivery: {str(e)}"
+        )
+
+
 @router.put("/{order_id}", response_model=OrderResponse)
 async def update_order(
     order_id: UUID,
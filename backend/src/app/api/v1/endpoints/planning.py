@@ -1,10 +1,18 @@
-from fastapi import APIRouter, HTTPException, Depends
+from fastapi import APIRouter, HTTPException, Depends, Query
 from sqlalchemy.ext.asyncio import AsyncSession
-from typing import Dict, Any, List
+from typing import Dict, Any, List, Optional
 import random
 from datetime import datetime, timedelta
 
 from app.db.database import get_db
+from app.schemas.production import (
+    ProductionQueueItem, QueueOptimizationRequest, QueueOptimizationResult,
+    ScheduleRequest, ScheduleResult, GanttLine, OrderPlanRequest, OrderPlanResult,
+    ScheduleRepairRequest, ScheduleRepairResult, ScenarioRequest, ScenarioComparison
+)
+from app.services.planning import PlanningService
+from app.services.scenarios import ScenarioService
+from app.services.sequencing import SequencingService
 
 router = APIRouter()
 
@@ -57,65 +65,100 @@ async def get_new_orders(db: AsyncSession = Depends(get_db)):
     return orders
 
 
-@router.get("/production-queue", response_model=List[Dict[str, Any]])
-async def get_production_queue(db: AsyncSession = Depends(get_db)):
-    """Get optimized production queue"""
-    
-    queue = [
-        {
-            "position": 1,
-            "order_id": "ORD-2024-001",
-            "product": "Пленка ПВД прозрачная 150мкм",
-            "line": "EXTRUDER-1",
-            "color_group": "transparent",
-            "estimated_time": 4.5,
-            "priority": "critical",
-            "materials_ready": True
-        },
-        {
-            "position": 2,
-            "order_id": "ORD-2024-003",
-            "product": "Пленка ПВД белая 120мкм", 
-            "line": "EXTRUDER-1",
-            "color_group": "white",
-            "estimated_time": 3.8,
-            "priority": "medium",
-            "materials_ready": True
-        }
-    ]
-    
-    return queue
+@router.get("/production-queue", response_model=List[ProductionQueueItem])
+async def get_production_queue(
+    line_id: Optional[int] = Query(None),
+    db: AsyncSession = Depends(get_db)
+):
+    """Get the production queue of each active line in its current sequence"""
+    try:
+        return await SequencingService.get_production_queue(db, line_id=line_id)
+    except ValueError as e:
+        raise HTTPException(status_code=404, detail=str(e))
 
 
-@router.post("/optimize-queue")
-async def optimize_production_queue(db: AsyncSession = Depends(get_db)):
-    """Optimize production queue to minimize changeovers"""
-    
-    # Simulate optimization process
-    return {
-        "status": "success",
-        "message": "Очередь оптимизирована",
-        "optimization_result": {
-            "original_changeovers": 8,
-            "optimized_changeovers": 3,
-            "time_saved": "2.5 часа",
-            "cost_saved": "15,000 ₽"
-        }
-    }
+@router.post("/optimize-queue", response_model=QueueOptimizationResult)
+async def optimize_production_queue(
+    request: Optional[QueueOptimizationRequest] = None,
+    db: AsyncSession = Depends(get_db)
+):
+    """Re-sequence queued jobs to minimize changeovers and late deliveries"""
+    request = request or QueueOptimizationRequest()
+    try:
+        return await SequencingService.optimize_queue(
+            db, line_id=request.line_id, time_budget_ms=request.time_budget_ms, apply=request.apply
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=404, detail=str(e))
 
 
-@router.post("/orders/{order_id}/plan")
-async def plan_order(order_id: str, planning_data: Dict[str, Any], db: AsyncSession = Depends(get_db)):
-    """Plan a specific order"""
-    
-    return {
-        "status": "success",
-        "message": f"Заказ {order_id} запланирован",
-        "planning_details": {
-            "order_id": order_id,
-            "assigned_line": planning_data.get("line", "EXTRUDER-1"),
-            "scheduled_start": planning_data.get("start_time"),
-            "estimated_completion": planning_data.get("completion_time"),
-            "materials_reserved": True
-        }
-    }
\ No newline at end of file
+@router.post("/schedule", response_model=ScheduleResult)
+async def build_schedule(
+    request: Optional[ScheduleRequest] = None,
+    db: AsyncSession = Depends(get_db)
+):
+    """Book queued jobs onto line capacity, respecting shifts, maintenance and running jobs"""
+    request = request or ScheduleRequest()
+    return await PlanningService.build_schedule(
+        db,
+        line_ids=request.line_ids,
+        reassign_lines=request.reassign_lines,
+        apply=request.apply,
+        start=request.start
+    )
+
+
+@router.post("/schedule/repair", response_model=ScheduleRepairResult)
+async def repair_schedule(
+    request: Optional[ScheduleRepairRequest] = None,
+    db: AsyncSession = Depends(get_db)
+):
+    """Shift jobs after a disruption on the given lines, keeping the frozen horizon, and return what moved"""
+    request = request or ScheduleRepairRequest()
+    try:
+        return await PlanningService.repair_schedule(
+            db, line_ids=request.line_ids, disruption_start=request.disruption_start, apply=request.apply
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+
+
+@router.post("/scenarios", response_model=ScenarioComparison)
+async def compare_scenarios(request: ScenarioRequest, db: AsyncSession = Depends(get_db)):
+    """Simulate what-if scenarios on a copy of the current schedule and stock and compare their KPIs"""
+    try:
+        return await ScenarioService.compare(db, request)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+
+@router.get("/gantt", response_model=List[GanttLine])
+async def get_gantt(
+    start: Optional[datetime] = Query(None),
+    end: Optional[datetime] = Query(None),
+    line_id: Optional[int] = Query(None),
+    db: AsyncSession = Depends(get_db)
+):
+    """Scheduled jobs, running jobs and maintenance per line; the next 7 days by default"""
+    start = start or datetime.utcnow().replace(second=0, microsecond=0)
+    end = end or start + timedelta(days=7)
+    try:
+        return await PlanningService.get_gantt(db, start, end, line_id=line_id)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+
+@router.post("/orders/{order_id}/plan", response_model=OrderPlanResult)
+async def plan_order(
+    order_id: str,
+    request: Optional[OrderPlanRequest] = None,
+    db: AsyncSession = Depends(get_db)
+):
+    """Create production jobs for an order and book them into free line capacity"""
+    try:
+        result = await PlanningService.plan_order(db, order_id, request or OrderPlanRequest())
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    if result is None:
+        raise HTTPException(status_code=404, detail=f"Order {order_id} not found")
+    return result
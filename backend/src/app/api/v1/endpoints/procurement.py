@@ -1,14 +1,57 @@
-from fastapi import APIRouter
-from typing import Dict, Any, List
+from fastapi import APIRouter, Depends, HTTPException, Query
+from sqlalchemy.ext.asyncio import AsyncSession
+from typing import Dict, Any, List, Optional
+
+from app.db.database import get_db
+from app.schemas.jobs import BackgroundJob
+from app.schemas.procurement import MRPRequirement, MRPRunRequest, MRPRunResult
+from app.services.jobs import JobService, job_runner
+from app.services.mrp import MRPService
 
 router = APIRouter()
 
-@router.get("/mrp-requirements")
-async def get_mrp_requirements():
-    """Get MRP requirements"""
-    return {"message": "MRP requirements endpoint - coming soon"}
+@router.get("/mrp-requirements", response_model=List[MRPRequirement])
+async def get_mrp_requirements(
+    material_id: Optional[int] = Query(None),
+    priority: Optional[str] = Query(None, description="critical, high, medium, low"),
+    include_fulfilled: bool = Query(False),
+    skip: int = Query(0, ge=0),
+    limit: int = Query(100, ge=1, le=1000),
+    db: AsyncSession = Depends(get_db)
+):
+    """Get MRP requirements, most urgent order date first"""
+    return await MRPService.get_requirements(
+        db, material_id=material_id, priority=priority, include_fulfilled=include_fulfilled,
+        skip=skip, limit=limit
+    )
+
+@router.post("/mrp/run", response_model=MRPRunResult)
+async def run_mrp(
+    request: Optional[MRPRunRequest] = None,
+    db: AsyncSession = Depends(get_db)
+):
+    """Explode open production orders through their BOMs and regenerate MRP requirements
+    (all of them, or only those affected by changes since the last run in net_change mode)"""
+    request = request or MRPRunRequest()
+    try:
+        return await MRPService.run(
+            db, horizon_days=request.horizon_days, bucket_days=request.bucket_days, mode=request.mode
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+@router.post("/mrp/jobs", response_model=BackgroundJob, status_code=202)
+async def submit_mrp_run_job(
+    request: Optional[MRPRunRequest] = None,
+    db: AsyncSession = Depends(get_db)
+):
+    """Run MRP in the background (use for full regenerations of large plans)"""
+    request = request or MRPRunRequest()
+    job = await JobService.create_job(db, "MRP_RUN", options=request.model_dump(mode="json"))
+    job_runner.submit(job.id)
+    return job
 
 @router.get("/suppliers")
 async def get_suppliers():
     """Get supplier information"""
-    return {"message": "Suppliers endpoint - coming soon"}
\ No newline at end of file
+    return {"message": "Suppliers endpoint - coming soon"}
@@ -1,8 +1,114 @@
-from fastapi import APIRouter
+from fastapi import APIRouter, Depends, HTTPException, Query, WebSocket, WebSocketDisconnect
+from sqlalchemy.ext.asyncio import AsyncSession
+from pydantic import ValidationError
+from typing import List, Optional
+from datetime import datetime, timedelta
+
+from app.db.database import get_db
+from app.schemas.production import (
+    FlatBOMResult, MaterialAvailabilityRequest, MaterialAvailabilityResult, OEEReport, OEERollupResult,
+    TelemetryBatch, TelemetryIngestResult, TelemetrySeries, LineTelemetryState
+)
+from app.services.bom import BOMService
+from app.services.mrp import BOMCycleError
+from app.services.oee import OEEService, OEE_GROUPS
+from app.services.telemetry import TelemetryService, telemetry_store
 
 router = APIRouter()
 
 @router.get("/lines")
 async def get_production_lines():
     """Get production line status"""
-    return {"message": "Production lines endpoint - coming soon"}
\ No newline at end of file
+    return {"message": "Production lines endpoint - coming soon"}
+
+@router.get("/products/{product_id}/flat-bom", response_model=FlatBOMResult)
+async def get_flat_bom(
+    product_id: int,
+    quantity: float = Query(1.0, gt=0),
+    db: AsyncSession = Depends(get_db)
+):
+    """Purchased materials for a quantity of the product through all BOM levels, with material cost"""
+    try:
+        return await BOMService.get_flat_bom(db, product_id, quantity=quantity)
+    except BOMCycleError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    except ValueError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+
+@router.post("/material-availability", response_model=MaterialAvailabilityResult)
+async def check_material_availability(
+    request: MaterialAvailabilityRequest,
+    db: AsyncSession = Depends(get_db)
+):
+    """Check whether available stock covers the materials needed to make the given products"""
+    try:
+        return await BOMService.check_material_availability(db, request.items, warehouse_id=request.warehouse_id)
+    except BOMCycleError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+
+@router.get("/oee", response_model=OEEReport)
+async def get_oee(
+    date_from: Optional[datetime] = Query(None, description="First production day; 7 days ago when omitted"),
+    date_to: Optional[datetime] = Query(None, description="Last production day; today when omitted"),
+    line_id: Optional[int] = None,
+    group_by: List[str] = Query(["line"], description="Any of line, day, shift"),
+    db: AsyncSession = Depends(get_db)
+):
+    """Availability, performance, quality and OEE of completed jobs from the per-shift rollups"""
+    unknown = set(group_by) - set(OEE_GROUPS)
+    if unknown:
+        raise HTTPException(status_code=400, detail=f"Cannot group by {', '.join(sorted(unknown))}")
+    date_to = (date_to or datetime.utcnow()).replace(hour=0, minute=0, second=0, microsecond=0)
+    date_from = (date_from or date_to - timedelta(days=6)).replace(hour=0, minute=0, second=0, microsecond=0)
+    return await OEEService.get_oee(db, date_from, date_to, line_id=line_id, group_by=group_by)
+
+@router.post("/oee/rollups", response_model=OEERollupResult)
+async def update_oee_rollups(
+    full: bool = Query(False, description="Rebuild every rollup instead of folding in queued job changes"),
+    db: AsyncSession = Depends(get_db)
+):
+    """Bring the OEE rollups up to date now instead of waiting for the aggregator"""
+    return await OEEService.update_rollups(db, full=full)
+
+@router.post("/telemetry", response_model=TelemetryIngestResult)
+async def ingest_telemetry(batch: TelemetryBatch):
+    """Accept a batch of machine samples (speed, output counter, state); buffered and written every few seconds"""
+    return await TelemetryService.ingest(batch.samples)
+
+@router.websocket("/telemetry/ws")
+async def stream_telemetry(websocket: WebSocket):
+    """Telemetry stream: every text message is a batch, answered with its ingest result"""
+    await websocket.accept()
+    try:
+        while True:
+            message = await websocket.receive_text()
+            try:
+                batch = TelemetryBatch.model_validate_json(message)
+            except ValidationError as e:
+                await websocket.send_json({"error": e.errors(include_url=False, include_context=False)})
+                continue
+            result = await TelemetryService.ingest(batch.samples)
+            await websocket.send_text(result.model_dump_json())
+    except WebSocketDisconnect:
+        pass
+
+@router.get("/telemetry/lines", response_model=List[LineTelemetryState])
+async def get_line_telemetry():
+    """Latest sample of every line that has reported since startup"""
+    return telemetry_store.line_states()
+
+@router.get("/telemetry/lines/{line_id}", response_model=TelemetrySeries)
+async def get_telemetry_series(
+    line_id: int,
+    resolution: int = Query(60, description="Seconds per point: 1, 60 or 3600"),
+    start: Optional[datetime] = Query(None, description="An hour before end when omitted"),
+    end: Optional[datetime] = Query(None, description="Now when omitted"),
+    db: AsyncSession = Depends(get_db)
+):
+    """Speed, output and state of a line over time at 1 s, 1 min or 1 h resolution"""
+    end = end or datetime.utcnow()
+    start = start or end - timedelta(hours=1)
+    try:
+        return await TelemetryService.get_series(db, line_id, resolution, start, end)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
@@ -1,9 +1,13 @@
 from fastapi import APIRouter, Depends, HTTPException, UploadFile, File, Form, Query
+from fastapi.responses import StreamingResponse
 from fastapi_pagination import Page, add_pagination, paginate
 from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy import select
 from typing import List, Optional
+from datetime import datetime
 import aiofiles
 
+from app.core.config import settings
 from app.db.database import get_db
 from app.services.warehouse import (
     WarehouseService, SupplierService, MaterialService, 
@@ -16,9 +20,33 @@ from app.schemas.warehouse import (
     Batch, BatchCreate, BatchUpdate,
     InventoryItem, InventoryItemCreate, InventoryItemUpdate,
     StockMovement, StockMovementCreate,
-    CSVImportResult, MaterialInventory, TraceabilityResult
+    CSVImportResult, MaterialInventory, MaterialInventoryInclude, TraceabilityResult,
+    ImportMode, UpsertResult, ExportDataset, ExportFormat,
+    GenealogyLink, GenealogyLinkCreate, GenealogyTrace, TraceDirection,
+    RecallItem, ClosureCheckResult,
+    BulkAllocationRequest, AllocationResult,
+    StockReservation as StockReservationSchema, ReservationRelease, ReservationUpdateResult,
+    AvailableToPromise,
+    QCQueuePage, BulkQualityDecision, BulkQualityDecisionResult, BatchQualityDecision,
+    WarehouseSummaryStats,
+    StorageLocation, StorageLocationCreate, BinContents, MaterialLocation, NearestBin,
+    Stocktake, StocktakeCreate, StocktakeCountBatch, StocktakeCountResult, StocktakeVarianceReport,
+    StockAsOf, StockSnapshotResult, SearchHit
 )
-from app.models.base import QualityStatus, MaterialType
+from app.schemas.jobs import BackgroundJob
+from app.services.jobs import JobService, job_runner
+from app.services.export import ExportService
+from app.services.genealogy import GenealogyService, GenealogyClosureService
+from app.services.allocation import AllocationService
+from app.services.reservations import ReservationService, InsufficientStockError
+from app.services.quality import QualityControlService
+from app.services.load_profiles import LoadProfile
+from app.services.locations import LocationService
+from app.services.stocktake import StocktakeService
+from app.services.stock_history import StockHistoryService
+from app.services.search import SearchService
+from app.models.base import QualityStatus, MaterialType, ReservationStatus, StocktakeStatus
+from app.models.warehouse import Batch as BatchModel
 
 router = APIRouter()
 
@@ -88,19 +116,30 @@ async def get_suppliers(
     return await SupplierService.get_suppliers(db, skip=skip, limit=limit, active_only=active_only)
 
 
-@router.get("/suppliers/search")
+@router.get("/suppliers/search", response_model=List[Supplier])
 async def search_suppliers(
     q: str = Query(..., min_length=2),
+    limit: int = Query(20, ge=1, le=100),
     db: AsyncSession = Depends(get_db)
 ):
-    """Search suppliers by name or code"""
-    return await SupplierService.search_suppliers(db, q)
+    """Search suppliers by name or code, best match first (prefix, typo and diacritic tolerant)"""
+    return await SupplierService.search_suppliers(db, q, limit=limit)
+
+
+@router.get("/suppliers/autocomplete", response_model=List[SearchHit])
+async def autocomplete_suppliers(
+    q: str = Query(..., min_length=1),
+    limit: int = Query(10, ge=1, le=50),
+    db: AsyncSession = Depends(get_db)
+):
+    """Supplier code/name suggestions served from the in-memory search index"""
+    return await SearchService.search_suppliers(db, q, limit=limit)
 
 
 @router.get("/suppliers/{supplier_id}", response_model=Supplier)
 async def get_supplier(supplier_id: int, db: AsyncSession = Depends(get_db)):
     """Get supplier by ID"""
-    supplier = await SupplierService.get_supplier(db, supplier_id)
+    supplier = await SupplierService.get_supplier(db, supplier_id, LoadProfile.LIST)
     if not supplier:
         raise HTTPException(status_code=404, detail="Supplier not found")
     return supplier
@@ -119,7 +158,7 @@ async def update_supplier(
     db: AsyncSession = Depends(get_db)
 ):
     """Update supplier (including ratings)"""
-    updated_supplier = await SupplierService.update_supplier(db, supplier_id, supplier)
+    updated_supplier = await SupplierService.update_supplier(db, supplier_id, supplier, LoadProfile.LIST)
     if not updated_supplier:
         raise HTTPException(status_code=404, detail="Supplier not found")
     return updated_supplier
@@ -139,10 +178,22 @@ async def get_materials(
 ):
     """Get all materials"""
     return await MaterialService.get_materials(
-        db, skip=skip, limit=limit, material_type=material_type, active_only=active_only
+        db, skip=skip, limit=limit, material_type=material_type, active_only=active_only,
+        profile=LoadProfile.LIST
     )
 
 
+@router.get("/materials/autocomplete", response_model=List[SearchHit])
+async def autocomplete_materials(
+    q: str = Query(..., min_length=1),
+    limit: int = Query(10, ge=1, le=50),
+    material_type: Optional[MaterialType] = Query(None),
+    db: AsyncSession = Depends(get_db)
+):
+    """Material code/name suggestions served from the in-memory search index"""
+    return await SearchService.search_materials(db, q, limit=limit, material_type=material_type)
+
+
 @router.get("/materials/low-stock", response_model=List[Material])
 async def get_low_stock_materials(db: AsyncSession = Depends(get_db)):
     """Get materials below reorder point"""
@@ -152,16 +203,24 @@ async def get_low_stock_materials(db: AsyncSession = Depends(get_db)):
 @router.get("/materials/{material_id}", response_model=Material)
 async def get_material(material_id: int, db: AsyncSession = Depends(get_db)):
     """Get material by ID"""
-    material = await MaterialService.get_material(db, material_id)
+    material = await MaterialService.get_material(db, material_id, LoadProfile.LIST)
     if not material:
         raise HTTPException(status_code=404, detail="Material not found")
     return material
 
 
 @router.get("/materials/{material_id}/inventory", response_model=MaterialInventory)
-async def get_material_inventory(material_id: int, db: AsyncSession = Depends(get_db)):
-    """Get complete inventory picture for a material"""
-    inventory = await InventoryService.get_material_inventory(db, material_id)
+async def get_material_inventory(
+    material_id: int,
+    include: List[MaterialInventoryInclude] = Query([], description="Detail sections to return"),
+    skip: int = Query(0, ge=0),
+    limit: int = Query(100, ge=1, le=1000),
+    db: AsyncSession = Depends(get_db)
+):
+    """Get inventory totals for a material, with optional paginated detail sections"""
+    inventory = await InventoryService.get_material_inventory(
+        db, material_id, include=include, skip=skip, limit=limit
+    )
     if not inventory:
         raise HTTPException(status_code=404, detail="Material not found")
     return inventory
@@ -180,7 +239,7 @@ async def update_material(
     db: AsyncSession = Depends(get_db)
 ):
     """Update material"""
-    updated_material = await MaterialService.update_material(db, material_id, material)
+    updated_material = await MaterialService.update_material(db, material_id, material, LoadProfile.LIST)
     if not updated_material:
         raise HTTPException(status_code=404, detail="Material not found")
     return updated_material
@@ -200,7 +259,8 @@ async def get_batches(
 ):
     """Get all batches with filtering"""
     return await BatchService.get_batches(
-        db, skip=skip, limit=limit, quality_status=quality_status, material_id=material_id
+        db, skip=skip, limit=limit, quality_status=quality_status, material_id=material_id,
+        profile=LoadProfile.LIST
     )
 
 
@@ -213,7 +273,7 @@ async def get_pending_quality_batches(db: AsyncSession = Depends(get_db)):
 @router.get("/batches/{batch_id}", response_model=Batch)
 async def get_batch(batch_id: int, db: AsyncSession = Depends(get_db)):
     """Get batch by ID"""
-    batch = await BatchService.get_batch(db, batch_id)
+    batch = await BatchService.get_batch(db, batch_id, LoadProfile.LIST)
     if not batch:
         raise HTTPException(status_code=404, detail="Batch not found")
     return batch
@@ -232,7 +292,7 @@ async def update_batch(
     db: AsyncSession = Depends(get_db)
 ):
     """Update batch details"""
-    updated_batch = await BatchService.update_batch(db, batch_id, batch)
+    updated_batch = await BatchService.update_batch(db, batch_id, batch, LoadProfile.LIST)
     if not updated_batch:
         raise HTTPException(status_code=404, detail="Batch not found")
     return updated_batch
@@ -264,6 +324,43 @@ async def block_batch(
     return batch
 
 
+@router.get("/batches/{batch_id}/quality-history", response_model=List[BatchQualityDecision])
+async def get_batch_quality_history(batch_id: int, db: AsyncSession = Depends(get_db)):
+    """Audit trail of quality decisions on a batch"""
+    return await QualityControlService.get_history(db, batch_id)
+
+
+# ===============================
+# QUALITY CONTROL ENDPOINTS
+# ===============================
+
+@router.get("/quality/queue", response_model=QCQueuePage)
+async def get_quality_queue(
+    status: QualityStatus = Query(QualityStatus.PENDING),
+    supplier_id: Optional[int] = Query(None),
+    material_id: Optional[int] = Query(None),
+    cursor: Optional[str] = Query(None, description="next_cursor of the previous page"),
+    limit: int = Query(100, ge=1, le=500),
+    db: AsyncSession = Depends(get_db)
+):
+    """QC work queue, oldest received first, keyset paginated"""
+    try:
+        return await QualityControlService.get_queue(
+            db, status=status, supplier_id=supplier_id, material_id=material_id, cursor=cursor, limit=limit
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+
+@router.post("/quality/decisions", response_model=BulkQualityDecisionResult)
+async def decide_batch_quality(decision: BulkQualityDecision, db: AsyncSession = Depends(get_db)):
+    """Approve, block or quarantine many batches at once"""
+    try:
+        return await QualityControlService.decide(db, decision)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+
 # ===============================
 # INVENTORY ENDPOINTS
 # ===============================
@@ -278,7 +375,8 @@ async def get_inventory(
 ):
     """Get current inventory levels"""
     return await InventoryService.get_inventory(
-        db, warehouse_id=warehouse_id, material_id=material_id, skip=skip, limit=limit
+        db, warehouse_id=warehouse_id, material_id=material_id, skip=skip, limit=limit,
+        profile=LoadProfile.LIST
     )
 
 
@@ -307,6 +405,164 @@ async def create_stock_movement(movement: StockMovementCreate, db: AsyncSession
     return await InventoryService.create_stock_movement(db, movement)
 
 
+@router.post("/inventory/allocations", response_model=List[AllocationResult])
+async def allocate_inventory(request: BulkAllocationRequest, db: AsyncSession = Depends(get_db)):
+    """Allocate and reserve approved batches (FEFO/FIFO) for a batch of issue requests"""
+    try:
+        return await AllocationService.allocate(
+            db,
+            request.requests,
+            strategy=request.strategy,
+            allow_partial=request.allow_partial,
+            dry_run=request.dry_run,
+            hold_minutes=request.hold_minutes,
+            user_id=request.user_id
+        )
+    except InsufficientStockError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+
+@router.get("/inventory/reservations", response_model=List[StockReservationSchema])
+async def get_reservations(
+    status: Optional[ReservationStatus] = Query(ReservationStatus.ACTIVE),
+    material_id: Optional[int] = Query(None),
+    inventory_item_id: Optional[int] = Query(None),
+    reference_type: Optional[str] = Query(None),
+    reference_id: Optional[str] = Query(None),
+    skip: int = Query(0, ge=0),
+    limit: int = Query(100, ge=1, le=1000),
+    db: AsyncSession = Depends(get_db)
+):
+    """List reservation holds"""
+    return await ReservationService.get_reservations(
+        db, status=status, material_id=material_id, inventory_item_id=inventory_item_id,
+        reference_type=reference_type, reference_id=reference_id, skip=skip, limit=limit
+    )
+
+
+@router.post("/inventory/reservations/release", response_model=ReservationUpdateResult)
+async def release_reservations(release: ReservationRelease, db: AsyncSession = Depends(get_db)):
+    """Release active holds by id or by holder (e.g. a finished production job)"""
+    try:
+        return await ReservationService.release(
+            db,
+            reservation_ids=release.reservation_ids,
+            reference_type=release.reference_type,
+            reference_id=release.reference_id
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+
+@router.post("/inventory/reservations/sweep", response_model=ReservationUpdateResult)
+async def sweep_expired_reservations(db: AsyncSession = Depends(get_db)):
+    """Expire overdue holds now instead of waiting for the periodic sweeper"""
+    return await ReservationService.sweep_expired(db)
+
+
+@router.post("/inventory/reservations/reconcile")
+async def reconcile_reservations(db: AsyncSession = Depends(get_db)):
+    """Reset drifted reserved_quantity values to the sum of active holds"""
+    return {"corrected": await ReservationService.reconcile(db)}
+
+
+@router.get("/inventory/atp", response_model=List[AvailableToPromise])
+async def get_available_to_promise(
+    material_ids: List[int] = Query(...),
+    warehouse_id: Optional[int] = Query(None),
+    db: AsyncSession = Depends(get_db)
+):
+    """Available-to-promise per material: approved stock net of reservations"""
+    return await ReservationService.get_available_to_promise(db, material_ids, warehouse_id=warehouse_id)
+
+
+@router.get("/inventory/as-of", response_model=StockAsOf)
+async def get_stock_as_of(
+    as_of: datetime = Query(..., description="Point in time (UTC)"),
+    material_id: Optional[int] = Query(None),
+    warehouse_id: Optional[int] = Query(None),
+    inventory_item_id: Optional[int] = Query(None),
+    db: AsyncSession = Depends(get_db)
+):
+    """Stock per inventory row at a past point in time, replayed from the nearest checkpoint"""
+    if not (material_id or warehouse_id or inventory_item_id):
+        raise HTTPException(status_code=400, detail="Filter by material_id, warehouse_id or inventory_item_id")
+    return await StockHistoryService.get_stock_as_of(
+        db, as_of, material_id=material_id, warehouse_id=warehouse_id, inventory_item_id=inventory_item_id
+    )
+
+
+@router.post("/inventory/snapshots", response_model=StockSnapshotResult)
+async def take_stock_snapshot(db: AsyncSession = Depends(get_db)):
+    """Checkpoint current stock now instead of waiting for the daily run"""
+    try:
+        return await StockHistoryService.take_snapshot(db)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+
+# ===============================
+# STORAGE LOCATION ENDPOINTS
+# ===============================
+
+@router.get("/warehouses/{warehouse_id}/locations", response_model=List[StorageLocation])
+async def get_storage_locations(
+    warehouse_id: int,
+    zone: Optional[str] = Query(None),
+    rack: Optional[str] = Query(None),
+    skip: int = Query(0, ge=0),
+    limit: int = Query(100, ge=1, le=1000),
+    db: AsyncSession = Depends(get_db)
+):
+    """Get storage bins of a warehouse"""
+    return await LocationService.get_locations(db, warehouse_id, zone=zone, rack=rack, skip=skip, limit=limit)
+
+
+@router.post("/locations", response_model=List[StorageLocation])
+async def create_storage_locations(locations: List[StorageLocationCreate], db: AsyncSession = Depends(get_db)):
+    """Create storage bins"""
+    try:
+        return await LocationService.create_locations(db, locations)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+
+@router.get("/warehouses/{warehouse_id}/locations/nearest-empty", response_model=List[NearestBin])
+async def find_nearest_empty_bins(
+    warehouse_id: int,
+    from_code: Optional[str] = Query(None, description="Reference bin, e.g. the dock or current pallet position"),
+    zone: Optional[str] = Query(None),
+    min_capacity: Optional[float] = Query(None, ge=0),
+    limit: int = Query(5, ge=1, le=100),
+    db: AsyncSession = Depends(get_db)
+):
+    """Empty bins closest to a reference bin"""
+    try:
+        return await LocationService.find_nearest_empty_bins(
+            db, warehouse_id, from_code=from_code, zone=zone, min_capacity=min_capacity, limit=limit
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+
+
+@router.get("/warehouses/{warehouse_id}/locations/{location_code}/contents", response_model=BinContents)
+async def get_bin_contents(warehouse_id: int, location_code: str, db: AsyncSession = Depends(get_db)):
+    """What is stored in a bin"""
+    return await LocationService.get_bin_contents(db, warehouse_id, location_code)
+
+
+@router.get("/materials/{material_id}/locations", response_model=List[MaterialLocation])
+async def get_material_locations(
+    material_id: int,
+    warehouse_id: Optional[int] = Query(None),
+    db: AsyncSession = Depends(get_db)
+):
+    """Bins holding stock of a material"""
+    return await LocationService.get_material_locations(db, material_id, warehouse_id=warehouse_id)
+
+
 # ===============================
 # TRACEABILITY ENDPOINTS
 # ===============================
@@ -320,6 +576,63 @@ async def trace_batch(batch_number: str, db: AsyncSession = Depends(get_db)):
     return result
 
 
+@router.get("/batches/{batch_number}/genealogy", response_model=GenealogyTrace)
+async def trace_batch_genealogy(
+    batch_number: str,
+    direction: TraceDirection = Query(TraceDirection.FORWARD),
+    max_depth: int = Query(10, ge=1, le=GenealogyService.MAX_DEPTH),
+    db: AsyncSession = Depends(get_db)
+):
+    """Forward (where used) or backward (made from) genealogy trace"""
+    batch = await db.scalar(select(BatchModel).where(BatchModel.batch_number == batch_number))
+    if not batch:
+        raise HTTPException(status_code=404, detail="Batch not found")
+    return await GenealogyService.trace(db, batch, direction=direction, max_depth=max_depth)
+
+
+@router.post("/genealogy/links", response_model=List[GenealogyLink])
+async def record_genealogy_links(
+    links: List[GenealogyLinkCreate],
+    db: AsyncSession = Depends(get_db)
+):
+    """Record consumption of input batches by production jobs producing output batches"""
+    try:
+        return await GenealogyService.record_links(db, links)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+
+@router.get("/batches/{batch_number}/recall", response_model=List[RecallItem])
+async def get_batch_recall(
+    batch_number: str,
+    finished_only: bool = Query(True, description="Only end products not consumed further"),
+    limit: Optional[int] = Query(None, ge=1),
+    db: AsyncSession = Depends(get_db)
+):
+    """Every batch containing the given batch, read from the genealogy closure"""
+    batch = await db.scalar(select(BatchModel).where(BatchModel.batch_number == batch_number))
+    if not batch:
+        raise HTTPException(status_code=404, detail="Batch not found")
+    return await GenealogyClosureService.get_descendants(db, batch.id, finished_only=finished_only, limit=limit)
+
+
+@router.post("/genealogy/closure/rebuild", response_model=BackgroundJob, status_code=202)
+async def rebuild_genealogy_closure(db: AsyncSession = Depends(get_db)):
+    """Recompute the genealogy closure from the links in the background"""
+    job = await JobService.create_job(db, "GENEALOGY_CLOSURE_REBUILD")
+    job_runner.submit(job.id)
+    return job
+
+
+@router.get("/genealogy/closure/check", response_model=ClosureCheckResult)
+async def check_genealogy_closure(
+    sample_size: int = Query(20, ge=0, le=1000),
+    db: AsyncSession = Depends(get_db)
+):
+    """Compare the stored closure with one recomputed from the links"""
+    return await GenealogyClosureService.check_consistency(db, sample_size=sample_size)
+
+
 # ===============================
 # CSV IMPORT/EXPORT ENDPOINTS
 # ===============================
@@ -329,9 +642,10 @@ async def import_materials_csv(
     file: UploadFile = File(...),
     has_header: bool = Form(True),
     delimiter: str = Form(","),
+    mode: ImportMode = Form(ImportMode.SKIP),
     db: AsyncSession = Depends(get_db)
 ):
-    """Import materials from CSV file"""
+    """Import materials from CSV file (mode=upsert updates existing codes)"""
     if not file.filename.endswith('.csv'):
         raise HTTPException(status_code=400, detail="File must be a CSV")
     
@@ -339,7 +653,7 @@ async def import_materials_csv(
     csv_content = content.decode('utf-8')
     
     return await CSVService.import_materials_csv(
-        db, csv_content, has_header=has_header, delimiter=delimiter
+        db, csv_content, has_header=has_header, delimiter=delimiter, mode=mode
     )
 
 
@@ -348,9 +662,10 @@ async def import_suppliers_csv(
     file: UploadFile = File(...),
     has_header: bool = Form(True),
     delimiter: str = Form(","),
+    mode: ImportMode = Form(ImportMode.SKIP),
     db: AsyncSession = Depends(get_db)
 ):
-    """Import suppliers from CSV file"""
+    """Import suppliers from CSV file (mode=upsert updates existing codes)"""
     if not file.filename.endswith('.csv'):
         raise HTTPException(status_code=400, detail="File must be a CSV")
     
@@ -358,7 +673,90 @@ async def import_suppliers_csv(
     csv_content = content.decode('utf-8')
     
     return await CSVService.import_suppliers_csv(
-        db, csv_content, has_header=has_header, delimiter=delimiter
+        db, csv_content, has_header=has_header, delimiter=delimiter, mode=mode
+    )
+
+
+async def _submit_import_job(
+    job_type: str,
+    file: UploadFile,
+    has_header: bool,
+    delimiter: str,
+    mode: ImportMode,
+    db: AsyncSession
+):
+    if not file.filename.endswith('.csv'):
+        raise HTTPException(status_code=400, detail="File must be a CSV")
+    
+    file_path, line_count = await JobService.spool_upload(file)
+    job = await JobService.create_job(
+        db,
+        job_type,
+        file_path=file_path,
+        original_filename=file.filename,
+        options={"has_header": has_header, "delimiter": delimiter, "mode": mode.value},
+        total_rows=max(line_count - (1 if has_header else 0), 0)
+    )
+    job_runner.submit(job.id)
+    return job
+
+
+@router.post("/import/materials/jobs", response_model=BackgroundJob, status_code=202)
+async def submit_materials_import_job(
+    file: UploadFile = File(...),
+    has_header: bool = Form(True),
+    delimiter: str = Form(","),
+    mode: ImportMode = Form(ImportMode.SKIP),
+    db: AsyncSession = Depends(get_db)
+):
+    """Import materials from a large CSV in the background; poll GET /jobs/{id}"""
+    return await _submit_import_job("IMPORT_MATERIALS", file, has_header, delimiter, mode, db)
+
+
+@router.post("/import/suppliers/jobs", response_model=BackgroundJob, status_code=202)
+async def submit_suppliers_import_job(
+    file: UploadFile = File(...),
+    has_header: bool = Form(True),
+    delimiter: str = Form(","),
+    mode: ImportMode = Form(ImportMode.SKIP),
+    db: AsyncSession = Depends(get_db)
+):
+    """Import suppliers from a large CSV in the background; poll GET /jobs/{id}"""
+    return await _submit_import_job("IMPORT_SUPPLIERS", file, has_header, delimiter, mode, db)
+
+
+@router.get("/export/{dataset}")
+async def export_dataset(
+    dataset: ExportDataset,
+    format: ExportFormat = Query(ExportFormat.CSV),
+    columns: Optional[str] = Query(None, description="Comma-separated column projection"),
+    material_id: Optional[int] = Query(None),
+    warehouse_id: Optional[int] = Query(None),
+    created_from: Optional[datetime] = Query(None),
+    created_to: Optional[datetime] = Query(None),
+    chunk_size: int = Query(settings.EXPORT_CHUNK_SIZE, ge=100, le=100000)
+):
+    """Stream inventory, batches or stock movements as CSV, Parquet or Arrow"""
+    try:
+        ExportService.check_format(format)
+        selected = ExportService.resolve_columns(
+            dataset, [c.strip() for c in columns.split(",") if c.strip()] if columns else None
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    
+    extension = {ExportFormat.CSV: "csv", ExportFormat.PARQUET: "parquet", ExportFormat.ARROW: "arrows"}[format]
+    stream = ExportService.export(
+        dataset, format, selected, chunk_size,
+        material_id=material_id,
+        warehouse_id=warehouse_id,
+        created_from=created_from,
+        created_to=created_to
+    )
+    return StreamingResponse(
+        stream,
+        media_type=ExportService.media_type(format),
+        headers={"Content-Disposition": f'attachment; filename="{dataset.value}.{extension}"'}
     )
 
 
@@ -379,6 +777,15 @@ async def bulk_create_materials(
     return created_materials
 
 
+@router.post("/materials/bulk/upsert", response_model=UpsertResult)
+async def bulk_upsert_materials(
+    materials: List[MaterialCreate],
+    db: AsyncSession = Depends(get_db)
+):
+    """Insert or update materials by code in one pass, with an inserted/updated/unchanged report"""
+    return await MaterialService.upsert_materials(db, materials)
+
+
 @router.post("/suppliers/bulk", response_model=List[Supplier])
 async def bulk_create_suppliers(
     suppliers: List[SupplierCreate],
@@ -392,28 +799,104 @@ async def bulk_create_suppliers(
     return created_suppliers
 
 
+@router.post("/suppliers/bulk/upsert", response_model=UpsertResult)
+async def bulk_upsert_suppliers(
+    suppliers: List[SupplierCreate],
+    db: AsyncSession = Depends(get_db)
+):
+    """Insert or update suppliers by code in one pass (nightly supplier master sync)"""
+    return await SupplierService.upsert_suppliers(db, suppliers)
+
+
+# ===============================
+# STOCKTAKE ENDPOINTS
+# ===============================
+
+@router.get("/stocktakes", response_model=List[Stocktake])
+async def get_stocktakes(
+    warehouse_id: Optional[int] = None,
+    status: Optional[StocktakeStatus] = None,
+    skip: int = Query(0, ge=0),
+    limit: int = Query(100, ge=1, le=1000),
+    db: AsyncSession = Depends(get_db)
+):
+    """Get stocktakes, newest first"""
+    return await StocktakeService.get_stocktakes(db, warehouse_id=warehouse_id, status=status, skip=skip, limit=limit)
+
+
+@router.post("/stocktakes", response_model=Stocktake)
+async def create_stocktake(
+    stocktake: StocktakeCreate,
+    db: AsyncSession = Depends(get_db)
+):
+    """Open a stocktake, freezing the expected quantities of the warehouse (or zone)"""
+    try:
+        return await StocktakeService.freeze(db, stocktake)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+
+@router.get("/stocktakes/{stocktake_id}", response_model=StocktakeVarianceReport)
+async def get_stocktake_report(
+    stocktake_id: int,
+    material_id: Optional[int] = None,
+    after_id: Optional[int] = None,
+    limit: int = Query(100, ge=1, le=1000),
+    db: AsyncSession = Depends(get_db)
+):
+    """Count progress and variances of a stocktake, lines paged by after_id"""
+    report = await StocktakeService.get_variance_report(
+        db, stocktake_id, material_id=material_id, after_id=after_id, limit=limit
+    )
+    if not report:
+        raise HTTPException(status_code=404, detail="Stocktake not found")
+    return report
+
+
+@router.post("/stocktakes/{stocktake_id}/counts", response_model=StocktakeCountResult)
+async def record_stocktake_counts(
+    stocktake_id: int,
+    batch: StocktakeCountBatch,
+    db: AsyncSession = Depends(get_db)
+):
+    """Record a batch of scanner counts"""
+    try:
+        return await StocktakeService.record_counts(db, stocktake_id, batch)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+
+@router.post("/stocktakes/{stocktake_id}/post", response_model=Stocktake)
+async def post_stocktake(
+    stocktake_id: int,
+    uncounted_as_zero: bool = False,
+    user_id: Optional[str] = None,
+    db: AsyncSession = Depends(get_db)
+):
+    """Book the variances as ADJUST stock movements and close the stocktake"""
+    try:
+        return await StocktakeService.post(db, stocktake_id, uncounted_as_zero=uncounted_as_zero, user_id=user_id)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+
+@router.post("/stocktakes/{stocktake_id}/cancel", response_model=Stocktake)
+async def cancel_stocktake(
+    stocktake_id: int,
+    db: AsyncSession = Depends(get_db)
+):
+    """Cancel a stocktake without booking anything"""
+    try:
+        return await StocktakeService.cancel(db, stocktake_id)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+
 # ===============================
 # SUMMARY ENDPOINTS
 # ===============================
 
-@router.get("/summary/stats")
+@router.get("/summary/stats", response_model=WarehouseSummaryStats)
 async def get_warehouse_stats(db: AsyncSession = Depends(get_db)):
     """Get warehouse summary statistics"""
-    warehouses = await WarehouseService.get_warehouses(db, limit=1000)
-    materials = await MaterialService.get_materials(db, limit=1000)
-    low_stock = await MaterialService.get_low_stock_materials(db)
-    pending_quality = await BatchService.get_pending_quality_batches(db)
-    
-    return {
-        "total_warehouses": len(warehouses),
-        "total_materials": len(materials),
-        "low_stock_items": len(low_stock),
-        "pending_quality_batches": len(pending_quality),
-        "active_warehouses": len([w for w in warehouses if w.is_active]),
-        "material_types": {
-            "granulates": len([m for m in materials if "granulate" in m.type.value]),
-            "inks": len([m for m in materials if "ink" in m.type.value]),
-            "adhesives": len([m for m in materials if "adhesive" in m.type.value]),
-            "films": len([m for m in materials if "film" in m.type.value]),
-        }
-    }
\ No newline at end of file
+    return await WarehouseService.get_summary_stats(db)
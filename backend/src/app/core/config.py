@@ -29,6 +29,86 @@ class Settings(BaseSettings):
     # Logging
     LOG_LEVEL: str = "INFO"
     
+    # Background jobs
+    JOB_SPOOL_DIR: str = "./spool"
+    JOB_MAX_WORKERS: int = 2
+    IMPORT_CHUNK_SIZE: int = 500
+    JOB_MAX_REPORTED_ERRORS: int = 200
+    # Workers refresh their job claims this often; a claim not refreshed within the timeout is taken over
+    JOB_HEARTBEAT_SECONDS: int = 30
+    JOB_CLAIM_TIMEOUT_SECONDS: int = 300
+    
+    # Bulk export
+    EXPORT_CHUNK_SIZE: int = 10000
+    
+    # Stock reservations
+    RESERVATION_TTL_MINUTES: int = 240
+    RESERVATION_SWEEP_INTERVAL_SECONDS: int = 60
+    RESERVATION_SWEEP_BATCH_SIZE: int = 1000
+    
+    # Cached dashboard aggregates
+    SUMMARY_CACHE_TTL_SECONDS: int = 30
+    
+    # In-memory bin occupancy map; refreshed incrementally from stock movements
+    OCCUPANCY_FULL_REFRESH_SECONDS: int = 900
+    # Movement ids below the watermark re-read on every refresh, for movements committed out of id order
+    OCCUPANCY_LATE_COMMIT_WINDOW: int = 1000
+    
+    # Stock checkpoints for as-of queries; the snapshotter checks hourly whether one is due
+    STOCK_SNAPSHOT_INTERVAL_HOURS: int = 24
+    STOCK_SNAPSHOT_CHECK_SECONDS: int = 3600
+    
+    # In-memory supplier/material search index; rebuilt on writes and at least this often
+    SEARCH_INDEX_REFRESH_SECONDS: int = 300
+    
+    # MRP explosion: planning horizon split into time buckets
+    MRP_HORIZON_DAYS: int = 180
+    MRP_BUCKET_DAYS: int = 7
+    # Net-change MRP picks up queued changes this often; a full regeneration runs daily
+    MRP_NET_CHANGE_INTERVAL_SECONDS: int = 300
+    MRP_FULL_RUN_INTERVAL_HOURS: int = 24
+    
+    # Flattened multi-level BOMs; rebuilt on BOM changes and at least this often
+    BOM_CACHE_REFRESH_SECONDS: int = 600
+    
+    # Production queue sequencing: solver time per line
+    SEQUENCING_TIME_BUDGET_MS: int = 800
+    
+    # Finite-capacity scheduling: plant shifts (HH:MM-HH:MM, comma separated) on workdays (0 = Monday)
+    PRODUCTION_SHIFTS: str = "06:00-14:00,14:00-22:00,22:00-06:00"
+    PRODUCTION_WORKDAYS: str = "0,1,2,3,4"
+    MAINTENANCE_WINDOW_HOURS: int = 8
+    SCHEDULE_HORIZON_DAYS: int = 90
+    # Jobs starting within this many minutes are committed and stay put when the schedule is repaired
+    SCHEDULE_FROZEN_HORIZON_MINUTES: int = 120
+    # Film density used to turn kg into meters when a job has no run time
+    FILM_DENSITY_KG_M3: float = 920.0
+    
+    # What-if scenarios: worker processes and sequencing time per line when a scenario re-sequences
+    SCENARIO_WORKERS: int = 4
+    SCENARIO_SEQUENCING_BUDGET_MS: int = 200
+    
+    # Delivery promising: projection horizon, shipping time after production, lead time for
+    # materials without a contract; the projection is rebuilt when stale and at least this often
+    PROMISE_HORIZON_DAYS: int = 120
+    PROMISE_SHIPPING_DAYS: int = 1
+    PROMISE_DEFAULT_LEAD_TIME_DAYS: int = 14
+    PROMISE_REFRESH_SECONDS: int = 60
+    PROMISE_MAX_AGE_SECONDS: int = 600
+    
+    # OEE rollups: the aggregator folds in completed job changes this often; the dashboard
+    # reports OEE over the last OEE_DASHBOARD_DAYS
+    OEE_ROLLUP_INTERVAL_SECONDS: int = 60
+    OEE_DASHBOARD_DAYS: int = 7
+    
+    # Machine telemetry: samples are buffered per second and written this often; a line without
+    # samples for TELEMETRY_STALE_SECONDS falls back to its stored status. 1 s and 1 min buckets are
+    # kept for the given days, 1 h buckets for good
+    TELEMETRY_FLUSH_SECONDS: int = 5
+    TELEMETRY_STALE_SECONDS: int = 60
+    TELEMETRY_SECOND_RETENTION_DAYS: int = 2
+    TELEMETRY_MINUTE_RETENTION_DAYS: int = 90
+    
     model_config = {
         "env_file": ".env",
         "case_sensitive": True,
@@ -38,6 +38,7 @@ from app.db.database import Base  # noqa
 from app.models.warehouse import *  # noqa
 from app.models.production import *  # noqa  
 from app.models.procurement import *  # noqa
+from app.models.jobs import *  # noqa
 from app.models.orders import Order  # noqa
 
 # The Base class is now aware of all models and will create their tables
\ No newline at end of file
@@ -1,6 +1,8 @@
 from sqlalchemy import create_engine
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import NullPool
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker, AsyncSession
 import logging
 from app.core.config import settings
 
@@ -14,6 +16,18 @@ engine = create_engine(
 )
 
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+
+# Async engine for AsyncSession-based services
+ASYNC_DATABASE_URL = settings.DATABASE_URL.replace("sqlite://", "sqlite+aiosqlite://", 1)
+
+async_engine = create_async_engine(ASYNC_DATABASE_URL, echo=settings.DEBUG)
+
+AsyncSessionLocal = async_sessionmaker(async_engine, class_=AsyncSession, expire_on_commit=False)
+
+# Background workers run their own event loops, so they must not share pooled connections
+worker_engine = create_async_engine(ASYNC_DATABASE_URL, poolclass=NullPool)
+
+WorkerSessionLocal = async_sessionmaker(worker_engine, class_=AsyncSession, expire_on_commit=False)
 Base = declarative_base()
 
 def get_session():
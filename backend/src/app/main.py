@@ -10,6 +10,14 @@ from typing import Dict, Any
 from app.api.v1.api import api_router
 from app.core.config import settings
 from app.db.init_db import init_db, check_db_initialized, get_db_stats
+from app.services.jobs import job_runner, job_heartbeat
+from app.services.reservations import reservation_sweeper
+from app.services.stock_history import stock_snapshotter
+from app.services.mrp import mrp_planner
+from app.services.promise import promise_refresher
+from app.services.oee import oee_aggregator
+from app.services.telemetry import telemetry_flusher, flush_telemetry
+from app.services.scenarios import scenario_pool
 
 # Configure logging
 logging.basicConfig(
@@ -47,11 +55,57 @@ async def lifespan(app: FastAPI):
         # Don't raise here - let the app start anyway for debugging
         logger.warning("⚠️ Starting application without database initialization")
     
+    # Start background job workers and pick up jobs interrupted by a restart
+    job_runner.start()
+    job_heartbeat.start()
+    try:
+        await job_runner.resume_pending()
+    except Exception as e:
+        logger.error(f"❌ Failed to resume background jobs: {e}")
+    
+    # Release expired stock reservations periodically
+    reservation_sweeper.start()
+    
+    # Checkpoint stock quantities for as-of queries
+    stock_snapshotter.start()
+    
+    # Net-change MRP on queued changes, full regeneration daily
+    mrp_planner.start()
+    
+    # Keep the delivery promise projection current
+    promise_refresher.start()
+    
+    # Fold completed jobs into the OEE rollups
+    oee_aggregator.start()
+    
+    # Write buffered machine telemetry
+    telemetry_flusher.start()
+    
+    # Worker processes for what-if scenario comparisons
+    scenario_pool.start()
+    
     logger.info("✅ MPSYSTEM Backend started successfully")
     yield
     
     # Shutdown
     logger.info("🔄 Shutting down MPSYSTEM ERP Backend...")
+    await reservation_sweeper.stop()
+    await stock_snapshotter.stop()
+    await mrp_planner.stop()
+    await promise_refresher.stop()
+    await oee_aggregator.stop()
+    await telemetry_flusher.stop()
+    try:
+        await flush_telemetry()
+    except Exception as e:
+        logger.error(f"❌ Failed to write buffered telemetry: {e}")
+    await job_heartbeat.stop()
+    job_runner.shutdown(wait=False)
+    try:
+        await job_runner.release_claims()
+    except Exception as e:
+        logger.error(f"❌ Failed to release background job claims: {e}")
+    scenario_pool.shutdown(wait=False)
 
 
 # Create FastAPI application
@@ -2,6 +2,7 @@
 from .warehouse import *
 from .production import *
 from .procurement import *
+from .jobs import *
 from .orders import Order, OrderPriority, OrderStatus, OrderUnit
 
 # Export all models
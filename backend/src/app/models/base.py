@@ -65,4 +65,23 @@ class ProductionLineStatus(str, enum.Enum):
     IDLE = "idle"
     ACTIVE = "active"
     MAINTENANCE = "maintenance"
-    ERROR = "error"
\ No newline at end of file
+    ERROR = "error"
+
+class JobStatus(str, enum.Enum):
+    QUEUED = "queued"
+    RUNNING = "running"
+    COMPLETED = "completed"
+    FAILED = "failed"
+
+
+class StocktakeStatus(str, enum.Enum):
+    COUNTING = "counting"    # Snapshot frozen, counts being ingested
+    POSTED = "posted"        # Adjustments booked
+    CANCELLED = "cancelled"
+
+
+class ReservationStatus(str, enum.Enum):
+    ACTIVE = "active"
+    RELEASED = "released"
+    CONSUMED = "consumed"
+    EXPIRED = "expired"
@@ -0,0 +1,53 @@
+from sqlalchemy.orm import Mapped, mapped_column
+from sqlalchemy import String, Text, Integer, DateTime, JSON, Enum as SQLEnum, Index
+from datetime import datetime
+from typing import Optional
+
+from app.db.base import BaseModel
+from app.models.base import JobStatus
+
+
+class BackgroundJob(BaseModel):
+    """Long-running jobs executed by the background worker pool"""
+    __tablename__ = "background_jobs"
+    __table_args__ = (
+        Index("ix_background_jobs_status", "status"),
+    )
+    
+    id: Mapped[int] = mapped_column(Integer, primary_key=True)
+    job_type: Mapped[str] = mapped_column(String(50), nullable=False)  # IMPORT_MATERIALS, IMPORT_SUPPLIERS
+    status: Mapped[JobStatus] = mapped_column(SQLEnum(JobStatus), default=JobStatus.QUEUED, nullable=False)
+    
+    # Input
+    file_path: Mapped[Optional[str]] = mapped_column(String(500))  # Spooled upload on local disk
+    original_filename: Mapped[Optional[str]] = mapped_column(String(255))
+    options: Mapped[Optional[dict]] = mapped_column(JSON)
+    
+    # Progress
+    total_rows: Mapped[int] = mapped_column(Integer, default=0)
+    processed_rows: Mapped[int] = mapped_column(Integer, default=0)
+    imported_rows: Mapped[int] = mapped_column(Integer, default=0)
+    updated_rows: Mapped[int] = mapped_column(Integer, default=0)
+    unchanged_rows: Mapped[int] = mapped_column(Integer, default=0)
+    failed_rows: Mapped[int] = mapped_column(Integer, default=0)
+    errors: Mapped[Optional[list]] = mapped_column(JSON)
+    warnings: Mapped[Optional[list]] = mapped_column(JSON)
+    result: Mapped[Optional[dict]] = mapped_column(JSON)
+    error_message: Mapped[Optional[str]] = mapped_column(Text)
+    
+    # Execution
+    attempts: Mapped[int] = mapped_column(Integer, default=0)
+    claimed_by: Mapped[Optional[str]] = mapped_column(String(100))  # Worker process running the job
+    heartbeat_at: Mapped[Optional[datetime]] = mapped_column(DateTime)  # Refreshed while the claim is alive
+    started_at: Mapped[Optional[datetime]] = mapped_column(DateTime)
+    finished_at: Mapped[Optional[datetime]] = mapped_column(DateTime)
+    created_by: Mapped[Optional[str]] = mapped_column(String(50))
+
+
+class TaskLease(BaseModel):
+    """Single-runner lease of a periodic task across worker processes"""
+    __tablename__ = "task_leases"
+    
+    name: Mapped[str] = mapped_column(String(50), primary_key=True)
+    holder: Mapped[Optional[str]] = mapped_column(String(100))  # Worker process holding the lease
+    expires_at: Mapped[datetime] = mapped_column(DateTime, nullable=False)
@@ -1,5 +1,5 @@
 from sqlalchemy.orm import Mapped, mapped_column, relationship
-from sqlalchemy import String, Text, Integer, Float, DateTime, Boolean, ForeignKey, Enum as SQLEnum
+from sqlalchemy import String, Text, Integer, Float, DateTime, Boolean, ForeignKey, Enum as SQLEnum, Index, literal_column
 from datetime import datetime
 from typing import Optional, List
 
@@ -117,6 +117,36 @@ class MRPRequirement(BaseModel):
     purchase_order: Mapped[Optional["PurchaseOrder"]] = relationship()
 
 
+# Requirement rows written by MRP runs; anything else (manual entries) is left alone
+MRP_SOURCE_TYPES = ("PRODUCTION_ORDER", "MIN_STOCK")
+
+# Rows an MRP run may rewrite: one open, unordered requirement per material and bucket.
+# Literal values, not binds: the predicate goes into index DDL and ON CONFLICT inference
+MRP_OPEN_REQUIREMENT = (
+    (MRPRequirement.is_fulfilled == False)
+    & MRPRequirement.purchase_order_id.is_(None)
+    & MRPRequirement.source_type.in_([literal_column(f"'{source}'") for source in MRP_SOURCE_TYPES])
+)
+
+Index(
+    "uq_mrp_requirements_open",
+    MRPRequirement.material_id,
+    MRPRequirement.requirement_date,
+    unique=True,
+    postgresql_where=MRP_OPEN_REQUIREMENT,
+    sqlite_where=MRP_OPEN_REQUIREMENT,
+)
+
+
+class MRPDirtyItem(BaseModel):
+    """Change queued for the next net-change MRP run (material, product, bom, order or purchase_order)"""
+    __tablename__ = "mrp_dirty_items"
+    
+    id: Mapped[int] = mapped_column(Integer, primary_key=True)
+    item_type: Mapped[str] = mapped_column(String(20), nullable=False)
+    item_id: Mapped[int] = mapped_column(Integer, nullable=False)
+
+
 class SupplierContract(BaseModel):
     """Supplier contracts and pricing agreements"""
     __tablename__ = "supplier_contracts"
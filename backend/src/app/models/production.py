@@ -1,5 +1,5 @@
 from sqlalchemy.orm import Mapped, mapped_column, relationship
-from sqlalchemy import String, Text, Integer, Float, DateTime, Boolean, ForeignKey, Enum as SQLEnum, JSON
+from sqlalchemy import String, Text, Integer, Float, DateTime, Boolean, ForeignKey, Enum as SQLEnum, JSON, Index, UniqueConstraint
 from datetime import datetime
 from typing import Optional, List
 
@@ -207,10 +207,13 @@ class ProductionLine(BaseModel):
     status: Mapped[ProductionLineStatus] = mapped_column(SQLEnum(ProductionLineStatus), default=ProductionLineStatus.IDLE)
     current_efficiency: Mapped[Optional[float]] = mapped_column(Float)  # Current efficiency %
     standard_efficiency: Mapped[Optional[float]] = mapped_column(Float, default=85.0)  # Standard efficiency %
+    machine_state: Mapped[Optional[str]] = mapped_column(String(20))  # Last state reported by telemetry
+    machine_state_at: Mapped[Optional[datetime]] = mapped_column(DateTime)  # Sample time of that report
     
     # Maintenance
     last_maintenance_date: Mapped[Optional[datetime]] = mapped_column(DateTime)
     next_maintenance_date: Mapped[Optional[datetime]] = mapped_column(DateTime)
+    maintenance_started_at: Mapped[Optional[datetime]] = mapped_column(DateTime)  # Unplanned maintenance, outside the planned date
     
     is_active: Mapped[bool] = mapped_column(Boolean, default=True)
     
@@ -222,6 +225,9 @@ class ProductionLine(BaseModel):
 class ProductionJob(BaseModel):
     """Specific production jobs on production lines"""
     __tablename__ = "production_jobs"
+    __table_args__ = (
+        Index("ix_production_jobs_line_sequence", "production_line_id", "sequence_number"),
+    )
     
     id: Mapped[int] = mapped_column(Integer, primary_key=True)
     job_number: Mapped[str] = mapped_column(String(50), unique=True, nullable=False)
@@ -229,6 +235,7 @@ class ProductionJob(BaseModel):
     production_line_id: Mapped[int] = mapped_column(ForeignKey("production_lines.id"), nullable=False)
     
     # Job scheduling
+    sequence_number: Mapped[Optional[int]] = mapped_column(Integer)  # Position in the line's queue
     scheduled_start_time: Mapped[Optional[datetime]] = mapped_column(DateTime)
     scheduled_end_time: Mapped[Optional[datetime]] = mapped_column(DateTime)
     actual_start_time: Mapped[Optional[datetime]] = mapped_column(DateTime)
@@ -263,5 +270,55 @@ class ProductionJob(BaseModel):
     production_line: Mapped["ProductionLine"] = relationship(back_populates="production_jobs")
 
 
+
+class OEERollup(BaseModel):
+    """Additive OEE sums of the jobs completed on a line in one shift of one production day"""
+    __tablename__ = "oee_rollups"
+    __table_args__ = (
+        UniqueConstraint("production_line_id", "day", "shift", name="uq_oee_rollups_line_day_shift"),
+        Index("ix_oee_rollups_day", "day"),
+    )
+    
+    id: Mapped[int] = mapped_column(Integer, primary_key=True)
+    production_line_id: Mapped[int] = mapped_column(ForeignKey("production_lines.id"), nullable=False)
+    day: Mapped[datetime] = mapped_column(DateTime, nullable=False)  # Midnight of the day the shift started
+    shift: Mapped[str] = mapped_column(String(20), nullable=False)
+    
+    jobs: Mapped[int] = mapped_column(Integer, default=0)
+    planned_minutes: Mapped[float] = mapped_column(Float, default=0.0)  # Actual start to end
+    run_minutes: Mapped[float] = mapped_column(Float, default=0.0)  # Planned minus setup and changeover
+    ideal_minutes: Mapped[float] = mapped_column(Float, default=0.0)  # Output at the line's maximum speed
+    total_quantity: Mapped[float] = mapped_column(Float, default=0.0)  # Produced plus waste
+    good_quantity: Mapped[float] = mapped_column(Float, default=0.0)
+
+
+class OEEDirtyBucket(BaseModel):
+    """Line and production day whose rollups must be recomputed after job changes"""
+    __tablename__ = "oee_dirty_buckets"
+    
+    id: Mapped[int] = mapped_column(Integer, primary_key=True)
+    production_line_id: Mapped[int] = mapped_column(Integer, nullable=False)
+    day: Mapped[datetime] = mapped_column(DateTime, nullable=False)
+
+
+
+class LineTelemetry(BaseModel):
+    """Machine telemetry of a line aggregated over one bucket of 1 s, 1 min or 1 h;
+    high-volume, so keyed by the bucket itself instead of a surrogate id"""
+    __tablename__ = "line_telemetry"
+    
+    production_line_id: Mapped[int] = mapped_column(Integer, primary_key=True)
+    resolution: Mapped[int] = mapped_column(Integer, primary_key=True)  # Bucket length in seconds
+    bucket_start: Mapped[datetime] = mapped_column(DateTime, primary_key=True)
+    
+    samples: Mapped[int] = mapped_column(Integer, nullable=False)
+    speed_sum: Mapped[float] = mapped_column(Float, nullable=False)  # Average is speed_sum / samples
+    speed_min: Mapped[float] = mapped_column(Float, nullable=False)
+    speed_max: Mapped[float] = mapped_column(Float, nullable=False)
+    output: Mapped[float] = mapped_column(Float, nullable=False)  # Counter increase within the bucket
+    counter: Mapped[Optional[float]] = mapped_column(Float)  # Last counter reading
+    state: Mapped[Optional[str]] = mapped_column(String(20))  # Last reported machine state
+
+
 # Import to avoid circular imports
 from app.models.warehouse import Material, Warehouse
\ No newline at end of file
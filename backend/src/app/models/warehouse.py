@@ -1,10 +1,10 @@
 from sqlalchemy.orm import Mapped, mapped_column, relationship
-from sqlalchemy import String, Text, Integer, Float, DateTime, Boolean, ForeignKey, Enum as SQLEnum
+from sqlalchemy import String, Text, Integer, Float, DateTime, Boolean, ForeignKey, Enum as SQLEnum, Index, UniqueConstraint
 from datetime import datetime
 from typing import Optional, List
 
 from app.db.base import BaseModel
-from app.models.base import QualityStatus, MaterialType, WarehouseType
+from app.models.base import QualityStatus, MaterialType, WarehouseType, ReservationStatus, StocktakeStatus
 
 
 class Warehouse(BaseModel):
@@ -84,6 +84,12 @@ class Material(BaseModel):
 class Batch(BaseModel):
     """Material batches for traceability"""
     __tablename__ = "batches"
+    __table_args__ = (
+        # FEFO/FIFO allocation: approved batches of a material by expiry
+        Index("ix_batches_material_quality_expiry", "material_id", "quality_status", "expiry_date"),
+        # QC work queue: keyset pagination by received date within a status
+        Index("ix_batches_quality_received", "quality_status", "received_date", "id"),
+    )
     
     id: Mapped[int] = mapped_column(Integer, primary_key=True)
     batch_number: Mapped[str] = mapped_column(String(50), unique=True, nullable=False)
@@ -120,6 +126,11 @@ class Batch(BaseModel):
 class InventoryItem(BaseModel):
     """Current inventory levels by warehouse and batch"""
     __tablename__ = "inventory_items"
+    __table_args__ = (
+        # Bin contents: location_code is resolved against storage_locations per warehouse
+        Index("ix_inventory_items_warehouse_location", "warehouse_id", "location_code"),
+        Index("ix_inventory_items_material_warehouse", "material_id", "warehouse_id"),
+    )
     
     id: Mapped[int] = mapped_column(Integer, primary_key=True)
     warehouse_id: Mapped[int] = mapped_column(ForeignKey("warehouses.id"), nullable=False)
@@ -143,9 +154,40 @@ class InventoryItem(BaseModel):
     batch: Mapped[Optional["Batch"]] = relationship(back_populates="inventory_items")
 
 
+class StorageLocation(BaseModel):
+    """Storage bin in the warehouse -> zone -> rack -> bin hierarchy"""
+    __tablename__ = "storage_locations"
+    __table_args__ = (
+        UniqueConstraint("warehouse_id", "code", name="uq_storage_locations_warehouse_code"),
+        Index("ix_storage_locations_hierarchy", "warehouse_id", "zone", "rack", "bin"),
+    )
+    
+    id: Mapped[int] = mapped_column(Integer, primary_key=True)
+    warehouse_id: Mapped[int] = mapped_column(ForeignKey("warehouses.id"), nullable=False)
+    code: Mapped[str] = mapped_column(String(50), nullable=False)  # A1-05-02, matches InventoryItem.location_code
+    zone: Mapped[str] = mapped_column(String(20), nullable=False)  # A1
+    rack: Mapped[str] = mapped_column(String(20), nullable=False)  # 05
+    bin: Mapped[str] = mapped_column(String(20), nullable=False)   # 02
+    
+    # Position in the warehouse floor plan (meters) for nearest-bin lookups
+    x: Mapped[Optional[float]] = mapped_column(Float)
+    y: Mapped[Optional[float]] = mapped_column(Float)
+    level: Mapped[int] = mapped_column(Integer, default=0)  # Shelf level, 0 = floor
+    
+    capacity: Mapped[Optional[float]] = mapped_column(Float)  # In material units, NULL = unlimited
+    is_active: Mapped[bool] = mapped_column(Boolean, default=True)
+    
+    # Relationships
+    warehouse: Mapped["Warehouse"] = relationship()
+
+
 class StockMovement(BaseModel):
     """Track all stock movements for audit trail"""
     __tablename__ = "stock_movements"
+    __table_args__ = (
+        # As-of queries replay one item's movements within a time window
+        Index("ix_stock_movements_item_created", "inventory_item_id", "created_at"),
+    )
     
     id: Mapped[int] = mapped_column(Integer, primary_key=True)
     inventory_item_id: Mapped[int] = mapped_column(ForeignKey("inventory_items.id"), nullable=False)
@@ -164,5 +206,143 @@ class StockMovement(BaseModel):
     inventory_item: Mapped["InventoryItem"] = relationship()
 
 
+class StockSnapshot(BaseModel):
+    """Checkpoint of an inventory row's quantity, the starting point for as-of stock queries"""
+    __tablename__ = "stock_snapshots"
+    __table_args__ = (
+        UniqueConstraint("inventory_item_id", "snapshot_at", name="uq_stock_snapshots_item_time"),
+        Index("ix_stock_snapshots_time", "snapshot_at"),
+    )
+    
+    id: Mapped[int] = mapped_column(Integer, primary_key=True)
+    snapshot_at: Mapped[datetime] = mapped_column(DateTime, nullable=False)
+    inventory_item_id: Mapped[int] = mapped_column(ForeignKey("inventory_items.id"), nullable=False)
+    quantity: Mapped[float] = mapped_column(Float, nullable=False)
+
+
+class Stocktake(BaseModel):
+    """Physical inventory count of a warehouse (or one zone of it)"""
+    __tablename__ = "stocktakes"
+    
+    id: Mapped[int] = mapped_column(Integer, primary_key=True)
+    code: Mapped[str] = mapped_column(String(50), unique=True, nullable=False)  # INV-2024-MAG1
+    warehouse_id: Mapped[int] = mapped_column(ForeignKey("warehouses.id"), nullable=False)
+    zone: Mapped[Optional[str]] = mapped_column(String(20))  # Cycle count of one zone, NULL = whole warehouse
+    status: Mapped[StocktakeStatus] = mapped_column(SQLEnum(StocktakeStatus), default=StocktakeStatus.COUNTING)
+    
+    frozen_at: Mapped[datetime] = mapped_column(DateTime, nullable=False)  # Snapshot time of expected quantities
+    posted_at: Mapped[Optional[datetime]] = mapped_column(DateTime)
+    
+    total_lines: Mapped[int] = mapped_column(Integer, default=0)
+    adjusted_lines: Mapped[int] = mapped_column(Integer, default=0)
+    
+    notes: Mapped[Optional[str]] = mapped_column(Text)
+    created_by: Mapped[Optional[str]] = mapped_column(String(50))
+
+
+class StocktakeLine(BaseModel):
+    """Frozen expected quantity of one inventory row and its physical count"""
+    __tablename__ = "stocktake_lines"
+    __table_args__ = (
+        UniqueConstraint("stocktake_id", "inventory_item_id", name="uq_stocktake_lines_item"),
+        Index("ix_stocktake_lines_location", "stocktake_id", "location_code", "material_id"),
+    )
+    
+    id: Mapped[int] = mapped_column(Integer, primary_key=True)
+    stocktake_id: Mapped[int] = mapped_column(ForeignKey("stocktakes.id"), nullable=False)
+    inventory_item_id: Mapped[Optional[int]] = mapped_column(ForeignKey("inventory_items.id"))  # NULL = stock found, not on record
+    material_id: Mapped[int] = mapped_column(ForeignKey("materials.id"), nullable=False)
+    batch_id: Mapped[Optional[int]] = mapped_column(ForeignKey("batches.id"))
+    location_code: Mapped[Optional[str]] = mapped_column(String(50))
+    
+    expected_quantity: Mapped[float] = mapped_column(Float, nullable=False)
+    counted_quantity: Mapped[Optional[float]] = mapped_column(Float)  # NULL = not counted yet
+    variance: Mapped[Optional[float]] = mapped_column(Float)  # counted - expected, set when posting
+    
+    counted_at: Mapped[Optional[datetime]] = mapped_column(DateTime)
+    counted_by: Mapped[Optional[str]] = mapped_column(String(50))
+
+
+class BatchQualityDecision(BaseModel):
+    """Audit trail of quality status changes on batches"""
+    __tablename__ = "batch_quality_decisions"
+    __table_args__ = (
+        Index("ix_batch_quality_decisions_batch", "batch_id", "created_at"),
+    )
+    
+    id: Mapped[int] = mapped_column(Integer, primary_key=True)
+    batch_id: Mapped[int] = mapped_column(ForeignKey("batches.id"), nullable=False)
+    previous_status: Mapped[Optional[QualityStatus]] = mapped_column(SQLEnum(QualityStatus))
+    new_status: Mapped[QualityStatus] = mapped_column(SQLEnum(QualityStatus), nullable=False)
+    notes: Mapped[Optional[str]] = mapped_column(Text)
+    user_id: Mapped[Optional[str]] = mapped_column(String(50))  # Who decided
+    decision_group: Mapped[Optional[str]] = mapped_column(String(36), index=True)  # Bulk decision id
+
+
+class StockReservation(BaseModel):
+    """Reservation ledger: who holds which part of InventoryItem.reserved_quantity, until when"""
+    __tablename__ = "stock_reservations"
+    __table_args__ = (
+        # Sweeper: active holds by expiry
+        Index("ix_stock_reservations_status_expires", "status", "expires_at"),
+        Index("ix_stock_reservations_reference", "reference_type", "reference_id", "status"),
+        Index("ix_stock_reservations_item_status", "inventory_item_id", "status"),
+    )
+    
+    id: Mapped[int] = mapped_column(Integer, primary_key=True)
+    inventory_item_id: Mapped[int] = mapped_column(ForeignKey("inventory_items.id"), nullable=False)
+    batch_id: Mapped[Optional[int]] = mapped_column(ForeignKey("batches.id"))
+    material_id: Mapped[int] = mapped_column(ForeignKey("materials.id"), nullable=False)
+    quantity: Mapped[float] = mapped_column(Float, nullable=False)
+    status: Mapped[ReservationStatus] = mapped_column(SQLEnum(ReservationStatus), default=ReservationStatus.ACTIVE)
+    
+    # Holder
+    reference_type: Mapped[Optional[str]] = mapped_column(String(50))  # PRODUCTION_JOB, ORDER
+    reference_id: Mapped[Optional[str]] = mapped_column(String(50))
+    production_job_id: Mapped[Optional[int]] = mapped_column(ForeignKey("production_jobs.id"))
+    user_id: Mapped[Optional[str]] = mapped_column(String(50))
+    
+    # Hold lifetime; NULL never expires
+    expires_at: Mapped[Optional[datetime]] = mapped_column(DateTime)
+    closed_at: Mapped[Optional[datetime]] = mapped_column(DateTime)
+    
+    # Relationships
+    inventory_item: Mapped["InventoryItem"] = relationship()
+
+
+class BatchGenealogy(BaseModel):
+    """Batch genealogy edge: an input batch consumed to produce an output batch"""
+    __tablename__ = "batch_genealogy"
+    __table_args__ = (
+        # Covering indexes for forward (parent -> child) and backward (child -> parent) traces
+        Index("ix_batch_genealogy_parent_child", "parent_batch_id", "child_batch_id"),
+        Index("ix_batch_genealogy_child_parent", "child_batch_id", "parent_batch_id"),
+    )
+    
+    id: Mapped[int] = mapped_column(Integer, primary_key=True)
+    parent_batch_id: Mapped[int] = mapped_column(ForeignKey("batches.id"), nullable=False)  # Consumed input
+    child_batch_id: Mapped[int] = mapped_column(ForeignKey("batches.id"), nullable=False)   # Produced output
+    production_job_id: Mapped[Optional[int]] = mapped_column(ForeignKey("production_jobs.id"))
+    
+    quantity: Mapped[Optional[float]] = mapped_column(Float)  # Input quantity consumed
+    notes: Mapped[Optional[str]] = mapped_column(Text)
+    
+    # Relationships
+    parent_batch: Mapped["Batch"] = relationship(foreign_keys=[parent_batch_id])
+    child_batch: Mapped["Batch"] = relationship(foreign_keys=[child_batch_id])
+
+
+class BatchGenealogyClosure(BaseModel):
+    """Transitive closure of batch genealogy for O(result) recall lookups"""
+    __tablename__ = "batch_genealogy_closure"
+    __table_args__ = (
+        Index("ix_batch_genealogy_closure_descendant", "descendant_batch_id", "ancestor_batch_id"),
+    )
+    
+    ancestor_batch_id: Mapped[int] = mapped_column(ForeignKey("batches.id"), primary_key=True)
+    descendant_batch_id: Mapped[int] = mapped_column(ForeignKey("batches.id"), primary_key=True)
+    depth: Mapped[int] = mapped_column(Integer, nullable=False)  # Shortest path length
+
+
 # Import from procurement models
 from app.models.procurement import PurchaseOrder
\ No newline at end of file
@@ -0,0 +1,54 @@
+from pydantic import BaseModel, ConfigDict, computed_field
+from typing import Optional, List
+from datetime import datetime
+from app.models.base import JobStatus
+
+
+class BackgroundJob(BaseModel):
+    """Status of a background job, polled via GET /jobs/{id}"""
+    model_config = ConfigDict(from_attributes=True)
+
+    id: int
+    job_type: str
+    status: JobStatus
+    original_filename: Optional[str] = None
+    options: Optional[dict] = None
+    total_rows: int = 0
+    processed_rows: int = 0
+    imported_rows: int = 0
+    updated_rows: int = 0
+    unchanged_rows: int = 0
+    failed_rows: int = 0
+    errors: Optional[List[str]] = None
+    warnings: Optional[List[str]] = None
+    result: Optional[dict] = None
+    error_message: Optional[str] = None
+    attempts: int = 0
+    started_at: Optional[datetime] = None
+    finished_at: Optional[datetime] = None
+    created_at: datetime
+
+    @computed_field
+    @property
+    def elapsed_seconds(self) -> Optional[float]:
+        if not self.started_at:
+            return None
+        end = self.finished_at or datetime.utcnow()
+        return round(max((end - self.started_at).total_seconds(), 0.0), 3)
+
+    @computed_field
+    @property
+    def rows_per_second(self) -> Optional[float]:
+        elapsed = self.elapsed_seconds
+        if not elapsed:
+            return None
+        return round(self.processed_rows / elapsed, 1)
+
+    @computed_field
+    @property
+    def progress_percent(self) -> float:
+        if self.status == JobStatus.COMPLETED:
+            return 100.0
+        if not self.total_rows:
+            return 0.0
+        return round(min(self.processed_rows / self.total_rows * 100, 100.0), 1)
@@ -184,6 +184,37 @@ class OrderFilter(BaseModel):
         return v
 
 
+class DeliveryPromiseRequest(BaseModel):
+    """Schema for quoting the earliest delivery date of a product quantity"""
+    
+    product_id: str = Field(..., min_length=1, max_length=50, description="Product code")
+    quantity: float = Field(..., gt=0, le=1000000, description="Quantity in the product's unit")
+    unit: Optional[OrderUnit] = Field(None, description="Unit of the quantity; must match the product's unit")
+
+
+class PromiseShortage(BaseModel):
+    """Material that stock and open receipts cannot cover in time and must be bought"""
+    
+    material_id: int = Field(..., description="Material identifier")
+    quantity: float = Field(..., description="Quantity needed")
+    lead_time_days: int = Field(..., description="Purchasing lead time")
+
+
+class DeliveryPromise(BaseModel):
+    """Schema for available-to-promise / capable-to-promise quotes"""
+    
+    product_id: str = Field(..., description="Product code")
+    quantity: float = Field(..., description="Quoted quantity")
+    feasible: bool = Field(..., description="Whether it can be made within the planning horizon")
+    earliest_delivery_date: date = Field(..., description="Earliest feasible delivery date")
+    materials_ready_date: date = Field(..., description="Date all materials are available")
+    production_line: Optional[str] = Field(None, description="Line with the earliest free capacity")
+    production_finish_date: Optional[date] = Field(None, description="Date production completes")
+    limited_by: str = Field(..., description="What sets the date: materials, capacity or none")
+    shortages: List[PromiseShortage] = Field(default_factory=list, description="Materials to purchase")
+    as_of: datetime = Field(..., description="Time of the stock and capacity projection")
+
+
 # Export all schemas
 __all__ = [
     'OrderBase',
@@ -193,5 +224,8 @@ __all__ = [
     'OrderListResponse',
     'OrderSummary',
     'OrderStatusUpdate',
-    'OrderFilter'
+    'OrderFilter',
+    'DeliveryPromiseRequest',
+    'PromiseShortage',
+    'DeliveryPromise'
 ]
\ No newline at end of file
@@ -0,0 +1,51 @@
+from pydantic import BaseModel, ConfigDict, Field
+from typing import Optional, List
+from datetime import datetime
+from enum import Enum
+
+
+class MRPRequirement(BaseModel):
+    model_config = ConfigDict(from_attributes=True)
+
+    id: int
+    material_id: int
+    required_quantity: float
+    current_stock: float
+    quantity_to_order: float
+    requirement_date: datetime
+    due_date: datetime  # Latest order date: requirement date minus supplier lead time
+    priority: str
+    source_type: Optional[str] = None
+    source_reference: Optional[str] = None
+    is_fulfilled: bool
+    purchase_order_id: Optional[int] = None
+    safety_stock: Optional[float] = None
+    lead_time_days: Optional[int] = None
+    notes: Optional[str] = None
+    created_at: datetime
+
+
+class MRPRunMode(str, Enum):
+    FULL = "full"              # Regenerate requirements for every material
+    NET_CHANGE = "net_change"  # Recompute only materials affected by changes since the last run
+
+
+class MRPRunRequest(BaseModel):
+    mode: MRPRunMode = MRPRunMode.FULL
+    horizon_days: Optional[int] = Field(None, ge=1, le=730)
+    bucket_days: Optional[int] = Field(None, ge=1, le=31)
+
+
+class MRPRunResult(BaseModel):
+    run_reference: str
+    mode: MRPRunMode
+    order_lines: int
+    items: int
+    items_recomputed: int
+    levels: int
+    buckets: int
+    requirements_written: int  # Inserted or updated in place
+    requirements_removed: int  # Open requirements no longer needed
+    planned_production_items: int  # Sub-assemblies with planned production (not written as requirements)
+    total_quantity_to_order: float
+    duration_ms: float
@@ -0,0 +1,333 @@
+from pydantic import BaseModel, Field
+from typing import Optional, List, Dict
+from datetime import datetime
+from enum import Enum
+
+from app.models.base import OrderPriority
+
+
+class FlatBOMComponent(BaseModel):
+    material_id: int
+    material_code: str
+    material_name: str
+    unit: Optional[str] = None
+    quantity_per_unit: float  # Through all sub-assembly levels, scrap included
+    quantity: float
+    unit_cost: Optional[float] = None
+    cost: Optional[float] = None
+
+
+class FlatBOMResult(BaseModel):
+    product_id: int
+    quantity: float
+    material_cost: float
+    uncosted_materials: int  # Components without a standard cost, left out of material_cost
+    components: List[FlatBOMComponent]
+
+
+class ProductQuantity(BaseModel):
+    product_id: int
+    quantity: float = Field(..., gt=0)
+
+
+class MaterialAvailabilityRequest(BaseModel):
+    items: List[ProductQuantity] = Field(..., min_length=1)
+    warehouse_id: Optional[int] = None
+
+
+class MaterialAvailabilityLine(BaseModel):
+    material_id: int
+    required_quantity: float
+    available_quantity: float
+    shortage: float
+
+
+class MaterialAvailabilityResult(BaseModel):
+    all_available: bool
+    products_without_bom: List[int]
+    lines: List[MaterialAvailabilityLine]
+
+
+class ProductionQueueItem(BaseModel):
+    line_id: int
+    line_code: str
+    position: int
+    job_id: int
+    job_number: str
+    order_number: str
+    product_code: Optional[str] = None
+    product_name: Optional[str] = None
+    color_group: str
+    material_id: Optional[int] = None  # Dominant purchased material of the product
+    width_mm: Optional[float] = None
+    priority: OrderPriority
+    changeover_minutes: float  # From the previous job (or the running one)
+    processing_minutes: float
+    scheduled_start_time: datetime
+    scheduled_end_time: datetime
+    due_date: Optional[datetime] = None
+    is_late: bool
+
+
+class QueueOptimizationRequest(BaseModel):
+    line_id: Optional[int] = None  # All active lines when omitted
+    time_budget_ms: Optional[int] = Field(None, ge=10, le=10000)  # Solver time per line
+    apply: bool = True  # False previews the sequence without saving it
+
+
+class LineSequenceResult(BaseModel):
+    line_id: int
+    line_code: str
+    jobs: int
+    original_changeover_minutes: float
+    optimized_changeover_minutes: float
+    original_weighted_tardiness: float
+    optimized_weighted_tardiness: float
+    original_late_jobs: int
+    optimized_late_jobs: int
+    time_saved_minutes: float
+    iterations: int
+    queue: List[ProductionQueueItem]
+
+
+class QueueOptimizationResult(BaseModel):
+    applied: bool
+    total_time_saved_minutes: float
+    lines: List[LineSequenceResult]
+
+
+class ScheduleRequest(BaseModel):
+    line_ids: Optional[List[int]] = None  # All active lines when omitted
+    reassign_lines: bool = False  # Let jobs move to any compatible line that finishes them earlier
+    start: Optional[datetime] = None  # Now when omitted
+    apply: bool = True
+
+
+class GanttBar(BaseModel):
+    kind: str  # job, running, maintenance
+    job_id: Optional[int] = None
+    job_number: Optional[str] = None
+    order_number: Optional[str] = None
+    product_code: Optional[str] = None
+    start: datetime
+    end: datetime
+    setup_minutes: Optional[float] = None
+    run_minutes: Optional[float] = None
+    due_date: Optional[datetime] = None
+    is_late: bool = False
+
+
+class GanttLine(BaseModel):
+    line_id: int
+    line_code: str
+    line_type: Optional[str] = None
+    utilization: float  # % of working time in the window
+    bars: List[GanttBar]
+
+
+class UnscheduledJob(BaseModel):
+    job_id: int
+    job_number: str
+    reason: str
+
+
+class ScheduleResult(BaseModel):
+    start: datetime
+    end: datetime
+    applied: bool
+    scheduled_jobs: int
+    late_jobs: int
+    unscheduled: List[UnscheduledJob]
+    lines: List[GanttLine]
+
+
+class OrderPlanRequest(BaseModel):
+    line_id: Optional[int] = None  # Any compatible line when omitted
+    line_type: Optional[str] = None
+    earliest_start: Optional[datetime] = None
+    rush: bool = False  # Go ahead of queued jobs outside the frozen horizon
+    apply: bool = True
+
+
+class ScheduleChange(BaseModel):
+    job_id: int
+    job_number: str
+    order_number: str
+    line_code: str
+    old_start: Optional[datetime] = None
+    old_end: Optional[datetime] = None
+    new_start: datetime
+    new_end: datetime
+    delay_minutes: float  # Change of the end time
+    was_late: bool
+    is_late: bool
+
+
+class OrderPlanResult(BaseModel):
+    order_number: str
+    applied: bool
+    planned_start: datetime
+    planned_completion: datetime
+    jobs: List[GanttBar]
+    lines: List[str]
+    displaced: List[ScheduleChange] = []  # Jobs moved to make way for a rush order
+
+
+class ScheduleRepairRequest(BaseModel):
+    line_ids: Optional[List[int]] = None  # All active lines when omitted
+    disruption_start: Optional[datetime] = None  # Now when omitted
+    apply: bool = True
+
+
+class ScheduleRepairResult(BaseModel):
+    applied: bool
+    disruption_start: datetime
+    frozen_until: datetime
+    jobs_moved: int
+    total_delay_minutes: float
+    newly_late_jobs: int
+    changes: List[ScheduleChange]
+    unscheduled: List[UnscheduledJob]
+    elapsed_ms: float
+
+
+class ScenarioChangeType(str, Enum):
+    RUSH_ORDER = "rush_order"      # Accept an order and run it ahead of the unfrozen queue
+    DELAY_ORDER = "delay_order"    # Push an order's jobs and due date back by days
+    CANCEL_ORDER = "cancel_order"  # Drop an order's queued jobs
+    LINE_DOWN = "line_down"        # Take a line out for hours from start
+
+
+class ScenarioChange(BaseModel):
+    type: ScenarioChangeType
+    order_number: Optional[str] = None
+    line_id: Optional[int] = None
+    days: float = Field(0, ge=0)
+    hours: float = Field(0, ge=0)
+    start: Optional[datetime] = None  # line_down: now when omitted
+
+
+class ScenarioSpec(BaseModel):
+    name: str
+    changes: List[ScenarioChange] = []
+    resequence: bool = False  # Re-optimize each line's unfrozen queue
+
+
+class ScenarioRequest(BaseModel):
+    scenarios: List[ScenarioSpec] = Field(..., min_length=1, max_length=10)
+    include_baseline: bool = True
+    window_days: int = Field(7, ge=1, le=90)  # Utilization window
+
+
+class MaterialShortage(BaseModel):
+    material_id: int
+    quantity: float
+    first_short_date: datetime
+
+
+class ScenarioKPIs(BaseModel):
+    name: str
+    scheduled_jobs: int
+    unscheduled_jobs: int
+    late_jobs: int
+    total_tardiness_hours: float
+    weighted_tardiness: float
+    changeover_minutes: float
+    utilization: float  # % of working time in the window, averaged over lines
+    line_utilization: Dict[str, float]
+    makespan_end: Optional[datetime] = None
+    shortages: List[MaterialShortage]
+    overlay_kb: float  # Scenario state held on top of the shared snapshot
+
+
+class ScenarioComparison(BaseModel):
+    start: datetime
+    jobs: int
+    scenarios: List[ScenarioKPIs]
+    elapsed_ms: float
+
+
+class OEEMetrics(BaseModel):
+    jobs: int
+    planned_minutes: float
+    run_minutes: float
+    availability: float  # % of planned time running (setup and changeover are losses)
+    performance: float   # % of ideal speed while running
+    quality: float       # % of output that is good
+    oee: float
+
+
+class OEERow(OEEMetrics):
+    line_id: Optional[int] = None
+    line_code: Optional[str] = None
+    day: Optional[datetime] = None
+    shift: Optional[str] = None
+
+
+class OEEReport(BaseModel):
+    date_from: datetime
+    date_to: datetime
+    total: OEEMetrics
+    rows: List[OEERow]
+
+
+class OEERollupResult(BaseModel):
+    full: bool
+    buckets: int  # Line days recomputed
+    jobs: int
+    rollups_written: int
+    duration_ms: float
+
+
+class MachineState(str, Enum):
+    RUNNING = "running"
+    SETUP = "setup"            # Changeover or threading, no good output
+    IDLE = "idle"
+    STOPPED = "stopped"
+    FAULT = "fault"
+    MAINTENANCE = "maintenance"
+
+
+class TelemetrySample(BaseModel):
+    line: str                           # Production line code
+    ts: Optional[datetime] = None       # Receive time when omitted
+    speed_mpm: float = Field(..., ge=0)
+    counter: Optional[float] = None     # Cumulative output (m) since the machine's last reset
+    state: Optional[MachineState] = None
+
+
+class TelemetryBatch(BaseModel):
+    samples: List[TelemetrySample] = Field(..., min_length=1, max_length=10000)
+
+
+class TelemetryIngestResult(BaseModel):
+    accepted: int
+    rejected: int
+    unknown_lines: List[str]
+
+
+class TelemetryPoint(BaseModel):
+    bucket_start: datetime
+    samples: int
+    speed_avg: float
+    speed_min: float
+    speed_max: float
+    output: float
+    counter: Optional[float] = None
+    state: Optional[str] = None
+
+
+class TelemetrySeries(BaseModel):
+    line_id: int
+    resolution: int  # Seconds per point
+    points: List[TelemetryPoint]
+
+
+class LineTelemetryState(BaseModel):
+    line_id: int
+    line_code: str
+    ts: datetime
+    speed_mpm: float
+    counter: Optional[float] = None
+    state: Optional[MachineState] = None
+    stale: bool  # No samples for TELEMETRY_STALE_SECONDS
@@ -1,7 +1,8 @@
 from pydantic import BaseModel, ConfigDict
-from typing import Optional, List
+from typing import Optional, List, Dict
 from datetime import datetime
-from app.models.base import QualityStatus, MaterialType, WarehouseType
+from enum import Enum
+from app.models.base import QualityStatus, MaterialType, WarehouseType, ReservationStatus, StocktakeStatus
 
 
 # Base schemas
@@ -31,6 +32,58 @@ class Warehouse(WarehouseBase):
     updated_at: Optional[datetime] = None
 
 
+# Storage location schemas
+class StorageLocationBase(BaseModel):
+    warehouse_id: int
+    code: str  # A1-05-02
+    zone: str
+    rack: str
+    bin: str
+    x: Optional[float] = None
+    y: Optional[float] = None
+    level: int = 0
+    capacity: Optional[float] = None
+    is_active: bool = True
+
+
+class StorageLocationCreate(StorageLocationBase):
+    pass
+
+
+class StorageLocation(StorageLocationBase):
+    model_config = ConfigDict(from_attributes=True)
+    
+    id: int
+    created_at: datetime
+
+
+class BinContentItem(BaseModel):
+    inventory_item_id: int
+    material_id: int
+    batch_id: Optional[int] = None
+    quantity: float
+
+
+class BinContents(BaseModel):
+    warehouse_id: int
+    location_code: str
+    location: Optional[StorageLocation] = None  # None for codes not in storage_locations
+    total_quantity: float
+    items: List[BinContentItem]
+
+
+class MaterialLocation(BaseModel):
+    warehouse_id: int
+    location_code: Optional[str] = None  # None = stock without a bin
+    quantity: float
+    inventory_item_ids: List[int]
+
+
+class NearestBin(BaseModel):
+    location: StorageLocation
+    distance: Optional[float] = None  # None when either bin has no coordinates
+
+
 # Supplier schemas
 class SupplierBase(BaseModel):
     code: str
@@ -166,6 +219,62 @@ class Batch(BatchBase):
     updated_at: Optional[datetime] = None
 
 
+# Quality control schemas
+class QCQueueItem(BaseModel):
+    """Flat batch row for the QC work queue"""
+    id: int
+    batch_number: str
+    quality_status: QualityStatus
+    material_id: int
+    material_code: str
+    material_name: str
+    supplier_id: int
+    supplier_code: str
+    supplier_name: str
+    received_quantity: float
+    received_date: datetime
+    expiry_date: Optional[datetime] = None
+    has_coa: bool
+    has_tds: bool
+    has_sds: bool
+    has_doc: bool
+    has_cmr: bool
+
+
+class QCQueuePage(BaseModel):
+    items: List[QCQueueItem]
+    next_cursor: Optional[str] = None  # Pass back as cursor for the next page
+
+
+class BulkQualityDecision(BaseModel):
+    batch_ids: List[int]
+    decision: QualityStatus  # approved, blocked, quarantine
+    notes: Optional[str] = None
+    user_id: Optional[str] = None
+    from_statuses: Optional[List[QualityStatus]] = None  # Only change batches currently in these statuses
+
+
+class BulkQualityDecisionResult(BaseModel):
+    decision: QualityStatus
+    decision_group: str
+    updated_batch_ids: List[int]
+    unchanged_batch_ids: List[int] = []  # Already in the decided status; notes and audit row still recorded
+    skipped_batch_ids: List[int] = []  # Unknown or not in from_statuses
+
+
+class BatchQualityDecision(BaseModel):
+    model_config = ConfigDict(from_attributes=True)
+    
+    id: int
+    batch_id: int
+    previous_status: Optional[QualityStatus] = None
+    new_status: QualityStatus
+    notes: Optional[str] = None
+    user_id: Optional[str] = None
+    decision_group: Optional[str] = None
+    created_at: datetime
+
+
 # Inventory schemas
 class InventoryItemBase(BaseModel):
     warehouse_id: int
@@ -221,6 +330,196 @@ class StockMovement(StockMovementBase):
     created_at: datetime
 
 
+# Allocation schemas
+class AllocationStrategy(str, Enum):
+    FEFO = "fefo"  # First expired, first out
+    FIFO = "fifo"  # First received, first out
+
+
+class AllocationRequest(BaseModel):
+    material_id: int
+    quantity: float
+    warehouse_id: Optional[int] = None
+    reference_type: Optional[str] = None  # PRODUCTION_JOB, ORDER
+    reference_id: Optional[str] = None
+    production_job_id: Optional[int] = None
+
+
+class BulkAllocationRequest(BaseModel):
+    requests: List[AllocationRequest]
+    strategy: AllocationStrategy = AllocationStrategy.FEFO
+    allow_partial: bool = True
+    dry_run: bool = False
+    hold_minutes: Optional[int] = None  # Reservation TTL, settings default when omitted; 0 = no expiry
+    user_id: Optional[str] = None
+
+
+class AllocationLine(BaseModel):
+    inventory_item_id: int
+    batch_id: int
+    batch_number: str
+    warehouse_id: int
+    location_code: Optional[str] = None
+    expiry_date: Optional[datetime] = None
+    quantity: float
+    reservation_id: Optional[int] = None
+
+
+class AllocationResult(BaseModel):
+    material_id: int
+    requested_quantity: float
+    allocated_quantity: float
+    shortfall: float
+    reference_type: Optional[str] = None
+    reference_id: Optional[str] = None
+    lines: List[AllocationLine] = []
+
+
+# Search schemas
+class SearchHit(BaseModel):
+    id: int
+    code: str
+    name: str
+    score: float  # 1.0 = every query word matched exactly
+
+
+# As-of stock schemas
+class StockAsOfItem(BaseModel):
+    inventory_item_id: int
+    warehouse_id: int
+    material_id: int
+    batch_id: Optional[int] = None
+    location_code: Optional[str] = None
+    quantity: float
+    checkpoint_at: Optional[datetime] = None  # Snapshot the quantity was replayed from, None = live row
+
+
+class StockAsOf(BaseModel):
+    as_of: datetime
+    material_id: Optional[int] = None
+    warehouse_id: Optional[int] = None
+    total_quantity: float
+    items: List[StockAsOfItem]
+
+
+class StockSnapshotResult(BaseModel):
+    snapshot_at: datetime
+    items: int  # Rows checkpointed; unchanged rows keep their previous checkpoint
+
+
+# Stocktake schemas
+class StocktakeCreate(BaseModel):
+    code: str
+    warehouse_id: int
+    zone: Optional[str] = None  # Count only bins of this zone
+    notes: Optional[str] = None
+    created_by: Optional[str] = None
+
+
+class Stocktake(BaseModel):
+    model_config = ConfigDict(from_attributes=True)
+    
+    id: int
+    code: str
+    warehouse_id: int
+    zone: Optional[str] = None
+    status: StocktakeStatus
+    frozen_at: datetime
+    posted_at: Optional[datetime] = None
+    total_lines: int
+    adjusted_lines: int
+    notes: Optional[str] = None
+    created_by: Optional[str] = None
+    created_at: datetime
+
+
+class StocktakeCount(BaseModel):
+    """One scanner count, by inventory row or by bin + material (+ batch)"""
+    inventory_item_id: Optional[int] = None
+    location_code: Optional[str] = None
+    material_id: Optional[int] = None
+    batch_id: Optional[int] = None
+    counted_quantity: float
+
+
+class StocktakeCountBatch(BaseModel):
+    counts: List[StocktakeCount]
+    counted_by: Optional[str] = None
+    accumulate: bool = False  # Add to earlier counts of the same line instead of replacing them
+
+
+class StocktakeCountResult(BaseModel):
+    received: int
+    updated_lines: int
+    new_lines: int  # Stock found that was not on record
+    errors: List[str] = []
+
+
+class StocktakeLine(BaseModel):
+    model_config = ConfigDict(from_attributes=True)
+    
+    id: int
+    inventory_item_id: Optional[int] = None
+    material_id: int
+    batch_id: Optional[int] = None
+    location_code: Optional[str] = None
+    expected_quantity: float
+    counted_quantity: Optional[float] = None
+    variance: Optional[float] = None
+    counted_at: Optional[datetime] = None
+    counted_by: Optional[str] = None
+
+
+class StocktakeVarianceReport(BaseModel):
+    stocktake: Stocktake
+    total_lines: int
+    counted_lines: int
+    variance_lines: int
+    net_variance: float
+    absolute_variance: float
+    lines: List[StocktakeLine]  # Lines with variance, one page
+    next_cursor: Optional[int] = None  # Pass back as after_id
+
+
+# Reservation schemas
+class StockReservation(BaseModel):
+    model_config = ConfigDict(from_attributes=True)
+    
+    id: int
+    inventory_item_id: int
+    batch_id: Optional[int] = None
+    material_id: int
+    quantity: float
+    status: ReservationStatus
+    reference_type: Optional[str] = None
+    reference_id: Optional[str] = None
+    production_job_id: Optional[int] = None
+    user_id: Optional[str] = None
+    expires_at: Optional[datetime] = None
+    closed_at: Optional[datetime] = None
+    created_at: datetime
+
+
+class ReservationRelease(BaseModel):
+    """Release holds by id or by holder reference"""
+    reservation_ids: Optional[List[int]] = None
+    reference_type: Optional[str] = None
+    reference_id: Optional[str] = None
+
+
+class ReservationUpdateResult(BaseModel):
+    reservations: int
+    quantity: float
+
+
+class AvailableToPromise(BaseModel):
+    """Approved stock of a material net of active reservations"""
+    material_id: int
+    on_hand: float
+    reserved: float
+    available: float
+
+
 # Specialized response schemas
 class InventorySummary(BaseModel):
     """Summary of inventory levels by warehouse"""
@@ -231,23 +530,111 @@ class InventorySummary(BaseModel):
     critical_items: int
 
 
+class WarehouseSummaryStats(BaseModel):
+    """Warehouse dashboard counts"""
+    total_warehouses: int
+    total_materials: int
+    low_stock_items: int
+    pending_quality_batches: int
+    active_warehouses: int
+    material_types: Dict[str, int]  # granulates, inks, adhesives, films, ...
+    materials_by_type: Dict[str, int]  # Per MaterialType value
+
+
+class MaterialInventoryInclude(str, Enum):
+    WAREHOUSES = "warehouses"
+    BATCHES = "batches"
+
+
 class MaterialInventory(BaseModel):
     """Current inventory for a specific material"""
     material: Material
     total_quantity: float
     available_quantity: float
     reserved_quantity: float
-    warehouses: List[InventoryItem]
-    batches: List[Batch]
+    inventory_item_count: int = 0
+    batch_count: int = 0
+    # Detail sections, only filled when requested via include (one page each)
+    warehouses: List[InventoryItem] = []
+    batches: List[Batch] = []
     days_of_stock: Optional[float] = None
 
 
+class RecallItem(BaseModel):
+    """A batch that contains (transitively) the traced batch"""
+    batch_id: int
+    batch_number: str
+    material_id: int
+    material_code: str
+    material_name: str
+    quality_status: QualityStatus
+    available_quantity: float
+    depth: int
+
+
 class TraceabilityResult(BaseModel):
     """Traceability chain for a batch"""
     batch: Batch
     source_documents: List[str]
     usage_history: List[dict]
     quality_documents: List[str]
+    finished_goods: List[RecallItem] = []
+
+
+# Genealogy schemas
+class TraceDirection(str, Enum):
+    FORWARD = "forward"    # Where did this batch go (recall)
+    BACKWARD = "backward"  # What went into this batch (root cause)
+
+
+class GenealogyLinkCreate(BaseModel):
+    parent_batch_id: int
+    child_batch_id: int
+    production_job_id: Optional[int] = None
+    quantity: Optional[float] = None
+    notes: Optional[str] = None
+
+
+class GenealogyLink(GenealogyLinkCreate):
+    model_config = ConfigDict(from_attributes=True)
+    
+    id: int
+    created_at: datetime
+
+
+class GenealogyNode(BaseModel):
+    """A batch reached by a trace, with the edge that reached it"""
+    batch_id: int
+    batch_number: str
+    material_id: int
+    material_code: str
+    material_name: str
+    quality_status: QualityStatus
+    depth: int
+    via_batch_id: int
+    production_job_id: Optional[int] = None
+    job_number: Optional[str] = None
+    quantity: Optional[float] = None
+
+
+class ClosureCheckResult(BaseModel):
+    """Stored genealogy closure compared with one recomputed from the edges"""
+    consistent: bool
+    stored_rows: int
+    expected_rows: int
+    missing_rows: int
+    extra_rows: int
+    missing_sample: List[List[int]] = []  # [ancestor_id, descendant_id, depth]
+    extra_sample: List[List[int]] = []
+
+
+class GenealogyTrace(BaseModel):
+    batch_id: int
+    batch_number: str
+    direction: TraceDirection
+    max_depth: int
+    nodes: List[GenealogyNode]
+    cycles: List[GenealogyNode] = []
 
 
 # CSV Import schemas
@@ -258,6 +645,30 @@ class CSVImportRequest(BaseModel):
     encoding: str = "utf-8"
 
 
+class ImportMode(str, Enum):
+    SKIP = "skip"      # Existing codes are left untouched
+    UPSERT = "upsert"  # Existing codes are updated in place
+
+
+class UpsertDiff(BaseModel):
+    """Codes grouped by what the upsert did to them"""
+    inserted: List[str] = []
+    updated: List[str] = []
+    unchanged: List[str] = []
+
+
+class UpsertResult(BaseModel):
+    success: bool
+    total_rows: int
+    inserted_rows: int
+    updated_rows: int
+    unchanged_rows: int
+    failed_rows: int
+    diff: UpsertDiff
+    errors: List[str] = []
+    warnings: List[str] = []
+
+
 class CSVImportResult(BaseModel):
     success: bool
     total_rows: int
@@ -265,6 +676,22 @@ class CSVImportResult(BaseModel):
     failed_rows: int
     errors: List[str]
     warnings: List[str]
+    updated_rows: int = 0
+    unchanged_rows: int = 0
+    diff: Optional[UpsertDiff] = None
+
+
+# Export schemas
+class ExportDataset(str, Enum):
+    INVENTORY = "inventory"
+    BATCHES = "batches"
+    MOVEMENTS = "movements"
+
+
+class ExportFormat(str, Enum):
+    CSV = "csv"
+    PARQUET = "parquet"
+    ARROW = "arrow"
 
 
 # Bulk operations
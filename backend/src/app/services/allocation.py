@@ -0,0 +1,184 @@
+"""
+FEFO/FIFO batch allocation for goods issue
+
+All requests of a call are served from one locked candidate query: approved,
+unexpired inventory rows of the requested materials in pick order. Requests
+are then filled in memory in the order given, and the reservations are written
+back as reservation ledger holds plus relative increments of reserved_quantity,
+in one transaction. The row lock does nothing on SQLite, so each increment is
+also guarded on the available quantity it was computed from; a concurrent
+allocation that got there first makes the call fail with nothing reserved.
+"""
+
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy import select, or_
+from typing import Dict, List, Optional
+from datetime import datetime
+
+from app.models.warehouse import Batch, InventoryItem
+from app.models.base import QualityStatus
+from app.schemas.warehouse import (
+    AllocationRequest, AllocationLine, AllocationResult, AllocationStrategy
+)
+from app.services.reservations import ReservationService, InsufficientStockError
+
+
+class _Candidate:
+    """Inventory row that can still be allocated from in this call"""
+    __slots__ = ("inventory_item_id", "batch_id", "batch_number", "warehouse_id",
+                 "location_code", "expiry_date", "remaining")
+
+    def __init__(self, row):
+        self.inventory_item_id = row.id
+        self.batch_id = row.batch_id
+        self.batch_number = row.batch_number
+        self.warehouse_id = row.warehouse_id
+        self.location_code = row.location_code
+        self.expiry_date = row.expiry_date
+        self.remaining = row.available_quantity
+
+
+class AllocationService:
+    """Service for allocating approved batches to issue requests"""
+
+    EPSILON = 1e-9
+
+    @staticmethod
+    async def _load_candidates(
+        db: AsyncSession,
+        material_ids: List[int],
+        strategy: AllocationStrategy,
+        lock: bool
+    ) -> Dict[int, List[_Candidate]]:
+        """Allocatable inventory rows per material, in pick order"""
+        now = datetime.utcnow()
+        if strategy == AllocationStrategy.FEFO:
+            # Batches without expiry date go last
+            order = (Batch.expiry_date.is_(None), Batch.expiry_date, Batch.received_date)
+        else:
+            order = (Batch.received_date,)
+
+        query = (
+            select(
+                InventoryItem.id,
+                InventoryItem.batch_id,
+                InventoryItem.warehouse_id,
+                InventoryItem.location_code,
+                InventoryItem.available_quantity,
+                Batch.batch_number,
+                Batch.material_id,
+                Batch.expiry_date,
+            )
+            .join(Batch, Batch.id == InventoryItem.batch_id)
+            .where(
+                Batch.material_id.in_(material_ids),
+                Batch.quality_status == QualityStatus.APPROVED,
+                or_(Batch.expiry_date.is_(None), Batch.expiry_date > now),
+                InventoryItem.available_quantity > 0
+            )
+            .order_by(Batch.material_id, *order, InventoryItem.id)
+        )
+        if lock:
+            # Serialize concurrent allocations of the same rows (no-op on SQLite, see apply_deltas)
+            query = query.with_for_update(of=InventoryItem)
+
+        candidates: Dict[int, List[_Candidate]] = {}
+        for row in (await db.execute(query)).all():
+            candidates.setdefault(row.material_id, []).append(_Candidate(row))
+        return candidates
+
+    @staticmethod
+    def _allocate(
+        request: AllocationRequest,
+        candidates: List[_Candidate],
+        allow_partial: bool
+    ) -> AllocationResult:
+        """Greedy split of one request across candidates, consuming their remaining quantity"""
+        pool = [
+            c for c in candidates
+            if c.remaining > AllocationService.EPSILON
+            and (request.warehouse_id is None or c.warehouse_id == request.warehouse_id)
+        ]
+
+        available = sum(c.remaining for c in pool)
+        if not allow_partial and available + AllocationService.EPSILON < request.quantity:
+            pool = []
+
+        lines = []
+        needed = request.quantity
+        for candidate in pool:
+            if needed <= AllocationService.EPSILON:
+                break
+            take = min(candidate.remaining, needed)
+            candidate.remaining -= take
+            needed -= take
+            lines.append(AllocationLine(
+                inventory_item_id=candidate.inventory_item_id,
+                batch_id=candidate.batch_id,
+                batch_number=candidate.batch_number,
+                warehouse_id=candidate.warehouse_id,
+                location_code=candidate.location_code,
+                expiry_date=candidate.expiry_date,
+                quantity=take
+            ))
+
+        allocated = sum(line.quantity for line in lines)
+        return AllocationResult(
+            material_id=request.material_id,
+            requested_quantity=request.quantity,
+            allocated_quantity=allocated,
+            shortfall=max(request.quantity - allocated, 0.0),
+            reference_type=request.reference_type,
+            reference_id=request.reference_id,
+            lines=lines
+        )
+
+    @staticmethod
+    async def allocate(
+        db: AsyncSession,
+        requests: List[AllocationRequest],
+        strategy: AllocationStrategy = AllocationStrategy.FEFO,
+        allow_partial: bool = True,
+        dry_run: bool = False,
+        hold_minutes: Optional[int] = None,
+        user_id: Optional[str] = None
+    ) -> List[AllocationResult]:
+        """
+        Allocate and reserve stock for a batch of issue requests.
+
+        Requests are served in the order given; a request that cannot be
+        fully covered gets a shortfall (or nothing when allow_partial is off).
+        Every allocated line becomes a reservation hold expiring after
+        hold_minutes.
+        """
+        if not requests:
+            return []
+
+        for request in requests:
+            if request.quantity <= 0:
+                raise ValueError(f"Quantity must be positive for material {request.material_id}")
+
+        material_ids = sorted({request.material_id for request in requests})
+        candidates = await AllocationService._load_candidates(db, material_ids, strategy, lock=not dry_run)
+
+        results = [
+            AllocationService._allocate(request, candidates.get(request.material_id, []), allow_partial)
+            for request in requests
+        ]
+
+        if dry_run:
+            return results
+
+        try:
+            await ReservationService.hold(
+                db,
+                results,
+                [request.production_job_id for request in requests],
+                hold_minutes=hold_minutes,
+                user_id=user_id
+            )
+        except InsufficientStockError:
+            await db.rollback()
+            raise
+        await db.commit()
+        return results
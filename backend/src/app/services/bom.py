@@ -0,0 +1,240 @@
+"""
+Flattened (multi-level) bills of materials
+
+FlatBOMCache keeps, per product with a BOM, the total quantity of every
+purchased material one unit of the product consumes, through all
+sub-assembly levels with scrap compounded along the way. Rows are stored as
+CSR arrays, so exploding any mix of products is a weighted bincount instead
+of a recursive walk. Flushes touching products, BOMs or BOM lines invalidate
+the cache; it is also reloaded at least every BOM_CACHE_REFRESH_SECONDS to
+pick up changes made by other processes.
+"""
+
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy import select, func, or_, event, inspect
+from sqlalchemy.orm import Session
+from typing import Any, Dict, List, Optional, Tuple
+import asyncio
+import time
+
+import numpy as np
+
+from app.core.config import settings
+from app.models.production import Product, BOM, BOMLine
+from app.models.warehouse import Material, InventoryItem, Batch
+from app.schemas.production import (
+    FlatBOMComponent, FlatBOMResult, ProductQuantity,
+    MaterialAvailabilityLine, MaterialAvailabilityResult
+)
+from app.services.mrp import MRPEngine, BOMStructure, BOMCycleError, load_bom_structure, UNUSABLE_STOCK
+
+
+class FlatBOM:
+    """Per-unit purchased-material quantities of every product with a BOM"""
+
+    def __init__(
+        self,
+        material_ids: np.ndarray,
+        row_of_product: Dict[int, int],
+        indptr: np.ndarray,
+        indices: np.ndarray,
+        quantities: np.ndarray
+    ):
+        self.material_ids = material_ids      # Column -> material id
+        self.row_of_product = row_of_product
+        self.indptr = indptr
+        self.indices = indices                # Columns, sorted within each row
+        self.quantities = quantities
+
+    @classmethod
+    def from_structure(cls, structure: BOMStructure) -> "FlatBOM":
+        levels = MRPEngine(structure.made.size, 1)
+        levels.set_structure(structure.parents, structure.children, structure.factors)
+        try:
+            low_level = levels.low_level_codes()
+        except BOMCycleError as e:
+            raise structure.cycle_error(e) from None
+
+        order = np.argsort(structure.parents, kind="stable")
+        parents = structure.parents[order]
+        children = structure.children[order]
+        factors = structure.factors[order]
+        bounds = np.searchsorted(parents, np.arange(structure.made.size + 1))
+
+        # Deepest sub-assemblies first, so every made child is flat before its parents
+        rows: Dict[int, Tuple[np.ndarray, np.ndarray]] = {}
+        for item in sorted(np.flatnonzero(structure.made).tolist(), key=lambda i: -low_level[i]):
+            start, end = bounds[item], bounds[item + 1]
+            columns, weights = [], []
+            for child, factor in zip(children[start:end].tolist(), factors[start:end].tolist()):
+                if structure.made[child]:
+                    child_columns, child_quantities = rows[child]
+                    columns.append(child_columns)
+                    weights.append(child_quantities * factor)
+                else:
+                    columns.append(np.array([child], dtype=np.int64))
+                    weights.append(np.array([factor]))
+            if columns:
+                merged, inverse = np.unique(np.concatenate(columns), return_inverse=True)
+                rows[item] = (merged, np.bincount(inverse, weights=np.concatenate(weights)))
+            else:
+                rows[item] = (np.zeros(0, dtype=np.int64), np.zeros(0))
+
+        row_of_product: Dict[int, int] = {}
+        indptr = [0]
+        indices, quantities = [], []
+        for product_id, item in structure.item_of_product.items():
+            if item in rows:
+                row_of_product[product_id] = len(indptr) - 1
+                indices.append(rows[item][0])
+                quantities.append(rows[item][1])
+                indptr.append(indptr[-1] + rows[item][0].size)
+
+        return cls(
+            material_ids=np.array([row.id for row in structure.materials], dtype=np.int64),
+            row_of_product=row_of_product,
+            indptr=np.array(indptr, dtype=np.int64),
+            indices=np.concatenate(indices) if indices else np.zeros(0, dtype=np.int64),
+            quantities=np.concatenate(quantities) if quantities else np.zeros(0)
+        )
+
+    def has_bom(self, product_id: int) -> bool:
+        return product_id in self.row_of_product
+
+    def components(self, product_id: int) -> Tuple[np.ndarray, np.ndarray]:
+        """(material ids, quantities per unit of the product)"""
+        row = self.row_of_product[product_id]
+        start, end = self.indptr[row], self.indptr[row + 1]
+        return self.material_ids[self.indices[start:end]], self.quantities[start:end]
+
+    def explode(self, demand: Dict[int, float]) -> Dict[int, float]:
+        """Total material quantities for product_id -> quantity; products without a BOM are ignored"""
+        rows = [(self.row_of_product[p], q) for p, q in demand.items() if p in self.row_of_product]
+        if not rows:
+            return {}
+        spans = [np.arange(self.indptr[row], self.indptr[row + 1]) for row, _ in rows]
+        entries = np.concatenate(spans)
+        scale = np.repeat([quantity for _, quantity in rows], [span.size for span in spans])
+        totals = np.bincount(
+            self.indices[entries], weights=self.quantities[entries] * scale, minlength=self.material_ids.size
+        )
+        columns = np.flatnonzero(totals)
+        return dict(zip(self.material_ids[columns].tolist(), totals[columns].tolist()))
+
+
+class FlatBOMCache:
+    """Process-wide FlatBOM, rebuilt after BOM changes and on a timer"""
+
+    def __init__(self, refresh_seconds: float):
+        self.refresh_seconds = refresh_seconds
+        self._flat: Optional[FlatBOM] = None
+        self._loaded_at: Optional[float] = None
+        self._lock = asyncio.Lock()
+
+    def invalidate(self) -> None:
+        self._loaded_at = None
+
+    async def get(self, db: AsyncSession) -> FlatBOM:
+        async with self._lock:
+            if self._loaded_at is None or time.monotonic() - self._loaded_at > self.refresh_seconds:
+                structure = await load_bom_structure(db)
+                self._flat = await asyncio.to_thread(FlatBOM.from_structure, structure)
+                self._loaded_at = time.monotonic()
+            return self._flat
+
+
+flat_bom_cache = FlatBOMCache(settings.BOM_CACHE_REFRESH_SECONDS)
+
+
+@event.listens_for(Session, "after_flush")
+def _invalidate_flat_boms(session: Session, flush_context: Any) -> None:
+    for obj in (*session.new, *session.dirty, *session.deleted):
+        if isinstance(obj, (Product, BOM, BOMLine)):
+            flat_bom_cache.invalidate()
+            return
+        # Sub-assemblies are linked by material code
+        if isinstance(obj, Material) and (obj not in session.dirty or inspect(obj).attrs.code.history.deleted):
+            flat_bom_cache.invalidate()
+            return
+
+
+class BOMService:
+    """Service for flattened BOM lookups: material requirements, cost and availability"""
+
+    @staticmethod
+    async def get_flat_bom(db: AsyncSession, product_id: int, quantity: float = 1.0) -> FlatBOMResult:
+        flat = await flat_bom_cache.get(db)
+        if not flat.has_bom(product_id):
+            raise ValueError(f"Product {product_id} has no active BOM")
+
+        material_ids, per_unit = flat.components(product_id)
+        result = await db.execute(
+            select(Material.id, Material.code, Material.name, Material.unit, Material.standard_cost)
+            .where(Material.id.in_(material_ids.tolist()))
+        )
+        materials = {row.id: row for row in result}
+
+        components = []
+        for material_id, unit_quantity in zip(material_ids.tolist(), per_unit.tolist()):
+            material = materials[material_id]
+            total = unit_quantity * quantity
+            components.append(FlatBOMComponent(
+                material_id=material_id,
+                material_code=material.code,
+                material_name=material.name,
+                unit=material.unit,
+                quantity_per_unit=unit_quantity,
+                quantity=total,
+                unit_cost=material.standard_cost,
+                cost=total * material.standard_cost if material.standard_cost is not None else None
+            ))
+
+        return FlatBOMResult(
+            product_id=product_id,
+            quantity=quantity,
+            material_cost=sum(component.cost or 0.0 for component in components),
+            uncosted_materials=sum(1 for component in components if component.cost is None),
+            components=components
+        )
+
+    @staticmethod
+    async def check_material_availability(
+        db: AsyncSession, items: List[ProductQuantity], warehouse_id: Optional[int] = None
+    ) -> MaterialAvailabilityResult:
+        """Purchased materials needed to make the given products against usable available stock"""
+        flat = await flat_bom_cache.get(db)
+        demand: Dict[int, float] = {}
+        for item in items:
+            demand[item.product_id] = demand.get(item.product_id, 0.0) + item.quantity
+        required = flat.explode(demand)
+
+        available: Dict[int, float] = {}
+        if required:
+            query = (
+                select(InventoryItem.material_id, func.sum(InventoryItem.available_quantity))
+                .outerjoin(Batch, Batch.id == InventoryItem.batch_id)
+                .where(
+                    InventoryItem.material_id.in_(list(required)),
+                    or_(Batch.id.is_(None), Batch.quality_status.not_in(UNUSABLE_STOCK))
+                )
+                .group_by(InventoryItem.material_id)
+            )
+            if warehouse_id:
+                query = query.where(InventoryItem.warehouse_id == warehouse_id)
+            available = dict((await db.execute(query)).all())
+
+        lines = []
+        for material_id, quantity in sorted(required.items()):
+            on_hand = max(available.get(material_id) or 0.0, 0.0)
+            lines.append(MaterialAvailabilityLine(
+                material_id=material_id,
+                required_quantity=quantity,
+                available_quantity=on_hand,
+                shortage=max(quantity - on_hand, 0.0)
+            ))
+
+        return MaterialAvailabilityResult(
+            all_available=all(line.shortage <= 1e-9 for line in lines),
+            products_without_bom=sorted(p for p in demand if not flat.has_bom(p)),
+            lines=lines
+        )
@@ -12,6 +12,38 @@ from app.schemas.dashboard import (
     AlertType
 )
 from app.core.config import settings
+from app.models.base import ProductionLineStatus as LineState
+from app.models.production import ProductionLine, ProductionJob, ProductionOrder
+from app.schemas.production import MachineState
+from app.services.oee import OEEService
+from app.services.planning import PlanningService, job_window
+from app.services.sequencing import QUEUED_STATUS, RUNNING_STATUS
+from app.services.telemetry import telemetry_store, holds_maintenance
+
+# Dashboard groups by line type
+LINE_GROUPS = {
+    "EXTRUDER": "extrusion",
+    "CUTTER": "extrusion",
+    "SLITTER": "extrusion",
+    "LAMINATOR": "lamination",
+    "PRINTER": "printing",
+}
+
+MACHINE_LINE_STATUS = {
+    MachineState.RUNNING: LineStatus.RUNNING,
+    MachineState.SETUP: LineStatus.RUNNING,
+    MachineState.IDLE: LineStatus.IDLE,
+    MachineState.STOPPED: LineStatus.STOPPED,
+    MachineState.FAULT: LineStatus.STOPPED,
+    MachineState.MAINTENANCE: LineStatus.MAINTENANCE,
+}
+
+STORED_LINE_STATUS = {
+    LineState.ACTIVE: LineStatus.RUNNING,
+    LineState.IDLE: LineStatus.IDLE,
+    LineState.MAINTENANCE: LineStatus.MAINTENANCE,
+    LineState.ERROR: LineStatus.STOPPED,
+}
 
 
 class DashboardService:
@@ -29,174 +61,78 @@ class DashboardService:
         # TODO: Replace with real database queries
         # For now, returning realistic simulated data matching ТЗ
         
+        # OEE over the last days, read from the per-shift rollups
+        oee = await OEEService.recent_oee(self.session)
+        
         return DashboardMetrics(
             orders_active=847,  # Count of active orders
             production_capacity=94.2,  # Production capacity utilization %
-            oee_efficiency=87.3,  # Overall Equipment Effectiveness
+            oee_efficiency=oee.oee,  # Overall Equipment Effectiveness
             quality_pass_rate=99.1  # Quality pass rate
         )
     
     async def get_production_lines_status(self) -> List[ProductionLineStatus]:
         """
         Get status of all production lines grouped by type
-        Returns data matching the ТЗ structure
+        Status and speed come from machine telemetry while it is fresh, the
+        stored line status otherwise; OEE is today's from the rollups
         """
         
-        lines = []
-        
-        # 🔄 Extrusion group (4 lines + 2 cutting + laboratory)
-        extrusion_lines = [
-            {
-                "line_id": "extrusion-1",
-                "line_name": "Экструзия-1 (рукава)",
-                "status": LineStatus.RUNNING,
-                "current_order": "ORD-250001",
-                "progress_percent": 65,
-                "time_remaining": "2ч 30мин осталось",
-                "oee_percent": 89.0,
-                "queue_count": 3,
-                "operator": "Иванов И.И."
-            },
-            {
-                "line_id": "extrusion-2",
-                "line_name": "Экструзия-2 (пакеты)",
-                "status": LineStatus.RUNNING,
-                "current_order": "ORD-250003",
-                "progress_percent": 30,
-                "time_remaining": "4ч 15мин осталось",
-                "oee_percent": 92.0,
-                "queue_count": 5,
-                "operator": "Петров П.П."
-            },
-            {
-                "line_id": "extrusion-3",
-                "line_name": "Экструзия-3",
-                "status": LineStatus.RUNNING,
-                "current_order": "ORD-250008",
-                "progress_percent": 85,
-                "time_remaining": "45мин осталось",
-                "oee_percent": 94.0,
-                "queue_count": 2,
-                "operator": "Сидоров С.С."
-            },
-            {
-                "line_id": "extrusion-4",
-                "line_name": "Экструзия-4",
-                "status": LineStatus.IDLE,
-                "current_order": None,
-                "progress_percent": 0,
-                "time_remaining": None,
-                "oee_percent": 0.0,
-                "queue_count": 1,
-                "operator": "Ожидание материала"
-            },
-            {
-                "line_id": "cutting-1",
-                "line_name": "Резка-1",
-                "status": LineStatus.RUNNING,
-                "current_order": "Резка ORD-250001",
-                "progress_percent": 40,
-                "time_remaining": "1ч 20мин осталось",
-                "oee_percent": 88.0,
-                "queue_count": 4,
-                "operator": "Резчик А.А."
-            },
-            {
-                "line_id": "cutting-2",
-                "line_name": "Резка-2",
-                "status": LineStatus.MAINTENANCE,
-                "current_order": "Смена ножей",
-                "progress_percent": 70,
-                "time_remaining": "20мин осталось",
-                "oee_percent": 0.0,
-                "queue_count": 2,
-                "operator": "Техник Б.Б."
-            },
-            {
-                "line_id": "laboratory",
-                "line_name": "Лаборатория",
-                "status": LineStatus.RUNNING,
-                "current_order": "Тест партии №245",
-                "progress_percent": 60,
-                "time_remaining": "30мин осталось",
-                "oee_percent": 95.0,
-                "queue_count": 3,
-                "operator": "Лаборант В.В."
-            }
-        ]
-        
-        # 📄 Lamination group (1 line + cutting)
-        lamination_lines = [
-            {
-                "line_id": "lamination-1",
-                "line_name": "Ламинация-1",
-                "status": LineStatus.RUNNING,
-                "current_order": "ORD-250009",
-                "progress_percent": 55,
-                "time_remaining": "3ч 45мин осталось",
-                "oee_percent": 82.0,
-                "queue_count": 7,
-                "operator": "Ламинатор Г.Г."
-            },
-            {
-                "line_id": "lamination-cutting",
-                "line_name": "Резка ламинации",
-                "status": LineStatus.IDLE,
-                "current_order": None,
-                "progress_percent": 0,
-                "time_remaining": None,
-                "oee_percent": 0.0,
-                "queue_count": 5,
-                "operator": "Ожидание ламинации"
-            }
-        ]
+        lines = (await self.session.execute(
+            select(ProductionLine).where(ProductionLine.is_active == True).order_by(ProductionLine.code)
+        )).scalars().all()
         
-        # 🎨 Printing group (2 lines)
-        printing_lines = [
-            {
-                "line_id": "printing-1",
-                "line_name": "Флексопечать-1",
-                "status": LineStatus.RUNNING,
-                "current_order": "ORD-250012",
-                "progress_percent": 45,
-                "time_remaining": "3ч 10мин осталось",
-                "oee_percent": 85.0,
-                "queue_count": 4,
-                "operator": "Печатник Д.Д."
-            },
-            {
-                "line_id": "printing-2",
-                "line_name": "Цифровая печать",
-                "status": LineStatus.RUNNING,
-                "current_order": "ORD-250015",
-                "progress_percent": 20,
-                "time_remaining": "1ч 45мин осталось",
-                "oee_percent": 78.0,
-                "queue_count": 2,
-                "operator": "Оператор Е.Е."
-            }
-        ]
+        result = await self.session.execute(
+            select(ProductionJob, ProductionOrder.order_number)
+            .join(ProductionOrder, ProductionOrder.id == ProductionJob.production_order_id)
+            .where(ProductionJob.status == RUNNING_STATUS)
+        )
+        running = {job.production_line_id: (job, order_number) for job, order_number in result}
+        queued = dict((await self.session.execute(
+            select(ProductionJob.production_line_id, func.count(ProductionJob.id))
+            .where(ProductionJob.status == QUEUED_STATUS)
+            .group_by(ProductionJob.production_line_id)
+        )).all())
         
-        # Combine all lines with group information
-        for line_data in extrusion_lines:
-            lines.append(ProductionLineStatus(
-                line_group="extrusion",
-                **line_data
-            ))
+        today = datetime.combine(datetime.utcnow().date(), datetime.min.time())
+        oee = await OEEService.get_oee(self.session, today, today, group_by=["line"])
+        oee_by_line = {row.line_id: row.oee for row in oee.rows}
         
-        for line_data in lamination_lines:
-            lines.append(ProductionLineStatus(
-                line_group="lamination",
-                **line_data
+        now = datetime.utcnow()
+        statuses = []
+        for line in lines:
+            sample = telemetry_store.latest(line.id)
+            if holds_maintenance(line, sample.state if sample is not None else None):
+                status = LineStatus.MAINTENANCE
+            elif sample is not None and sample.state is not None:
+                status = MACHINE_LINE_STATUS[sample.state]
+            elif sample is not None:
+                status = LineStatus.RUNNING if sample.speed > 0 else LineStatus.IDLE
+            else:
+                status = STORED_LINE_STATUS.get(line.status, LineStatus.IDLE)
+            
+            job, order_number = running.get(line.id, (None, None))
+            time_remaining = None
+            if job is not None:
+                _, end = job_window(job, now)
+                minutes = int((end - now).total_seconds() // 60)
+                hours, minutes = divmod(max(minutes, 0), 60)
+                time_remaining = f"{hours}ч {minutes}мин осталось" if hours else f"{minutes}мин осталось"
+            
+            statuses.append(ProductionLineStatus(
+                line_id=line.code,
+                line_name=line.name,
+                line_group=LINE_GROUPS.get((line.line_type or "").upper(), (line.line_type or "other").lower()),
+                status=status,
+                current_order=order_number,
+                progress_percent=int(job.progress_percentage or 0) if job is not None else 0,
+                time_remaining=time_remaining,
+                oee_percent=oee_by_line.get(line.id, 0.0),
+                queue_count=queued.get(line.id, 0),
+                operator=job.primary_operator if job is not None else None
             ))
         
-        for line_data in printing_lines:
-            lines.append(ProductionLineStatus(
-                line_group="printing",
-                **line_data
-            ))
-        
-        return lines
+        return statuses
     
     async def get_critical_alerts(self, limit: int = 10) -> List[CriticalAlert]:
         """
@@ -280,13 +216,31 @@ class DashboardService:
         
         message = action_map.get(action, "действие выполнено")
         
-        return {
+        result = {
             "line_id": line_id,
             "action": action,
             "status": f"Линия {line_id} {message}",
             "timestamp": datetime.now(),
             "estimated_completion": datetime.now() + timedelta(minutes=30)
         }
+        
+        if action == "maintenance":
+            condition = ProductionLine.code == line_id
+            if line_id.isdigit():
+                condition = or_(condition, ProductionLine.id == int(line_id))
+            line = await self.session.scalar(select(ProductionLine).where(condition))
+            if line is not None:
+                # Block the line from now on and shift its queue around the window; the planned date stays
+                now = datetime.utcnow().replace(second=0, microsecond=0)
+                line.status = LineState.MAINTENANCE
+                line.maintenance_started_at = now
+                await self.session.flush()
+                impact = await PlanningService.repair_schedule(self.session, [line.id], disruption_start=now)
+                await self.session.commit()
+                result["estimated_completion"] = now + timedelta(hours=settings.MAINTENANCE_WINDOW_HOURS)
+                result["schedule_impact"] = impact
+        
+        return result
     
     async def execute_alert_action(self, alert_id: int, action: str) -> Dict[str, Any]:
         """
@@ -0,0 +1,220 @@
+"""
+Bulk export of inventory, batches and stock movements
+
+Rows are streamed from a server-side cursor in fixed-size chunks with only
+the requested columns selected, then encoded chunk by chunk as CSV, Arrow IPC
+or Parquet. Memory use is bounded by the chunk size, not the table size.
+"""
+
+from sqlalchemy import select, Integer, Float, Boolean, DateTime, Date
+from sqlalchemy.sql.schema import Column
+from typing import AsyncIterator, Dict, List, Optional, Tuple, Type, Any
+from datetime import datetime
+import csv
+import enum
+import io
+
+from app.db.database import AsyncSessionLocal
+from app.models.warehouse import InventoryItem, Batch, StockMovement
+from app.schemas.warehouse import ExportDataset, ExportFormat
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:  # pragma: no cover - optional dependency
+    pa = None
+    pq = None
+
+
+EXPORT_MODELS: Dict[ExportDataset, Type[Any]] = {
+    ExportDataset.INVENTORY: InventoryItem,
+    ExportDataset.BATCHES: Batch,
+    ExportDataset.MOVEMENTS: StockMovement,
+}
+
+
+class _ChunkSink(io.RawIOBase):
+    """Write-only file object that hands written bytes back to the generator"""
+
+    def __init__(self):
+        self._buffer = bytearray()
+        self._position = 0
+
+    def writable(self) -> bool:
+        return True
+
+    def write(self, data) -> int:
+        self._buffer.extend(data)
+        self._position += len(data)
+        return len(data)
+
+    def tell(self) -> int:
+        return self._position
+
+    def drain(self) -> bytes:
+        data = bytes(self._buffer)
+        self._buffer.clear()
+        return data
+
+
+class ExportService:
+    """Service for streaming bulk exports"""
+
+    @staticmethod
+    def media_type(export_format: ExportFormat) -> str:
+        return {
+            ExportFormat.CSV: "text/csv",
+            ExportFormat.PARQUET: "application/vnd.apache.parquet",
+            ExportFormat.ARROW: "application/vnd.apache.arrow.stream",
+        }[export_format]
+
+    @staticmethod
+    def resolve_columns(dataset: ExportDataset, columns: Optional[List[str]] = None) -> List[Column]:
+        """Project only the requested columns; all table columns by default"""
+        table = EXPORT_MODELS[dataset].__table__
+        if not columns:
+            return list(table.columns)
+
+        unknown = [name for name in columns if name not in table.columns]
+        if unknown:
+            raise ValueError(f"Unknown columns for {dataset.value}: {', '.join(unknown)}")
+        return [table.columns[name] for name in columns]
+
+    @staticmethod
+    def check_format(export_format: ExportFormat) -> None:
+        if export_format != ExportFormat.CSV and pa is None:
+            raise ValueError("Parquet/Arrow export requires the 'pyarrow' package")
+
+    @staticmethod
+    def _build_query(
+        dataset: ExportDataset,
+        columns: List[Column],
+        material_id: Optional[int] = None,
+        warehouse_id: Optional[int] = None,
+        created_from: Optional[datetime] = None,
+        created_to: Optional[datetime] = None
+    ):
+        model = EXPORT_MODELS[dataset]
+        query = select(*columns).order_by(model.id)
+
+        if dataset == ExportDataset.MOVEMENTS and (material_id or warehouse_id):
+            items = select(InventoryItem.id)
+            if material_id:
+                items = items.where(InventoryItem.material_id == material_id)
+            if warehouse_id:
+                items = items.where(InventoryItem.warehouse_id == warehouse_id)
+            query = query.where(StockMovement.inventory_item_id.in_(items))
+        else:
+            if material_id:
+                query = query.where(model.material_id == material_id)
+            if warehouse_id and dataset == ExportDataset.INVENTORY:
+                query = query.where(InventoryItem.warehouse_id == warehouse_id)
+            elif warehouse_id and dataset == ExportDataset.BATCHES:
+                # Batches have no warehouse of their own; they are in those holding stock of them
+                query = query.where(Batch.id.in_(
+                    select(InventoryItem.batch_id).where(InventoryItem.warehouse_id == warehouse_id)
+                ))
+
+        if created_from:
+            query = query.where(model.created_at >= created_from)
+        if created_to:
+            query = query.where(model.created_at < created_to)
+
+        return query
+
+    @staticmethod
+    async def stream_chunks(
+        dataset: ExportDataset,
+        columns: List[Column],
+        chunk_size: int,
+        **filters
+    ) -> AsyncIterator[List[Tuple]]:
+        """Yield row chunks from a server-side cursor"""
+        # The response outlives the request-scoped session, so the stream owns its own
+        query = ExportService._build_query(dataset, columns, **filters)
+        async with AsyncSessionLocal() as db:
+            result = await db.stream(query.execution_options(yield_per=chunk_size))
+            async for partition in result.partitions(chunk_size):
+                yield partition
+
+    @staticmethod
+    def _plain(value: Any) -> Any:
+        return value.value if isinstance(value, enum.Enum) else value
+
+    @staticmethod
+    async def export_csv(dataset: ExportDataset, columns: List[Column], chunk_size: int, **filters) -> AsyncIterator[bytes]:
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        writer.writerow([column.name for column in columns])
+
+        async for rows in ExportService.stream_chunks(dataset, columns, chunk_size, **filters):
+            writer.writerows([[ExportService._plain(value) for value in row] for row in rows])
+            yield buffer.getvalue().encode("utf-8")
+            buffer.seek(0)
+            buffer.truncate()
+
+        if buffer.tell():
+            yield buffer.getvalue().encode("utf-8")
+
+    @staticmethod
+    def _arrow_schema(columns: List[Column]):
+        fields = []
+        for column in columns:
+            if isinstance(column.type, Boolean):
+                arrow_type = pa.bool_()
+            elif isinstance(column.type, Integer):
+                arrow_type = pa.int64()
+            elif isinstance(column.type, Float):
+                arrow_type = pa.float64()
+            elif isinstance(column.type, DateTime):
+                arrow_type = pa.timestamp("us")
+            elif isinstance(column.type, Date):
+                arrow_type = pa.date32()
+            else:
+                arrow_type = pa.string()
+            fields.append(pa.field(column.name, arrow_type))
+        return pa.schema(fields)
+
+    @staticmethod
+    def _record_batch(schema, rows: List[Tuple]):
+        arrays = []
+        for index, field in enumerate(schema):
+            values = [ExportService._plain(row[index]) for row in rows]
+            arrays.append(pa.array(values, type=field.type))
+        return pa.RecordBatch.from_arrays(arrays, schema=schema)
+
+    @staticmethod
+    async def export_arrow(
+        dataset: ExportDataset,
+        columns: List[Column],
+        chunk_size: int,
+        export_format: ExportFormat,
+        **filters
+    ) -> AsyncIterator[bytes]:
+        """Arrow IPC stream or Parquet file, one record batch / row group per chunk"""
+        schema = ExportService._arrow_schema(columns)
+        sink = _ChunkSink()
+        if export_format == ExportFormat.PARQUET:
+            writer = pq.ParquetWriter(sink, schema, compression="snappy")
+        else:
+            writer = pa.ipc.new_stream(sink, schema)
+
+        try:
+            async for rows in ExportService.stream_chunks(dataset, columns, chunk_size, **filters):
+                writer.write_batch(ExportService._record_batch(schema, rows))
+                yield sink.drain()
+        finally:
+            writer.close()
+        yield sink.drain()
+
+    @staticmethod
+    def export(
+        dataset: ExportDataset,
+        export_format: ExportFormat,
+        columns: List[Column],
+        chunk_size: int,
+        **filters
+    ) -> AsyncIterator[bytes]:
+        if export_format == ExportFormat.CSV:
+            return ExportService.export_csv(dataset, columns, chunk_size, **filters)
+        return ExportService.export_arrow(dataset, columns, chunk_size, export_format, **filters)
@@ -0,0 +1,391 @@
+"""
+Batch genealogy for recall and root-cause traceability
+
+Every consumption of an input batch by a production job is stored as an edge
+(parent batch -> child batch). Forward and backward traces walk these edges
+with a single recursive CTE. Its rows are distinct edges per depth rather
+than paths, so batches that split and merge cost at most edges x depth rows
+instead of one row per path. An edge closes a cycle in bad data when its
+target was reached no later than its source and already reaches it, which
+the closure table answers directly.
+"""
+
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy import select, func, literal, and_, or_, not_, case, delete, except_, exists
+from typing import List, Optional
+
+from app.models.warehouse import Batch, Material, BatchGenealogy, BatchGenealogyClosure
+from app.models.production import ProductionJob
+from app.schemas.warehouse import (
+    GenealogyLinkCreate, GenealogyNode, GenealogyTrace, TraceDirection,
+    RecallItem, ClosureCheckResult
+)
+from app.utils.upsert import dialect_insert
+
+
+class GenealogyService:
+    """Service for recording and tracing batch genealogy"""
+
+    MAX_DEPTH = 50
+
+    @staticmethod
+    async def record_links(db: AsyncSession, links: List[GenealogyLinkCreate]) -> List[BatchGenealogy]:
+        """Record input -> output batch consumption edges"""
+        for link in links:
+            if link.parent_batch_id == link.child_batch_id:
+                raise ValueError(f"Batch {link.parent_batch_id} cannot consume itself")
+
+        batch_ids = {link.parent_batch_id for link in links} | {link.child_batch_id for link in links}
+        found = await db.execute(select(Batch.id).where(Batch.id.in_(batch_ids)))
+        missing = batch_ids - set(found.scalars().all())
+        if missing:
+            raise ValueError(f"Unknown batch ids: {sorted(missing)}")
+
+        db_links = [BatchGenealogy(**link.model_dump()) for link in links]
+        db.add_all(db_links)
+        for link in links:
+            await GenealogyClosureService.add_edge(db, link.parent_batch_id, link.child_batch_id)
+        await db.commit()
+        for db_link in db_links:
+            await db.refresh(db_link)
+        return db_links
+
+    @staticmethod
+    def _trace_cte(batch_id: int, direction: TraceDirection, max_depth: int):
+        """
+        WITH RECURSIVE trace(batch_id, via_batch_id, production_job_id, quantity, depth)
+
+        Each row is one edge reached from the start batch at one depth. UNION
+        keeps a single row per edge and depth however many paths lead there;
+        a cycle in bad data repeats at most until max_depth. Edges back into
+        the start batch are not expanded again.
+        """
+        edge = BatchGenealogy.__table__
+        if direction == TraceDirection.FORWARD:
+            source, target = edge.c.parent_batch_id, edge.c.child_batch_id
+        else:
+            source, target = edge.c.child_batch_id, edge.c.parent_batch_id
+
+        seed = (
+            select(
+                target.label("batch_id"),
+                source.label("via_batch_id"),
+                edge.c.production_job_id,
+                edge.c.quantity,
+                literal(1).label("depth"),
+            )
+            .where(source == batch_id)
+            .cte("trace", recursive=True)
+        )
+
+        step = (
+            select(target, source, edge.c.production_job_id, edge.c.quantity, seed.c.depth + 1)
+            .select_from(edge.join(seed, source == seed.c.batch_id))
+            .where(and_(seed.c.depth < max_depth, seed.c.batch_id != batch_id))
+        )
+
+        return seed.union(step)
+
+    @staticmethod
+    async def trace(
+        db: AsyncSession,
+        batch: Batch,
+        direction: TraceDirection = TraceDirection.FORWARD,
+        max_depth: int = 10
+    ) -> GenealogyTrace:
+        """Forward (recall) or backward (root cause) trace from a batch"""
+        max_depth = max(1, min(max_depth, GenealogyService.MAX_DEPTH))
+        trace = GenealogyService._trace_cte(batch.id, direction, max_depth)
+
+        # Collapse the per-depth rows to one row per edge at its shallowest depth
+        edges = (
+            select(
+                trace.c.batch_id,
+                trace.c.via_batch_id,
+                trace.c.production_job_id,
+                func.max(trace.c.quantity).label("quantity"),
+                func.min(trace.c.depth).label("depth"),
+            )
+            .group_by(trace.c.batch_id, trace.c.via_batch_id, trace.c.production_job_id)
+            .subquery()
+        )
+        reached = (
+            select(trace.c.batch_id, func.min(trace.c.depth).label("depth"))
+            .group_by(trace.c.batch_id)
+            .subquery()
+        )
+        target = reached.alias("target")
+        via = reached.alias("via")
+        via_depth = case((edges.c.via_batch_id == batch.id, 0), else_=func.coalesce(via.c.depth, 0))
+
+        # An edge closes a cycle when it leads back to a batch reached no later
+        # than its source and that batch already reaches the source
+        closure = BatchGenealogyClosure.__table__
+        if direction == TraceDirection.FORWARD:
+            reaches_back = and_(
+                closure.c.ancestor_batch_id == edges.c.batch_id,
+                closure.c.descendant_batch_id == edges.c.via_batch_id
+            )
+        else:
+            reaches_back = and_(
+                closure.c.ancestor_batch_id == edges.c.via_batch_id,
+                closure.c.descendant_batch_id == edges.c.batch_id
+            )
+        is_cycle = or_(
+            edges.c.batch_id == batch.id,
+            and_(target.c.depth <= via_depth, exists().where(reaches_back))
+        )
+
+        result = await db.execute(
+            select(
+                edges,
+                is_cycle.label("is_cycle"),
+                Batch.batch_number,
+                Batch.material_id,
+                Batch.quality_status,
+                Material.code,
+                Material.name,
+                ProductionJob.job_number,
+            )
+            .join(target, target.c.batch_id == edges.c.batch_id)
+            .outerjoin(via, via.c.batch_id == edges.c.via_batch_id)
+            .join(Batch, Batch.id == edges.c.batch_id)
+            .join(Material, Material.id == Batch.material_id)
+            .outerjoin(ProductionJob, ProductionJob.id == edges.c.production_job_id)
+            .order_by(edges.c.depth, edges.c.batch_id)
+        )
+
+        nodes = []
+        cycles = []
+        for row in result.all():
+            node = GenealogyNode(
+                batch_id=row.batch_id,
+                batch_number=row.batch_number,
+                material_id=row.material_id,
+                material_code=row.code,
+                material_name=row.name,
+                quality_status=row.quality_status,
+                depth=row.depth,
+                via_batch_id=row.via_batch_id,
+                production_job_id=row.production_job_id,
+                job_number=row.job_number,
+                quantity=row.quantity,
+            )
+            if row.is_cycle:
+                cycles.append(node)
+            else:
+                nodes.append(node)
+
+        return GenealogyTrace(
+            batch_id=batch.id,
+            batch_number=batch.batch_number,
+            direction=direction,
+            max_depth=max_depth,
+            nodes=nodes,
+            cycles=cycles
+        )
+
+    @staticmethod
+    async def get_direct_consumption(db: AsyncSession, batch_id: int) -> List[dict]:
+        """Production jobs and output batches that consumed a batch directly"""
+        child = Batch.__table__.alias("child")
+        result = await db.execute(
+            select(
+                BatchGenealogy.quantity,
+                BatchGenealogy.created_at,
+                child.c.batch_number,
+                ProductionJob.job_number,
+            )
+            .join(child, child.c.id == BatchGenealogy.child_batch_id)
+            .outerjoin(ProductionJob, ProductionJob.id == BatchGenealogy.production_job_id)
+            .where(BatchGenealogy.parent_batch_id == batch_id)
+            .order_by(BatchGenealogy.created_at)
+        )
+        return [
+            {
+                "production_job": row.job_number,
+                "output_batch": row.batch_number,
+                "quantity_used": row.quantity,
+                "date": row.created_at,
+            }
+            for row in result.all()
+        ]
+
+
+class GenealogyClosureService:
+    """
+    Maintains batch_genealogy_closure: one row per (ancestor, descendant) pair.
+    
+    Recording an edge p -> c connects every ancestor of p (and p) with every
+    descendant of c (and c) in one INSERT ... SELECT, so recall lookups are a
+    single index range scan instead of a graph walk. Pairs further apart than
+    GenealogyService.MAX_DEPTH are left out, both here and when the closure is
+    recomputed from the edges.
+    """
+
+    @staticmethod
+    async def add_edge(db: AsyncSession, parent_batch_id: int, child_batch_id: int) -> None:
+        closure = BatchGenealogyClosure.__table__
+        ancestors = (
+            select(closure.c.ancestor_batch_id.label("batch_id"), closure.c.depth)
+            .where(closure.c.descendant_batch_id == parent_batch_id)
+            .union_all(select(literal(parent_batch_id), literal(0)))
+            .subquery("ancestors")
+        )
+        descendants = (
+            select(closure.c.descendant_batch_id.label("batch_id"), closure.c.depth)
+            .where(closure.c.ancestor_batch_id == child_batch_id)
+            .union_all(select(literal(child_batch_id), literal(0)))
+            .subquery("descendants")
+        )
+        pairs = (
+            select(
+                ancestors.c.batch_id,
+                descendants.c.batch_id,
+                ancestors.c.depth + descendants.c.depth + 1,
+            )
+            .select_from(ancestors.join(descendants, literal(True)))
+            .where(
+                # Cycles in bad data must not produce self-containment rows
+                ancestors.c.batch_id != descendants.c.batch_id,
+                # Same depth limit as the recomputed closure
+                ancestors.c.depth + descendants.c.depth + 1 <= GenealogyService.MAX_DEPTH
+            )
+        )
+
+        stmt = dialect_insert(db.get_bind().dialect.name, closure).from_select(
+            ["ancestor_batch_id", "descendant_batch_id", "depth"], pairs
+        )
+        stmt = stmt.on_conflict_do_update(
+            index_elements=["ancestor_batch_id", "descendant_batch_id"],
+            set_={
+                "depth": case(
+                    (stmt.excluded.depth < closure.c.depth, stmt.excluded.depth),
+                    else_=closure.c.depth
+                )
+            }
+        )
+        await db.execute(stmt)
+
+    @staticmethod
+    def _expected_closure():
+        """Closure recomputed from the edge table with a recursive CTE"""
+        edge = BatchGenealogy.__table__
+        walk = (
+            select(
+                edge.c.parent_batch_id.label("ancestor_batch_id"),
+                edge.c.child_batch_id.label("descendant_batch_id"),
+                literal(1).label("depth"),
+            )
+            .cte("walk", recursive=True)
+        )
+        walk = walk.union(
+            select(walk.c.ancestor_batch_id, edge.c.child_batch_id, walk.c.depth + 1)
+            .select_from(walk.join(edge, edge.c.parent_batch_id == walk.c.descendant_batch_id))
+            .where(walk.c.depth < GenealogyService.MAX_DEPTH)
+        )
+        return (
+            select(
+                walk.c.ancestor_batch_id,
+                walk.c.descendant_batch_id,
+                func.min(walk.c.depth).label("depth"),
+            )
+            .where(walk.c.ancestor_batch_id != walk.c.descendant_batch_id)
+            .group_by(walk.c.ancestor_batch_id, walk.c.descendant_batch_id)
+        )
+
+    @staticmethod
+    async def rebuild(db: AsyncSession) -> int:
+        """Recompute the whole closure from the edge table (run as a background job)"""
+        closure = BatchGenealogyClosure.__table__
+        await db.execute(delete(closure))
+        await db.execute(
+            closure.insert().from_select(
+                ["ancestor_batch_id", "descendant_batch_id", "depth"],
+                GenealogyClosureService._expected_closure()
+            )
+        )
+        count = await db.scalar(select(func.count()).select_from(closure))
+        await db.commit()
+        return count
+
+    @staticmethod
+    async def check_consistency(db: AsyncSession, sample_size: int = 20) -> ClosureCheckResult:
+        """Compare the stored closure with one recomputed from the edges"""
+        closure = BatchGenealogyClosure.__table__
+        expected = GenealogyClosureService._expected_closure().subquery("expected")
+        stored = select(closure.c.ancestor_batch_id, closure.c.descendant_batch_id, closure.c.depth)
+        expected_rows = select(expected.c.ancestor_batch_id, expected.c.descendant_batch_id, expected.c.depth)
+
+        missing = except_(expected_rows, stored).subquery("missing")
+        extra = except_(stored, expected_rows).subquery("extra")
+
+        missing_count = await db.scalar(select(func.count()).select_from(missing))
+        extra_count = await db.scalar(select(func.count()).select_from(extra))
+        missing_sample = (await db.execute(select(missing).limit(sample_size))).all()
+        extra_sample = (await db.execute(select(extra).limit(sample_size))).all()
+
+        return ClosureCheckResult(
+            consistent=missing_count == 0 and extra_count == 0,
+            stored_rows=await db.scalar(select(func.count()).select_from(closure)),
+            expected_rows=await db.scalar(select(func.count()).select_from(expected)),
+            missing_rows=missing_count,
+            extra_rows=extra_count,
+            missing_sample=[list(row) for row in missing_sample],
+            extra_sample=[list(row) for row in extra_sample]
+        )
+
+    @staticmethod
+    async def get_descendants(
+        db: AsyncSession,
+        batch_id: int,
+        finished_only: bool = True,
+        limit: Optional[int] = None
+    ) -> List[RecallItem]:
+        """
+        All batches containing batch_id, from the closure table.
+        
+        finished_only keeps the end products: descendants that were not
+        consumed by any further production step.
+        """
+        closure = BatchGenealogyClosure.__table__
+        query = (
+            select(
+                Batch.id,
+                Batch.batch_number,
+                Batch.material_id,
+                Material.code,
+                Material.name,
+                Batch.quality_status,
+                Batch.available_quantity,
+                closure.c.depth,
+            )
+            .select_from(closure)
+            .join(Batch, Batch.id == closure.c.descendant_batch_id)
+            .join(Material, Material.id == Batch.material_id)
+            .where(closure.c.ancestor_batch_id == batch_id)
+            .order_by(closure.c.depth, Batch.id)
+        )
+
+        if finished_only:
+            query = query.where(
+                not_(exists().where(BatchGenealogy.parent_batch_id == closure.c.descendant_batch_id))
+            )
+
+        if limit:
+            query = query.limit(limit)
+
+        result = await db.execute(query)
+        return [
+            RecallItem(
+                batch_id=row.id,
+                batch_number=row.batch_number,
+                material_id=row.material_id,
+                material_code=row.code,
+                material_name=row.name,
+                quality_status=row.quality_status,
+                available_quantity=row.available_quantity,
+                depth=row.depth
+            )
+            for row in result.all()
+        ]
@@ -0,0 +1,390 @@
+"""
+Background job runner for MPSYSTEM ERP
+
+Jobs are stored in the background_jobs table and executed on a thread pool.
+Every worker thread runs its own event loop and AsyncSession, so long imports
+never block request handling. Progress is committed together with each
+processed chunk, which lets a restarted worker resume exactly where it stopped.
+
+A worker process claims a job atomically before running it and keeps the
+claim alive with a heartbeat, so with several processes each unfinished job
+is resumed by exactly one of them. Every heartbeat also looks for jobs to
+take over: a claim whose heartbeat stopped (the process died) after
+JOB_CLAIM_TIMEOUT_SECONDS, and claims a stopping process released at once.
+"""
+
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy import select, update, desc, or_
+from concurrent.futures import ThreadPoolExecutor
+from typing import Awaitable, Callable, Collection, Dict, List, Optional, Set, Tuple
+from datetime import datetime, timedelta
+from pathlib import Path
+import asyncio
+import itertools
+import logging
+import threading
+import uuid
+
+import aiofiles
+from fastapi import UploadFile
+
+from app.core.config import settings
+from app.db.database import WorkerSessionLocal
+from app.models.base import JobStatus
+from app.models.jobs import BackgroundJob
+from app.schemas.warehouse import CSVImportResult, ImportMode
+from app.services.warehouse import CSVService
+from app.services.search import invalidate_search
+from app.models.warehouse import Material, Supplier
+from app.services.genealogy import GenealogyClosureService
+from app.services.mrp import MRPService
+from app.services.leases import WORKER_ID
+from app.schemas.procurement import MRPRunMode
+from app.utils.periodic import PeriodicTask
+
+logger = logging.getLogger(__name__)
+
+JobHandler = Callable[[AsyncSession, BackgroundJob], Awaitable[None]]
+
+UNFINISHED_STATUSES = (JobStatus.QUEUED, JobStatus.RUNNING)
+
+
+class JobService:
+    """Service for background job records"""
+
+    @staticmethod
+    async def create_job(
+        db: AsyncSession,
+        job_type: str,
+        file_path: Optional[str] = None,
+        original_filename: Optional[str] = None,
+        options: Optional[dict] = None,
+        total_rows: int = 0,
+        created_by: Optional[str] = None
+    ) -> BackgroundJob:
+        db_job = BackgroundJob(
+            job_type=job_type,
+            status=JobStatus.QUEUED,
+            file_path=file_path,
+            original_filename=original_filename,
+            options=options or {},
+            total_rows=total_rows,
+            processed_rows=0,
+            imported_rows=0,
+            updated_rows=0,
+            unchanged_rows=0,
+            failed_rows=0,
+            attempts=0,
+            errors=[],
+            warnings=[],
+            created_by=created_by
+        )
+        db.add(db_job)
+        await db.commit()
+        await db.refresh(db_job)
+        return db_job
+
+    @staticmethod
+    async def get_job(db: AsyncSession, job_id: int) -> Optional[BackgroundJob]:
+        result = await db.execute(select(BackgroundJob).where(BackgroundJob.id == job_id))
+        return result.scalar_one_or_none()
+
+    @staticmethod
+    async def get_jobs(
+        db: AsyncSession,
+        skip: int = 0,
+        limit: int = 50,
+        job_type: Optional[str] = None,
+        status: Optional[JobStatus] = None
+    ) -> List[BackgroundJob]:
+        query = select(BackgroundJob).order_by(desc(BackgroundJob.id)).offset(skip).limit(limit)
+
+        if job_type:
+            query = query.where(BackgroundJob.job_type == job_type)
+
+        if status:
+            query = query.where(BackgroundJob.status == status)
+
+        result = await db.execute(query)
+        return result.scalars().all()
+
+    @staticmethod
+    def _claimable(worker_id: str):
+        """Unclaimed, already ours, or held by a worker whose heartbeat stopped"""
+        stale_before = datetime.utcnow() - timedelta(seconds=settings.JOB_CLAIM_TIMEOUT_SECONDS)
+        return or_(
+            BackgroundJob.claimed_by.is_(None),
+            BackgroundJob.claimed_by == worker_id,
+            BackgroundJob.heartbeat_at < stale_before
+        )
+
+    @staticmethod
+    async def claim_job(db: AsyncSession, job_id: int, worker_id: str) -> bool:
+        """Atomically claim an unfinished job for a worker; False when another worker holds it"""
+        result = await db.execute(
+            update(BackgroundJob)
+            .where(
+                BackgroundJob.id == job_id,
+                BackgroundJob.status.in_(UNFINISHED_STATUSES),
+                JobService._claimable(worker_id)
+            )
+            .values(claimed_by=worker_id, heartbeat_at=datetime.utcnow())
+            .execution_options(synchronize_session=False)
+        )
+        await db.commit()
+        return result.rowcount == 1
+
+    @staticmethod
+    async def claim_unfinished_jobs(db: AsyncSession, worker_id: str) -> List[int]:
+        """Claim the jobs left queued or interrupted mid-run by a worker restart"""
+        result = await db.execute(
+            update(BackgroundJob)
+            .where(BackgroundJob.status.in_(UNFINISHED_STATUSES), JobService._claimable(worker_id))
+            .values(claimed_by=worker_id, heartbeat_at=datetime.utcnow())
+            .returning(BackgroundJob.id)
+            .execution_options(synchronize_session=False)
+        )
+        job_ids = sorted(result.scalars().all())
+        await db.commit()
+        return job_ids
+
+    @staticmethod
+    async def heartbeat(db: AsyncSession, worker_id: str) -> int:
+        """Keep a worker's claims on its unfinished jobs alive"""
+        result = await db.execute(
+            update(BackgroundJob)
+            .where(BackgroundJob.claimed_by == worker_id, BackgroundJob.status.in_(UNFINISHED_STATUSES))
+            .values(heartbeat_at=datetime.utcnow())
+            .execution_options(synchronize_session=False)
+        )
+        await db.commit()
+        return result.rowcount
+
+    @staticmethod
+    async def release_claims(db: AsyncSession, worker_id: str, keep: Collection[int] = ()) -> int:
+        """Hand a stopping worker's unfinished jobs back, except those it is still running"""
+        query = (
+            update(BackgroundJob)
+            .where(BackgroundJob.claimed_by == worker_id, BackgroundJob.status.in_(UNFINISHED_STATUSES))
+            .values(claimed_by=None, heartbeat_at=None)
+            .execution_options(synchronize_session=False)
+        )
+        if keep:
+            query = query.where(BackgroundJob.id.not_in(list(keep)))
+        result = await db.execute(query)
+        await db.commit()
+        return result.rowcount
+
+    @staticmethod
+    def record_chunk(job: BackgroundJob, chunk: CSVImportResult) -> None:
+        """Accumulate the result of one processed chunk on the job row"""
+        job.processed_rows += chunk.total_rows
+        job.imported_rows += chunk.imported_rows
+        job.updated_rows += chunk.updated_rows
+        job.unchanged_rows += chunk.unchanged_rows
+        job.failed_rows += chunk.failed_rows
+
+        # Reassign the lists so the JSON columns are flagged as modified
+        limit = settings.JOB_MAX_REPORTED_ERRORS
+        job.errors = (list(job.errors or []) + chunk.errors)[:limit]
+        job.warnings = (list(job.warnings or []) + chunk.warnings)[:limit]
+
+    @staticmethod
+    async def spool_upload(file: UploadFile) -> Tuple[str, int]:
+        """Stream an upload to the spool directory and count its lines"""
+        spool_dir = Path(settings.JOB_SPOOL_DIR)
+        spool_dir.mkdir(parents=True, exist_ok=True)
+        file_path = spool_dir / f"{uuid.uuid4().hex}-{Path(file.filename).name}"
+
+        line_count = 0
+        async with aiofiles.open(file_path, "wb") as out:
+            while chunk := await file.read(1024 * 1024):
+                line_count += chunk.count(b"\n")
+                await out.write(chunk)
+
+        return str(file_path), line_count
+
+
+class JobRunner:
+    """Thread pool executing persisted background jobs"""
+
+    def __init__(self, max_workers: int):
+        self.max_workers = max_workers
+        self.worker_id = WORKER_ID
+        self._handlers: Dict[str, JobHandler] = {}
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._lock = threading.Lock()
+        self._submitted: Set[int] = set()  # Submitted and not finished in this process
+        self._running: Set[int] = set()
+
+    def register(self, job_type: str) -> Callable[[JobHandler], JobHandler]:
+        """Decorator registering the coroutine that executes a job type"""
+        def decorator(handler: JobHandler) -> JobHandler:
+            self._handlers[job_type] = handler
+            return handler
+        return decorator
+
+    def start(self) -> None:
+        with self._lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(
+                    max_workers=self.max_workers, thread_name_prefix="mpsystem-job"
+                )
+                logger.info(f"Background job runner started with {self.max_workers} workers")
+
+    def shutdown(self, wait: bool = False) -> None:
+        with self._lock:
+            if self._executor is not None:
+                self._executor.shutdown(wait=wait, cancel_futures=True)
+                self._executor = None
+                logger.info("Background job runner stopped")
+
+    def submit(self, job_id: int) -> None:
+        self.start()
+        with self._lock:
+            self._submitted.add(job_id)
+        self._executor.submit(self._run_in_thread, job_id)
+
+    async def resume_pending(self) -> int:
+        """Claim and submit unfinished jobs that are unclaimed or whose worker stopped heartbeating"""
+        async with WorkerSessionLocal() as db:
+            job_ids = await JobService.claim_unfinished_jobs(db, self.worker_id)
+
+        with self._lock:
+            job_ids = [job_id for job_id in job_ids if job_id not in self._submitted]
+        for job_id in job_ids:
+            self.submit(job_id)
+
+        if job_ids:
+            logger.info(f"Resumed {len(job_ids)} unfinished background jobs")
+        return len(job_ids)
+
+    async def heartbeat(self) -> int:
+        """Keep this worker's claims alive, then take over jobs whose worker died or released them"""
+        async with WorkerSessionLocal() as db:
+            alive = await JobService.heartbeat(db, self.worker_id)
+        await self.resume_pending()
+        return alive
+
+    async def release_claims(self) -> int:
+        """On shutdown: jobs not running here go back to the other workers straight away"""
+        with self._lock:
+            running = set(self._running)
+        async with WorkerSessionLocal() as db:
+            return await JobService.release_claims(db, self.worker_id, keep=running)
+
+    def _run_in_thread(self, job_id: int) -> None:
+        with self._lock:
+            self._running.add(job_id)
+        try:
+            asyncio.run(self._run(job_id))
+        except Exception:
+            logger.exception(f"Background job {job_id} crashed")
+        finally:
+            with self._lock:
+                self._running.discard(job_id)
+                self._submitted.discard(job_id)
+
+    async def _run(self, job_id: int) -> None:
+        async with WorkerSessionLocal() as db:
+            if not await JobService.claim_job(db, job_id, self.worker_id):
+                logger.info(f"Background job {job_id} is claimed by another worker")
+                return
+            job = await JobService.get_job(db, job_id)
+            if not job or job.status in (JobStatus.COMPLETED, JobStatus.FAILED):
+                return
+
+            handler = self._handlers.get(job.job_type)
+            if handler is None:
+                job.status = JobStatus.FAILED
+                job.error_message = f"No handler registered for job type {job.job_type}"
+                job.finished_at = datetime.utcnow()
+                await db.commit()
+                return
+
+            job.status = JobStatus.RUNNING
+            job.attempts += 1
+            job.started_at = job.started_at or datetime.utcnow()
+            await db.commit()
+
+            try:
+                await handler(db, job)
+                job.status = JobStatus.COMPLETED
+                job.finished_at = datetime.utcnow()
+                await db.commit()
+                logger.info(f"Background job {job_id} ({job.job_type}) completed: {job.processed_rows} rows")
+            except Exception as e:
+                logger.exception(f"Background job {job_id} ({job.job_type}) failed")
+                await db.rollback()
+                job = await JobService.get_job(db, job_id)
+                job.status = JobStatus.FAILED
+                job.error_message = str(e)
+                job.finished_at = datetime.utcnow()
+                await db.commit()
+
+
+job_runner = JobRunner(max_workers=settings.JOB_MAX_WORKERS)
+
+job_heartbeat = PeriodicTask("job-heartbeat", settings.JOB_HEARTBEAT_SECONDS, job_runner.heartbeat)
+
+
+async def _run_csv_import(
+    db: AsyncSession,
+    job: BackgroundJob,
+    import_rows: Callable[[AsyncSession, List[dict], int, ImportMode], Awaitable[CSVImportResult]],
+    fieldnames: List[str]
+) -> None:
+    """Import a spooled CSV chunk by chunk, committing progress with every chunk"""
+    options = job.options or {}
+    mode = ImportMode(options.get("mode", ImportMode.SKIP))
+    chunk_size = settings.IMPORT_CHUNK_SIZE
+
+    with open(job.file_path, newline="", encoding=options.get("encoding", "utf-8")) as f:
+        reader = CSVService.make_reader(
+            f, options.get("has_header", True), options.get("delimiter", ","), fieldnames
+        )
+
+        # Rows before processed_rows were committed by an earlier attempt
+        rows = itertools.islice(reader, job.processed_rows, None)
+        while chunk := list(itertools.islice(rows, chunk_size)):
+            result = await import_rows(db, chunk, job.processed_rows + 1, mode)
+            JobService.record_chunk(job, result)
+            await db.commit()
+
+    job.total_rows = job.processed_rows
+    job.result = {"success": not job.errors}
+    Path(job.file_path).unlink(missing_ok=True)
+
+
+@job_runner.register("IMPORT_MATERIALS")
+async def run_materials_import(db: AsyncSession, job: BackgroundJob) -> None:
+    await _run_csv_import(db, job, CSVService.import_material_rows, CSVService.MATERIAL_FIELDS)
+    invalidate_search(Material)
+
+
+@job_runner.register("IMPORT_SUPPLIERS")
+async def run_suppliers_import(db: AsyncSession, job: BackgroundJob) -> None:
+    await _run_csv_import(db, job, CSVService.import_supplier_rows, CSVService.SUPPLIER_FIELDS)
+    invalidate_search(Supplier)
+
+
+@job_runner.register("GENEALOGY_CLOSURE_REBUILD")
+async def run_genealogy_closure_rebuild(db: AsyncSession, job: BackgroundJob) -> None:
+    rows = await GenealogyClosureService.rebuild(db)
+    job.processed_rows = rows
+    job.total_rows = rows
+    job.result = {"closure_rows": rows}
+
+
+@job_runner.register("MRP_RUN")
+async def run_mrp(db: AsyncSession, job: BackgroundJob) -> None:
+    options = job.options or {}
+    result = await MRPService.run(
+        db,
+        horizon_days=options.get("horizon_days"),
+        bucket_days=options.get("bucket_days"),
+        mode=MRPRunMode(options.get("mode", MRPRunMode.FULL))
+    )
+    job.processed_rows = result.items_recomputed
+    job.total_rows = result.items
+    job.result = result.model_dump(mode="json")
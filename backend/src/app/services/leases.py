@@ -0,0 +1,40 @@
+"""
+Single-runner leases for periodic tasks
+
+Every worker process starts the same periodic tasks. Tasks that must run in
+one process only (a planner rewriting shared tables, an aggregator consuming
+a queue) take a lease first: a task_leases row naming the holding process and
+an expiry. The holder renews it on every run; when the holder dies, the lease
+expires and the next process to try takes it over.
+"""
+
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy import update, or_
+from datetime import datetime, timedelta
+import os
+import socket
+import uuid
+
+from app.models.jobs import TaskLease
+from app.utils.upsert import dialect_insert
+
+# Identifies this process in leases and job claims
+WORKER_ID = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+
+
+async def acquire_lease(db: AsyncSession, name: str, ttl_seconds: float) -> bool:
+    """Take or renew the named lease for this process; False while another process holds it"""
+    now = datetime.utcnow()
+    await db.execute(
+        dialect_insert(db.get_bind().dialect.name, TaskLease.__table__)
+        .values(name=name, holder=None, expires_at=now)
+        .on_conflict_do_nothing(index_elements=["name"])
+    )
+    result = await db.execute(
+        update(TaskLease)
+        .where(TaskLease.name == name, or_(TaskLease.holder == WORKER_ID, TaskLease.expires_at <= now))
+        .values(holder=WORKER_ID, expires_at=now + timedelta(seconds=ttl_seconds))
+        .execution_options(synchronize_session=False)
+    )
+    await db.commit()
+    return result.rowcount == 1
@@ -0,0 +1,100 @@
+"""
+Named eager-loading profiles for warehouse reads
+
+Callers choose how much of the object graph a read brings along:
+
+- MINIMAL: the row only, for writes that just need to modify columns
+- LIST: many-to-one references rendered by the response schemas, joined
+  into the same SELECT
+- DETAIL: LIST plus the child collections, one extra SELECT per collection
+"""
+
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy import select
+from sqlalchemy.orm import joinedload, selectinload
+from typing import Any, Callable, Dict, List, Optional, Tuple, Type
+from enum import Enum
+
+from app.models.warehouse import Supplier, Material, Batch, InventoryItem
+
+
+class LoadProfile(str, Enum):
+    MINIMAL = "minimal"
+    LIST = "list"
+    DETAIL = "detail"
+
+
+def _material_refs(material_path):
+    return (material_path.joinedload(Material.primary_supplier),)
+
+
+def _batch_refs(batch_path):
+    return (
+        batch_path.joinedload(Batch.material).joinedload(Material.primary_supplier),
+        batch_path.joinedload(Batch.supplier),
+    )
+
+
+# A profile missing for a model falls back to the next leaner one
+_PROFILES: Dict[Type[Any], Dict[LoadProfile, Callable[[], Tuple]]] = {
+    Supplier: {
+        LoadProfile.LIST: lambda: (),
+        LoadProfile.DETAIL: lambda: (selectinload(Supplier.materials),),
+    },
+    Material: {
+        LoadProfile.LIST: lambda: (joinedload(Material.primary_supplier),),
+        LoadProfile.DETAIL: lambda: (
+            joinedload(Material.primary_supplier),
+            selectinload(Material.batches),
+            selectinload(Material.inventory_items),
+        ),
+    },
+    Batch: {
+        LoadProfile.LIST: lambda: (
+            joinedload(Batch.material).joinedload(Material.primary_supplier),
+            joinedload(Batch.supplier),
+        ),
+        LoadProfile.DETAIL: lambda: (
+            joinedload(Batch.material).joinedload(Material.primary_supplier),
+            joinedload(Batch.supplier),
+            selectinload(Batch.inventory_items),
+        ),
+    },
+    InventoryItem: {
+        LoadProfile.LIST: lambda: (
+            joinedload(InventoryItem.warehouse),
+            *_material_refs(joinedload(InventoryItem.material)),
+            *_batch_refs(joinedload(InventoryItem.batch)),
+        ),
+    },
+}
+
+
+def load_options(model: Type[Any], profile: LoadProfile) -> List[Any]:
+    """Loader options implementing a profile for a model"""
+    profiles = _PROFILES[model]
+    if profile == LoadProfile.DETAIL and profile not in profiles:
+        profile = LoadProfile.LIST
+    if profile == LoadProfile.MINIMAL:
+        return []
+    return list(profiles[profile]())
+
+
+async def load_by_id(
+    db: AsyncSession,
+    model: Type[Any],
+    object_id: int,
+    profile: LoadProfile,
+    refresh: bool = False
+) -> Optional[Any]:
+    """
+    Load one row with a profile.
+
+    refresh re-reads an instance already in the session, e.g. after a bulk
+    UPDATE or a commit that changed server-side columns.
+    """
+    query = select(model).options(*load_options(model, profile)).where(model.id == object_id)
+    if refresh:
+        query = query.execution_options(populate_existing=True)
+    result = await db.execute(query)
+    return result.unique().scalar_one_or_none()
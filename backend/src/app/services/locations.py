@@ -0,0 +1,353 @@
+"""
+Storage locations (warehouse -> zone -> rack -> bin) and bin occupancy
+
+Bin and material lookups are served from an in-process OccupancyMap instead
+of scanning inventory_items. The map is loaded once, then kept current by
+reading only the stock movements recorded since its watermark (plus inventory
+rows changed in this process without a movement). Ids are assigned at insert
+but become visible at commit, so a movement can show up below the watermark
+after it moved on: every refresh re-reads the last OCCUPANCY_LATE_COMMIT_WINDOW
+ids below it and applies those not seen yet. A periodic full reload picks up
+changes made by other processes that bypass stock movements, and movements
+committed later than that window.
+"""
+
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy import select, func
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+import asyncio
+import heapq
+import math
+import time
+
+from app.core.config import settings
+from app.models.warehouse import StorageLocation, InventoryItem, StockMovement
+from app.schemas.warehouse import (
+    StorageLocationCreate, StorageLocation as StorageLocationSchema,
+    BinContentItem, BinContents, MaterialLocation, NearestBin
+)
+from app.utils.upsert import chunked
+
+Slot = Tuple[int, Optional[str]]  # (warehouse_id, location_code)
+
+
+class _Bin:
+    """Detached copy of a storage location row"""
+    __slots__ = ("id", "warehouse_id", "code", "zone", "rack", "bin", "x", "y",
+                 "level", "capacity", "is_active", "created_at")
+
+    def __init__(self, location: StorageLocation):
+        for name in self.__slots__:
+            setattr(self, name, getattr(location, name))
+
+
+class OccupancyMap:
+    """In-memory index of bin contents and material locations"""
+
+    EPSILON = 1e-9
+
+    def __init__(self, full_refresh_seconds: float):
+        self.full_refresh_seconds = full_refresh_seconds
+        self._bins: Dict[Slot, _Bin] = {}
+        self._empty: Dict[int, Set[str]] = {}  # warehouse_id -> codes of active empty bins
+        self._contents: Dict[Slot, Dict[int, Tuple[int, Optional[int], float]]] = {}  # item -> (material, batch, qty)
+        self._item_slot: Dict[int, Tuple[Slot, int]] = {}
+        self._material_slots: Dict[int, Dict[Slot, Set[int]]] = {}
+        self._dirty_items: Set[int] = set()
+        self._watermark = 0  # Highest stock_movements.id applied
+        self._seen: Set[int] = set()  # Movement ids applied within the late-commit window
+        self._loaded_at: Optional[float] = None
+        self._lock = asyncio.Lock()
+
+    # --- maintenance -------------------------------------------------------
+
+    def mark_dirty(self, inventory_item_ids: Iterable[int]) -> None:
+        """Re-read these inventory rows on the next refresh (changes without a stock movement)"""
+        self._dirty_items.update(inventory_item_ids)
+
+    def invalidate(self) -> None:
+        self._loaded_at = None
+
+    def add_bins(self, locations: Iterable[StorageLocation]) -> None:
+        if self._loaded_at is None:
+            return
+        for location in locations:
+            self._add_bin(_Bin(location))
+
+    async def ensure_fresh(self, db: AsyncSession) -> None:
+        async with self._lock:
+            if self._loaded_at is None or time.monotonic() - self._loaded_at > self.full_refresh_seconds:
+                await self._load_all(db)
+            else:
+                await self._refresh_incremental(db)
+
+    async def _load_all(self, db: AsyncSession) -> None:
+        # Read the watermark and the movements already committed below it before the rows: anything
+        # committed later is not in _seen and is re-applied next time (re-applying an item is idempotent)
+        watermark = await db.scalar(select(func.coalesce(func.max(StockMovement.id), 0)))
+        seen = set(
+            (await db.execute(
+                select(StockMovement.id).where(
+                    StockMovement.id > watermark - settings.OCCUPANCY_LATE_COMMIT_WINDOW,
+                    StockMovement.id <= watermark
+                )
+            )).scalars()
+        )
+
+        self._bins.clear()
+        self._empty.clear()
+        self._contents.clear()
+        self._item_slot.clear()
+        self._material_slots.clear()
+        self._dirty_items.clear()
+
+        for location in (await db.execute(select(StorageLocation))).scalars():
+            self._add_bin(_Bin(location))
+
+        result = await db.stream(
+            select(
+                InventoryItem.id, InventoryItem.warehouse_id, InventoryItem.location_code,
+                InventoryItem.material_id, InventoryItem.batch_id, InventoryItem.quantity
+            )
+            .where(InventoryItem.quantity > 0)
+            .execution_options(yield_per=settings.EXPORT_CHUNK_SIZE)
+        )
+        async for row in result:
+            self._apply_item(*row)
+
+        self._seen = seen
+        self._watermark = watermark
+        self._loaded_at = time.monotonic()
+
+    async def _refresh_incremental(self, db: AsyncSession) -> None:
+        floor = self._watermark - settings.OCCUPANCY_LATE_COMMIT_WINDOW
+        result = await db.execute(
+            select(StockMovement.id, StockMovement.inventory_item_id).where(StockMovement.id > floor)
+        )
+        new = [(movement_id, item_id) for movement_id, item_id in result.all() if movement_id not in self._seen]
+        item_ids = {item_id for _, item_id in new} | self._dirty_items
+        if new:
+            self._watermark = max(self._watermark, max(movement_id for movement_id, _ in new))
+            self._seen.update(movement_id for movement_id, _ in new)
+            floor = self._watermark - settings.OCCUPANCY_LATE_COMMIT_WINDOW
+            self._seen = {movement_id for movement_id in self._seen if movement_id > floor}
+        if not item_ids:
+            return
+
+        found = set()
+        for ids in chunked(sorted(item_ids), 500):
+            rows = await db.execute(
+                select(
+                    InventoryItem.id, InventoryItem.warehouse_id, InventoryItem.location_code,
+                    InventoryItem.material_id, InventoryItem.batch_id, InventoryItem.quantity
+                )
+                .where(InventoryItem.id.in_(ids))
+            )
+            for row in rows:
+                found.add(row.id)
+                self._apply_item(*row)
+
+        for item_id in item_ids - found:
+            self._remove_item(item_id)
+
+        self._dirty_items.clear()
+
+    def _add_bin(self, location: _Bin) -> None:
+        slot = (location.warehouse_id, location.code)
+        self._bins[slot] = location
+        empty = self._empty.setdefault(location.warehouse_id, set())
+        if location.is_active and slot not in self._contents:
+            empty.add(location.code)
+        else:
+            empty.discard(location.code)
+
+    def _apply_item(
+        self,
+        item_id: int,
+        warehouse_id: int,
+        location_code: Optional[str],
+        material_id: int,
+        batch_id: Optional[int],
+        quantity: float
+    ) -> None:
+        self._remove_item(item_id)
+        if quantity is None or quantity <= self.EPSILON:
+            return
+
+        slot = (warehouse_id, location_code)
+        self._contents.setdefault(slot, {})[item_id] = (material_id, batch_id, quantity)
+        self._item_slot[item_id] = (slot, material_id)
+        self._material_slots.setdefault(material_id, {}).setdefault(slot, set()).add(item_id)
+        if location_code is not None:
+            self._empty.get(warehouse_id, set()).discard(location_code)
+
+    def _remove_item(self, item_id: int) -> None:
+        entry = self._item_slot.pop(item_id, None)
+        if entry is None:
+            return
+        slot, material_id = entry
+
+        contents = self._contents[slot]
+        contents.pop(item_id, None)
+        if not contents:
+            del self._contents[slot]
+            location = self._bins.get(slot)
+            if location is not None and location.is_active:
+                self._empty.setdefault(slot[0], set()).add(slot[1])
+
+        slots = self._material_slots[material_id]
+        slots[slot].discard(item_id)
+        if not slots[slot]:
+            del slots[slot]
+        if not slots:
+            del self._material_slots[material_id]
+
+    # --- lookups -----------------------------------------------------------
+
+    def bin_contents(self, warehouse_id: int, location_code: str) -> BinContents:
+        slot = (warehouse_id, location_code)
+        location = self._bins.get(slot)
+        items = [
+            BinContentItem(inventory_item_id=item_id, material_id=material_id, batch_id=batch_id, quantity=quantity)
+            for item_id, (material_id, batch_id, quantity) in sorted(self._contents.get(slot, {}).items())
+        ]
+        return BinContents(
+            warehouse_id=warehouse_id,
+            location_code=location_code,
+            location=StorageLocationSchema.model_validate(location) if location else None,
+            total_quantity=sum(item.quantity for item in items),
+            items=items
+        )
+
+    def material_locations(self, material_id: int, warehouse_id: Optional[int] = None) -> List[MaterialLocation]:
+        locations = []
+        for slot, item_ids in self._material_slots.get(material_id, {}).items():
+            if warehouse_id is not None and slot[0] != warehouse_id:
+                continue
+            contents = self._contents[slot]
+            locations.append(MaterialLocation(
+                warehouse_id=slot[0],
+                location_code=slot[1],
+                quantity=sum(contents[item_id][2] for item_id in item_ids),
+                inventory_item_ids=sorted(item_ids)
+            ))
+        return sorted(locations, key=lambda loc: (loc.warehouse_id, loc.location_code or ""))
+
+    def nearest_empty(
+        self,
+        warehouse_id: int,
+        from_code: Optional[str] = None,
+        zone: Optional[str] = None,
+        min_capacity: Optional[float] = None,
+        limit: int = 5
+    ) -> List[NearestBin]:
+        """Empty active bins closest to from_code (floor distance, then shelf level)"""
+        origin = self._bins.get((warehouse_id, from_code)) if from_code else None
+        if from_code and origin is None:
+            raise ValueError(f"Unknown location {from_code} in warehouse {warehouse_id}")
+
+        def distance(location: _Bin) -> Optional[float]:
+            if origin is None or None in (origin.x, origin.y, location.x, location.y):
+                return None
+            return math.hypot(location.x - origin.x, location.y - origin.y)
+
+        def sort_key(location: _Bin):
+            dist = distance(location)
+            same_zone = origin is not None and location.zone == origin.zone
+            return (dist is None, dist or 0.0, not same_zone, location.level, location.code)
+
+        candidates = []
+        for code in self._empty.get(warehouse_id, ()):
+            location = self._bins[(warehouse_id, code)]
+            if zone and location.zone != zone:
+                continue
+            if min_capacity is not None and location.capacity is not None and location.capacity < min_capacity:
+                continue
+            candidates.append(location)
+
+        return [
+            NearestBin(location=StorageLocationSchema.model_validate(location), distance=distance(location))
+            for location in heapq.nsmallest(limit, candidates, key=sort_key)
+        ]
+
+
+occupancy_map = OccupancyMap(full_refresh_seconds=settings.OCCUPANCY_FULL_REFRESH_SECONDS)
+
+
+class LocationService:
+    """Service for storage locations and bin lookups"""
+
+    @staticmethod
+    async def get_locations(
+        db: AsyncSession,
+        warehouse_id: int,
+        zone: Optional[str] = None,
+        rack: Optional[str] = None,
+        skip: int = 0,
+        limit: int = 100
+    ) -> List[StorageLocation]:
+        query = (
+            select(StorageLocation)
+            .where(StorageLocation.warehouse_id == warehouse_id)
+            .order_by(StorageLocation.zone, StorageLocation.rack, StorageLocation.bin)
+            .offset(skip)
+            .limit(limit)
+        )
+
+        if zone:
+            query = query.where(StorageLocation.zone == zone)
+
+        if rack:
+            query = query.where(StorageLocation.rack == rack)
+
+        result = await db.execute(query)
+        return result.scalars().all()
+
+    @staticmethod
+    async def create_locations(db: AsyncSession, locations: List[StorageLocationCreate]) -> List[StorageLocation]:
+        keys = [(location.warehouse_id, location.code) for location in locations]
+        if len(set(keys)) != len(keys):
+            raise ValueError("Duplicate location codes in request")
+
+        existing = await db.execute(
+            select(StorageLocation.warehouse_id, StorageLocation.code)
+            .where(StorageLocation.code.in_({code for _, code in keys}))
+        )
+        duplicates = set(keys) & set(existing.all())
+        if duplicates:
+            raise ValueError(f"Locations already exist: {', '.join(sorted(code for _, code in duplicates))}")
+
+        db_locations = [StorageLocation(**location.model_dump()) for location in locations]
+        db.add_all(db_locations)
+        await db.commit()
+        for db_location in db_locations:
+            await db.refresh(db_location)
+
+        occupancy_map.add_bins(db_locations)
+        return db_locations
+
+    @staticmethod
+    async def get_bin_contents(db: AsyncSession, warehouse_id: int, location_code: str) -> BinContents:
+        await occupancy_map.ensure_fresh(db)
+        return occupancy_map.bin_contents(warehouse_id, location_code)
+
+    @staticmethod
+    async def get_material_locations(
+        db: AsyncSession, material_id: int, warehouse_id: Optional[int] = None
+    ) -> List[MaterialLocation]:
+        await occupancy_map.ensure_fresh(db)
+        return occupancy_map.material_locations(material_id, warehouse_id)
+
+    @staticmethod
+    async def find_nearest_empty_bins(
+        db: AsyncSession,
+        warehouse_id: int,
+        from_code: Optional[str] = None,
+        zone: Optional[str] = None,
+        min_capacity: Optional[float] = None,
+        limit: int = 5
+    ) -> List[NearestBin]:
+        await occupancy_map.ensure_fresh(db)
+        return occupancy_map.nearest_empty(
+            warehouse_id, from_code=from_code, zone=zone, min_capacity=min_capacity, limit=limit
+        )
@@ -0,0 +1,624 @@
+"""
+Material Requirements Planning
+
+A run explodes open production order lines through Product.bom -> BOMLine
+into time-bucketed requirements per material and nets them against on-hand
+stock, open purchase order lines and safety stock (Material.min_stock_level).
+Components whose Material.code matches a Product.code with a BOM are
+sub-assemblies: their net requirement is planned as production and exploded
+further instead of being purchased.
+
+Everything is computed on numpy arrays indexed by item (rows) and time bucket
+(columns). Items are processed by low-level code, the deepest level at which
+they appear in any BOM, so an item is netted only once all of its demand is
+known. Each level is a handful of array operations, whatever the number of
+order lines.
+
+Net-change runs recompute only what changed. Flushes touching orders, BOMs,
+stock, batches or purchase order lines queue the affected items in
+mrp_dirty_items; a net-change run takes the queue, recomputes those items
+and everything below them in the BOM, and upserts their open requirements.
+A full regeneration still runs daily to catch changes made outside the ORM.
+The scheduled runs happen in one worker process, the holder of the planner
+lease.
+"""
+
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy import select, delete, insert, func, and_, or_, literal, inspect, event
+from sqlalchemy.orm import Session
+from typing import Any, Dict, List, NamedTuple, Optional, Sequence, Tuple
+from datetime import datetime, timedelta
+import logging
+import time
+
+import numpy as np
+
+from app.core.config import settings
+from app.db.database import AsyncSessionLocal
+from app.models.base import OrderStatus, POStatus, QualityStatus
+from app.models.production import Product, BOM, BOMLine, ProductionOrder, ProductionOrderLine
+from app.models.procurement import (
+    PurchaseOrder, PurchaseOrderLine, MRPRequirement, MRPDirtyItem, ContractPricing, MRP_OPEN_REQUIREMENT
+)
+from app.models.warehouse import Material, InventoryItem, Batch
+from app.schemas.procurement import MRPRunMode, MRPRunResult
+from app.services.leases import acquire_lease
+from app.utils.periodic import PeriodicTask
+from app.utils.upsert import chunked, upsert_statement
+
+logger = logging.getLogger(__name__)
+
+OPEN_ORDER_STATUSES = (OrderStatus.NEW, OrderStatus.PLANNED, OrderStatus.IN_PRODUCTION)
+OPEN_PO_STATUSES = (POStatus.SENT, POStatus.CONFIRMED, POStatus.IN_TRANSIT)
+UNUSABLE_STOCK = (QualityStatus.BLOCKED, QualityStatus.QUARANTINE)
+
+
+class MRPPlan(NamedTuple):
+    levels: np.ndarray   # Low-level code per item
+    gross: np.ndarray    # items x buckets, independent + dependent demand
+    planned: np.ndarray  # items x buckets, net requirement (planned orders)
+
+
+class BOMCycleError(ValueError):
+    """BOM lines lead back to an item being made, so the structure has no low-level codes"""
+
+    def __init__(self, items: np.ndarray, bom_ids: Sequence[int] = ()):
+        self.items = items
+        self.bom_ids = sorted(bom_ids)
+        if self.bom_ids:
+            super().__init__(f"BOM structure contains a cycle through BOMs {', '.join(map(str, self.bom_ids))}")
+        else:
+            super().__init__("BOM structure contains a cycle")
+
+
+class MRPEngine:
+    """Level-by-level gross-to-net explosion on dense item x bucket arrays"""
+
+    def __init__(self, n_items: int, n_buckets: int):
+        self.n_items = n_items
+        self.n_buckets = n_buckets
+        self.on_hand = np.zeros(n_items)
+        self.safety_stock = np.zeros(n_items)
+        self.receipts = np.zeros((n_items, n_buckets))
+        self.demand = np.zeros((n_items, n_buckets))
+        self.parents = np.zeros(0, dtype=np.int64)
+        self.children = np.zeros(0, dtype=np.int64)
+        self.factors = np.zeros(0)
+
+    def add_demand(self, items: np.ndarray, buckets: np.ndarray, quantities: np.ndarray) -> None:
+        np.add.at(self.demand, (items, buckets), quantities)
+
+    def add_receipts(self, items: np.ndarray, buckets: np.ndarray, quantities: np.ndarray) -> None:
+        np.add.at(self.receipts, (items, buckets), quantities)
+
+    def set_structure(self, parents: np.ndarray, children: np.ndarray, factors: np.ndarray) -> None:
+        """BOM edges: one unit of parent consumes factor units of child"""
+        self.parents = parents.astype(np.int64)
+        self.children = children.astype(np.int64)
+        self.factors = factors.astype(float)
+
+    def low_level_codes(self) -> np.ndarray:
+        levels = np.zeros(self.n_items, dtype=np.int64)
+        for _ in range(self.n_items + 1):
+            pushed = levels.copy()
+            np.maximum.at(pushed, self.children, levels[self.parents] + 1)
+            if np.array_equal(pushed, levels):
+                return levels
+            levels = pushed
+        raise BOMCycleError(self.cycle_items())
+
+    def cycle_items(self) -> np.ndarray:
+        """Items on a cycle (or between cycles): what is left after peeling off items without parents or children"""
+        alive = np.ones(self.n_items, dtype=bool)
+        while True:
+            edges = alive[self.parents] & alive[self.children]
+            has_parent = np.zeros(self.n_items, dtype=bool)
+            has_parent[self.children[edges]] = True
+            has_child = np.zeros(self.n_items, dtype=bool)
+            has_child[self.parents[edges]] = True
+            keep = alive & has_parent & has_child
+            if np.array_equal(keep, alive):
+                return np.flatnonzero(alive)
+            alive = keep
+
+    def run(self) -> MRPPlan:
+        levels = self.low_level_codes()
+        gross = self.demand.copy()
+        planned = np.zeros_like(gross)
+        edge_levels = levels[self.parents]
+
+        for level in range(int(levels.max(initial=0)) + 1):
+            rows = np.flatnonzero(levels == level)
+            if rows.size == 0:
+                continue
+
+            # Cumulative shortage against stock + scheduled receipts, kept monotone so
+            # a later receipt never cancels an order an earlier bucket already needed
+            need = (
+                np.cumsum(gross[rows], axis=1)
+                + self.safety_stock[rows, None]
+                - self.on_hand[rows, None]
+                - np.cumsum(self.receipts[rows], axis=1)
+            )
+            shortage = np.maximum.accumulate(np.maximum(need, 0.0), axis=1)
+            planned[rows] = np.diff(shortage, axis=1, prepend=0.0)
+
+            edges = np.flatnonzero(edge_levels == level)
+            if edges.size:
+                np.add.at(
+                    gross, self.children[edges],
+                    planned[self.parents[edges]] * self.factors[edges, None]
+                )
+
+        return MRPPlan(levels=levels, gross=gross, planned=planned)
+
+
+# What a flushed row changes for planning: (item_type, attribute naming the item) per model
+_DIRTY_SOURCES: Dict[type, Tuple[Tuple[str, str], ...]] = {
+    Material: (("material", "id"),),
+    InventoryItem: (("material", "material_id"),),
+    Batch: (("material", "material_id"),),
+    # Old values are queued too, so switching a product's BOM replans the old BOM's components
+    Product: (("product", "id"), ("bom", "bom_id")),
+    BOM: (("bom", "id"),),
+    BOMLine: (("bom", "bom_id"), ("material", "material_id")),
+    ProductionOrder: (("order", "id"),),
+    ProductionOrderLine: (("product", "product_id"),),
+    PurchaseOrder: (("purchase_order", "id"),),
+    PurchaseOrderLine: (("material", "material_id"),),
+    ContractPricing: (("material", "material_id"),),  # Lead times move due dates
+}
+
+
+@event.listens_for(Session, "after_flush")
+def _queue_mrp_changes(session: Session, flush_context: Any) -> None:
+    """Queue the planning items touched by a flush for the next net-change run"""
+    queued = set()
+    for obj in (*session.new, *session.dirty, *session.deleted):
+        sources = _DIRTY_SOURCES.get(type(obj))
+        if sources is None or (obj in session.dirty and not session.is_modified(obj)):
+            continue
+        state = inspect(obj)
+        for item_type, attribute in sources:
+            # Old values too: a line moved to another product changes both
+            for value in (getattr(obj, attribute), *state.attrs[attribute].history.deleted):
+                if value is not None:
+                    queued.add((item_type, value))
+
+    if queued:
+        session.connection().execute(
+            insert(MRPDirtyItem.__table__),
+            [{"item_type": item_type, "item_id": item_id} for item_type, item_id in queued]
+        )
+
+
+class BOMStructure(NamedTuple):
+    """Item space for BOM explosion: materials first, then products not stocked as a material"""
+    materials: List[Any]
+    item_of_material: Dict[int, int]
+    item_of_product: Dict[int, int]
+    items_of_bom: Dict[int, List[int]]
+    made: np.ndarray  # Items produced from a BOM
+    parents: np.ndarray
+    children: np.ndarray
+    factors: np.ndarray
+
+    def cycle_error(self, error: BOMCycleError) -> BOMCycleError:
+        """The same error naming the BOMs of the items on the cycle"""
+        on_cycle = set(error.items.tolist())
+        return BOMCycleError(
+            error.items,
+            [bom_id for bom_id, items in self.items_of_bom.items() if on_cycle.intersection(items)]
+        )
+
+
+def read_bom_structure(session: Session) -> BOMStructure:
+    """Items and single-level BOM edges; a material whose code is a product with a BOM is a sub-assembly"""
+    materials = session.execute(
+        select(Material.id, Material.code, Material.min_stock_level).order_by(Material.id)
+    ).all()
+    item_of_material = {row.id: index for index, row in enumerate(materials)}
+    item_of_code = {row.code: index for index, row in enumerate(materials)}
+    n_items = len(materials)
+
+    products = session.execute(
+        select(Product.id, Product.code, BOM.id.label("bom_id"), BOM.base_quantity)
+        .outerjoin(BOM, and_(BOM.id == Product.bom_id, BOM.is_active == True))
+    ).all()
+    item_of_product: Dict[int, int] = {}
+    bom_of_item: Dict[int, Tuple[int, float]] = {}
+    for row in products:
+        item = item_of_code.get(row.code)
+        if item is None:
+            item = n_items
+            n_items += 1
+        item_of_product[row.id] = item
+        if row.bom_id is not None:
+            bom_of_item[item] = (row.bom_id, row.base_quantity or 1.0)
+
+    items_of_bom: Dict[int, List[int]] = {}
+    for item, (bom_id, _) in bom_of_item.items():
+        items_of_bom.setdefault(bom_id, []).append(item)
+
+    lines = session.execute(
+        select(BOMLine.bom_id, BOMLine.material_id, BOMLine.quantity, BOMLine.scrap_factor)
+        .where(BOMLine.bom_id.in_(items_of_bom))
+    ).all()
+    parents, children, factors = [], [], []
+    for line in lines:
+        for item in items_of_bom[line.bom_id]:
+            parents.append(item)
+            children.append(item_of_material[line.material_id])
+            # scrap_factor is a percentage added for waste
+            factors.append(line.quantity * (1.0 + (line.scrap_factor or 0.0) / 100.0) / bom_of_item[item][1])
+
+    made = np.zeros(n_items, dtype=bool)
+    made[list(bom_of_item)] = True
+    return BOMStructure(
+        materials=materials,
+        item_of_material=item_of_material,
+        item_of_product=item_of_product,
+        items_of_bom=items_of_bom,
+        made=made,
+        parents=np.array(parents, dtype=np.int64),
+        children=np.array(children, dtype=np.int64),
+        factors=np.array(factors, dtype=float),
+    )
+
+
+async def load_bom_structure(db: AsyncSession) -> BOMStructure:
+    return await db.run_sync(read_bom_structure)
+
+
+def read_usable_stock(session: Session, material_ids: Optional[List[int]] = None) -> Dict[int, float]:
+    """On-hand quantity per material, blocked and quarantined batches left out"""
+    query = (
+        select(InventoryItem.material_id, func.sum(InventoryItem.quantity))
+        .outerjoin(Batch, Batch.id == InventoryItem.batch_id)
+        .where(or_(Batch.id.is_(None), Batch.quality_status.not_in(UNUSABLE_STOCK)))
+        .group_by(InventoryItem.material_id)
+    )
+    if material_ids is not None:
+        query = query.where(InventoryItem.material_id.in_(material_ids))
+    return dict(session.execute(query).all())
+
+
+def read_open_receipts(session: Session, material_ids: Optional[List[int]] = None) -> List[Any]:
+    """(material_id, quantity_remaining, due_date) of open purchase order lines"""
+    query = (
+        select(
+            PurchaseOrderLine.material_id,
+            PurchaseOrderLine.quantity_remaining,
+            func.coalesce(
+                PurchaseOrderLine.requested_delivery_date,
+                PurchaseOrder.confirmed_delivery_date,
+                PurchaseOrder.requested_delivery_date
+            ).label("due_date")
+        )
+        .join(PurchaseOrder, PurchaseOrder.id == PurchaseOrderLine.purchase_order_id)
+        .where(PurchaseOrder.status.in_(OPEN_PO_STATUSES), PurchaseOrderLine.quantity_remaining > 0)
+    )
+    if material_ids is not None:
+        query = query.where(PurchaseOrderLine.material_id.in_(material_ids))
+    return session.execute(query).all()
+
+
+def _reach(start: np.ndarray, sources: np.ndarray, targets: np.ndarray) -> np.ndarray:
+    """Items reachable from the start mask along source -> target edges, start included"""
+    reached = start.copy()
+    while True:
+        grown = reached.copy()
+        grown[targets[reached[sources]]] = True
+        if np.array_equal(grown, reached):
+            return reached
+        reached = grown
+
+
+class MRPService:
+    """Service for MRP runs and their requirements"""
+
+    WRITE_CHUNK = 500
+
+    @staticmethod
+    def _priority(due_date: datetime, today: datetime) -> str:
+        days = (due_date - today).days
+        if days < 0:
+            return "critical"
+        if days <= 7:
+            return "high"
+        if days <= 30:
+            return "medium"
+        return "low"
+
+    @staticmethod
+    async def _claim_dirty(db: AsyncSession) -> Dict[str, set]:
+        """
+        Take the queued changes: DELETE ... RETURNING claims exactly the rows
+        deleted, so a change committed while the run is going is left for the
+        next one whatever its id. Rolling the run back puts them back.
+        """
+        queued: Dict[str, set] = {}
+        result = await db.execute(delete(MRPDirtyItem).returning(MRPDirtyItem.item_type, MRPDirtyItem.item_id))
+        for item_type, item_id in result:
+            queued.setdefault(item_type, set()).add(item_id)
+        return queued
+
+    @staticmethod
+    async def _dirty_items(db: AsyncSession, structure: BOMStructure, queued: Dict[str, set]) -> np.ndarray:
+        """Mask of items named by the queued changes"""
+        product_ids = set(queued.get("product", ()))
+        material_ids = set(queued.get("material", ()))
+        if queued.get("order"):
+            result = await db.execute(
+                select(ProductionOrderLine.product_id)
+                .where(ProductionOrderLine.production_order_id.in_(queued["order"]))
+            )
+            product_ids.update(result.scalars())
+        if queued.get("purchase_order"):
+            result = await db.execute(
+                select(PurchaseOrderLine.material_id)
+                .where(PurchaseOrderLine.purchase_order_id.in_(queued["purchase_order"]))
+            )
+            material_ids.update(result.scalars())
+        if queued.get("bom"):
+            # A deactivated or replaced BOM is gone from the structure; its components and products are not
+            for ids in chunked(list(queued["bom"]), MRPService.WRITE_CHUNK):
+                result = await db.execute(select(BOMLine.material_id).where(BOMLine.bom_id.in_(ids)))
+                material_ids.update(result.scalars())
+                result = await db.execute(select(Product.id).where(Product.bom_id.in_(ids)))
+                product_ids.update(result.scalars())
+
+        dirty = np.zeros(structure.made.size, dtype=bool)
+        dirty[[structure.item_of_material[i] for i in material_ids if i in structure.item_of_material]] = True
+        dirty[[structure.item_of_product[i] for i in product_ids if i in structure.item_of_product]] = True
+        for bom_id in queued.get("bom", ()):
+            dirty[structure.items_of_bom.get(bom_id, [])] = True
+        return dirty
+
+    @staticmethod
+    async def mark_dirty(db: AsyncSession, item_type: str, ids_query) -> None:
+        """Queue items for the next net-change run from a SELECT of ids (for bulk statements the
+        flush listener does not see)"""
+        await db.execute(
+            insert(MRPDirtyItem).from_select(
+                ["item_type", "item_id"],
+                select(literal(item_type), ids_query.subquery().c[0])
+            )
+        )
+
+    @staticmethod
+    async def run(
+        db: AsyncSession,
+        horizon_days: Optional[int] = None,
+        bucket_days: Optional[int] = None,
+        mode: MRPRunMode = MRPRunMode.FULL
+    ) -> MRPRunResult:
+        """
+        Plan requirements from open production orders.
+
+        FULL regenerates every material. NET_CHANGE only recomputes the items
+        affected by changes queued since the last run (their BOM descendants
+        included), reading just the demand and supply of those items and of
+        the parents feeding them.
+        """
+        started = time.perf_counter()
+        horizon_days = horizon_days or settings.MRP_HORIZON_DAYS
+        bucket_days = bucket_days or settings.MRP_BUCKET_DAYS
+        today = datetime.utcnow().replace(hour=0, minute=0, second=0, microsecond=0)
+        n_buckets = -(-horizon_days // bucket_days)
+        run_reference = f"MRP-{datetime.utcnow():%Y%m%d%H%M%S%f}"[:50]
+
+        def buckets_of(dates: List[Optional[datetime]]) -> np.ndarray:
+            # Past due and undated go to the first bucket, beyond the horizon to the last
+            days = np.array([(d - today).days if d is not None else 0 for d in dates], dtype=np.int64)
+            return np.clip(days // bucket_days, 0, n_buckets - 1)
+
+        # A full run covers every queued change too
+        queued = await MRPService._claim_dirty(db)
+
+        structure = await load_bom_structure(db)
+        materials = structure.materials
+        n_items = structure.made.size
+        engine = MRPEngine(n_items, n_buckets)
+        engine.set_structure(structure.parents, structure.children, structure.factors)
+
+        if mode == MRPRunMode.NET_CHANGE:
+            dirty = await MRPService._dirty_items(db, structure, queued)
+            affected = _reach(dirty, structure.parents, structure.children)
+            needed = _reach(affected, structure.children, structure.parents)
+        else:
+            affected = needed = np.ones(n_items, dtype=bool)
+
+        needed_materials = [row.id for item, row in enumerate(materials) if needed[item]]
+        needed_products = [p for p, item in structure.item_of_product.items() if needed[item]]
+        scoped = mode == MRPRunMode.NET_CHANGE
+
+        # --- independent demand -------------------------------------------------
+        order_lines = []
+        if needed_products:
+            query = (
+                select(
+                    ProductionOrderLine.product_id,
+                    ProductionOrderLine.quantity_remaining,
+                    func.coalesce(
+                        ProductionOrderLine.requested_delivery_date,
+                        ProductionOrder.requested_delivery_date,
+                        ProductionOrder.order_date
+                    ).label("need_date")
+                )
+                .join(ProductionOrder, ProductionOrder.id == ProductionOrderLine.production_order_id)
+                .where(
+                    ProductionOrder.status.in_(OPEN_ORDER_STATUSES),
+                    ProductionOrderLine.quantity_remaining > 0
+                )
+            )
+            if scoped:
+                query = query.where(ProductionOrderLine.product_id.in_(needed_products))
+            order_lines = (await db.execute(query)).all()
+        if order_lines:
+            engine.add_demand(
+                np.array([structure.item_of_product[row.product_id] for row in order_lines]),
+                buckets_of([row.need_date for row in order_lines]),
+                np.array([row.quantity_remaining for row in order_lines], dtype=float)
+            )
+
+        # --- supply ---------------------------------------------------------------
+        if needed_materials:
+            scope = needed_materials if scoped else None
+            # Reserved stock stays on hand: reservations serve the same orders counted as demand
+            for material_id, quantity in (await db.run_sync(read_usable_stock, scope)).items():
+                engine.on_hand[structure.item_of_material[material_id]] = max(quantity or 0.0, 0.0)
+
+            receipts = await db.run_sync(read_open_receipts, scope)
+            if receipts:
+                engine.add_receipts(
+                    np.array([structure.item_of_material[row.material_id] for row in receipts]),
+                    buckets_of([row.due_date for row in receipts]),
+                    np.array([row.quantity_remaining for row in receipts], dtype=float)
+                )
+
+        for item, row in enumerate(materials):
+            engine.safety_stock[item] = row.min_stock_level or 0.0
+
+        lead_times = dict((await db.execute(
+            select(ContractPricing.material_id, func.min(ContractPricing.standard_lead_time_days))
+            .where(ContractPricing.is_active == True)
+            .group_by(ContractPricing.material_id)
+        )).all())
+
+        # --- explode and write ----------------------------------------------------
+        try:
+            plan = engine.run()
+        except BOMCycleError as e:
+            raise structure.cycle_error(e) from None
+
+        material_items = np.arange(len(materials))
+        written = material_items[affected[material_items] & ~structure.made[material_items]]
+
+        rows = []
+        item_rows, bucket_cols = np.nonzero(plan.planned[written] > 1e-9)
+        for row_index, bucket in zip(item_rows.tolist(), bucket_cols.tolist()):
+            item = int(written[row_index])
+            material = materials[item]
+            requirement_date = today + timedelta(days=bucket * bucket_days)
+            lead_time = lead_times.get(material.id)
+            due_date = requirement_date - timedelta(days=lead_time or 0)
+            gross = float(plan.gross[item, bucket])
+            rows.append({
+                "material_id": material.id,
+                "required_quantity": gross,
+                "current_stock": float(engine.on_hand[item]),
+                "quantity_to_order": float(plan.planned[item, bucket]),
+                "requirement_date": requirement_date,
+                "due_date": due_date,
+                "priority": MRPService._priority(due_date, today),
+                "source_type": "PRODUCTION_ORDER" if gross > 1e-9 else "MIN_STOCK",
+                "source_reference": run_reference,
+                "is_fulfilled": False,
+                "safety_stock": float(engine.safety_stock[item]),
+                "lead_time_days": lead_time,
+            })
+
+        if rows:
+            await db.execute(
+                upsert_statement(
+                    db.get_bind().dialect.name, MRPRequirement.__table__, None,
+                    index_elements=["material_id", "requirement_date"],
+                    index_where=MRP_OPEN_REQUIREMENT,
+                    update_columns=[key for key in rows[0] if key not in ("material_id", "requirement_date")]
+                ),
+                rows
+            )
+
+        # Open requirements of recomputed materials this run did not produce are obsolete
+        stale = and_(MRP_OPEN_REQUIREMENT, MRPRequirement.source_reference != run_reference)
+        if scoped:
+            removed = 0
+            scope_ids = [materials[item].id for item in material_items[affected[material_items]].tolist()]
+            for ids in chunked(scope_ids, MRPService.WRITE_CHUNK):
+                result = await db.execute(delete(MRPRequirement).where(stale, MRPRequirement.material_id.in_(ids)))
+                removed += result.rowcount
+        else:
+            removed = (await db.execute(delete(MRPRequirement).where(stale))).rowcount
+
+        await db.commit()
+
+        return MRPRunResult(
+            run_reference=run_reference,
+            mode=mode,
+            order_lines=len(order_lines),
+            items=n_items,
+            items_recomputed=int(np.count_nonzero(affected)),
+            levels=int(plan.levels.max(initial=0)) + 1,
+            buckets=n_buckets,
+            requirements_written=len(rows),
+            requirements_removed=removed,
+            planned_production_items=int(np.count_nonzero(plan.planned[structure.made & affected].sum(axis=1) > 1e-9)),
+            total_quantity_to_order=float(sum(row["quantity_to_order"] for row in rows)),
+            duration_ms=round((time.perf_counter() - started) * 1000, 1)
+        )
+
+    @staticmethod
+    async def get_requirements(
+        db: AsyncSession,
+        material_id: Optional[int] = None,
+        priority: Optional[str] = None,
+        include_fulfilled: bool = False,
+        skip: int = 0,
+        limit: int = 100
+    ) -> List[MRPRequirement]:
+        query = (
+            select(MRPRequirement)
+            .order_by(MRPRequirement.due_date, MRPRequirement.material_id)
+            .offset(skip)
+            .limit(limit)
+        )
+
+        if material_id:
+            query = query.where(MRPRequirement.material_id == material_id)
+
+        if priority:
+            query = query.where(MRPRequirement.priority == priority)
+
+        if not include_fulfilled:
+            query = query.where(MRPRequirement.is_fulfilled == False)
+
+        result = await db.execute(query)
+        return result.scalars().all()
+
+
+_last_full_run: Optional[float] = None
+
+
+async def run_scheduled_mrp() -> None:
+    """
+    Net-change run on every tick, full regeneration when the last one is older than the interval.
+
+    Only the worker process holding the planner lease runs, so starting
+    several workers does not start several full regenerations.
+    """
+    global _last_full_run
+    now = time.monotonic()
+    full_due = _last_full_run is None or now - _last_full_run >= settings.MRP_FULL_RUN_INTERVAL_HOURS * 3600
+    async with AsyncSessionLocal() as db:
+        if not await acquire_lease(db, "mrp-planner", settings.MRP_NET_CHANGE_INTERVAL_SECONDS * 3):
+            return
+        if full_due:
+            result = await MRPService.run(db, mode=MRPRunMode.FULL)
+            _last_full_run = now
+        elif await db.scalar(select(MRPDirtyItem.id).limit(1)) is not None:
+            result = await MRPService.run(db, mode=MRPRunMode.NET_CHANGE)
+        else:
+            return
+    logger.info(
+        f"MRP {result.mode.value} run {result.run_reference}: {result.items_recomputed} items, "
+        f"{result.requirements_written} requirements written, {result.requirements_removed} removed "
+        f"in {result.duration_ms} ms"
+    )
+
+
+mrp_planner = PeriodicTask(
+    "mrp-planner",
+    settings.MRP_NET_CHANGE_INTERVAL_SECONDS,
+    run_scheduled_mrp
+)
@@ -0,0 +1,366 @@
+"""
+Overall Equipment Effectiveness from completed production jobs
+
+Each completed job contributes additive sums:
+
+- planned minutes: actual start to actual end
+- run minutes: planned minus setup and changeover
+- ideal minutes: its output (good and waste) at the line's maximum speed, or
+  at the job's own run-time estimate when the output is not film in kg
+- total and good quantity: produced plus waste, and produced
+
+Availability = run / planned, performance = ideal / run and quality = good /
+total; OEE is their product. Because the sums add up, they are kept per line,
+production day and shift in oee_rollups, and any coarser figure (a line over
+a week, the plant today) is a SUM over rollups instead of a pass over jobs.
+A job belongs to the shift it started in; a night shift belongs to the day
+it started.
+
+Rollups update incrementally: flushes that complete a job or change a
+completed one queue its line and day in oee_dirty_buckets, and the
+aggregator recomputes just those buckets from their jobs, writing each job's
+oee_percentage on the way. The first run with no rollups yet builds them
+all. The aggregator runs in one worker process, the holder of its lease.
+"""
+
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy import select, delete, insert, update, func, inspect, event, bindparam
+from sqlalchemy.orm import Session
+from typing import Any, Dict, Iterable, List, NamedTuple, Optional, Set, Tuple
+from datetime import datetime, time as clock, timedelta
+import logging
+import time
+
+from app.core.config import settings
+from app.db.database import AsyncSessionLocal
+from app.models.production import (
+    ProductionLine, ProductionJob, ProductionOrderLine, Product, OEERollup, OEEDirtyBucket
+)
+from app.schemas.production import OEEMetrics, OEERow, OEEReport, OEERollupResult
+from app.services.leases import acquire_lease
+from app.services.planning import film_meters
+from app.utils.periodic import PeriodicTask
+from app.utils.scheduling import parse_shifts
+from app.utils.upsert import chunked, upsert_statement
+
+logger = logging.getLogger(__name__)
+
+COMPLETED_STATUS = "COMPLETED"
+
+# Job attributes OEE is computed from; other changes to a completed job leave its rollup alone
+OEE_INPUTS = (
+    "status", "production_line_id", "actual_start_time", "actual_end_time", "produced_quantity",
+    "waste_quantity", "target_quantity", "run_time_minutes", "setup_time_minutes",
+    "changeover_time_minutes", "shift",
+)
+
+ROLLUP_SUMS = ("jobs", "planned_minutes", "run_minutes", "ideal_minutes", "total_quantity", "good_quantity")
+
+OEE_GROUPS = ("line", "day", "shift")
+
+
+class _Contribution(NamedTuple):
+    planned_minutes: float
+    run_minutes: float
+    ideal_minutes: float
+    total_quantity: float
+    good_quantity: float
+
+    @property
+    def oee(self) -> float:
+        return _metrics(1, *self).oee
+
+
+def production_shift(moment: datetime) -> Tuple[datetime, str]:
+    """(production day, shift) a moment falls in; a shift past midnight counts for the day it started"""
+    shifts = parse_shifts(settings.PRODUCTION_SHIFTS)
+    if not shifts:
+        return datetime.combine(moment.date(), clock()), "day"
+    for days_back in (0, 1):
+        day = datetime.combine(moment.date(), clock()) - timedelta(days=days_back)
+        for start, end in shifts:
+            shift_start = datetime.combine(day.date(), start)
+            shift_end = datetime.combine(day.date(), end)
+            if shift_end <= shift_start:
+                shift_end += timedelta(days=1)
+            if shift_start <= moment < shift_end:
+                return day, f"{start:%H:%M}-{end:%H:%M}"
+    return datetime.combine(moment.date(), clock()), "off-shift"
+
+
+def _metrics(jobs: int, planned: float, run: float, ideal: float, total: float, good: float) -> OEEMetrics:
+    availability = run / planned if planned > 0 else 0.0
+    performance = ideal / run if run > 0 else 0.0
+    quality = good / total if total > 0 else 0.0
+    return OEEMetrics(
+        jobs=jobs,
+        planned_minutes=round(planned, 1),
+        run_minutes=round(run, 1),
+        availability=round(availability * 100, 1),
+        performance=round(performance * 100, 1),
+        quality=round(quality * 100, 1),
+        oee=round(availability * performance * quality * 100, 1)
+    )
+
+
+def job_contribution(job: ProductionJob, line: ProductionLine, product: Optional[Product]) -> Optional[_Contribution]:
+    """OEE sums of a completed job; None without actual start and end"""
+    if job.actual_start_time is None or job.actual_end_time is None:
+        return None
+    planned = (job.actual_end_time - job.actual_start_time).total_seconds() / 60
+    if planned <= 0:
+        return None
+    run = max(planned - (job.setup_time_minutes or 0) - (job.changeover_time_minutes or 0), 0.0)
+
+    good = max(job.produced_quantity or 0.0, 0.0)
+    total = good + max(job.waste_quantity or 0.0, 0.0)
+    meters = film_meters(product, total)
+    if meters is not None and line.max_speed_mpm:
+        ideal = meters / line.max_speed_mpm
+    elif job.run_time_minutes and job.target_quantity:
+        ideal = job.run_time_minutes * total / job.target_quantity
+    else:
+        ideal = run  # No rate to compare against: count as full speed
+    # Faster than ideal means a wrong ideal rate, not more than 100% performance
+    return _Contribution(planned, run, min(ideal, run), total, good)
+
+
+@event.listens_for(Session, "after_flush")
+def _queue_oee_changes(session: Session, flush_context: Any) -> None:
+    """Queue the line days of completed jobs touched by a flush for the next aggregation"""
+    queued = set()
+    for obj in (*session.new, *session.dirty, *session.deleted):
+        if not isinstance(obj, ProductionJob):
+            continue
+        state = inspect(obj)
+        if obj in session.dirty and not any(state.attrs[name].history.has_changes() for name in OEE_INPUTS):
+            continue
+        # Old values too: a job moved to another line or day changes both buckets
+        if COMPLETED_STATUS not in (obj.status, *state.attrs.status.history.deleted):
+            continue
+        for line_id in (obj.production_line_id, *state.attrs.production_line_id.history.deleted):
+            for start in (obj.actual_start_time, *state.attrs.actual_start_time.history.deleted):
+                if line_id is not None and start is not None:
+                    queued.add((line_id, production_shift(start)[0]))
+
+    if queued:
+        session.connection().execute(
+            insert(OEEDirtyBucket.__table__),
+            [{"production_line_id": line_id, "day": day} for line_id, day in queued]
+        )
+
+
+class OEEService:
+    """Service for OEE rollups and reports"""
+
+    WRITE_CHUNK = 500
+
+    @staticmethod
+    async def _job_products(db: AsyncSession, jobs: List[ProductionJob]) -> Dict[int, Product]:
+        """Product of each job's order: a job makes its order's first line"""
+        products: Dict[int, Product] = {}
+        order_ids = list({job.production_order_id for job in jobs})
+        for ids in chunked(order_ids, OEEService.WRITE_CHUNK):
+            result = await db.execute(
+                select(ProductionOrderLine.production_order_id, Product)
+                .join(Product, Product.id == ProductionOrderLine.product_id)
+                .where(ProductionOrderLine.production_order_id.in_(ids))
+                .order_by(ProductionOrderLine.production_order_id, ProductionOrderLine.line_number)
+            )
+            for order_id, product in result:
+                products.setdefault(order_id, product)
+        return products
+
+    @staticmethod
+    async def _recompute(db: AsyncSession, buckets: Dict[int, Set[datetime]]) -> Tuple[int, int]:
+        """Rewrite the rollups of the given days per line from their completed jobs; (jobs, rollups)"""
+        lines = {
+            line.id: line for line in (await db.execute(
+                select(ProductionLine).where(ProductionLine.id.in_(list(buckets)))
+            )).scalars()
+        }
+
+        jobs: List[ProductionJob] = []
+        for line_id, days in buckets.items():
+            # Night shifts reach into the next calendar day
+            result = await db.execute(
+                select(ProductionJob).where(
+                    ProductionJob.production_line_id == line_id,
+                    ProductionJob.status == COMPLETED_STATUS,
+                    ProductionJob.actual_start_time >= min(days),
+                    ProductionJob.actual_start_time < max(days) + timedelta(days=2)
+                )
+            )
+            jobs.extend(
+                job for job in result.scalars()
+                if production_shift(job.actual_start_time)[0] in days
+            )
+        products = await OEEService._job_products(db, jobs)
+
+        sums: Dict[Tuple[int, datetime, str], List[float]] = {}
+        job_oee = []
+        for job in jobs:
+            line = lines.get(job.production_line_id)
+            contribution = job_contribution(job, line, products.get(job.production_order_id)) if line else None
+            if contribution is None:
+                continue
+            day, shift = production_shift(job.actual_start_time)
+            key = (job.production_line_id, day, job.shift or shift)
+            totals = sums.setdefault(key, [0] * len(ROLLUP_SUMS))
+            for index, value in enumerate((1, *contribution)):
+                totals[index] += value
+            job_oee.append({"job_id": job.id, "oee": contribution.oee})
+
+        for line_id, days in buckets.items():
+            for chunk in chunked(sorted(days), OEEService.WRITE_CHUNK):
+                await db.execute(
+                    delete(OEERollup).where(OEERollup.production_line_id == line_id, OEERollup.day.in_(chunk))
+                )
+        rows = [
+            {"production_line_id": line_id, "day": day, "shift": shift, **dict(zip(ROLLUP_SUMS, totals))}
+            for (line_id, day, shift), totals in sums.items()
+        ]
+        if rows:
+            # Upsert: a concurrent recompute of the same bucket may have inserted it since the delete
+            await db.execute(
+                upsert_statement(
+                    db.get_bind().dialect.name, OEERollup.__table__, None,
+                    index_elements=["production_line_id", "day", "shift"], update_columns=ROLLUP_SUMS
+                ),
+                rows
+            )
+        if job_oee:
+            # Core UPDATE: the flush listener must not queue these jobs again
+            await db.execute(
+                update(ProductionJob.__table__)
+                .where(ProductionJob.__table__.c.id == bindparam("job_id"))
+                .values(oee_percentage=bindparam("oee")),
+                job_oee
+            )
+        return len(jobs), len(rows)
+
+    @staticmethod
+    async def update_rollups(db: AsyncSession, full: bool = False) -> OEERollupResult:
+        """Fold queued job changes into the rollups, or rebuild every rollup (full)"""
+        started = time.perf_counter()
+        # DELETE ... RETURNING claims exactly the queued rows it removes, so a change committed
+        # meanwhile is left for the next run whatever its id; a rollback puts them back
+        claimed = (await db.execute(
+            delete(OEEDirtyBucket).returning(OEEDirtyBucket.production_line_id, OEEDirtyBucket.day)
+        )).all()
+
+        buckets: Dict[int, Set[datetime]] = {}
+        if full:
+            result = await db.execute(
+                select(ProductionJob.production_line_id, ProductionJob.actual_start_time).where(
+                    ProductionJob.status == COMPLETED_STATUS, ProductionJob.actual_start_time.is_not(None)
+                )
+            )
+            for line_id, start in result:
+                buckets.setdefault(line_id, set()).add(production_shift(start)[0])
+            await db.execute(delete(OEERollup))
+        else:
+            for line_id, day in claimed:
+                buckets.setdefault(line_id, set()).add(day)
+
+        jobs = written = 0
+        if buckets:
+            jobs, written = await OEEService._recompute(db, buckets)
+        await db.commit()
+
+        return OEERollupResult(
+            full=full,
+            buckets=sum(len(days) for days in buckets.values()),
+            jobs=jobs,
+            rollups_written=written,
+            duration_ms=round((time.perf_counter() - started) * 1000, 1)
+        )
+
+    @staticmethod
+    async def get_oee(
+        db: AsyncSession,
+        date_from: datetime,
+        date_to: datetime,
+        line_id: Optional[int] = None,
+        group_by: Iterable[str] = ("line",)
+    ) -> OEEReport:
+        """OEE over production days date_from to date_to (inclusive), in total and per group"""
+        group_by = [group for group in OEE_GROUPS if group in set(group_by)]
+        sums = [func.coalesce(func.sum(getattr(OEERollup, name)), 0) for name in ROLLUP_SUMS]
+        conditions = [OEERollup.day >= date_from, OEERollup.day <= date_to]
+        if line_id:
+            conditions.append(OEERollup.production_line_id == line_id)
+
+        total = (await db.execute(select(*sums).where(*conditions))).one()
+
+        columns = {
+            "line": [OEERollup.production_line_id, ProductionLine.code],
+            "day": [OEERollup.day],
+            "shift": [OEERollup.shift],
+        }
+        keys = [column for group in group_by for column in columns[group]]
+        rows = []
+        if keys:
+            result = await db.execute(
+                select(*keys, *sums)
+                .join(ProductionLine, ProductionLine.id == OEERollup.production_line_id)
+                .where(*conditions)
+                .group_by(*keys)
+                .order_by(*keys)
+            )
+            for row in result:
+                values = dict(zip(("jobs", "planned", "run", "ideal", "total", "good"), row[len(keys):]))
+                grouping = dict(zip([column.key for column in keys], row[:len(keys)]))
+                rows.append(OEERow(
+                    line_id=grouping.get("production_line_id"),
+                    line_code=grouping.get("code"),
+                    day=grouping.get("day"),
+                    shift=grouping.get("shift"),
+                    **_metrics(**values).model_dump()
+                ))
+
+        return OEEReport(
+            date_from=date_from,
+            date_to=date_to,
+            total=_metrics(*total),
+            rows=rows
+        )
+
+    @staticmethod
+    async def recent_oee(db: AsyncSession, days: Optional[int] = None) -> OEEMetrics:
+        """Plant OEE over the last days, today included"""
+        today = datetime.combine(datetime.utcnow().date(), clock())
+        days = days or settings.OEE_DASHBOARD_DAYS
+        report = await OEEService.get_oee(db, today - timedelta(days=days - 1), today, group_by=())
+        return report.total
+
+
+async def run_oee_aggregation() -> None:
+    """
+    Incremental update on every tick; a full build when there are no rollups yet.
+
+    Only the worker process holding the aggregator lease runs, so workers do
+    not delete and re-insert the same buckets concurrently.
+    """
+    async with AsyncSessionLocal() as db:
+        if not await acquire_lease(db, "oee-aggregator", settings.OEE_ROLLUP_INTERVAL_SECONDS * 3):
+            return
+        if await db.scalar(select(OEERollup.id).limit(1)) is None:
+            if await db.scalar(select(ProductionJob.id).where(ProductionJob.status == COMPLETED_STATUS).limit(1)) is None:
+                return
+            result = await OEEService.update_rollups(db, full=True)
+        elif await db.scalar(select(OEEDirtyBucket.id).limit(1)) is not None:
+            result = await OEEService.update_rollups(db)
+        else:
+            return
+    logger.info(
+        f"OEE rollups {'rebuilt' if result.full else 'updated'}: {result.buckets} line days, "
+        f"{result.jobs} jobs, {result.rollups_written} rollups in {result.duration_ms} ms"
+    )
+
+
+oee_aggregator = PeriodicTask(
+    "oee-aggregator",
+    settings.OEE_ROLLUP_INTERVAL_SECONDS,
+    run_oee_aggregation
+)
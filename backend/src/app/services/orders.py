@@ -3,8 +3,10 @@ from sqlalchemy import and_, or_, func, desc, asc
 from typing import Optional, List, Dict, Any
 from datetime import datetime, date
 from uuid import UUID
+import logging
 import math
 
+from app.core.config import settings
 from app.models.orders import Order, OrderPriority, OrderStatus
 from app.schemas.orders import (
     OrderCreate, 
@@ -12,8 +14,13 @@ from app.schemas.orders import (
     OrderResponse, 
     OrderListResponse,
     OrderFilter,
-    OrderSummary
+    OrderSummary,
+    DeliveryPromiseRequest,
+    DeliveryPromise
 )
+from app.services.promise import promise_cache
+
+logger = logging.getLogger(__name__)
 
 
 class OrderService:
@@ -82,11 +89,24 @@ class OrderService:
             self.db.commit()
             self.db.refresh(db_order)
             
-            return OrderResponse.model_validate(db_order)
-            
         except Exception as e:
             self.db.rollback()
             raise ValueError(f"Failed to create order: {str(e)}")
+        
+        # Later quotes must not promise the material and capacity this order takes
+        try:
+            promise_cache.reserve(db_order.product_id, db_order.quantity, db_order.unit)
+        except ValueError:
+            pass  # Not quotable in this unit, so never checked against the projection
+        except Exception as e:
+            # The order is stored; the next rebuild of the projection accounts for it
+            logger.error(f"Failed to reserve order {db_order.number} in the delivery projection: {e}")
+        
+        return OrderResponse.model_validate(db_order)
+    
+    def quote_delivery(self, request: DeliveryPromiseRequest) -> Optional[DeliveryPromise]:
+        """Earliest feasible delivery date from material availability and free line capacity"""
+        return promise_cache.quote(request.product_id, request.quantity, request.unit)
     
     def get_order_by_id(self, order_id: UUID) -> Optional[OrderResponse]:
         """Get order by ID"""
@@ -374,6 +394,24 @@ class OrderService:
         # Validate quantity
         if order_data.quantity <= 0:
             raise ValueError("Quantity must be positive")
+        
+        # Validate due date against material availability and line capacity;
+        # unknown products and other units than the product's cannot be quoted
+        try:
+            promise = promise_cache.quote(order_data.product_id, order_data.quantity, order_data.unit)
+        except ValueError:
+            promise = None
+        except Exception as e:
+            # Order intake does not depend on the projection being available
+            logger.error(f"Failed to quote delivery of {order_data.product_id}: {e}")
+            promise = None
+        if promise and not promise.feasible:
+            raise ValueError(
+                f"Product {order_data.product_id} cannot be made within the "
+                f"{settings.PROMISE_HORIZON_DAYS}-day planning horizon"
+            )
+        if promise and order_data.due_date < promise.earliest_delivery_date:
+            raise ValueError(f"Earliest feasible delivery date is {promise.earliest_delivery_date.isoformat()}")
     
     def _validate_order_update(self, existing_order: Order, update_data: OrderUpdate) -> None:
         """Validate business rules for order updates"""
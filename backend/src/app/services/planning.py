@@ -0,0 +1,626 @@
+"""
+Finite-capacity scheduling of production jobs onto lines
+
+Every line gets a LineTimeline: the plant shift calendar plus busy time for
+its maintenance window and the job it is running. Queued jobs are then
+booked into the earliest slot that holds their setup and run time, either
+on their own line in queue order, or (reassign_lines) on whichever
+compatible line finishes them first. A line is compatible when it is of the
+same type as the job's current line and its width range admits the
+product. Run time is scaled by line speed where both speeds are known.
+
+Disruptions (a line going to maintenance, a rush order) are repaired
+incrementally: jobs inside the frozen horizon or finished before the
+disruption stay pinned, and only the later jobs of the affected lines are
+shifted right in their current order, never earlier than they were.
+"""
+
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy import select, func
+from typing import Dict, List, NamedTuple, Optional, Tuple
+from datetime import datetime, timedelta
+import time
+
+from app.core.config import settings
+from app.models.base import OrderStatus, OrderPriority, ProductionLineStatus
+from app.models.production import ProductionLine, ProductionJob, ProductionOrder, ProductionOrderLine, Product
+from app.schemas.production import (
+    GanttBar, GanttLine, ScheduleResult, UnscheduledJob, OrderPlanRequest, OrderPlanResult,
+    ScheduleChange, ScheduleRepairResult
+)
+from app.services.sequencing import SequencingService, JobContext, QUEUED_STATUS, RUNNING_STATUS, DEFAULT_RUN_MINUTES
+from app.utils.scheduling import ShiftCalendar, LineTimeline, parse_shifts
+
+PRIORITY_RANK = {
+    OrderPriority.CRITICAL: 0,
+    OrderPriority.HIGH: 1,
+    OrderPriority.MEDIUM: 2,
+    OrderPriority.LOW: 3,
+}
+
+
+class _Booking(NamedTuple):
+    context: JobContext
+    line: ProductionLine
+    start: datetime
+    end: datetime
+    setup_minutes: float
+    run_minutes: float
+
+
+def plant_calendar() -> ShiftCalendar:
+    workdays = [int(day) for day in settings.PRODUCTION_WORKDAYS.split(",") if day.strip()]
+    return ShiftCalendar(parse_shifts(settings.PRODUCTION_SHIFTS), workdays)
+
+
+def line_accepts(line: ProductionLine, line_type: Optional[str], product: Optional[Product]) -> bool:
+    if line_type and line.line_type != line_type:
+        return False
+    width = product.width_mm if product is not None else None
+    if width is not None:
+        if line.min_width_mm is not None and width < line.min_width_mm:
+            return False
+        if line.max_width_mm is not None and width > line.max_width_mm:
+            return False
+    return True
+
+
+def film_meters(product: Optional[Product], quantity: float) -> Optional[float]:
+    """Film length of a quantity in kg; None when the product is not film measured in kg"""
+    if product is None or not product.thickness_micron or not product.width_mm \
+            or (product.standard_unit or "kg") != "kg":
+        return None
+    kg_per_meter = product.thickness_micron * 1e-6 * product.width_mm * 1e-3 * settings.FILM_DENSITY_KG_M3
+    return quantity / kg_per_meter
+
+
+def run_minutes_on(job: ProductionJob, product: Optional[Product], own_line: Optional[ProductionLine],
+                   line: ProductionLine) -> float:
+    """Run time of the job on a line: its own estimate, scaled by speed on another line,
+    or derived from film dimensions and line speed"""
+    speed = line.max_speed_mpm
+    if job.run_time_minutes:
+        own_speed = own_line.max_speed_mpm if own_line is not None else None
+        if own_line is not None and line.id != own_line.id and own_speed and speed:
+            return job.run_time_minutes * own_speed / speed
+        return float(job.run_time_minutes)
+
+    meters = film_meters(product, job.target_quantity)
+    if speed and meters is not None:
+        efficiency = (line.standard_efficiency or 100.0) / 100.0
+        return meters / (speed * efficiency)
+    return float(DEFAULT_RUN_MINUTES)
+
+
+def maintenance_windows(line: ProductionLine, now: datetime) -> List[Tuple[datetime, datetime]]:
+    duration = timedelta(hours=settings.MAINTENANCE_WINDOW_HOURS)
+    windows = []
+    planned = line.next_maintenance_date
+    # A line in maintenance outside a planned window in progress is down for a window from when
+    # it was taken down, or from now once that window has run out and it is still down
+    if line.status == ProductionLineStatus.MAINTENANCE and not (
+        planned is not None and planned <= now < planned + duration
+    ):
+        started = line.maintenance_started_at
+        if started is None or started + duration <= now:
+            started = now
+        windows.append((started, started + duration))
+    if planned is not None:
+        windows.append((planned, planned + duration))
+    return windows
+
+
+def job_window(job: ProductionJob, now: datetime) -> Optional[Tuple[datetime, datetime]]:
+    """Time a job holds its line: a running job from now until its remaining run time is done"""
+    if job.status == RUNNING_STATUS:
+        remaining = (job.run_time_minutes or DEFAULT_RUN_MINUTES) * (1 - (job.progress_percentage or 0) / 100)
+        return now, max(job.scheduled_end_time or now, now + timedelta(minutes=max(remaining, 0)))
+    if job.scheduled_start_time and job.scheduled_end_time:
+        return job.scheduled_start_time, job.scheduled_end_time
+    return None
+
+
+class PlanningService:
+    """Service for finite-capacity production scheduling"""
+
+    @staticmethod
+    async def _lines(db: AsyncSession, line_ids: Optional[List[int]] = None) -> List[ProductionLine]:
+        query = (
+            select(ProductionLine)
+            .where(ProductionLine.is_active == True, ProductionLine.status != ProductionLineStatus.ERROR)
+            .order_by(ProductionLine.code)
+        )
+        if line_ids:
+            query = query.where(ProductionLine.id.in_(line_ids))
+        return (await db.execute(query)).scalars().all()
+
+    @staticmethod
+    async def _timelines(
+        db: AsyncSession,
+        lines: List[ProductionLine],
+        fixed_statuses: Tuple[str, ...] = (RUNNING_STATUS,)
+    ) -> Dict[int, LineTimeline]:
+        """Timelines with maintenance and the jobs in fixed_statuses already booked"""
+        calendar = plant_calendar()
+        # Line status and running jobs describe the present, whatever window is planned
+        now = datetime.utcnow().replace(second=0, microsecond=0)
+        timelines = {}
+        for line in lines:
+            timeline = LineTimeline(calendar)
+            for start, end in maintenance_windows(line, now):
+                timeline.block(start, end, "maintenance")
+            timelines[line.id] = timeline
+
+        result = await db.execute(
+            select(ProductionJob).where(
+                ProductionJob.production_line_id.in_(list(timelines)),
+                ProductionJob.status.in_(fixed_statuses)
+            )
+        )
+        for job in result.scalars():
+            window = job_window(job, now)
+            if window is not None:
+                timelines[job.production_line_id].block(window[0], window[1], job.id)
+        return timelines
+
+    @staticmethod
+    def _book(
+        context: JobContext,
+        candidates: List[ProductionLine],
+        own_line: Optional[ProductionLine],
+        timelines: Dict[int, LineTimeline],
+        release: Dict[int, datetime],
+        horizon_end: datetime
+    ) -> Optional[_Booking]:
+        """Earliest-finishing slot over candidate lines; ties keep the job's own line"""
+        best: Optional[_Booking] = None
+        job = context.job
+        for line in candidates:
+            setup = float((job.setup_time_minutes or 0) + (job.changeover_time_minutes or 0))
+            run = run_minutes_on(job, context.product, own_line, line)
+            slot = timelines[line.id].earliest_slot(release[line.id], setup + run, horizon_end)
+            if slot is None:
+                continue
+            booking = _Booking(context, line, slot[0], slot[1], setup, run)
+            if best is None or booking.end < best.end or (
+                booking.end == best.end and own_line is not None and line.id == own_line.id
+            ):
+                best = booking
+        return best
+
+    @staticmethod
+    def _bar(booking: _Booking) -> GanttBar:
+        context = booking.context
+        return GanttBar(
+            kind="job",
+            job_id=context.job.id,
+            job_number=context.job.job_number,
+            order_number=context.order_number,
+            product_code=context.product.code if context.product else None,
+            start=booking.start,
+            end=booking.end,
+            setup_minutes=round(booking.setup_minutes, 1),
+            run_minutes=round(booking.run_minutes, 1),
+            due_date=context.due_date,
+            is_late=context.due_date is not None and booking.end > context.due_date
+        )
+
+    @staticmethod
+    def _gantt_lines(
+        lines: List[ProductionLine], timelines: Dict[int, LineTimeline], bookings: List[_Booking],
+        start: datetime, end: datetime
+    ) -> List[GanttLine]:
+        calendar = plant_calendar()
+        by_line: Dict[int, List[GanttBar]] = {line.id: [] for line in lines}
+        booked = {booking.context.job.id for booking in bookings}
+        for line in lines:
+            for interval in timelines[line.id].intervals():
+                if interval.data in booked or interval.end <= start or interval.start >= end:
+                    continue
+                kind = "maintenance" if interval.data == "maintenance" else "running"
+                by_line[line.id].append(GanttBar(
+                    kind=kind,
+                    job_id=interval.data if kind != "maintenance" else None,
+                    start=interval.start,
+                    end=interval.end
+                ))
+        for booking in bookings:
+            by_line[booking.line.id].append(PlanningService._bar(booking))
+
+        working = calendar.working_minutes(start, end) if end > start else 0.0
+        result = []
+        for line in lines:
+            bars = sorted(by_line[line.id], key=lambda bar: bar.start)
+            busy = sum(
+                calendar.working_minutes(max(bar.start, start), min(bar.end, end))
+                for bar in bars if bar.kind != "maintenance" and bar.end > start and bar.start < end
+            )
+            result.append(GanttLine(
+                line_id=line.id,
+                line_code=line.code,
+                line_type=line.line_type,
+                utilization=round(100.0 * busy / working, 1) if working else 0.0,
+                bars=bars
+            ))
+        return result
+
+    @staticmethod
+    async def _apply(db: AsyncSession, bookings: List[_Booking], renumber: bool) -> None:
+        by_line: Dict[int, List[_Booking]] = {}
+        for booking in bookings:
+            job = booking.context.job
+            job.production_line_id = booking.line.id
+            job.scheduled_start_time = booking.start
+            job.scheduled_end_time = booking.end
+            if job.setup_time_minutes is None:
+                job.setup_time_minutes = int(round(booking.setup_minutes))
+            job.run_time_minutes = int(round(booking.run_minutes))
+            by_line.setdefault(booking.line.id, []).append(booking)
+
+        if renumber:
+            for line_bookings in by_line.values():
+                for position, booking in enumerate(sorted(line_bookings, key=lambda b: b.start), start=1):
+                    booking.context.job.sequence_number = position
+
+        # Orders span their jobs
+        order_ids = {booking.context.job.production_order_id for booking in bookings}
+        spans = await db.execute(
+            select(
+                ProductionJob.production_order_id,
+                func.min(ProductionJob.scheduled_start_time),
+                func.max(ProductionJob.scheduled_end_time)
+            )
+            .where(ProductionJob.production_order_id.in_(order_ids), ProductionJob.status != "CANCELLED")
+            .group_by(ProductionJob.production_order_id)
+        )
+        orders = {
+            order.id: order for order in (await db.execute(
+                select(ProductionOrder).where(ProductionOrder.id.in_(order_ids))
+            )).scalars()
+        }
+        for order_id, planned_start, planned_end in spans.all():
+            order = orders[order_id]
+            order.planned_start_date = planned_start
+            order.planned_completion_date = planned_end
+            if order.status == OrderStatus.NEW:
+                order.status = OrderStatus.PLANNED
+
+    @staticmethod
+    async def build_schedule(
+        db: AsyncSession,
+        line_ids: Optional[List[int]] = None,
+        reassign_lines: bool = False,
+        apply: bool = True,
+        start: Optional[datetime] = None
+    ) -> ScheduleResult:
+        """Book every queued job of the selected lines from start on"""
+        start = start or datetime.utcnow().replace(second=0, microsecond=0)
+        horizon_end = start + timedelta(days=settings.SCHEDULE_HORIZON_DAYS)
+        lines = await PlanningService._lines(db, line_ids)
+        lines_by_id = {line.id: line for line in lines}
+        timelines = await PlanningService._timelines(db, lines)
+
+        result = await db.execute(
+            select(ProductionJob)
+            .where(ProductionJob.production_line_id.in_(list(lines_by_id)), ProductionJob.status == QUEUED_STATUS)
+            .order_by(
+                ProductionJob.production_line_id,
+                ProductionJob.sequence_number.is_(None),
+                ProductionJob.sequence_number,
+                ProductionJob.scheduled_start_time,
+                ProductionJob.id
+            )
+        )
+        contexts = await SequencingService.describe_jobs(db, result.scalars().all())
+
+        if reassign_lines:
+            # Urgent work first, each on whichever compatible line finishes it earliest
+            contexts.sort(key=lambda c: (
+                c.due_date or datetime.max, PRIORITY_RANK.get(c.priority, 2), c.job.sequence_number or 0
+            ))
+
+        bookings: List[_Booking] = []
+        unscheduled: List[UnscheduledJob] = []
+        release = {line_id: start for line_id in lines_by_id}
+        for context in contexts:
+            own_line = lines_by_id[context.job.production_line_id]
+            if reassign_lines:
+                candidates = [line for line in lines if line_accepts(line, own_line.line_type, context.product)]
+                job_release = {line_id: start for line_id in lines_by_id}
+            else:
+                candidates = [own_line]
+                job_release = release  # Keep the queue order on the line
+
+            booking = PlanningService._book(context, candidates, own_line, timelines, job_release, horizon_end)
+            if booking is None:
+                reason = "no compatible line" if not candidates else "no capacity within the horizon"
+                unscheduled.append(UnscheduledJob(job_id=context.job.id, job_number=context.job.job_number, reason=reason))
+                continue
+            timelines[booking.line.id].block(booking.start, booking.end, context.job.id)
+            release[booking.line.id] = booking.end
+            bookings.append(booking)
+
+        end = max((booking.end for booking in bookings), default=start)
+        if apply:
+            await PlanningService._apply(db, bookings, renumber=reassign_lines)
+            await db.commit()
+
+        return ScheduleResult(
+            start=start,
+            end=end,
+            applied=apply,
+            scheduled_jobs=len(bookings),
+            late_jobs=sum(1 for booking in bookings if PlanningService._bar(booking).is_late),
+            unscheduled=unscheduled,
+            lines=PlanningService._gantt_lines(lines, timelines, bookings, start, end)
+        )
+
+    @staticmethod
+    async def get_gantt(
+        db: AsyncSession, start: datetime, end: datetime, line_id: Optional[int] = None
+    ) -> List[GanttLine]:
+        """Stored schedule between start and end"""
+        if end <= start:
+            raise ValueError("end must be after start")
+        lines = await PlanningService._lines(db, [line_id] if line_id else None)
+        timelines = await PlanningService._timelines(db, lines)
+
+        result = await db.execute(
+            select(ProductionJob).where(
+                ProductionJob.production_line_id.in_([line.id for line in lines]),
+                ProductionJob.status == QUEUED_STATUS,
+                ProductionJob.scheduled_start_time < end,
+                ProductionJob.scheduled_end_time > start
+            )
+        )
+        lines_by_id = {line.id: line for line in lines}
+        bookings = [
+            _Booking(
+                context, lines_by_id[context.job.production_line_id],
+                context.job.scheduled_start_time, context.job.scheduled_end_time,
+                float(context.job.setup_time_minutes or 0), float(context.job.run_time_minutes or 0)
+            )
+            for context in await SequencingService.describe_jobs(db, result.scalars().all())
+        ]
+        return PlanningService._gantt_lines(lines, timelines, bookings, start, end)
+
+    @staticmethod
+    async def _pin_jobs(
+        db: AsyncSession,
+        lines: List[ProductionLine],
+        timelines: Dict[int, LineTimeline],
+        disruption_start: datetime,
+        frozen_until: datetime
+    ) -> List[JobContext]:
+        """Book the queued jobs that stay where they are; the rest come back in line order"""
+        result = await db.execute(
+            select(ProductionJob)
+            .where(
+                ProductionJob.production_line_id.in_([line.id for line in lines]),
+                ProductionJob.status == QUEUED_STATUS
+            )
+            .order_by(
+                ProductionJob.production_line_id,
+                ProductionJob.scheduled_start_time.is_(None),
+                ProductionJob.scheduled_start_time,
+                ProductionJob.sequence_number,
+                ProductionJob.id
+            )
+        )
+        movable = []
+        for context in await SequencingService.describe_jobs(db, result.scalars().all()):
+            job = context.job
+            start, end = job.scheduled_start_time, job.scheduled_end_time
+            timeline = timelines[job.production_line_id]
+            # Frozen jobs only move when the disruption makes them impossible
+            if start is not None and end is not None and (start < frozen_until or end <= disruption_start) \
+                    and not timeline.busy.overlapping(start, end):
+                timeline.block(start, end, job.id)
+            else:
+                movable.append(context)
+        return movable
+
+    @staticmethod
+    def _shift_right(
+        movable: List[JobContext],
+        lines_by_id: Dict[int, ProductionLine],
+        timelines: Dict[int, LineTimeline],
+        start: datetime,
+        horizon_end: datetime
+    ) -> Tuple[List[_Booking], List[ScheduleChange], List[UnscheduledJob]]:
+        """Rebook movable jobs on their own line in order, no earlier than planned"""
+        bookings, changes, unscheduled = [], [], []
+        release = {line_id: start for line_id in lines_by_id}
+        for context in movable:
+            job = context.job
+            line = lines_by_id[job.production_line_id]
+            earliest = max(release[line.id], job.scheduled_start_time or start)
+            booking = PlanningService._book(context, [line], line, timelines, {line.id: earliest}, horizon_end)
+            if booking is None:
+                unscheduled.append(UnscheduledJob(
+                    job_id=job.id, job_number=job.job_number, reason="no capacity within the horizon"
+                ))
+                continue
+            timelines[line.id].block(booking.start, booking.end, job.id)
+            release[line.id] = booking.end
+            bookings.append(booking)
+
+            if booking.start == job.scheduled_start_time and booking.end == job.scheduled_end_time:
+                continue
+            due = context.due_date
+            changes.append(ScheduleChange(
+                job_id=job.id,
+                job_number=job.job_number,
+                order_number=context.order_number,
+                line_code=line.code,
+                old_start=job.scheduled_start_time,
+                old_end=job.scheduled_end_time,
+                new_start=booking.start,
+                new_end=booking.end,
+                delay_minutes=round((booking.end - job.scheduled_end_time).total_seconds() / 60, 1)
+                if job.scheduled_end_time else 0.0,
+                was_late=due is not None and job.scheduled_end_time is not None and job.scheduled_end_time > due,
+                is_late=due is not None and booking.end > due
+            ))
+        return bookings, changes, unscheduled
+
+    @staticmethod
+    async def repair_schedule(
+        db: AsyncSession,
+        line_ids: Optional[List[int]] = None,
+        disruption_start: Optional[datetime] = None,
+        apply: bool = True
+    ) -> ScheduleRepairResult:
+        """Shift the jobs of the affected lines around new busy time, leaving the frozen horizon alone"""
+        started = time.perf_counter()
+        now = datetime.utcnow().replace(second=0, microsecond=0)
+        disruption_start = max(disruption_start or now, now)
+        frozen_until = now + timedelta(minutes=settings.SCHEDULE_FROZEN_HORIZON_MINUTES)
+        horizon_end = now + timedelta(days=settings.SCHEDULE_HORIZON_DAYS)
+
+        lines = await PlanningService._lines(db, line_ids)
+        if line_ids and not lines:
+            raise ValueError("No active production line among the given ones")
+        lines_by_id = {line.id: line for line in lines}
+        timelines = await PlanningService._timelines(db, lines)
+        movable = await PlanningService._pin_jobs(db, lines, timelines, disruption_start, frozen_until)
+        bookings, changes, unscheduled = PlanningService._shift_right(
+            movable, lines_by_id, timelines, now, horizon_end
+        )
+
+        if apply and changes:
+            changed = {change.job_id for change in changes}
+            await PlanningService._apply(
+                db, [booking for booking in bookings if booking.context.job.id in changed], renumber=False
+            )
+            await db.commit()
+
+        return ScheduleRepairResult(
+            applied=apply,
+            disruption_start=disruption_start,
+            frozen_until=frozen_until,
+            jobs_moved=len(changes),
+            total_delay_minutes=round(sum(max(change.delay_minutes, 0.0) for change in changes), 1),
+            newly_late_jobs=sum(1 for change in changes if change.is_late and not change.was_late),
+            changes=changes,
+            unscheduled=unscheduled,
+            elapsed_ms=round((time.perf_counter() - started) * 1000, 1)
+        )
+
+    @staticmethod
+    async def plan_order(db: AsyncSession, order_number: str, request: OrderPlanRequest) -> Optional[OrderPlanResult]:
+        """Create a job per open order line and book it into free capacity, leaving other jobs in place"""
+        order = await db.scalar(select(ProductionOrder).where(ProductionOrder.order_number == order_number))
+        if order is None:
+            return None
+        existing = await db.scalar(
+            select(func.count(ProductionJob.id))
+            .where(ProductionJob.production_order_id == order.id, ProductionJob.status != "CANCELLED")
+        )
+        if existing:
+            raise ValueError(f"Order {order_number} already has production jobs")
+
+        result = await db.execute(
+            select(ProductionOrderLine, Product)
+            .join(Product, Product.id == ProductionOrderLine.product_id)
+            .where(ProductionOrderLine.production_order_id == order.id, ProductionOrderLine.quantity_remaining > 0)
+            .order_by(ProductionOrderLine.line_number)
+        )
+        order_lines = result.all()
+        if not order_lines:
+            raise ValueError(f"Order {order_number} has nothing left to produce")
+
+        lines = await PlanningService._lines(db, [request.line_id] if request.line_id else None)
+        if not lines:
+            raise ValueError("No active production line available")
+        now = datetime.utcnow().replace(second=0, microsecond=0)
+        start = max(request.earliest_start or now, now)
+        horizon_end = start + timedelta(days=settings.SCHEDULE_HORIZON_DAYS)
+        movable: List[JobContext] = []
+        if request.rush:
+            # Take the first free time after the frozen horizon; later jobs make way
+            timelines = await PlanningService._timelines(db, lines)
+            frozen_until = now + timedelta(minutes=settings.SCHEDULE_FROZEN_HORIZON_MINUTES)
+            movable = await PlanningService._pin_jobs(db, lines, timelines, start, frozen_until)
+            start = max(start, frozen_until)
+        else:
+            timelines = await PlanningService._timelines(db, lines, fixed_statuses=(RUNNING_STATUS, QUEUED_STATUS))
+        release = {line.id: start for line in lines}
+
+        # Re-planning after a cancellation keeps the cancelled jobs, so their numbers get a round suffix
+        taken = set((await db.execute(
+            select(ProductionJob.job_number).where(ProductionJob.job_number.like(f"{order.order_number}-%"))
+        )).scalars())
+
+        def job_number(line_number: int) -> str:
+            number = base = f"{order.order_number}-{line_number:02d}"
+            round_number = 1
+            while number in taken:
+                round_number += 1
+                number = f"{base}-{round_number}"
+            taken.add(number)
+            return number
+
+        bookings = []
+        for order_line, product in order_lines:
+            job = ProductionJob(
+                job_number=job_number(order_line.line_number),
+                production_order_id=order.id,
+                production_line_id=lines[0].id,
+                status=QUEUED_STATUS,
+                target_quantity=order_line.quantity_remaining,
+                setup_time_minutes=0
+            )
+            context = JobContext(
+                job=job,
+                order_number=order.order_number,
+                priority=order.priority or OrderPriority.MEDIUM,
+                product=product,
+                color_group="",
+                material_id=None,
+                due_date=order_line.requested_delivery_date or order.confirmed_delivery_date
+                or order.requested_delivery_date,
+                processing_minutes=0.0
+            )
+            candidates = [line for line in lines if line_accepts(line, request.line_type, product)]
+            booking = PlanningService._book(context, candidates, None, timelines, release, horizon_end)
+            if booking is None:
+                raise ValueError(
+                    f"No capacity for line {order_line.line_number} of order {order_number}"
+                    if candidates else f"No compatible production line for product {product.code}"
+                )
+            timelines[booking.line.id].block(booking.start, booking.end, job.job_number)
+            bookings.append(booking)
+
+        displaced: List[_Booking] = []
+        changes: List[ScheduleChange] = []
+        if movable:
+            touched = {booking.line.id for booking in bookings}
+            displaced, changes, unscheduled = PlanningService._shift_right(
+                [context for context in movable if context.job.production_line_id in touched],
+                {line.id: line for line in lines}, timelines, now, horizon_end
+            )
+            if unscheduled:
+                raise ValueError(f"Rush order {order_number} would push jobs past the scheduling horizon")
+            changed = {change.job_id for change in changes}
+            displaced = [booking for booking in displaced if booking.context.job.id in changed]
+
+        if request.apply:
+            for booking in bookings:
+                db.add(booking.context.job)
+            await db.flush()
+            await PlanningService._apply(db, bookings + displaced, renumber=False)
+            await db.commit()
+
+        used = [line for line in lines if any(booking.line.id == line.id for booking in bookings)]
+        planned_start = min(booking.start for booking in bookings)
+        planned_end = max(booking.end for booking in bookings)
+        return OrderPlanResult(
+            order_number=order.order_number,
+            applied=request.apply,
+            planned_start=planned_start,
+            planned_completion=planned_end,
+            jobs=[PlanningService._bar(booking) for booking in bookings],
+            lines=[line.code for line in used],
+            displaced=changes
+        )
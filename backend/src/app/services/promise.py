@@ -0,0 +1,484 @@
+"""
+Available-to-promise / capable-to-promise delivery quoting
+
+A PromiseSnapshot holds, in day buckets over PROMISE_HORIZON_DAYS, two
+projections computed once from the database:
+
+- ATP per purchased material: usable stock plus open purchase receipts minus
+  the material committed to open production orders and open sales orders,
+  as the least projected balance from each day on. Promising up to that
+  quantity on a day never starves a later commitment.
+- Free minutes per line and day: shift calendar time minus maintenance and
+  scheduled or running jobs, with queued jobs that have no times yet taken
+  from the first free days. Kept cumulative, so the finishing day of a run
+  is one searchsorted.
+
+A quote explodes the product through the flattened BOM: every component is
+ready on the first day its ATP covers the requirement, or after its
+purchasing lead time. Production starts once all are ready, on whichever
+compatible line finishes first, and ships PROMISE_SHIPPING_DAYS later.
+Quoting is array lookups only; orders created in between are reserved on
+the snapshot, and a background refresher rebuilds it after relevant flushes.
+"""
+
+from sqlalchemy import select, func, event
+from sqlalchemy.orm import Session
+from typing import Any, Dict, List, NamedTuple, Optional, Tuple
+from datetime import datetime, timedelta
+import asyncio
+import logging
+import threading
+import time
+
+import numpy as np
+
+from app.core.config import settings
+from app.db.database import SessionLocal
+from app.models.base import ProductionLineStatus
+from app.models.orders import Order, OrderStatus as SalesOrderStatus, OrderUnit
+from app.models.production import (
+    Product, BOM, BOMLine, ProductionLine, ProductionJob, ProductionOrder, ProductionOrderLine
+)
+from app.models.procurement import PurchaseOrder, PurchaseOrderLine, ContractPricing
+from app.models.warehouse import InventoryItem, Batch
+from app.schemas.orders import DeliveryPromise, PromiseShortage
+from app.services.bom import FlatBOM
+from app.services.mrp import OPEN_ORDER_STATUSES, read_bom_structure, read_usable_stock, read_open_receipts
+from app.services.planning import plant_calendar, line_accepts, run_minutes_on, maintenance_windows, job_window
+from app.services.sequencing import QUEUED_STATUS, RUNNING_STATUS
+from app.utils.scheduling import ShiftCalendar
+from app.utils.periodic import PeriodicTask
+
+logger = logging.getLogger(__name__)
+
+# Sales orders not yet turned into production orders still claim material and capacity
+OPEN_SALES_STATUSES = (SalesOrderStatus.NEW, SalesOrderStatus.CONFIRMED)
+
+
+class _Run(NamedTuple):
+    """Just what run_minutes_on reads of a job, for work that has no job yet"""
+    run_time_minutes: Optional[int]
+    target_quantity: float
+
+
+class _Quote(NamedTuple):
+    materials_day: int
+    line_index: Optional[int]
+    start_day: int
+    finish_day: Optional[int]
+    unconstrained_day: Optional[int]      # Finish on the same line had materials been ready today
+    minutes: float
+    columns: np.ndarray
+    requirements: np.ndarray
+    covered: np.ndarray
+    lead_days: np.ndarray
+
+
+def _free_segments(
+    windows: List[Tuple[datetime, datetime]], busy: List[Tuple[datetime, datetime]]
+) -> List[Tuple[datetime, datetime]]:
+    """Working windows minus busy time; both sorted by start"""
+    free = []
+    index = 0
+    for start, end in windows:
+        while index < len(busy) and busy[index][1] <= start:
+            index += 1
+        cursor = start
+        scan = index
+        while scan < len(busy) and busy[scan][0] < end:
+            if busy[scan][0] > cursor:
+                free.append((cursor, busy[scan][0]))
+            cursor = max(cursor, busy[scan][1])
+            scan += 1
+        if cursor < end:
+            free.append((cursor, end))
+    return free
+
+
+def _minutes_per_day(segments: List[Tuple[datetime, datetime]], today: datetime, days: int) -> np.ndarray:
+    minutes = np.zeros(days)
+    for start, end in segments:
+        while start < end:
+            day = (start - today).days
+            if day >= days:
+                break
+            day_end = min(end, today + timedelta(days=day + 1))
+            minutes[day] += (day_end - start).total_seconds() / 60
+            start = day_end
+    return minutes
+
+
+class PromiseSnapshot:
+    """Material and capacity projections in day buckets from today"""
+
+    def __init__(
+        self,
+        today: datetime,
+        flat: FlatBOM,
+        projected: np.ndarray,
+        lead_days: np.ndarray,
+        products: Dict[str, Product],
+        lines: List[ProductionLine],
+        free_minutes: np.ndarray
+    ):
+        self.today = today
+        self.as_of = datetime.utcnow()
+        self.built_at = time.monotonic()
+        self.flat = flat
+        self.column_of_material = {material_id: column for column, material_id in enumerate(flat.material_ids.tolist())}
+        self.projected = projected            # (materials, days) balance at the end of each day
+        self.lead_days = lead_days            # Per material column
+        self.products = products              # By code
+        self.lines = lines
+        self.free_minutes = free_minutes      # (lines, days)
+        self._refresh_atp()
+        self._refresh_capacity()
+
+    @property
+    def days(self) -> int:
+        return self.projected.shape[1]
+
+    def _refresh_atp(self, columns: Optional[np.ndarray] = None) -> None:
+        # Least balance from each day on: a reverse running minimum, non-decreasing in time
+        if columns is None:
+            self.atp = np.minimum.accumulate(self.projected[:, ::-1], axis=1)[:, ::-1].copy()
+        else:
+            self.atp[columns] = np.minimum.accumulate(self.projected[columns, ::-1], axis=1)[:, ::-1]
+
+    def _refresh_capacity(self) -> None:
+        self.cum_free = np.cumsum(self.free_minutes, axis=1)
+
+    def _quote(self, product: Product, quantity: float) -> _Quote:
+        columns = np.zeros(0, dtype=np.int64)
+        requirements = np.zeros(0)
+        if self.flat.has_bom(product.id):
+            material_ids, per_unit = self.flat.components(product.id)
+            columns = np.array([self.column_of_material[m] for m in material_ids.tolist()], dtype=np.int64)
+            requirements = per_unit * quantity
+
+        # First day stock covers each requirement; a purchase arrives after its lead time
+        stock_days = np.array(
+            [np.searchsorted(self.atp[column], need - 1e-9) for column, need in zip(columns.tolist(), requirements)],
+            dtype=np.int64
+        )
+        lead_days = self.lead_days[columns]
+        covered = stock_days <= lead_days
+        materials_day = int(np.where(covered, stock_days, lead_days).max()) if columns.size else 0
+
+        best: Tuple[Optional[int], Optional[int], float] = (None, None, 0.0)
+        start = min(materials_day, self.days)
+        run = _Run(run_time_minutes=None, target_quantity=quantity)
+        for index, line in enumerate(self.lines):
+            if not line_accepts(line, None, product):
+                continue
+            minutes = run_minutes_on(run, product, None, line)
+            before = self.cum_free[index, start - 1] if start > 0 else 0.0
+            finish = int(np.searchsorted(self.cum_free[index], before + minutes - 1e-9))
+            if finish < self.days and (best[1] is None or finish < best[1]):
+                best = (index, finish, minutes)
+        unconstrained = None
+        if best[0] is not None:
+            unconstrained = int(np.searchsorted(self.cum_free[best[0]], best[2] - 1e-9))
+        return _Quote(
+            materials_day=materials_day,
+            line_index=best[0],
+            start_day=start,
+            finish_day=best[1],
+            unconstrained_day=unconstrained,
+            minutes=best[2],
+            columns=columns,
+            requirements=requirements,
+            covered=covered,
+            lead_days=lead_days
+        )
+
+    def quote(self, product: Product, quantity: float) -> DeliveryPromise:
+        quote = self._quote(product, quantity)
+        feasible = quote.finish_day is not None
+        finish_day = quote.finish_day if feasible else self.days
+        if feasible and quote.finish_day > quote.unconstrained_day:
+            limited_by = "materials"
+        elif not feasible or quote.finish_day > 0:
+            limited_by = "capacity"
+        else:
+            limited_by = "none"
+
+        return DeliveryPromise(
+            product_id=product.code,
+            quantity=quantity,
+            feasible=feasible,
+            earliest_delivery_date=(self.today + timedelta(days=finish_day + settings.PROMISE_SHIPPING_DAYS)).date(),
+            materials_ready_date=(self.today + timedelta(days=quote.materials_day)).date(),
+            production_line=self.lines[quote.line_index].code if feasible else None,
+            production_finish_date=(self.today + timedelta(days=finish_day)).date() if feasible else None,
+            limited_by=limited_by,
+            shortages=[
+                PromiseShortage(
+                    material_id=int(self.flat.material_ids[column]),
+                    quantity=round(float(need), 3),
+                    lead_time_days=int(lead)
+                )
+                for column, need, covered, lead in zip(
+                    quote.columns.tolist(), quote.requirements.tolist(), quote.covered.tolist(), quote.lead_days.tolist()
+                )
+                if not covered
+            ],
+            as_of=self.as_of
+        )
+
+    def reserve(self, product: Product, quantity: float) -> None:
+        """Take an accepted order's material and capacity out of the projections"""
+        quote = self._quote(product, quantity)
+        # Material is drawn when production starts; stock short of it is bought for the order
+        stocked = quote.columns[quote.covered]
+        if stocked.size:
+            day = min(quote.start_day, self.days - 1)
+            self.projected[stocked, day:] -= quote.requirements[quote.covered][:, None]
+            self._refresh_atp(stocked)
+
+        if quote.line_index is not None:
+            free = self.free_minutes[quote.line_index]
+            remaining = quote.minutes
+            for day in range(quote.start_day, self.days):
+                taken = min(free[day], remaining)
+                free[day] -= taken
+                remaining -= taken
+                if remaining <= 1e-9:
+                    break
+            self._refresh_capacity()
+
+
+def _material_projection(
+    session: Session, flat: FlatBOM, today: datetime, days: int
+) -> Tuple[np.ndarray, np.ndarray]:
+    """(projected balance, lead days) per material column"""
+    column_of_material = {material_id: column for column, material_id in enumerate(flat.material_ids.tolist())}
+    n_materials = flat.material_ids.size
+
+    def day_of(moment: Optional[datetime]) -> int:
+        # Past due and undated count from today, beyond the horizon on its last day
+        if moment is None:
+            return 0
+        return int(np.clip((moment - today).days, 0, days - 1))
+
+    changes = np.zeros((n_materials, days))
+    for material_id, quantity in read_usable_stock(session).items():
+        if material_id in column_of_material:
+            changes[column_of_material[material_id], 0] += max(quantity or 0.0, 0.0)
+    for row in read_open_receipts(session):
+        if row.material_id in column_of_material:
+            changes[column_of_material[row.material_id], day_of(row.due_date)] += row.quantity_remaining
+
+    # Open production orders consume their materials by their need date
+    demand: Dict[Tuple[int, int], float] = {}
+    order_lines = session.execute(
+        select(
+            ProductionOrderLine.product_id,
+            ProductionOrderLine.quantity_remaining,
+            func.coalesce(
+                ProductionOrderLine.requested_delivery_date,
+                ProductionOrder.requested_delivery_date,
+                ProductionOrder.order_date
+            ).label("need_date")
+        )
+        .join(ProductionOrder, ProductionOrder.id == ProductionOrderLine.production_order_id)
+        .where(ProductionOrder.status.in_(OPEN_ORDER_STATUSES), ProductionOrderLine.quantity_remaining > 0)
+    ).all()
+    for row in order_lines:
+        key = (row.product_id, day_of(row.need_date))
+        demand[key] = demand.get(key, 0.0) + row.quantity_remaining
+    for (product_id, day), quantity in demand.items():
+        for material_id, need in flat.explode({product_id: quantity}).items():
+            changes[column_of_material[material_id], day] -= need
+
+    lead_times = dict(session.execute(
+        select(ContractPricing.material_id, func.min(ContractPricing.standard_lead_time_days))
+        .where(ContractPricing.is_active == True)
+        .group_by(ContractPricing.material_id)
+    ).all())
+    lead_days = np.array([
+        lead_times.get(material_id) if lead_times.get(material_id) is not None
+        else settings.PROMISE_DEFAULT_LEAD_TIME_DAYS
+        for material_id in flat.material_ids.tolist()
+    ], dtype=np.int64)
+    return np.cumsum(changes, axis=1), lead_days
+
+
+def _capacity_projection(
+    session: Session, lines: List[ProductionLine], calendar: ShiftCalendar, now: datetime, today: datetime, days: int
+) -> np.ndarray:
+    """Free minutes per line and day"""
+    horizon_end = today + timedelta(days=days)
+    windows = [
+        (start, min(end, horizon_end)) for start, end in calendar.windows(now, horizon_end) if start < horizon_end
+    ]
+    busy: Dict[int, List[Tuple[datetime, datetime]]] = {
+        line.id: maintenance_windows(line, now) for line in lines
+    }
+    unscheduled: Dict[int, float] = {}
+    line_by_id = {line.id: line for line in lines}
+    jobs = session.execute(
+        select(ProductionJob).where(
+            ProductionJob.production_line_id.in_(line_by_id),
+            ProductionJob.status.in_([QUEUED_STATUS, RUNNING_STATUS])
+        )
+    ).scalars()
+    for job in jobs:
+        window = job_window(job, now)
+        if window is not None:
+            busy[job.production_line_id].append(window)
+        else:
+            line = line_by_id[job.production_line_id]
+            minutes = (job.setup_time_minutes or 0) + run_minutes_on(job, None, line, line)
+            unscheduled[line.id] = unscheduled.get(line.id, 0.0) + minutes
+
+    free = np.zeros((len(lines), days))
+    for index, line in enumerate(lines):
+        free[index] = _minutes_per_day(_free_segments(windows, sorted(busy[line.id])), today, days)
+        # Queued jobs without times run in the first free time
+        remaining = unscheduled.get(line.id, 0.0)
+        for day in range(days):
+            if remaining <= 0:
+                break
+            taken = min(free[index, day], remaining)
+            free[index, day] -= taken
+            remaining -= taken
+    return free
+
+
+def build_snapshot() -> PromiseSnapshot:
+    """Read stock, receipts, commitments and line capacity; runs in its own session"""
+    now = datetime.utcnow().replace(second=0, microsecond=0)
+    today = now.replace(hour=0, minute=0)
+    days = settings.PROMISE_HORIZON_DAYS
+
+    with SessionLocal() as session:
+        flat = FlatBOM.from_structure(read_bom_structure(session))
+        projected, lead_days = _material_projection(session, flat, today, days)
+
+        products = {product.code: product for product in session.execute(
+            select(Product).where(Product.is_active == True)
+        ).scalars()}
+        lines = session.execute(
+            select(ProductionLine)
+            .where(ProductionLine.is_active == True, ProductionLine.status != ProductionLineStatus.ERROR)
+            .order_by(ProductionLine.code)
+        ).scalars().all()
+        free_minutes = _capacity_projection(session, lines, plant_calendar(), now, today, days)
+
+        sales_orders = session.execute(
+            select(Order.product_id, Order.quantity, Order.unit, Order.due_date)
+            .where(Order.status.in_(OPEN_SALES_STATUSES))
+            .order_by(Order.due_date, Order.created_at)
+        ).all()
+        # Loaded rows stay readable once the session is closed
+        session.expunge_all()
+
+    snapshot = PromiseSnapshot(today, flat, projected, lead_days, products, lines, free_minutes)
+    # Accepted sales orders claim their share in due date order, as they were promised
+    for row in sales_orders:
+        product = products.get(row.product_id)
+        if product is not None and row.unit is not None and row.unit.value == product.standard_unit:
+            snapshot.reserve(product, row.quantity)
+    return snapshot
+
+
+class PromiseCache:
+    """Process-wide PromiseSnapshot, rebuilt in the background after relevant changes"""
+
+    def __init__(self, max_age_seconds: float):
+        self.max_age_seconds = max_age_seconds
+        self._snapshot: Optional[PromiseSnapshot] = None
+        self._stale = True
+        self._lock = threading.Lock()
+
+    def invalidate(self) -> None:
+        self._stale = True
+
+    def needs_rebuild(self) -> bool:
+        snapshot = self._snapshot
+        return (
+            self._stale or snapshot is None
+            or time.monotonic() - snapshot.built_at > self.max_age_seconds / 2
+            or snapshot.today.date() != datetime.utcnow().date()
+        )
+
+    def rebuild(self) -> PromiseSnapshot:
+        # Changes flushed while building mark the new snapshot stale again
+        self._stale = False
+        try:
+            snapshot = build_snapshot()
+        except Exception:
+            self._stale = True
+            raise
+        with self._lock:
+            self._snapshot = snapshot
+        return snapshot
+
+    def _expired(self, snapshot: Optional[PromiseSnapshot]) -> bool:
+        return (
+            snapshot is None or time.monotonic() - snapshot.built_at > self.max_age_seconds
+            or snapshot.today.date() != datetime.utcnow().date()
+        )
+
+    def _current(self) -> PromiseSnapshot:
+        snapshot = self._snapshot
+        # The refresher keeps it current; without one (scripts, workers) callers rebuild it
+        if self._expired(snapshot):
+            snapshot = self.rebuild()
+        return snapshot
+
+    def _product(self, snapshot: PromiseSnapshot, product_code: str, unit: Optional[OrderUnit]) -> Optional[Product]:
+        product = snapshot.products.get(product_code)
+        if product is not None and unit is not None and unit.value != product.standard_unit:
+            raise ValueError(f"Product {product_code} is quoted in {product.standard_unit}, not {unit.value}")
+        return product
+
+    def quote(self, product_code: str, quantity: float, unit: Optional[OrderUnit] = None) -> Optional[DeliveryPromise]:
+        """Earliest delivery of a product quantity; None for unknown products"""
+        snapshot = self._current()
+        product = self._product(snapshot, product_code, unit)
+        if product is None:
+            return None
+        with self._lock:
+            return snapshot.quote(product, quantity)
+
+    def reserve(self, product_code: str, quantity: float, unit: Optional[OrderUnit] = None) -> None:
+        snapshot = self._snapshot
+        # The order is committed, so the next build accounts for it; no need to build one here
+        if self._expired(snapshot):
+            return
+        product = self._product(snapshot, product_code, unit)
+        if product is not None:
+            with self._lock:
+                snapshot.reserve(product, quantity)
+
+
+promise_cache = PromiseCache(settings.PROMISE_MAX_AGE_SECONDS)
+
+_PROMISE_SOURCES = (
+    InventoryItem, Batch, PurchaseOrder, PurchaseOrderLine, ProductionJob, ProductionLine,
+    ProductionOrder, ProductionOrderLine, Product, BOM, BOMLine, Order
+)
+
+
+@event.listens_for(Session, "after_flush")
+def _invalidate_promises(session: Session, flush_context: Any) -> None:
+    for obj in (*session.new, *session.dirty, *session.deleted):
+        if isinstance(obj, _PROMISE_SOURCES):
+            promise_cache.invalidate()
+            return
+
+
+async def refresh_promises() -> None:
+    if promise_cache.needs_rebuild():
+        started = time.perf_counter()
+        await asyncio.to_thread(promise_cache.rebuild)
+        logger.info(f"Delivery promise projection rebuilt in {(time.perf_counter() - started) * 1000:.0f} ms")
+
+
+promise_refresher = PeriodicTask(
+    "promise-refresher",
+    settings.PROMISE_REFRESH_SECONDS,
+    refresh_promises
+)
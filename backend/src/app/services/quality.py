@@ -0,0 +1,189 @@
+"""
+Quality control work queue for incoming batches
+
+The queue is read with keyset pagination on (received_date, id), which stays
+constant-time per page however deep the lab gets into the backlog. Decisions
+are applied in bulk: one UPDATE for all selected batches plus one audit row
+per decided batch, in a single transaction. Re-deciding a batch already in the
+target status keeps its status but still records the new notes and an audit
+row, and is reported as unchanged.
+"""
+
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy import select, update, insert, and_, or_
+from typing import List, Optional, Tuple
+from datetime import datetime
+import base64
+import uuid
+
+from app.models.base import QualityStatus
+from app.models.warehouse import Batch, Material, Supplier, BatchQualityDecision
+from app.schemas.warehouse import (
+    QCQueueItem, QCQueuePage, BulkQualityDecision, BulkQualityDecisionResult
+)
+from app.services.mrp import MRPService
+
+
+class QualityControlService:
+    """Service for the QC batch decision queue"""
+
+    DECISIONS = (QualityStatus.APPROVED, QualityStatus.BLOCKED, QualityStatus.QUARANTINE)
+
+    @staticmethod
+    def encode_cursor(received_date: datetime, batch_id: int) -> str:
+        raw = f"{received_date.isoformat()}|{batch_id}".encode()
+        return base64.urlsafe_b64encode(raw).decode()
+
+    @staticmethod
+    def decode_cursor(cursor: str) -> Tuple[datetime, int]:
+        try:
+            received_date, batch_id = base64.urlsafe_b64decode(cursor.encode()).decode().split("|")
+            return datetime.fromisoformat(received_date), int(batch_id)
+        except (ValueError, UnicodeDecodeError):
+            raise ValueError("Invalid cursor")
+
+    @staticmethod
+    async def get_queue(
+        db: AsyncSession,
+        status: QualityStatus = QualityStatus.PENDING,
+        supplier_id: Optional[int] = None,
+        material_id: Optional[int] = None,
+        cursor: Optional[str] = None,
+        limit: int = 100
+    ) -> QCQueuePage:
+        """Oldest received batches first, one page after the cursor"""
+        query = (
+            select(
+                Batch.id,
+                Batch.batch_number,
+                Batch.quality_status,
+                Batch.material_id,
+                Material.code.label("material_code"),
+                Material.name.label("material_name"),
+                Batch.supplier_id,
+                Supplier.code.label("supplier_code"),
+                Supplier.name.label("supplier_name"),
+                Batch.received_quantity,
+                Batch.received_date,
+                Batch.expiry_date,
+                Batch.has_coa,
+                Batch.has_tds,
+                Batch.has_sds,
+                Batch.has_doc,
+                Batch.has_cmr,
+            )
+            .join(Material, Material.id == Batch.material_id)
+            .join(Supplier, Supplier.id == Batch.supplier_id)
+            .where(Batch.quality_status == status)
+            .order_by(Batch.received_date, Batch.id)
+            .limit(limit + 1)
+        )
+
+        if supplier_id:
+            query = query.where(Batch.supplier_id == supplier_id)
+
+        if material_id:
+            query = query.where(Batch.material_id == material_id)
+
+        if cursor:
+            after_date, after_id = QualityControlService.decode_cursor(cursor)
+            query = query.where(
+                or_(
+                    Batch.received_date > after_date,
+                    and_(Batch.received_date == after_date, Batch.id > after_id)
+                )
+            )
+
+        rows = (await db.execute(query)).all()
+        items = [QCQueueItem(**row._mapping) for row in rows[:limit]]
+
+        next_cursor = None
+        if len(rows) > limit:
+            last = items[-1]
+            next_cursor = QualityControlService.encode_cursor(last.received_date, last.id)
+
+        return QCQueuePage(items=items, next_cursor=next_cursor)
+
+    @staticmethod
+    async def decide(db: AsyncSession, decision: BulkQualityDecision) -> BulkQualityDecisionResult:
+        """Set the quality status of many batches with one UPDATE and an audit row each"""
+        if decision.decision not in QualityControlService.DECISIONS:
+            raise ValueError(
+                f"Decision must be one of: {', '.join(status.value for status in QualityControlService.DECISIONS)}"
+            )
+
+        batch_ids = list(dict.fromkeys(decision.batch_ids))
+        decision_group = str(uuid.uuid4())
+        if not batch_ids:
+            return BulkQualityDecisionResult(
+                decision=decision.decision, decision_group=decision_group, updated_batch_ids=[]
+            )
+
+        # Lock the rows so the audited previous status is the one actually replaced
+        result = await db.execute(
+            select(Batch.id, Batch.quality_status)
+            .where(Batch.id.in_(batch_ids))
+            .with_for_update()
+        )
+        current = dict(result.all())
+
+        # from_statuses limits both; a batch already in the target status is re-decided: new notes and an audit row
+        candidates = [
+            batch_id for batch_id in batch_ids
+            if batch_id in current and (not decision.from_statuses or current[batch_id] in decision.from_statuses)
+        ]
+        eligible = [batch_id for batch_id in candidates if current[batch_id] != decision.decision]
+        unchanged = [batch_id for batch_id in candidates if current[batch_id] == decision.decision]
+
+        if candidates:
+            values = {"quality_status": decision.decision, "updated_at": datetime.utcnow()}
+            if decision.notes is not None:
+                values["quality_notes"] = decision.notes
+
+            await db.execute(
+                update(Batch)
+                .where(Batch.id.in_(candidates))
+                .values(**values)
+                .execution_options(synchronize_session=False)
+            )
+        if eligible:
+            await MRPService.mark_dirty(
+                db, "material", select(Batch.material_id).where(Batch.id.in_(eligible)).distinct()
+            )
+
+        decided = eligible + unchanged
+        if decided:
+            await db.execute(
+                insert(BatchQualityDecision),
+                [
+                    {
+                        "batch_id": batch_id,
+                        "previous_status": current[batch_id],
+                        "new_status": decision.decision,
+                        "notes": decision.notes,
+                        "user_id": decision.user_id,
+                        "decision_group": decision_group,
+                    }
+                    for batch_id in decided
+                ]
+            )
+            await db.commit()
+
+        decided_set = set(decided)
+        return BulkQualityDecisionResult(
+            decision=decision.decision,
+            decision_group=decision_group,
+            updated_batch_ids=eligible,
+            unchanged_batch_ids=unchanged,
+            skipped_batch_ids=[batch_id for batch_id in batch_ids if batch_id not in decided_set]
+        )
+
+    @staticmethod
+    async def get_history(db: AsyncSession, batch_id: int) -> List[BatchQualityDecision]:
+        """Quality decisions on a batch, newest first"""
+        result = await db.execute(
+            select(BatchQualityDecision)
+            .where(BatchQualityDecision.batch_id == batch_id)
+            .order_by(BatchQualityDecision.created_at.desc(), BatchQualityDecision.id.desc())
+        )
+        return result.scalars().all()
@@ -0,0 +1,365 @@
+"""
+Stock reservation ledger
+
+Every reserved quantity is backed by a StockReservation row naming its holder
+and expiry. InventoryItem.reserved_quantity (and Batch.reserved_quantity) stay
+as the running aggregate of the active holds and are adjusted in the same
+transaction as the ledger, so available-to-promise is a plain SUM over
+inventory rows and never scans the ledger. A periodic sweeper releases
+expired holds in bulk.
+"""
+
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy import select, update, insert, func, bindparam, or_
+from typing import Dict, Iterable, List, Optional, Tuple
+from datetime import datetime, timedelta
+import logging
+
+from app.core.config import settings
+from app.db.database import AsyncSessionLocal
+from app.models.base import QualityStatus, ReservationStatus
+from app.models.warehouse import Batch, InventoryItem, StockReservation
+from app.schemas.warehouse import AllocationResult, AvailableToPromise, ReservationUpdateResult
+from app.utils.periodic import PeriodicTask
+from app.utils.upsert import chunked
+
+logger = logging.getLogger(__name__)
+
+
+class InsufficientStockError(ValueError):
+    """An inventory row no longer has the quantity a reservation was computed from"""
+
+
+class ReservationService:
+    """Service for the stock reservation ledger"""
+
+    EPSILON = 1e-9
+
+    @staticmethod
+    async def apply_deltas(
+        db: AsyncSession,
+        per_item: Dict[int, float],
+        per_batch: Dict[int, float]
+    ) -> None:
+        """
+        Add signed quantities to reserved_quantity.
+
+        Each reserved inventory item (a positive delta) gets its own guarded
+        UPDATE, changing the row only while its available quantity still
+        covers the delta, so concurrent reservations cannot drive it negative
+        even where row locks do not exist (SQLite). A row that fails the
+        guard raises InsufficientStockError; the caller rolls back. Releases
+        and the batch deltas need no guard and go out as one executemany each.
+        """
+        now = datetime.utcnow()
+        items = InventoryItem.__table__
+
+        for item_id, qty in per_item.items():
+            if qty <= 0:
+                continue
+            result = await db.execute(
+                update(items)
+                .where(
+                    items.c.id == item_id,
+                    items.c.available_quantity >= qty - ReservationService.EPSILON
+                )
+                .values(
+                    reserved_quantity=items.c.reserved_quantity + qty,
+                    available_quantity=items.c.available_quantity - qty,
+                    updated_at=now
+                )
+            )
+            if result.rowcount != 1:
+                raise InsufficientStockError(
+                    f"Inventory item {item_id} no longer has {qty} available; stock changed concurrently, retry"
+                )
+
+        releases = [{"item_pk": item_id, "qty": qty} for item_id, qty in per_item.items() if qty < 0]
+        if releases:
+            await db.execute(
+                update(items)
+                .where(items.c.id == bindparam("item_pk"))
+                .values(
+                    reserved_quantity=items.c.reserved_quantity + bindparam("qty"),
+                    available_quantity=items.c.available_quantity - bindparam("qty"),
+                    updated_at=now
+                ),
+                releases
+            )
+
+        if per_batch:
+            batches = Batch.__table__
+            await db.execute(
+                update(batches)
+                .where(batches.c.id == bindparam("batch_pk"))
+                .values(
+                    reserved_quantity=batches.c.reserved_quantity + bindparam("qty"),
+                    available_quantity=batches.c.available_quantity - bindparam("qty"),
+                    updated_at=now
+                ),
+                [{"batch_pk": batch_id, "qty": qty} for batch_id, qty in per_batch.items()]
+            )
+
+    @staticmethod
+    def _totals(rows: Iterable[Tuple[int, Optional[int], float]], sign: float) -> Tuple[Dict[int, float], Dict[int, float]]:
+        """Sum (inventory_item_id, batch_id, quantity) rows per item and per batch"""
+        per_item: Dict[int, float] = {}
+        per_batch: Dict[int, float] = {}
+        for item_id, batch_id, quantity in rows:
+            per_item[item_id] = per_item.get(item_id, 0.0) + sign * quantity
+            if batch_id is not None:
+                per_batch[batch_id] = per_batch.get(batch_id, 0.0) + sign * quantity
+        return per_item, per_batch
+
+    @staticmethod
+    async def hold(
+        db: AsyncSession,
+        results: List[AllocationResult],
+        production_job_ids: List[Optional[int]],
+        hold_minutes: Optional[int] = None,
+        user_id: Optional[str] = None
+    ) -> None:
+        """
+        Record ledger rows for allocation results and reserve their quantity.
+
+        Sets reservation_id on every allocation line; does not commit.
+        """
+        if hold_minutes is None:
+            hold_minutes = settings.RESERVATION_TTL_MINUTES
+        expires_at = datetime.utcnow() + timedelta(minutes=hold_minutes) if hold_minutes > 0 else None
+
+        lines = []
+        values = []
+        for result, production_job_id in zip(results, production_job_ids):
+            for line in result.lines:
+                lines.append(line)
+                values.append({
+                    "inventory_item_id": line.inventory_item_id,
+                    "batch_id": line.batch_id,
+                    "material_id": result.material_id,
+                    "quantity": line.quantity,
+                    "status": ReservationStatus.ACTIVE,
+                    "reference_type": result.reference_type,
+                    "reference_id": result.reference_id,
+                    "production_job_id": production_job_id,
+                    "user_id": user_id,
+                    "expires_at": expires_at,
+                })
+
+        if not values:
+            return
+
+        ids = await db.scalars(
+            insert(StockReservation).returning(StockReservation.id, sort_by_parameter_order=True),
+            values
+        )
+        for line, reservation_id in zip(lines, ids.all()):
+            line.reservation_id = reservation_id
+
+        await ReservationService.apply_deltas(
+            db,
+            *ReservationService._totals(
+                ((line.inventory_item_id, line.batch_id, line.quantity) for line in lines), 1.0
+            )
+        )
+
+    @staticmethod
+    async def _close(db: AsyncSession, query, status: ReservationStatus) -> ReservationUpdateResult:
+        """Close the active holds selected by query and give back their quantity"""
+        rows = (await db.execute(query)).all()
+        if not rows:
+            return ReservationUpdateResult(reservations=0, quantity=0.0)
+
+        now = datetime.utcnow()
+        for ids in chunked([row.id for row in rows], 500):
+            await db.execute(
+                update(StockReservation)
+                .where(StockReservation.id.in_(ids))
+                .values(status=status, closed_at=now, updated_at=now)
+                .execution_options(synchronize_session=False)
+            )
+
+        await ReservationService.apply_deltas(
+            db,
+            *ReservationService._totals(
+                ((row.inventory_item_id, row.batch_id, row.quantity) for row in rows), -1.0
+            )
+        )
+        return ReservationUpdateResult(
+            reservations=len(rows),
+            quantity=sum(row.quantity for row in rows)
+        )
+
+    @staticmethod
+    def _active_query():
+        return (
+            select(
+                StockReservation.id,
+                StockReservation.inventory_item_id,
+                StockReservation.batch_id,
+                StockReservation.quantity,
+            )
+            .where(StockReservation.status == ReservationStatus.ACTIVE)
+            .order_by(StockReservation.id)
+        )
+
+    @staticmethod
+    async def release(
+        db: AsyncSession,
+        reservation_ids: Optional[List[int]] = None,
+        reference_type: Optional[str] = None,
+        reference_id: Optional[str] = None,
+        status: ReservationStatus = ReservationStatus.RELEASED
+    ) -> ReservationUpdateResult:
+        """Release (or mark consumed) the active holds by id or by holder reference"""
+        if not reservation_ids and not reference_id:
+            raise ValueError("Either reservation_ids or reference_id is required")
+
+        query = ReservationService._active_query().with_for_update()
+        if reservation_ids:
+            query = query.where(StockReservation.id.in_(reservation_ids))
+        if reference_id:
+            query = query.where(StockReservation.reference_id == reference_id)
+            if reference_type:
+                query = query.where(StockReservation.reference_type == reference_type)
+
+        result = await ReservationService._close(db, query, status)
+        await db.commit()
+        return result
+
+    @staticmethod
+    async def sweep_expired(db: AsyncSession, batch_size: Optional[int] = None) -> ReservationUpdateResult:
+        """Expire every active hold past its expires_at, batch_size holds per transaction"""
+        batch_size = batch_size or settings.RESERVATION_SWEEP_BATCH_SIZE
+        now = datetime.utcnow()
+        total = ReservationUpdateResult(reservations=0, quantity=0.0)
+
+        while True:
+            # SKIP LOCKED lets several workers sweep without blocking on each other
+            query = (
+                ReservationService._active_query()
+                .where(StockReservation.expires_at <= now)
+                .limit(batch_size)
+                .with_for_update(skip_locked=True)
+            )
+            result = await ReservationService._close(db, query, ReservationStatus.EXPIRED)
+            await db.commit()
+
+            total.reservations += result.reservations
+            total.quantity += result.quantity
+            if result.reservations < batch_size:
+                return total
+
+    @staticmethod
+    async def get_reservations(
+        db: AsyncSession,
+        status: Optional[ReservationStatus] = ReservationStatus.ACTIVE,
+        material_id: Optional[int] = None,
+        inventory_item_id: Optional[int] = None,
+        reference_type: Optional[str] = None,
+        reference_id: Optional[str] = None,
+        skip: int = 0,
+        limit: int = 100
+    ) -> List[StockReservation]:
+        query = select(StockReservation).order_by(StockReservation.id).offset(skip).limit(limit)
+
+        if status:
+            query = query.where(StockReservation.status == status)
+        if material_id:
+            query = query.where(StockReservation.material_id == material_id)
+        if inventory_item_id:
+            query = query.where(StockReservation.inventory_item_id == inventory_item_id)
+        if reference_type:
+            query = query.where(StockReservation.reference_type == reference_type)
+        if reference_id:
+            query = query.where(StockReservation.reference_id == reference_id)
+
+        result = await db.execute(query)
+        return result.scalars().all()
+
+    @staticmethod
+    async def get_available_to_promise(
+        db: AsyncSession,
+        material_ids: List[int],
+        warehouse_id: Optional[int] = None
+    ) -> List[AvailableToPromise]:
+        """Approved, unexpired stock net of reservations, from the inventory aggregate"""
+        query = (
+            select(
+                InventoryItem.material_id,
+                func.coalesce(func.sum(InventoryItem.quantity), 0.0).label("on_hand"),
+                func.coalesce(func.sum(InventoryItem.reserved_quantity), 0.0).label("reserved"),
+                func.coalesce(func.sum(InventoryItem.available_quantity), 0.0).label("available"),
+            )
+            .join(Batch, Batch.id == InventoryItem.batch_id)
+            .where(
+                InventoryItem.material_id.in_(material_ids),
+                Batch.quality_status == QualityStatus.APPROVED,
+                or_(Batch.expiry_date.is_(None), Batch.expiry_date > datetime.utcnow())
+            )
+            .group_by(InventoryItem.material_id)
+        )
+        if warehouse_id:
+            query = query.where(InventoryItem.warehouse_id == warehouse_id)
+
+        rows = {row.material_id: row for row in (await db.execute(query)).all()}
+        return [
+            AvailableToPromise(
+                material_id=material_id,
+                on_hand=rows[material_id].on_hand if material_id in rows else 0.0,
+                reserved=rows[material_id].reserved if material_id in rows else 0.0,
+                available=max(rows[material_id].available, 0.0) if material_id in rows else 0.0
+            )
+            for material_id in material_ids
+        ]
+
+    @staticmethod
+    async def reconcile(db: AsyncSession) -> Dict[str, int]:
+        """
+        Reset reserved_quantity to the sum of active holds where it has drifted.
+
+        Makes the ledger authoritative: reservations set by hand without a
+        ledger row are dropped.
+        """
+        def active_sum(column):
+            return (
+                select(func.coalesce(func.sum(StockReservation.quantity), 0.0))
+                .where(column, StockReservation.status == ReservationStatus.ACTIVE)
+                .scalar_subquery()
+            )
+
+        now = datetime.utcnow()
+        corrected = {}
+        for name, model, fk in (
+            ("inventory_items", InventoryItem, StockReservation.inventory_item_id),
+            ("batches", Batch, StockReservation.batch_id),
+        ):
+            expected = active_sum(fk == model.id)
+            result = await db.execute(
+                update(model)
+                .where(func.abs(func.coalesce(model.reserved_quantity, 0.0) - expected) > 1e-9)
+                .values(
+                    available_quantity=model.available_quantity + func.coalesce(model.reserved_quantity, 0.0) - expected,
+                    reserved_quantity=expected,
+                    updated_at=now
+                )
+                .execution_options(synchronize_session=False)
+            )
+            corrected[name] = result.rowcount
+
+        await db.commit()
+        return corrected
+
+
+async def sweep_expired_reservations() -> None:
+    async with AsyncSessionLocal() as db:
+        result = await ReservationService.sweep_expired(db)
+    if result.reservations:
+        logger.info(f"Expired {result.reservations} stock reservations ({result.quantity} units released)")
+
+
+reservation_sweeper = PeriodicTask(
+    "reservation-sweeper",
+    settings.RESERVATION_SWEEP_INTERVAL_SECONDS,
+    sweep_expired_reservations
+)
@@ -0,0 +1,513 @@
+"""
+What-if scenarios for production planning
+
+The schedule (queued jobs per line with their changeover attributes, busy
+time per line) and stock (on-hand, open purchase receipts, flattened BOMs)
+are read once into a PlanningSnapshot. Each scenario applies its changes to
+copy-on-write columns over the snapshot, books every line again on the
+shift calendar, nets the material demand of the resulting schedule against
+stock and reports KPIs. Scenarios run in one process pool started with the
+app; a comparison pickles its snapshot once and each worker unpickles it
+once, so a scenario only costs the columns it changes.
+"""
+
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy import select
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Dict, List, NamedTuple, Optional, Set, Tuple
+from datetime import datetime, timedelta
+import asyncio
+import logging
+import multiprocessing
+import pickle
+import threading
+import time
+import uuid
+
+import numpy as np
+
+from app.core.config import settings
+from app.models.base import OrderPriority
+from app.models.production import ProductionJob, ProductionOrder, ProductionOrderLine, Product
+from app.schemas.production import (
+    ScenarioChangeType, ScenarioSpec, ScenarioRequest, ScenarioKPIs, ScenarioComparison, MaterialShortage
+)
+from app.services.bom import FlatBOM, flat_bom_cache
+from app.services.mrp import MRPEngine, read_usable_stock, read_open_receipts
+from app.services.planning import PlanningService, plant_calendar, line_accepts, run_minutes_on
+from app.services.sequencing import (
+    SequencingService, QUEUED_STATUS, RUNNING_STATUS, COLOR_RANK, PRIORITY_WEIGHTS, color_group, dominant_material
+)
+from app.utils.cow import CopyOnWriteColumns, freeze
+from app.utils.intervals import Interval
+from app.utils.scheduling import ShiftCalendar, LineTimeline
+from app.utils.sequencing import SequenceProblem, solve_sequence
+
+logger = logging.getLogger(__name__)
+
+MAX_SHORTAGES = 50
+# Scenario moves delayed jobs behind everything else on their line
+DELAYED_POSITION = 1e9
+
+JOB_COLUMNS = (
+    "job_id", "line", "order", "minutes", "due", "weight", "color",
+    "material", "width", "product", "quantity", "release", "position", "frozen", "active"
+)
+
+
+class PlanningSnapshot(NamedTuple):
+    start: datetime
+    frozen_until: datetime
+    horizon_end: datetime
+    calendar: ShiftCalendar
+    line_ids: Tuple[int, ...]
+    line_codes: Tuple[str, ...]
+    busy: Tuple[Tuple[Tuple[datetime, datetime], ...], ...]  # Maintenance and running jobs per line
+    line_state: Dict[str, np.ndarray]  # color, material, width of what each line runs now; color nan when clean
+    jobs: Dict[str, np.ndarray]        # Queued jobs, read-only JOB_COLUMNS
+    candidates: Dict[str, np.ndarray]  # Jobs of orders a scenario may rush in, not on a line yet
+    candidate_minutes: np.ndarray      # candidates x lines, nan where a line cannot make the product
+    order_index: Dict[str, int]
+    flat: FlatBOM
+    on_hand: np.ndarray                # Per FlatBOM material column
+    receipts: Tuple[np.ndarray, np.ndarray, np.ndarray]  # Material columns, days from start, quantities
+    n_days: int
+
+
+def _columns(rows: List[tuple]) -> Dict[str, np.ndarray]:
+    dtypes = {"job_id": np.int64, "line": np.int64, "order": np.int64, "material": np.int64,
+              "product": np.int64, "frozen": bool, "active": bool}
+    values = list(zip(*rows)) if rows else [()] * len(JOB_COLUMNS)
+    return freeze({
+        name: np.array(column, dtype=dtypes.get(name, float))
+        for name, column in zip(JOB_COLUMNS, values)
+    })
+
+
+def _setup_matrix(snapshot: PlanningSnapshot, jobs: CopyOnWriteColumns, rows: np.ndarray,
+                  state: Tuple[float, int, float]) -> np.ndarray:
+    """(n + 1) x (n + 1) changeovers with the line's state as the last row"""
+    color, material, width = state
+    setup = SequencingService.changeover_model.matrix(
+        np.append(jobs["color"][rows], 0.0 if np.isnan(color) else color),
+        np.append(jobs["material"][rows], material),
+        np.append(jobs["width"][rows], width)
+    )
+    if np.isnan(color):
+        setup[-1, :] = 0.0  # A clean line
+    return setup
+
+
+def simulate(snapshot: PlanningSnapshot, spec: ScenarioSpec, window_days: int, time_budget: float) -> ScenarioKPIs:
+    """Apply the scenario's changes to its own view of the snapshot and schedule every line"""
+    jobs = CopyOnWriteColumns(snapshot.jobs)
+    n_lines = len(snapshot.line_ids)
+    line_of = {line_id: index for index, line_id in enumerate(snapshot.line_ids)}
+    downtime: List[List[Tuple[datetime, datetime]]] = [[] for _ in range(n_lines)]
+
+    for change in spec.changes:
+        if change.type == ScenarioChangeType.LINE_DOWN:
+            start = max(change.start or snapshot.start, snapshot.start)
+            downtime[line_of[change.line_id]].append((start, start + timedelta(hours=change.hours)))
+            continue
+
+        order = snapshot.order_index[change.order_number]
+        if change.type == ScenarioChangeType.RUSH_ORDER:
+            rows = np.flatnonzero(snapshot.candidates["order"] == order)
+            added = {name: values[rows].copy() for name, values in snapshot.candidates.items()}
+            minutes = snapshot.candidate_minutes[rows].copy()
+            if change.line_id is not None:
+                minutes[:, [index for index in range(n_lines) if snapshot.line_ids[index] != change.line_id]] = np.nan
+            active = jobs["active"]
+            load = np.bincount(jobs["line"][active], weights=jobs["minutes"][active], minlength=n_lines)
+            for k in range(rows.size):
+                if np.all(np.isnan(minutes[k])):
+                    continue  # Stays off every line and counts as unscheduled
+                # Least loaded line that can make it, ahead of everything not frozen
+                line = int(np.nanargmin(load + minutes[k]))
+                on_line = (jobs["line"] == line) & jobs["frozen"] & jobs["active"]
+                front = jobs["position"][on_line].max() if on_line.any() else -1.0
+                added["line"][k] = line
+                added["minutes"][k] = minutes[k, line]
+                added["position"][k] = front + 0.5 + k * 1e-3
+                added["weight"][k] = PRIORITY_WEIGHTS[OrderPriority.CRITICAL]
+                load[line] += minutes[k, line]
+            jobs.append(added)
+            continue
+
+        rows = (jobs["order"] == order) & jobs["active"]
+        if change.type == ScenarioChangeType.CANCEL_ORDER:
+            jobs.writable("active")[rows] = False
+        elif change.type == ScenarioChangeType.DELAY_ORDER:
+            shift = change.days * 24 * 60
+            jobs.writable("due")[rows] += shift
+            release = jobs.writable("release")
+            release[rows] = np.maximum(release[rows], shift)
+            jobs.writable("position")[rows] += DELAYED_POSITION
+
+    calendar = snapshot.calendar
+    window_end = snapshot.start + timedelta(days=window_days)
+    window_minutes = calendar.working_minutes(snapshot.start, window_end)
+    active = jobs["active"]
+    lines, positions = jobs["line"], jobs["position"]
+    frozen = jobs["frozen"]
+    minutes, due, weights = jobs["minutes"], jobs["due"], jobs["weight"]
+
+    ends: Dict[int, datetime] = {}
+    starts: Dict[int, datetime] = {}
+    changeover_total = 0.0
+    unscheduled = int(np.count_nonzero(active & (lines < 0)))
+    line_utilization: Dict[str, float] = {}
+    for line in range(n_lines):
+        timeline = LineTimeline(calendar, [Interval(s, e) for s, e in snapshot.busy[line] + tuple(downtime[line])])
+        busy_minutes = 0.0
+        state = tuple(snapshot.line_state[name][line] for name in ("color", "material", "width"))
+        chain = snapshot.start
+        on_line = np.flatnonzero(active & (lines == line))
+        on_line = on_line[np.argsort(positions[on_line], kind="stable")]
+        # Frozen jobs run first as planned; the rest may be re-sequenced behind them
+        for phase_rows, optimize in ((on_line[frozen[on_line]], False), (on_line[~frozen[on_line]], spec.resequence)):
+            if phase_rows.size == 0:
+                continue
+            problem = SequenceProblem(
+                setup=_setup_matrix(snapshot, jobs, phase_rows, state),
+                processing=minutes[phase_rows],
+                due=due[phase_rows],
+                weights=weights[phase_rows]
+            )
+            current = np.arange(phase_rows.size, dtype=np.int64)
+            sequence = solve_sequence(problem, time_budget, current) if optimize else problem.evaluate(current)
+            for index, changeover in zip(sequence.order.tolist(), sequence.changeovers.tolist()):
+                row = int(phase_rows[index])
+                release = max(chain, snapshot.start + timedelta(minutes=float(jobs["release"][row])))
+                slot = timeline.earliest_slot(release, changeover + minutes[row], snapshot.horizon_end)
+                if slot is None:
+                    unscheduled += 1
+                    continue
+                timeline.block(slot[0], slot[1])
+                chain = slot[1]
+                starts[row], ends[row] = slot
+                changeover_total += changeover
+                if slot[0] < window_end:
+                    busy_minutes += calendar.working_minutes(slot[0], min(slot[1], window_end))
+            last = int(phase_rows[sequence.order[-1]])
+            state = (jobs["color"][last], int(jobs["material"][last]), jobs["width"][last])
+        line_utilization[snapshot.line_codes[line]] = round(100.0 * busy_minutes / window_minutes, 1) \
+            if window_minutes else 0.0
+
+    # Tardiness against the booked end of each job
+    late = 0
+    tardiness = weighted = 0.0
+    for row, end in ends.items():
+        if np.isnan(due[row]):
+            continue
+        overdue = (end - snapshot.start).total_seconds() / 60 - due[row]
+        if overdue > 0:
+            late += 1
+            tardiness += overdue
+            weighted += weights[row] * overdue
+
+    return ScenarioKPIs(
+        name=spec.name,
+        scheduled_jobs=len(ends),
+        unscheduled_jobs=unscheduled,
+        late_jobs=late,
+        total_tardiness_hours=round(tardiness / 60, 1),
+        weighted_tardiness=round(weighted, 1),
+        changeover_minutes=round(changeover_total, 1),
+        utilization=round(sum(line_utilization.values()) / n_lines, 1) if n_lines else 0.0,
+        line_utilization=line_utilization,
+        makespan_end=max(ends.values(), default=None),
+        shortages=_shortages(snapshot, jobs, starts),
+        overlay_kb=round(jobs.owned_bytes / 1024, 1)
+    )
+
+
+def _day_zero(start: datetime) -> datetime:
+    """Origin of the daily material buckets, demand and receipts alike"""
+    return start.replace(hour=0, minute=0, second=0, microsecond=0)
+
+
+def _shortages(snapshot: PlanningSnapshot, jobs: CopyOnWriteColumns, starts: Dict[int, datetime]) -> List[MaterialShortage]:
+    """Net the materials of the scheduled jobs, needed on their start day, against stock and receipts"""
+    flat = snapshot.flat
+    day_zero = _day_zero(snapshot.start)
+    columns, days, quantities = [], [], []
+    products, amounts = jobs["product"], jobs["quantity"]
+    for row, start in starts.items():
+        flat_row = flat.row_of_product.get(int(products[row]))
+        if flat_row is None:
+            continue
+        span = slice(flat.indptr[flat_row], flat.indptr[flat_row + 1])
+        columns.append(flat.indices[span])
+        quantities.append(flat.quantities[span] * amounts[row])
+        days.append(np.full(flat.indices[span].size, min(max((start - day_zero).days, 0), snapshot.n_days - 1)))
+    if not columns:
+        return []
+
+    engine = MRPEngine(flat.material_ids.size, snapshot.n_days)
+    engine.on_hand[:] = snapshot.on_hand
+    engine.add_receipts(*snapshot.receipts)
+    engine.add_demand(np.concatenate(columns), np.concatenate(days), np.concatenate(quantities))
+    planned = engine.run().planned
+
+    short = np.flatnonzero(planned.sum(axis=1) > 1e-9)
+    first_day = np.argmax(planned[short] > 1e-9, axis=1)
+    ranked = sorted(zip(short.tolist(), first_day.tolist()), key=lambda item: (item[1], -planned[item[0]].sum()))
+    return [
+        MaterialShortage(
+            material_id=int(flat.material_ids[column]),
+            quantity=round(float(planned[column].sum()), 3),
+            first_short_date=day_zero + timedelta(days=day)
+        )
+        for column, day in ranked[:MAX_SHORTAGES]
+    ]
+
+
+# --- process pool ---------------------------------------------------------------
+
+_worker_snapshot: Optional[Tuple[str, PlanningSnapshot]] = None
+
+
+def _simulate_in_worker(
+    token: str, payload: bytes, spec: ScenarioSpec, window_days: int, time_budget: float
+) -> ScenarioKPIs:
+    # Workers outlive a comparison; the snapshot is unpickled once per comparison, not per scenario
+    global _worker_snapshot
+    if _worker_snapshot is None or _worker_snapshot[0] != token:
+        _worker_snapshot = (token, pickle.loads(payload))
+    return simulate(_worker_snapshot[1], spec, window_days, time_budget)
+
+
+def _pool_context():
+    # Workers fork from a clean server process rather than from the threaded app
+    if "forkserver" in multiprocessing.get_all_start_methods():
+        context = multiprocessing.get_context("forkserver")
+        # The server imports these once; workers fork from it ready to run. Failed preloads are
+        # skipped silently, and the models only import cleanly with app.db.base first
+        context.set_forkserver_preload(["app.db.base", __name__])
+        return context
+    return multiprocessing.get_context("spawn")
+
+
+class ScenarioPool:
+    """Worker processes for scenario comparisons, started once with the app"""
+
+    def __init__(self, max_workers: int):
+        self.max_workers = max_workers
+        self._executor: Optional[ProcessPoolExecutor] = None
+        self._lock = threading.Lock()
+
+    def start(self) -> None:
+        with self._lock:
+            if self._executor is None and self.max_workers > 1:
+                self._executor = ProcessPoolExecutor(max_workers=self.max_workers, mp_context=_pool_context())
+                logger.info(f"Scenario pool started with {self.max_workers} workers")
+
+    def shutdown(self, wait: bool = False) -> None:
+        with self._lock:
+            if self._executor is not None:
+                self._executor.shutdown(wait=wait, cancel_futures=True)
+                self._executor = None
+                logger.info("Scenario pool stopped")
+
+    async def run(
+        self, snapshot: PlanningSnapshot, specs: List[ScenarioSpec], window_days: int, time_budget: float
+    ) -> List[ScenarioKPIs]:
+        self.start()
+        executor = self._executor
+        if executor is None or len(specs) <= 1:
+            return [
+                await asyncio.to_thread(simulate, snapshot, spec, window_days, time_budget)
+                for spec in specs
+            ]
+
+        token = uuid.uuid4().hex
+        payload = pickle.dumps(snapshot, protocol=pickle.HIGHEST_PROTOCOL)
+        loop = asyncio.get_running_loop()
+        try:
+            return list(await asyncio.gather(*(
+                loop.run_in_executor(executor, _simulate_in_worker, token, payload, spec, window_days, time_budget)
+                for spec in specs
+            )))
+        except BrokenProcessPool:
+            # A worker died; the next comparison starts a fresh pool
+            with self._lock:
+                if self._executor is executor:
+                    self._executor = None
+            executor.shutdown(wait=False, cancel_futures=True)
+            raise
+
+
+scenario_pool = ScenarioPool(settings.SCENARIO_WORKERS)
+
+
+class ScenarioService:
+    """Service for what-if comparison of planning scenarios"""
+
+    @staticmethod
+    async def take_snapshot(db: AsyncSession, rush_orders: Set[str]) -> PlanningSnapshot:
+        """Current schedule and stock; rush_orders are loaded as candidates to queue"""
+        start = datetime.utcnow().replace(second=0, microsecond=0)
+        frozen_until = start + timedelta(minutes=settings.SCHEDULE_FROZEN_HORIZON_MINUTES)
+        n_days = settings.SCHEDULE_HORIZON_DAYS
+        lines = await PlanningService._lines(db)
+        line_index = {line.id: index for index, line in enumerate(lines)}
+        timelines = await PlanningService._timelines(db, lines)
+        flat = await flat_bom_cache.get(db)
+
+        result = await db.execute(
+            select(ProductionJob)
+            .where(
+                ProductionJob.production_line_id.in_(list(line_index)),
+                ProductionJob.status.in_([QUEUED_STATUS, RUNNING_STATUS])
+            )
+            .order_by(
+                ProductionJob.production_line_id,
+                ProductionJob.sequence_number.is_(None),
+                ProductionJob.sequence_number,
+                ProductionJob.scheduled_start_time,
+                ProductionJob.id
+            )
+        )
+        contexts = await SequencingService.describe_jobs(db, result.scalars().all())
+
+        state = {
+            "color": np.full(len(lines), np.nan),
+            "material": np.full(len(lines), -1, dtype=np.int64),
+            "width": np.full(len(lines), np.nan)
+        }
+        order_index: Dict[str, int] = {}
+        rows = []
+        for context in contexts:
+            job = context.job
+            line = line_index[job.production_line_id]
+            width = context.product.width_mm if context.product is not None and context.product.width_mm else np.nan
+            material = context.material_id if context.material_id is not None else -1
+            if job.status == RUNNING_STATUS:
+                state["color"][line] = COLOR_RANK[context.color_group]
+                state["material"][line] = material
+                state["width"][line] = width
+                continue
+            order = order_index.setdefault(context.order_number, len(order_index))
+            due = (context.due_date - start).total_seconds() / 60 if context.due_date is not None else np.nan
+            run = run_minutes_on(job, context.product, lines[line], lines[line])
+            frozen = job.scheduled_start_time is not None and job.scheduled_start_time < frozen_until
+            rows.append((
+                job.id, line, order, (job.setup_time_minutes or 0) + run, due,
+                PRIORITY_WEIGHTS.get(context.priority, 0.1), COLOR_RANK[context.color_group], material, width,
+                context.product.id if context.product is not None else -1,
+                max(job.target_quantity - (job.produced_quantity or 0), 0.0), 0.0, 0.0, frozen, True
+            ))
+        # Frozen jobs lead each line, the rest keep their queue order
+        rows.sort(key=lambda row: (row[1], not row[13]))
+        rows = [row[:12] + (float(position),) + row[13:] for position, row in enumerate(rows)]
+
+        candidate_rows, candidate_minutes = [], []
+        for order_number in sorted(rush_orders):
+            order = await db.scalar(select(ProductionOrder).where(ProductionOrder.order_number == order_number))
+            if order is None:
+                raise ValueError(f"Order {order_number} not found")
+            if order_number in order_index:
+                raise ValueError(f"Order {order_number} is already in the production queue")
+            order_index[order_number] = len(order_index)
+            result = await db.execute(
+                select(ProductionOrderLine, Product)
+                .join(Product, Product.id == ProductionOrderLine.product_id)
+                .where(ProductionOrderLine.production_order_id == order.id, ProductionOrderLine.quantity_remaining > 0)
+                .order_by(ProductionOrderLine.line_number)
+            )
+            for order_line, product in result.all():
+                due_date = order_line.requested_delivery_date or order.confirmed_delivery_date \
+                    or order.requested_delivery_date
+                material = dominant_material(flat, product.id)
+                job = ProductionJob(target_quantity=order_line.quantity_remaining)
+                candidate_rows.append((
+                    0, -1, order_index[order_number], 0.0,
+                    (due_date - start).total_seconds() / 60 if due_date is not None else np.nan,
+                    0.0, COLOR_RANK[color_group(product.color, product.transparency)],
+                    material if material is not None else -1, product.width_mm or np.nan,
+                    product.id, order_line.quantity_remaining, 0.0, 0.0, False, True
+                ))
+                candidate_minutes.append([
+                    run_minutes_on(job, product, None, line) if line_accepts(line, None, product) else np.nan
+                    for line in lines
+                ])
+
+        # Stock and open receipts per FlatBOM material column
+        column_of = {material_id: column for column, material_id in enumerate(flat.material_ids.tolist())}
+        on_hand = np.zeros(flat.material_ids.size)
+        for material_id, quantity in (await db.run_sync(read_usable_stock)).items():
+            if material_id in column_of:
+                on_hand[column_of[material_id]] = max(quantity or 0.0, 0.0)
+        receipts = await db.run_sync(read_open_receipts)
+        receipts = [row for row in receipts if row[0] in column_of]
+        day_zero = _day_zero(start)
+
+        return PlanningSnapshot(
+            start=start,
+            frozen_until=frozen_until,
+            horizon_end=start + timedelta(days=n_days),
+            calendar=plant_calendar(),
+            line_ids=tuple(line.id for line in lines),
+            line_codes=tuple(line.code for line in lines),
+            busy=tuple(
+                tuple((interval.start, interval.end) for interval in timelines[line.id].intervals())
+                for line in lines
+            ),
+            line_state=freeze(state),
+            jobs=_columns(rows),
+            candidates=_columns(candidate_rows),
+            candidate_minutes=np.array(candidate_minutes, dtype=float).reshape(len(candidate_rows), len(lines)),
+            order_index=order_index,
+            flat=flat,
+            on_hand=on_hand,
+            receipts=(
+                np.array([column_of[row[0]] for row in receipts], dtype=np.int64),
+                np.array([
+                    min(max((row[2] - day_zero).days, 0), n_days - 1) if row[2] is not None else 0
+                    for row in receipts
+                ], dtype=np.int64),
+                np.array([row[1] for row in receipts], dtype=float)
+            ),
+            n_days=n_days
+        )
+
+    @staticmethod
+    def _validate(snapshot: PlanningSnapshot, specs: List[ScenarioSpec]) -> None:
+        for spec in specs:
+            for change in spec.changes:
+                if change.type == ScenarioChangeType.LINE_DOWN:
+                    if change.line_id not in snapshot.line_ids:
+                        raise ValueError(f"{spec.name}: production line {change.line_id} not found or inactive")
+                    if change.hours <= 0:
+                        raise ValueError(f"{spec.name}: line_down needs hours")
+                    continue
+                if not change.order_number or change.order_number not in snapshot.order_index:
+                    raise ValueError(f"{spec.name}: order {change.order_number} has no queued jobs")
+                if change.type == ScenarioChangeType.RUSH_ORDER and change.line_id is not None \
+                        and change.line_id not in snapshot.line_ids:
+                    raise ValueError(f"{spec.name}: production line {change.line_id} not found or inactive")
+
+    @staticmethod
+    async def compare(db: AsyncSession, request: ScenarioRequest) -> ScenarioComparison:
+        """Run every scenario (and the unchanged baseline) on one snapshot and return their KPIs"""
+        started = time.perf_counter()
+        specs = ([ScenarioSpec(name="baseline")] if request.include_baseline else []) + request.scenarios
+        rush_orders = {
+            change.order_number for spec in specs for change in spec.changes
+            if change.type == ScenarioChangeType.RUSH_ORDER and change.order_number
+        }
+        snapshot = await ScenarioService.take_snapshot(db, rush_orders)
+        ScenarioService._validate(snapshot, specs)
+
+        time_budget = settings.SCENARIO_SEQUENCING_BUDGET_MS / 1000
+        results = await scenario_pool.run(snapshot, specs, request.window_days, time_budget)
+
+        return ScenarioComparison(
+            start=snapshot.start,
+            jobs=len(snapshot.jobs["job_id"]),
+            scenarios=list(results),
+            elapsed_ms=round((time.perf_counter() - started) * 1000, 1)
+        )
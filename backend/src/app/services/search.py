@@ -0,0 +1,114 @@
+"""
+Catalog search (suppliers, materials) for autocomplete
+
+Each catalog keeps an in-process TrigramIndex over code and name of its active
+rows. Writes going through the services invalidate the index; it is rebuilt
+on the next search, and at least every SEARCH_INDEX_REFRESH_SECONDS to pick up
+changes made by other processes. Searches never touch the database.
+"""
+
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy import select
+from typing import Any, Dict, List, Optional, Tuple, Type
+import asyncio
+import time
+
+from app.core.config import settings
+from app.models.warehouse import Supplier, Material
+from app.schemas.warehouse import SearchHit
+from app.utils.search import TrigramIndex, fold
+
+
+class CatalogSearchIndex:
+    """Search index over the active rows of a model with code and name columns"""
+
+    CODE_BONUS = 0.05  # Codes typed from the start outrank equally good name matches
+
+    def __init__(self, model: Type[Any], refresh_seconds: float):
+        self.model = model
+        self.refresh_seconds = refresh_seconds
+        self._index: Optional[TrigramIndex] = None
+        self._rows: Dict[int, Tuple[str, str, Any]] = {}  # id -> (code, name, type)
+        self._loaded_at: Optional[float] = None
+        # Bumped by every write; the index is fresh only if built from the current generation
+        self._generation = 0
+        self._loaded_generation: Optional[int] = None
+        self._lock = asyncio.Lock()
+
+    def invalidate(self) -> None:
+        self._generation += 1
+
+    async def ensure_fresh(self, db: AsyncSession) -> None:
+        async with self._lock:
+            if self._loaded_generation != self._generation \
+                    or time.monotonic() - self._loaded_at > self.refresh_seconds:
+                await self._load(db)
+
+    async def _load(self, db: AsyncSession) -> None:
+        # Read before the rows: a write landing during the build leaves the index stale
+        generation = self._generation
+        model = self.model
+        columns = [model.id, model.code, model.name]
+        if hasattr(model, "type"):
+            columns.append(model.type)
+        result = await db.execute(select(*columns).where(model.is_active == True))
+        rows = {row[0]: (row[1], row[2], row[3] if len(row) > 3 else None) for row in result}
+        # Building takes a while on large catalogs; keep the event loop responsive meanwhile
+        self._index = await asyncio.to_thread(
+            TrigramIndex, [(doc_id, (code, name)) for doc_id, (code, name, _) in rows.items()]
+        )
+        self._rows = rows
+        self._loaded_generation = generation
+        self._loaded_at = time.monotonic()
+
+    def search(self, query: str, limit: int = 20, kind: Optional[Any] = None) -> List[SearchHit]:
+        if self._index is None:
+            return []
+
+        folded = fold(query).strip()
+        # Over-fetch when filtering by type, so the limit applies after the filter
+        candidates = self._index.search(query, limit=limit * 5 if kind is not None else limit * 2)
+
+        hits = []
+        for doc_id, score in candidates:
+            code, name, row_kind = self._rows[doc_id]
+            if kind is not None and row_kind != kind:
+                continue
+            if folded and fold(code).startswith(folded):
+                score += self.CODE_BONUS
+            hits.append(SearchHit(id=doc_id, code=code, name=name, score=round(score, 4)))
+
+        hits.sort(key=lambda hit: (-hit.score, len(hit.name), hit.name))
+        return hits[:limit]
+
+
+supplier_search = CatalogSearchIndex(Supplier, settings.SEARCH_INDEX_REFRESH_SECONDS)
+material_search = CatalogSearchIndex(Material, settings.SEARCH_INDEX_REFRESH_SECONDS)
+
+_INDEXES: Dict[Type[Any], CatalogSearchIndex] = {
+    Supplier: supplier_search,
+    Material: material_search,
+}
+
+
+def invalidate_search(model: Type[Any]) -> None:
+    """Mark a model's search index stale after a write"""
+    index = _INDEXES.get(model)
+    if index is not None:
+        index.invalidate()
+
+
+class SearchService:
+    """Service for catalog autocomplete"""
+
+    @staticmethod
+    async def search_suppliers(db: AsyncSession, query: str, limit: int = 20) -> List[SearchHit]:
+        await supplier_search.ensure_fresh(db)
+        return supplier_search.search(query, limit=limit)
+
+    @staticmethod
+    async def search_materials(
+        db: AsyncSession, query: str, limit: int = 20, material_type: Optional[Any] = None
+    ) -> List[SearchHit]:
+        await material_search.ensure_fresh(db)
+        return material_search.search(query, limit=limit, kind=material_type)
@@ -0,0 +1,168 @@
+"""
+Historical (as-of) stock from checkpoints and the movement log
+
+StockSnapshot rows checkpoint inventory quantities, by default once a day. A
+checkpoint only copies rows changed since the previous one, so an unchanged
+row's latest checkpoint stays valid. The quantity of a row at time T is its
+latest checkpoint at or before T plus the movements recorded after it, up to
+T. Rows without an earlier checkpoint are replayed backwards from the next
+checkpoint (or the live row). Each replay reads one item's movements within a
+window through ix_stock_movements_item_created, so the cost is bounded by the
+movements since the checkpoint, not by the item's whole history.
+
+Quantity edits made without a stock movement are only visible from the next
+checkpoint onwards.
+"""
+
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy import select, insert, func, case, literal
+from sqlalchemy.orm import aliased
+from typing import Optional
+from datetime import datetime, timedelta
+import logging
+
+from app.core.config import settings
+from app.db.database import AsyncSessionLocal
+from app.models.warehouse import InventoryItem, StockMovement, StockSnapshot
+from app.schemas.warehouse import StockAsOf, StockAsOfItem, StockSnapshotResult
+from app.utils.periodic import PeriodicTask
+
+logger = logging.getLogger(__name__)
+
+
+class StockHistoryService:
+    """Service for stock checkpoints and as-of stock queries"""
+
+    @staticmethod
+    async def take_snapshot(db: AsyncSession, snapshot_at: Optional[datetime] = None) -> StockSnapshotResult:
+        """Checkpoint every inventory row changed since the previous checkpoint"""
+        snapshot_at = snapshot_at or datetime.utcnow()
+        previous = await db.scalar(select(func.max(StockSnapshot.snapshot_at)))
+
+        rows = select(literal(snapshot_at), InventoryItem.id, InventoryItem.quantity)
+        if previous is not None:
+            if previous >= snapshot_at:
+                raise ValueError(f"A checkpoint at {previous.isoformat()} already exists")
+            rows = rows.where(func.coalesce(InventoryItem.updated_at, InventoryItem.created_at) > previous)
+
+        result = await db.execute(
+            insert(StockSnapshot).from_select(["snapshot_at", "inventory_item_id", "quantity"], rows)
+        )
+        await db.commit()
+        return StockSnapshotResult(snapshot_at=snapshot_at, items=result.rowcount)
+
+    @staticmethod
+    async def snapshot_if_due(db: AsyncSession) -> Optional[StockSnapshotResult]:
+        previous = await db.scalar(select(func.max(StockSnapshot.snapshot_at)))
+        interval = timedelta(hours=settings.STOCK_SNAPSHOT_INTERVAL_HOURS)
+        if previous is not None and datetime.utcnow() - previous < interval:
+            return None
+        return await StockHistoryService.take_snapshot(db)
+
+    @staticmethod
+    async def get_stock_as_of(
+        db: AsyncSession,
+        as_of: datetime,
+        material_id: Optional[int] = None,
+        warehouse_id: Optional[int] = None,
+        inventory_item_id: Optional[int] = None
+    ) -> StockAsOf:
+        """Stock per inventory row at as_of, rows with no stock left out"""
+        before = aliased(StockSnapshot)
+        after = aliased(StockSnapshot)
+
+        floor_at = (
+            select(func.max(before.snapshot_at))
+            .where(before.inventory_item_id == InventoryItem.id, before.snapshot_at <= as_of)
+            .scalar_subquery()
+        )
+        ceiling_at = (
+            select(func.min(after.snapshot_at))
+            .where(after.inventory_item_id == InventoryItem.id, after.snapshot_at > as_of)
+            .scalar_subquery()
+        )
+
+        scope = select(
+            InventoryItem.id.label("inventory_item_id"),
+            InventoryItem.warehouse_id,
+            InventoryItem.material_id,
+            InventoryItem.batch_id,
+            InventoryItem.location_code,
+            InventoryItem.quantity.label("live_quantity"),
+            floor_at.label("floor_at"),
+            ceiling_at.label("ceiling_at"),
+        ).where(InventoryItem.created_at <= as_of)
+
+        if material_id:
+            scope = scope.where(InventoryItem.material_id == material_id)
+
+        if warehouse_id:
+            scope = scope.where(InventoryItem.warehouse_id == warehouse_id)
+
+        if inventory_item_id:
+            scope = scope.where(InventoryItem.id == inventory_item_id)
+
+        items = scope.subquery()
+
+        def checkpoint_quantity(snapshot_at):
+            return (
+                select(StockSnapshot.quantity)
+                .where(StockSnapshot.inventory_item_id == items.c.inventory_item_id, StockSnapshot.snapshot_at == snapshot_at)
+                .scalar_subquery()
+            )
+
+        def movements(start, end=None):
+            window = [StockMovement.inventory_item_id == items.c.inventory_item_id, StockMovement.created_at > start]
+            if end is not None:
+                window.append(StockMovement.created_at <= end)
+            return (
+                select(func.coalesce(func.sum(StockMovement.quantity), 0.0))
+                .where(*window)
+                .scalar_subquery()
+            )
+
+        quantity = case(
+            (items.c.floor_at.is_not(None), checkpoint_quantity(items.c.floor_at) + movements(items.c.floor_at, as_of)),
+            (items.c.ceiling_at.is_not(None), checkpoint_quantity(items.c.ceiling_at) - movements(as_of, items.c.ceiling_at)),
+            else_=items.c.live_quantity - movements(as_of),
+        )
+        checkpoint = func.coalesce(items.c.floor_at, items.c.ceiling_at)
+
+        result = await db.execute(
+            select(
+                items.c.inventory_item_id,
+                items.c.warehouse_id,
+                items.c.material_id,
+                items.c.batch_id,
+                items.c.location_code,
+                quantity.label("quantity"),
+                checkpoint.label("checkpoint_at"),
+            )
+            .order_by(items.c.inventory_item_id)
+        )
+        rows = [
+            StockAsOfItem(**row._mapping) for row in result
+            if abs(row.quantity or 0.0) > 1e-9
+        ]
+
+        return StockAsOf(
+            as_of=as_of,
+            material_id=material_id,
+            warehouse_id=warehouse_id,
+            total_quantity=sum(row.quantity for row in rows),
+            items=rows
+        )
+
+
+async def take_due_stock_snapshot() -> None:
+    async with AsyncSessionLocal() as db:
+        result = await StockHistoryService.snapshot_if_due(db)
+    if result:
+        logger.info(f"Stock checkpoint at {result.snapshot_at.isoformat()}: {result.items} inventory rows")
+
+
+stock_snapshotter = PeriodicTask(
+    "stock-snapshotter",
+    settings.STOCK_SNAPSHOT_CHECK_SECONDS,
+    take_due_stock_snapshot
+)
@@ -0,0 +1,460 @@
+"""
+Physical inventory (stocktake / cycle count) reconciliation
+
+A stocktake freezes the expected quantity of every inventory row in scope with
+one INSERT ... SELECT, then receives scanner counts in bulk (one executemany
+UPDATE per chunk, the variance maintained alongside the count). Posting books
+every non-zero variance as an ADJUST stock movement with one INSERT ... SELECT
+and applies the same variances to inventory_items with one correlated UPDATE,
+so the cost of closing is a handful of statements whatever the line count.
+
+Variances are measured against the frozen snapshot and added to the current
+quantity, so movements booked while counting are preserved.
+"""
+
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy import select, update, insert, func, bindparam, literal, and_, or_, case
+from typing import Dict, List, Optional, Tuple
+from datetime import datetime
+
+from app.models.base import StocktakeStatus
+from app.models.warehouse import Stocktake, StocktakeLine, InventoryItem, StockMovement, StorageLocation
+from app.schemas.warehouse import (
+    StocktakeCreate, StocktakeCountBatch, StocktakeCountResult,
+    StocktakeVarianceReport, Stocktake as StocktakeSchema, StocktakeLine as StocktakeLineSchema
+)
+from app.services.mrp import MRPService
+from app.utils.upsert import chunked
+
+LineKey = Tuple[Optional[str], int, Optional[int]]  # (location_code, material_id, batch_id)
+
+
+class StocktakeService:
+    """Service for stocktakes and cycle counts"""
+
+    CHUNK_SIZE = 1000
+    EPSILON = 1e-9
+
+    @staticmethod
+    async def _get_counting(db: AsyncSession, stocktake_id: int, lock: bool = False) -> Stocktake:
+        query = select(Stocktake).where(Stocktake.id == stocktake_id)
+        if lock:
+            query = query.with_for_update()
+        stocktake = (await db.execute(query)).scalar_one_or_none()
+        if not stocktake:
+            raise ValueError(f"Stocktake {stocktake_id} not found")
+        if stocktake.status != StocktakeStatus.COUNTING:
+            raise ValueError(f"Stocktake {stocktake.code} is {stocktake.status.value}")
+        return stocktake
+
+    @staticmethod
+    async def get_stocktake(db: AsyncSession, stocktake_id: int) -> Optional[Stocktake]:
+        result = await db.execute(select(Stocktake).where(Stocktake.id == stocktake_id))
+        return result.scalar_one_or_none()
+
+    @staticmethod
+    async def get_stocktakes(
+        db: AsyncSession,
+        warehouse_id: Optional[int] = None,
+        status: Optional[StocktakeStatus] = None,
+        skip: int = 0,
+        limit: int = 100
+    ) -> List[Stocktake]:
+        query = select(Stocktake).order_by(Stocktake.frozen_at.desc(), Stocktake.id.desc()).offset(skip).limit(limit)
+
+        if warehouse_id:
+            query = query.where(Stocktake.warehouse_id == warehouse_id)
+
+        if status:
+            query = query.where(Stocktake.status == status)
+
+        result = await db.execute(query)
+        return result.scalars().all()
+
+    @staticmethod
+    async def freeze(db: AsyncSession, stocktake: StocktakeCreate) -> Stocktake:
+        """Open a stocktake and snapshot the expected quantities in scope"""
+        existing = await db.scalar(select(Stocktake.id).where(Stocktake.code == stocktake.code))
+        if existing:
+            raise ValueError(f"Stocktake {stocktake.code} already exists")
+
+        # A whole-warehouse count overlaps every zone count
+        overlap = select(Stocktake.code).where(
+            Stocktake.warehouse_id == stocktake.warehouse_id,
+            Stocktake.status == StocktakeStatus.COUNTING
+        )
+        if stocktake.zone:
+            overlap = overlap.where(or_(Stocktake.zone.is_(None), Stocktake.zone == stocktake.zone))
+        overlapping = await db.scalar(overlap.limit(1))
+        if overlapping:
+            raise ValueError(f"Stocktake {overlapping} is still counting in this warehouse")
+
+        db_stocktake = Stocktake(
+            **stocktake.model_dump(),
+            status=StocktakeStatus.COUNTING,
+            frozen_at=datetime.utcnow(),
+            total_lines=0,
+            adjusted_lines=0
+        )
+        db.add(db_stocktake)
+        await db.flush()
+
+        snapshot = (
+            select(
+                literal(db_stocktake.id),
+                InventoryItem.id,
+                InventoryItem.material_id,
+                InventoryItem.batch_id,
+                InventoryItem.location_code,
+                InventoryItem.quantity,
+            )
+            .where(InventoryItem.warehouse_id == stocktake.warehouse_id)
+        )
+        if stocktake.zone:
+            snapshot = snapshot.where(
+                InventoryItem.location_code.in_(
+                    select(StorageLocation.code).where(
+                        StorageLocation.warehouse_id == stocktake.warehouse_id,
+                        StorageLocation.zone == stocktake.zone
+                    )
+                )
+            )
+
+        result = await db.execute(
+            insert(StocktakeLine).from_select(
+                ["stocktake_id", "inventory_item_id", "material_id", "batch_id", "location_code", "expected_quantity"],
+                snapshot
+            )
+        )
+        db_stocktake.total_lines = result.rowcount
+        await db.commit()
+        await db.refresh(db_stocktake)
+        return db_stocktake
+
+    @staticmethod
+    def _spread(
+        lines: List[Tuple[int, float, Optional[float]]],
+        quantity: float,
+        accumulate: bool
+    ) -> Dict[int, float]:
+        """
+        Split a bin count over the (line_id, expected, counted) lines sharing its key.
+
+        Lines are filled up to their expected quantity in line order and the
+        last line takes any surplus, so the variances add up to the count
+        minus the total expected. Accumulating adds to what was counted so far.
+        """
+        if accumulate:
+            quantity += sum(counted or 0.0 for _, _, counted in lines)
+        spread = {}
+        for index, (line_id, expected, _) in enumerate(lines):
+            share = quantity if index == len(lines) - 1 else min(max(expected, 0.0), quantity)
+            spread[line_id] = share
+            quantity -= share
+        return spread
+
+    @staticmethod
+    async def record_counts(db: AsyncSession, stocktake_id: int, batch: StocktakeCountBatch) -> StocktakeCountResult:
+        """
+        Record scanner counts in bulk.
+
+        Counts name an inventory row, or a bin + material (+ batch). A bin count
+        covers every frozen line with that bin/material/batch, or with that
+        bin/material whatever the batch when no batch is given, and is spread
+        over them; one matching no frozen line is stock found off the books and
+        opens a new line with an expected quantity of zero.
+        """
+        stocktake = await StocktakeService._get_counting(db, stocktake_id)
+        errors: List[str] = []
+
+        # Collapse repeated scans of the same line first: last one wins, or summed when accumulating
+        by_item: Dict[int, float] = {}
+        by_key: Dict[LineKey, float] = {}
+        for index, count in enumerate(batch.counts):
+            if count.counted_quantity < 0:
+                errors.append(f"Count {index}: negative quantity")
+                continue
+            if count.inventory_item_id is not None:
+                target, key = by_item, count.inventory_item_id
+            elif count.material_id is not None:
+                target, key = by_key, (count.location_code, count.material_id, count.batch_id)
+            else:
+                errors.append(f"Count {index}: needs inventory_item_id or material_id")
+                continue
+            target[key] = (target.get(key, 0.0) if batch.accumulate else 0.0) + count.counted_quantity
+
+        line_quantities: Dict[int, float] = {}
+
+        for item_ids in chunked(list(by_item), StocktakeService.CHUNK_SIZE):
+            result = await db.execute(
+                select(StocktakeLine.inventory_item_id, StocktakeLine.id)
+                .where(StocktakeLine.stocktake_id == stocktake_id, StocktakeLine.inventory_item_id.in_(item_ids))
+            )
+            lines = dict(result.all())
+            for item_id in item_ids:
+                if item_id in lines:
+                    line_quantities[lines[item_id]] = by_item[item_id]
+                else:
+                    errors.append(f"Inventory item {item_id} is not part of stocktake {stocktake.code}")
+
+        # Bin counts are totals over every line sharing the bin/material/batch; set absolutely
+        key_quantities: Dict[int, float] = {}
+        unmatched: Dict[LineKey, float] = {}
+        for keys in chunked(list(by_key), StocktakeService.CHUNK_SIZE):
+            codes = {location_code for location_code, _, _ in keys if location_code is not None}
+            conditions = []
+            if codes:
+                conditions.append(StocktakeLine.location_code.in_(codes))
+            if len(codes) < len(keys):
+                conditions.append(StocktakeLine.location_code.is_(None))
+            result = await db.execute(
+                select(
+                    StocktakeLine.location_code, StocktakeLine.material_id, StocktakeLine.batch_id,
+                    StocktakeLine.id, StocktakeLine.expected_quantity, StocktakeLine.counted_quantity
+                )
+                .where(
+                    StocktakeLine.stocktake_id == stocktake_id,
+                    StocktakeLine.material_id.in_({material_id for _, material_id, _ in keys}),
+                    or_(*conditions)
+                )
+                .order_by(StocktakeLine.id)
+            )
+            lines: Dict[LineKey, List[Tuple[int, float, Optional[float]]]] = {}
+            for location_code, material_id, batch_id, line_id, expected, counted in result:
+                lines.setdefault((location_code, material_id, batch_id), []).append((line_id, expected, counted))
+                if batch_id is not None:
+                    # A count without a batch covers the bin/material over all batches
+                    lines.setdefault((location_code, material_id, None), []).append((line_id, expected, counted))
+            for key in keys:
+                if key in lines:
+                    key_quantities.update(StocktakeService._spread(lines[key], by_key[key], batch.accumulate))
+                else:
+                    unmatched[key] = by_key[key]
+
+        now = datetime.utcnow()
+        lines_table = StocktakeLine.__table__
+        for quantities, accumulate in ((line_quantities, batch.accumulate), (key_quantities, False)):
+            counted = (
+                func.coalesce(lines_table.c.counted_quantity, 0.0) + bindparam("qty")
+                if accumulate else bindparam("qty")
+            )
+            for line_ids in chunked(list(quantities), StocktakeService.CHUNK_SIZE):
+                await db.execute(
+                    update(lines_table)
+                    .where(lines_table.c.id == bindparam("line_pk"))
+                    .values(
+                        counted_quantity=counted,
+                        variance=counted - lines_table.c.expected_quantity,
+                        counted_at=now,
+                        counted_by=batch.counted_by,
+                        updated_at=now
+                    ),
+                    [{"line_pk": line_id, "qty": quantities[line_id]} for line_id in line_ids]
+                )
+
+        if unmatched:
+            await db.execute(
+                insert(StocktakeLine),
+                [
+                    {
+                        "stocktake_id": stocktake_id,
+                        "inventory_item_id": None,
+                        "material_id": material_id,
+                        "batch_id": batch_id,
+                        "location_code": location_code,
+                        "expected_quantity": 0.0,
+                        "counted_quantity": quantity,
+                        "variance": quantity,
+                        "counted_at": now,
+                        "counted_by": batch.counted_by,
+                    }
+                    for (location_code, material_id, batch_id), quantity in unmatched.items()
+                ]
+            )
+            await db.execute(
+                update(Stocktake)
+                .where(Stocktake.id == stocktake_id)
+                .values(total_lines=Stocktake.total_lines + len(unmatched))
+                .execution_options(synchronize_session=False)
+            )
+
+        await db.commit()
+        return StocktakeCountResult(
+            received=len(batch.counts),
+            updated_lines=len(line_quantities.keys() | key_quantities.keys()),
+            new_lines=len(unmatched),
+            errors=errors
+        )
+
+    @staticmethod
+    async def get_variance_report(
+        db: AsyncSession,
+        stocktake_id: int,
+        material_id: Optional[int] = None,
+        after_id: Optional[int] = None,
+        limit: int = 100
+    ) -> Optional[StocktakeVarianceReport]:
+        """Count progress and variance totals, plus one page of lines with a variance"""
+        stocktake = await StocktakeService.get_stocktake(db, stocktake_id)
+        if not stocktake:
+            return None
+
+        has_variance = and_(
+            StocktakeLine.variance.is_not(None),
+            func.abs(StocktakeLine.variance) > StocktakeService.EPSILON
+        )
+        scope = [StocktakeLine.stocktake_id == stocktake_id]
+        if material_id:
+            scope.append(StocktakeLine.material_id == material_id)
+
+        totals = (await db.execute(
+            select(
+                func.count(StocktakeLine.id),
+                func.count(StocktakeLine.counted_quantity),
+                func.coalesce(func.sum(case((has_variance, 1), else_=0)), 0),
+                func.coalesce(func.sum(StocktakeLine.variance), 0.0),
+                func.coalesce(func.sum(func.abs(StocktakeLine.variance)), 0.0),
+            )
+            .where(*scope)
+        )).one()
+
+        query = select(StocktakeLine).where(*scope, has_variance).order_by(StocktakeLine.id).limit(limit + 1)
+        if after_id:
+            query = query.where(StocktakeLine.id > after_id)
+        lines = (await db.execute(query)).scalars().all()
+
+        return StocktakeVarianceReport(
+            stocktake=StocktakeSchema.model_validate(stocktake),
+            total_lines=totals[0],
+            counted_lines=totals[1],
+            variance_lines=totals[2],
+            net_variance=totals[3],
+            absolute_variance=totals[4],
+            lines=[StocktakeLineSchema.model_validate(line) for line in lines[:limit]],
+            next_cursor=lines[limit - 1].id if len(lines) > limit else None
+        )
+
+    @staticmethod
+    async def post(
+        db: AsyncSession,
+        stocktake_id: int,
+        uncounted_as_zero: bool = False,
+        user_id: Optional[str] = None
+    ) -> Stocktake:
+        """
+        Book the variances as ADJUST stock movements and close the stocktake.
+
+        Uncounted lines are left untouched unless uncounted_as_zero is set, in
+        which case their stock is written off.
+        """
+        stocktake = await StocktakeService._get_counting(db, stocktake_id, lock=True)
+        now = datetime.utcnow()
+
+        if uncounted_as_zero:
+            await db.execute(
+                update(StocktakeLine)
+                .where(StocktakeLine.stocktake_id == stocktake_id, StocktakeLine.counted_quantity.is_(None))
+                .values(
+                    counted_quantity=0.0,
+                    variance=-StocktakeLine.expected_quantity,
+                    counted_at=now,
+                    counted_by=user_id,
+                    updated_at=now
+                )
+                .execution_options(synchronize_session=False)
+            )
+
+        # Stock found off the books gets an inventory row, filled by its movement below
+        found = (await db.execute(
+            select(StocktakeLine.id, StocktakeLine.material_id, StocktakeLine.batch_id, StocktakeLine.location_code)
+            .where(
+                StocktakeLine.stocktake_id == stocktake_id,
+                StocktakeLine.inventory_item_id.is_(None),
+                StocktakeLine.variance > StocktakeService.EPSILON
+            )
+            .order_by(StocktakeLine.id)
+        )).all()
+        if found:
+            item_ids = (await db.execute(
+                insert(InventoryItem).returning(InventoryItem.id, sort_by_parameter_order=True),
+                [
+                    {
+                        "warehouse_id": stocktake.warehouse_id,
+                        "material_id": line.material_id,
+                        "batch_id": line.batch_id,
+                        "location_code": line.location_code,
+                        "quantity": 0.0,
+                        "reserved_quantity": 0.0,
+                        "available_quantity": 0.0,
+                    }
+                    for line in found
+                ]
+            )).scalars().all()
+            lines_table = StocktakeLine.__table__
+            await db.execute(
+                update(lines_table)
+                .where(lines_table.c.id == bindparam("line_pk"))
+                .values(inventory_item_id=bindparam("item_pk")),
+                [{"line_pk": line.id, "item_pk": item_id} for line, item_id in zip(found, item_ids)]
+            )
+
+        adjusted = and_(
+            StocktakeLine.stocktake_id == stocktake_id,
+            StocktakeLine.inventory_item_id.is_not(None),
+            StocktakeLine.variance.is_not(None),
+            func.abs(StocktakeLine.variance) > StocktakeService.EPSILON
+        )
+
+        result = await db.execute(
+            insert(StockMovement).from_select(
+                ["inventory_item_id", "movement_type", "quantity", "reference_type", "reference_id", "notes", "user_id"],
+                select(
+                    StocktakeLine.inventory_item_id,
+                    literal("ADJUST"),
+                    StocktakeLine.variance,
+                    literal("STOCKTAKE"),
+                    literal(stocktake.code),
+                    literal(f"Stocktake {stocktake.code} variance"),
+                    literal(user_id),
+                )
+                .where(adjusted)
+                .order_by(StocktakeLine.id)
+            )
+        )
+        adjusted_lines = result.rowcount
+
+        variance = (
+            select(StocktakeLine.variance)
+            .where(adjusted, StocktakeLine.inventory_item_id == InventoryItem.id)
+            .scalar_subquery()
+        )
+        await MRPService.mark_dirty(db, "material", select(StocktakeLine.material_id).where(adjusted).distinct())
+        await db.execute(
+            update(InventoryItem)
+            .where(InventoryItem.id.in_(select(StocktakeLine.inventory_item_id).where(adjusted)))
+            .values(
+                quantity=InventoryItem.quantity + variance,
+                available_quantity=InventoryItem.quantity + variance - InventoryItem.reserved_quantity,
+                last_movement_date=now,
+                updated_at=now
+            )
+            .execution_options(synchronize_session=False)
+        )
+
+        stocktake.status = StocktakeStatus.POSTED
+        stocktake.posted_at = now
+        stocktake.adjusted_lines = adjusted_lines
+        stocktake.total_lines = await db.scalar(
+            select(func.count(StocktakeLine.id)).where(StocktakeLine.stocktake_id == stocktake_id)
+        )
+        await db.commit()
+        await db.refresh(stocktake)
+        return stocktake
+
+    @staticmethod
+    async def cancel(db: AsyncSession, stocktake_id: int) -> Stocktake:
+        stocktake = await StocktakeService._get_counting(db, stocktake_id, lock=True)
+        stocktake.status = StocktakeStatus.CANCELLED
+        await db.commit()
+        await db.refresh(stocktake)
+        return stocktake
@@ -0,0 +1,379 @@
+"""
+Machine telemetry ingestion and time-series storage
+
+Extruders and printers send batches of samples (speed, output counter,
+machine state) over HTTP or a WebSocket. Ingestion never touches the
+database: samples are folded into per-line, per-second buckets in memory and
+the latest sample of every line is kept for live status. Every
+TELEMETRY_FLUSH_SECONDS the flusher writes the buckets to line_telemetry,
+together with the 1 min and 1 h buckets they fall in. Bucket columns are
+sums, minima, maxima and last values, so every level is written as an
+additive upsert: a bucket spanning several flushes, or late samples, simply
+add to it. Old 1 s and 1 min buckets are purged after their retention; 1 h
+buckets are kept.
+
+A change of reported machine state is also written to ProductionLine.status,
+so planning sees a faulted line as down without waiting for anyone to
+report it. Maintenance entered by people is left alone until the machine
+itself reports maintenance. The reported state and its sample time are kept
+on the line, so with several worker processes a report older than the one
+written by another process does not overwrite it.
+"""
+
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy import select, delete, func, and_, or_
+from typing import Dict, List, Optional, Set, Tuple
+from datetime import datetime, timedelta, timezone
+import logging
+import time
+
+from app.core.config import settings
+from app.db.database import AsyncSessionLocal
+from app.models.base import ProductionLineStatus
+from app.models.production import ProductionLine, LineTelemetry
+from app.schemas.production import (
+    MachineState, TelemetrySample, TelemetryIngestResult, TelemetryPoint, TelemetrySeries, LineTelemetryState
+)
+from app.utils.periodic import PeriodicTask
+from app.utils.upsert import dialect_insert
+
+logger = logging.getLogger(__name__)
+
+RESOLUTIONS = (1, 60, 3600)
+
+STATE_STATUS = {
+    MachineState.RUNNING: ProductionLineStatus.ACTIVE,
+    MachineState.SETUP: ProductionLineStatus.ACTIVE,
+    MachineState.IDLE: ProductionLineStatus.IDLE,
+    MachineState.STOPPED: ProductionLineStatus.IDLE,
+    MachineState.FAULT: ProductionLineStatus.ERROR,
+    MachineState.MAINTENANCE: ProductionLineStatus.MAINTENANCE,
+}
+
+# A sample stamped further ahead than this is a machine clock error
+MAX_CLOCK_SKEW = timedelta(minutes=5)
+
+# Per-second bucket: [samples, speed_sum, speed_min, speed_max, output, counter, state]
+SAMPLES, SPEED_SUM, SPEED_MIN, SPEED_MAX, OUTPUT, COUNTER, STATE = range(7)
+
+
+def holds_maintenance(line: ProductionLine, state: Optional[MachineState]) -> bool:
+    """Maintenance entered by people: kept until they end it, whatever the machine reports meanwhile"""
+    return line.status == ProductionLineStatus.MAINTENANCE and MachineState.MAINTENANCE.value not in (
+        state.value if state is not None else None, line.machine_state
+    )
+
+
+class LatestSample:
+    __slots__ = ("ts", "speed", "counter", "state")
+
+    def __init__(self, ts: datetime, speed: float, counter: Optional[float], state: Optional[MachineState]):
+        self.ts = ts
+        self.speed = speed
+        self.counter = counter
+        self.state = state
+
+
+def bucket_start(moment: datetime, resolution: int) -> datetime:
+    """Start of the bucket of a resolution dividing a day"""
+    elapsed = moment.hour * 3600 + moment.minute * 60 + moment.second
+    return moment.replace(microsecond=0) - timedelta(seconds=elapsed % resolution)
+
+
+def _merge(buckets: Dict[tuple, list], key: tuple, bucket: list) -> None:
+    """Fold an older bucket into buckets[key]; the newer counter and state win"""
+    current = buckets.get(key)
+    if current is None:
+        buckets[key] = list(bucket)
+        return
+    current[SAMPLES] += bucket[SAMPLES]
+    current[SPEED_SUM] += bucket[SPEED_SUM]
+    current[SPEED_MIN] = min(current[SPEED_MIN], bucket[SPEED_MIN])
+    current[SPEED_MAX] = max(current[SPEED_MAX], bucket[SPEED_MAX])
+    current[OUTPUT] += bucket[OUTPUT]
+    if current[COUNTER] is None:
+        current[COUNTER] = bucket[COUNTER]
+    if current[STATE] is None:
+        current[STATE] = bucket[STATE]
+
+
+def _upsert_statement(dialect_name: str):
+    table = LineTelemetry.__table__
+    stmt = dialect_insert(dialect_name, table)
+    least, greatest = (func.least, func.greatest) if dialect_name == "postgresql" else (func.min, func.max)
+    return stmt.on_conflict_do_update(
+        index_elements=["production_line_id", "resolution", "bucket_start"],
+        set_={
+            "samples": table.c.samples + stmt.excluded.samples,
+            "speed_sum": table.c.speed_sum + stmt.excluded.speed_sum,
+            "speed_min": least(table.c.speed_min, stmt.excluded.speed_min),
+            "speed_max": greatest(table.c.speed_max, stmt.excluded.speed_max),
+            "output": table.c.output + stmt.excluded.output,
+            "counter": func.coalesce(stmt.excluded.counter, table.c.counter),
+            "state": func.coalesce(stmt.excluded.state, table.c.state),
+        }
+    )
+
+
+class TelemetryStore:
+    """
+    Per-second buckets awaiting the flusher and the latest sample of every line.
+
+    The store is per process: with several workers, latest() and
+    line_states() only know the samples this process received. The machine
+    state written to the line is shared.
+    """
+
+    def __init__(self):
+        self._line_ids: Dict[str, int] = {}
+        self._line_codes: Dict[int, str] = {}
+        self._lines_loaded_at: Optional[float] = None
+        self._pending: Dict[Tuple[int, datetime], list] = {}
+        self._latest: Dict[int, LatestSample] = {}
+        self._state_changes: Dict[int, Tuple[datetime, MachineState]] = {}  # Latest reported state per line
+        self._purged_at: Optional[float] = None
+
+    async def resolve_lines(self, codes: Set[str]) -> None:
+        """Load line codes, again when a batch names an unknown one (at most once per flush interval)"""
+        if codes.issubset(self._line_ids):
+            return
+        if self._lines_loaded_at is not None \
+                and time.monotonic() - self._lines_loaded_at < settings.TELEMETRY_FLUSH_SECONDS:
+            return
+        async with AsyncSessionLocal() as db:
+            rows = (await db.execute(select(ProductionLine.id, ProductionLine.code))).all()
+        self._line_ids = {code: line_id for line_id, code in rows}
+        self._line_codes = {line_id: code for line_id, code in rows}
+        self._lines_loaded_at = time.monotonic()
+
+    def ingest(self, samples: List[TelemetrySample], received_at: Optional[datetime] = None) -> TelemetryIngestResult:
+        received_at = received_at or datetime.utcnow()
+        latest_allowed = received_at + MAX_CLOCK_SKEW
+        line_ids = self._line_ids
+        pending = self._pending
+        latest = self._latest
+        accepted = rejected = 0
+        unknown: Set[str] = set()
+
+        stamped = []
+        for sample in samples:
+            ts = sample.ts
+            if ts is None:
+                ts = received_at
+            elif ts.tzinfo is not None:
+                ts = ts.astimezone(timezone.utc).replace(tzinfo=None)
+            stamped.append((ts, sample))
+        # Counters are differenced in time order
+        stamped.sort(key=lambda item: item[0])
+
+        for ts, sample in stamped:
+            line_id = line_ids.get(sample.line)
+            if line_id is None:
+                unknown.add(sample.line)
+                rejected += 1
+                continue
+            if ts > latest_allowed:
+                rejected += 1
+                continue
+
+            speed = sample.speed_mpm
+            counter = sample.counter
+            state = sample.state
+            previous = latest.get(line_id)
+            in_order = previous is None or ts >= previous.ts
+            output = 0.0
+            if in_order and counter is not None and previous is not None and previous.counter is not None:
+                output = counter - previous.counter
+                if output < 0:
+                    output = counter  # The machine reset its counter
+
+            key = (line_id, ts.replace(microsecond=0))
+            bucket = pending.get(key)
+            if bucket is None:
+                pending[key] = [1, speed, speed, speed, output, counter if in_order else None, state if in_order else None]
+            else:
+                bucket[SAMPLES] += 1
+                bucket[SPEED_SUM] += speed
+                if speed < bucket[SPEED_MIN]:
+                    bucket[SPEED_MIN] = speed
+                if speed > bucket[SPEED_MAX]:
+                    bucket[SPEED_MAX] = speed
+                bucket[OUTPUT] += output
+                if in_order:
+                    if counter is not None:
+                        bucket[COUNTER] = counter
+                    if state is not None:
+                        bucket[STATE] = state
+
+            if previous is None:
+                latest[line_id] = LatestSample(ts, speed, counter, state)
+            elif in_order:
+                previous.ts = ts
+                previous.speed = speed
+                if counter is not None:
+                    previous.counter = counter
+                if state is not None:
+                    previous.state = state
+            if in_order and state is not None:
+                # Every report, not just changes seen here: another process may have written a different state
+                self._state_changes[line_id] = (ts, state)
+            accepted += 1
+
+        return TelemetryIngestResult(accepted=accepted, rejected=rejected, unknown_lines=sorted(unknown))
+
+    def latest(self, line_id: int) -> Optional[LatestSample]:
+        """Latest sample of a line, None when it has not reported for TELEMETRY_STALE_SECONDS"""
+        sample = self._latest.get(line_id)
+        if sample is None or datetime.utcnow() - sample.ts > timedelta(seconds=settings.TELEMETRY_STALE_SECONDS):
+            return None
+        return sample
+
+    def line_states(self) -> List[LineTelemetryState]:
+        stale_before = datetime.utcnow() - timedelta(seconds=settings.TELEMETRY_STALE_SECONDS)
+        return [
+            LineTelemetryState(
+                line_id=line_id,
+                line_code=self._line_codes.get(line_id, str(line_id)),
+                ts=sample.ts,
+                speed_mpm=sample.speed,
+                counter=sample.counter,
+                state=sample.state,
+                stale=sample.ts < stale_before
+            )
+            for line_id, sample in sorted(self._latest.items())
+        ]
+
+    def _rows(self, pending: Dict[Tuple[int, datetime], list]) -> List[dict]:
+        buckets: Dict[tuple, list] = {}
+        # Newest first, so the last counter and state of each coarser bucket win
+        for (line_id, second), bucket in sorted(pending.items(), reverse=True):
+            for resolution in RESOLUTIONS:
+                _merge(buckets, (line_id, resolution, bucket_start(second, resolution)), bucket)
+        return [
+            {
+                "production_line_id": line_id,
+                "resolution": resolution,
+                "bucket_start": start,
+                "samples": bucket[SAMPLES],
+                "speed_sum": bucket[SPEED_SUM],
+                "speed_min": bucket[SPEED_MIN],
+                "speed_max": bucket[SPEED_MAX],
+                "output": bucket[OUTPUT],
+                "counter": bucket[COUNTER],
+                "state": bucket[STATE].value if bucket[STATE] is not None else None,
+            }
+            for (line_id, resolution, start), bucket in buckets.items()
+        ]
+
+    async def flush(self, db: AsyncSession) -> int:
+        """Write buffered buckets at every resolution and machine state changes; returns rows written"""
+        pending, self._pending = self._pending, {}
+        changes, self._state_changes = self._state_changes, {}
+        rows = self._rows(pending) if pending else []
+        try:
+            if rows:
+                await db.execute(_upsert_statement(db.get_bind().dialect.name), rows)
+            if changes:
+                lines = await db.execute(select(ProductionLine).where(ProductionLine.id.in_(list(changes))))
+                for line in lines.scalars():
+                    ts, state = changes[line.id]
+                    if line.machine_state == state.value or (
+                        line.machine_state_at is not None and ts <= line.machine_state_at
+                    ):
+                        continue  # Unchanged, or older than a report another process wrote
+                    held = holds_maintenance(line, state)
+                    line.machine_state = state.value
+                    line.machine_state_at = ts
+                    if not held:
+                        line.status = STATE_STATUS[state]
+            await self._purge_if_due(db)
+            await db.commit()
+        except Exception:
+            await db.rollback()
+            # Keep the data for the next flush; anything ingested meanwhile is newer
+            for key, bucket in pending.items():
+                _merge(self._pending, key, bucket)
+            for line_id, report in changes.items():
+                self._state_changes.setdefault(line_id, report)
+            raise
+        return len(rows)
+
+    async def _purge_if_due(self, db: AsyncSession) -> None:
+        if self._purged_at is not None and time.monotonic() - self._purged_at < 3600:
+            return
+        now = datetime.utcnow()
+        await db.execute(delete(LineTelemetry).where(or_(
+            and_(
+                LineTelemetry.resolution == 1,
+                LineTelemetry.bucket_start < now - timedelta(days=settings.TELEMETRY_SECOND_RETENTION_DAYS)
+            ),
+            and_(
+                LineTelemetry.resolution == 60,
+                LineTelemetry.bucket_start < now - timedelta(days=settings.TELEMETRY_MINUTE_RETENTION_DAYS)
+            )
+        )))
+        self._purged_at = time.monotonic()
+
+
+telemetry_store = TelemetryStore()
+
+
+class TelemetryService:
+    """Service for telemetry ingestion and time-series reads"""
+
+    @staticmethod
+    async def ingest(samples: List[TelemetrySample]) -> TelemetryIngestResult:
+        await telemetry_store.resolve_lines({sample.line for sample in samples})
+        return telemetry_store.ingest(samples)
+
+    @staticmethod
+    async def get_series(
+        db: AsyncSession,
+        line_id: int,
+        resolution: int,
+        start: datetime,
+        end: datetime
+    ) -> TelemetrySeries:
+        """Buckets of a line from start (inclusive) to end (exclusive); the last
+        TELEMETRY_FLUSH_SECONDS may not be written yet"""
+        if resolution not in RESOLUTIONS:
+            raise ValueError(f"Resolution must be one of {', '.join(map(str, RESOLUTIONS))} seconds")
+        result = await db.execute(
+            select(LineTelemetry)
+            .where(
+                LineTelemetry.production_line_id == line_id,
+                LineTelemetry.resolution == resolution,
+                LineTelemetry.bucket_start >= bucket_start(start, resolution),
+                LineTelemetry.bucket_start < end
+            )
+            .order_by(LineTelemetry.bucket_start)
+        )
+        return TelemetrySeries(
+            line_id=line_id,
+            resolution=resolution,
+            points=[
+                TelemetryPoint(
+                    bucket_start=row.bucket_start,
+                    samples=row.samples,
+                    speed_avg=round(row.speed_sum / row.samples, 2) if row.samples else 0.0,
+                    speed_min=row.speed_min,
+                    speed_max=row.speed_max,
+                    output=round(row.output, 3),
+                    counter=row.counter,
+                    state=row.state
+                )
+                for row in result.scalars()
+            ]
+        )
+
+
+async def flush_telemetry() -> None:
+    async with AsyncSessionLocal() as db:
+        await telemetry_store.flush(db)
+
+
+telemetry_flusher = PeriodicTask(
+    "telemetry-flusher",
+    settings.TELEMETRY_FLUSH_SECONDS,
+    flush_telemetry
+)
@@ -1,7 +1,6 @@
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy import select, and_, or_, func, desc
-from sqlalchemy.orm import selectinload
-from typing import List, Optional
+from sqlalchemy import select, and_, func, desc
+from typing import Any, Collection, Dict, List, Optional, Tuple, Type
 import csv
 import io
 from datetime import datetime
@@ -16,9 +15,20 @@ from app.schemas.warehouse import (
     BatchCreate, BatchUpdate,
     InventoryItemCreate, InventoryItemUpdate,
     StockMovementCreate,
-    CSVImportResult, MaterialInventory, TraceabilityResult
+    CSVImportResult, MaterialInventory, MaterialInventoryInclude, TraceabilityResult,
+    ImportMode, UpsertDiff, UpsertResult, BulkQualityDecision,
+    WarehouseSummaryStats
 )
 from app.models.base import QualityStatus, MaterialType
+from app.core.config import settings
+from app.utils.cache import TTLCache
+from app.utils.upsert import upsert_statement, chunked
+from app.services.genealogy import GenealogyService, GenealogyClosureService
+from app.services.quality import QualityControlService
+from app.services.load_profiles import LoadProfile, load_options, load_by_id
+from app.services.locations import occupancy_map
+from app.services.search import SearchService, invalidate_search
+from app.services.mrp import MRPService
 
 
 class WarehouseService:
@@ -66,11 +76,75 @@ class WarehouseService:
             await db.commit()
             return True
         return False
+    
+    # Summary bucket of every material type
+    MATERIAL_TYPE_GROUPS: Dict[MaterialType, str] = {
+        MaterialType.GRANULATE_LDPE: "granulates",
+        MaterialType.GRANULATE_HDPE: "granulates",
+        MaterialType.GRANULATE_PP: "granulates",
+        MaterialType.INK_PRINTING: "inks",
+        MaterialType.ADHESIVE_PU: "adhesives",
+        MaterialType.ADHESIVE_ACRYLIC: "adhesives",
+        MaterialType.FILM_BASE_BOPP: "films",
+        MaterialType.FILM_BASE_PET: "films",
+        MaterialType.SOLVENT: "solvents",
+        MaterialType.ADDITIVE: "additives",
+    }
+    
+    _summary_cache = TTLCache(ttl=settings.SUMMARY_CACHE_TTL_SECONDS, maxsize=1)
+    
+    @staticmethod
+    async def _compute_summary_stats(db: AsyncSession) -> WarehouseSummaryStats:
+        def count(model, *criteria):
+            return select(func.count()).select_from(model).where(*criteria).scalar_subquery()
+        
+        low_stock = MaterialService.low_stock_query().subquery()
+        counts = (await db.execute(
+            select(
+                count(Warehouse, Warehouse.is_active == True).label("active_warehouses"),
+                count(Material, Material.is_active == True).label("total_materials"),
+                select(func.count()).select_from(low_stock).scalar_subquery().label("low_stock_items"),
+                count(Batch, Batch.quality_status == QualityStatus.PENDING).label("pending_quality_batches"),
+            )
+        )).one()
+        
+        by_type = dict((await db.execute(
+            select(Material.type, func.count())
+            .where(Material.is_active == True)
+            .group_by(Material.type)
+        )).all())
+        
+        material_types = {group: 0 for group in ("granulates", "inks", "adhesives", "films")}
+        for material_type, type_count in by_type.items():
+            group = WarehouseService.MATERIAL_TYPE_GROUPS[material_type]
+            material_types[group] = material_types.get(group, 0) + type_count
+        
+        return WarehouseSummaryStats(
+            total_warehouses=counts.active_warehouses,
+            total_materials=counts.total_materials,
+            low_stock_items=counts.low_stock_items,
+            pending_quality_batches=counts.pending_quality_batches,
+            active_warehouses=counts.active_warehouses,
+            material_types=material_types,
+            materials_by_type={material_type.value: type_count for material_type, type_count in by_type.items()}
+        )
+    
+    @staticmethod
+    async def get_summary_stats(db: AsyncSession, use_cache: bool = True) -> WarehouseSummaryStats:
+        """Warehouse summary counts, cached for SUMMARY_CACHE_TTL_SECONDS"""
+        if not use_cache:
+            return await WarehouseService._compute_summary_stats(db)
+        return await WarehouseService._summary_cache.get_or_set(
+            "summary", lambda: WarehouseService._compute_summary_stats(db)
+        )
 
 
 class SupplierService:
     """Service for supplier CRUD operations"""
     
+    # Columns a bulk upsert may overwrite on an existing supplier
+    UPSERT_COLUMNS = ['name', 'contact_person', 'email', 'phone', 'address', 'is_active', 'is_approved']
+    
     @staticmethod
     async def get_suppliers(db: AsyncSession, skip: int = 0, limit: int = 100, active_only: bool = True) -> List[Supplier]:
         query = select(Supplier).offset(skip).limit(limit).order_by(Supplier.name)
@@ -81,25 +155,28 @@ class SupplierService:
         return result.scalars().all()
     
     @staticmethod
-    async def get_supplier(db: AsyncSession, supplier_id: int) -> Optional[Supplier]:
-        result = await db.execute(
-            select(Supplier)
-            .options(selectinload(Supplier.materials))
-            .where(Supplier.id == supplier_id)
-        )
-        return result.scalar_one_or_none()
+    async def get_supplier(
+        db: AsyncSession, supplier_id: int, profile: LoadProfile = LoadProfile.DETAIL
+    ) -> Optional[Supplier]:
+        return await load_by_id(db, Supplier, supplier_id, profile)
     
     @staticmethod
     async def create_supplier(db: AsyncSession, supplier: SupplierCreate) -> Supplier:
         db_supplier = Supplier(**supplier.model_dump())
         db.add(db_supplier)
         await db.commit()
+        invalidate_search(Supplier)
         await db.refresh(db_supplier)
         return db_supplier
     
     @staticmethod
-    async def update_supplier(db: AsyncSession, supplier_id: int, supplier: SupplierUpdate) -> Optional[Supplier]:
-        db_supplier = await SupplierService.get_supplier(db, supplier_id)
+    async def update_supplier(
+        db: AsyncSession,
+        supplier_id: int,
+        supplier: SupplierUpdate,
+        profile: LoadProfile = LoadProfile.LIST
+    ) -> Optional[Supplier]:
+        db_supplier = await SupplierService.get_supplier(db, supplier_id, LoadProfile.MINIMAL)
         if db_supplier:
             for key, value in supplier.model_dump(exclude_unset=True).items():
                 setattr(db_supplier, key, value)
@@ -117,41 +194,56 @@ class SupplierService:
                 db_supplier.overall_rating = sum(r * w for r, w in zip(ratings, weights))
             
             await db.commit()
-            await db.refresh(db_supplier)
+            invalidate_search(Supplier)
+            db_supplier = await load_by_id(db, Supplier, supplier_id, profile, refresh=True)
         return db_supplier
     
     @staticmethod
-    async def search_suppliers(db: AsyncSession, query: str) -> List[Supplier]:
-        result = await db.execute(
-            select(Supplier)
-            .where(
-                and_(
-                    Supplier.is_active == True,
-                    or_(
-                        Supplier.name.ilike(f"%{query}%"),
-                        Supplier.code.ilike(f"%{query}%")
-                    )
-                )
-            )
-            .order_by(Supplier.name)
-        )
-        return result.scalars().all()
+    async def upsert_suppliers(db: AsyncSession, suppliers: List[SupplierCreate]) -> UpsertResult:
+        """Insert new and update changed suppliers by code in one pass"""
+        # Existing suppliers only take the fields the payload sets; defaults are for new ones
+        records = [
+            (num, supplier.model_dump(), supplier.model_dump(exclude_unset=True).keys())
+            for num, supplier in enumerate(suppliers, 1)
+        ]
+        result = await UpsertService.upsert_by_code(db, Supplier, records, SupplierService.UPSERT_COLUMNS)
+        await db.commit()
+        invalidate_search(Supplier)
+        return result
+    
+    @staticmethod
+    async def search_suppliers(db: AsyncSession, query: str, limit: int = 20) -> List[Supplier]:
+        """Active suppliers matching query by code or name, best match first"""
+        hits = await SearchService.search_suppliers(db, query, limit=limit)
+        if not hits:
+            return []
+        
+        result = await db.execute(select(Supplier).where(Supplier.id.in_([hit.id for hit in hits])))
+        suppliers = {supplier.id: supplier for supplier in result.scalars()}
+        return [suppliers[hit.id] for hit in hits if hit.id in suppliers]
 
 
 class MaterialService:
     """Service for material CRUD operations"""
     
+    # Columns a bulk upsert may overwrite on an existing material
+    UPSERT_COLUMNS = [
+        'name', 'description', 'type', 'unit', 'min_stock_level', 'max_stock_level',
+        'reorder_point', 'standard_cost', 'is_active', 'primary_supplier_id'
+    ]
+    
     @staticmethod
     async def get_materials(
         db: AsyncSession, 
         skip: int = 0, 
         limit: int = 100, 
         material_type: Optional[MaterialType] = None,
-        active_only: bool = True
+        active_only: bool = True,
+        profile: LoadProfile = LoadProfile.LIST
     ) -> List[Material]:
         query = (
             select(Material)
-            .options(selectinload(Material.primary_supplier))
+            .options(*load_options(Material, profile))
             .offset(skip)
             .limit(limit)
             .order_by(Material.code)
@@ -167,59 +259,82 @@ class MaterialService:
         return result.scalars().all()
     
     @staticmethod
-    async def get_material(db: AsyncSession, material_id: int) -> Optional[Material]:
-        result = await db.execute(
-            select(Material)
-            .options(
-                selectinload(Material.primary_supplier),
-                selectinload(Material.batches),
-                selectinload(Material.inventory_items)
-            )
-            .where(Material.id == material_id)
-        )
-        return result.scalar_one_or_none()
+    async def get_material(
+        db: AsyncSession, material_id: int, profile: LoadProfile = LoadProfile.DETAIL
+    ) -> Optional[Material]:
+        return await load_by_id(db, Material, material_id, profile)
     
     @staticmethod
-    async def create_material(db: AsyncSession, material: MaterialCreate) -> Material:
+    async def create_material(
+        db: AsyncSession, material: MaterialCreate, profile: LoadProfile = LoadProfile.LIST
+    ) -> Material:
         db_material = Material(**material.model_dump())
         db.add(db_material)
         await db.commit()
-        await db.refresh(db_material)
-        return db_material
+        invalidate_search(Material)
+        return await load_by_id(db, Material, db_material.id, profile, refresh=True)
     
     @staticmethod
-    async def update_material(db: AsyncSession, material_id: int, material: MaterialUpdate) -> Optional[Material]:
-        db_material = await MaterialService.get_material(db, material_id)
+    async def update_material(
+        db: AsyncSession,
+        material_id: int,
+        material: MaterialUpdate,
+        profile: LoadProfile = LoadProfile.LIST
+    ) -> Optional[Material]:
+        db_material = await MaterialService.get_material(db, material_id, LoadProfile.MINIMAL)
         if db_material:
             for key, value in material.model_dump(exclude_unset=True).items():
                 setattr(db_material, key, value)
             await db.commit()
-            await db.refresh(db_material)
+            invalidate_search(Material)
+            db_material = await load_by_id(db, Material, material_id, profile, refresh=True)
         return db_material
     
     @staticmethod
-    async def get_low_stock_materials(db: AsyncSession) -> List[Material]:
-        """Get materials below reorder point"""
-        # This is a simplified version - in reality would need complex inventory calculation
-        result = await db.execute(
+    async def upsert_materials(db: AsyncSession, materials: List[MaterialCreate]) -> UpsertResult:
+        """Insert new and update changed materials by code in one pass"""
+        # Existing materials only take the fields the payload sets; defaults are for new ones
+        records = [
+            (num, material.model_dump(), material.model_dump(exclude_unset=True).keys())
+            for num, material in enumerate(materials, 1)
+        ]
+        result = await UpsertService.upsert_by_code(db, Material, records, MaterialService.UPSERT_COLUMNS)
+        await db.commit()
+        invalidate_search(Material)
+        return result
+    
+    @staticmethod
+    def low_stock_query():
+        """Active materials whose available stock is at or below the reorder point"""
+        stock = (
+            select(
+                InventoryItem.material_id,
+                func.sum(InventoryItem.available_quantity).label("available")
+            )
+            .group_by(InventoryItem.material_id)
+            .subquery()
+        )
+        return (
             select(Material)
-            .options(selectinload(Material.inventory_items))
+            .outerjoin(stock, stock.c.material_id == Material.id)
             .where(
                 and_(
                     Material.is_active == True,
-                    Material.reorder_point.is_not(None)
+                    Material.reorder_point.is_not(None),
+                    func.coalesce(stock.c.available, 0.0) <= Material.reorder_point
                 )
             )
         )
-        materials = result.scalars().all()
-        
-        low_stock = []
-        for material in materials:
-            total_stock = sum(item.available_quantity for item in material.inventory_items)
-            if material.reorder_point and total_stock <= material.reorder_point:
-                low_stock.append(material)
-        
-        return low_stock
+    
+    @staticmethod
+    async def get_low_stock_materials(db: AsyncSession) -> List[Material]:
+        """Get materials below reorder point"""
+        result = await db.execute(
+            MaterialService.low_stock_query()
+            .options(*load_options(Material, LoadProfile.LIST))
+            .order_by(Material.code)
+        )
+        return result.scalars().all()
 
 
 class BatchService:
@@ -231,14 +346,12 @@ class BatchService:
         skip: int = 0, 
         limit: int = 100,
         quality_status: Optional[QualityStatus] = None,
-        material_id: Optional[int] = None
+        material_id: Optional[int] = None,
+        profile: LoadProfile = LoadProfile.LIST
     ) -> List[Batch]:
         query = (
             select(Batch)
-            .options(
-                selectinload(Batch.material),
-                selectinload(Batch.supplier)
-            )
+            .options(*load_options(Batch, profile))
             .offset(skip)
             .limit(limit)
             .order_by(desc(Batch.received_date))
@@ -254,35 +367,34 @@ class BatchService:
         return result.scalars().all()
     
     @staticmethod
-    async def get_batch(db: AsyncSession, batch_id: int) -> Optional[Batch]:
-        result = await db.execute(
-            select(Batch)
-            .options(
-                selectinload(Batch.material),
-                selectinload(Batch.supplier),
-                selectinload(Batch.inventory_items)
-            )
-            .where(Batch.id == batch_id)
-        )
-        return result.scalar_one_or_none()
+    async def get_batch(
+        db: AsyncSession, batch_id: int, profile: LoadProfile = LoadProfile.DETAIL
+    ) -> Optional[Batch]:
+        return await load_by_id(db, Batch, batch_id, profile)
     
     @staticmethod
-    async def create_batch(db: AsyncSession, batch: BatchCreate) -> Batch:
+    async def create_batch(
+        db: AsyncSession, batch: BatchCreate, profile: LoadProfile = LoadProfile.LIST
+    ) -> Batch:
         db_batch = Batch(**batch.model_dump())
         db_batch.available_quantity = db_batch.received_quantity
         db.add(db_batch)
         await db.commit()
-        await db.refresh(db_batch)
-        return db_batch
+        return await load_by_id(db, Batch, db_batch.id, profile, refresh=True)
     
     @staticmethod
-    async def update_batch(db: AsyncSession, batch_id: int, batch: BatchUpdate) -> Optional[Batch]:
-        db_batch = await BatchService.get_batch(db, batch_id)
+    async def update_batch(
+        db: AsyncSession,
+        batch_id: int,
+        batch: BatchUpdate,
+        profile: LoadProfile = LoadProfile.LIST
+    ) -> Optional[Batch]:
+        db_batch = await BatchService.get_batch(db, batch_id, LoadProfile.MINIMAL)
         if db_batch:
             for key, value in batch.model_dump(exclude_unset=True).items():
                 setattr(db_batch, key, value)
             await db.commit()
-            await db.refresh(db_batch)
+            db_batch = await load_by_id(db, Batch, batch_id, profile, refresh=True)
         return db_batch
     
     @staticmethod
@@ -290,37 +402,37 @@ class BatchService:
         """Get batches pending quality control"""
         result = await db.execute(
             select(Batch)
-            .options(
-                selectinload(Batch.material),
-                selectinload(Batch.supplier)
-            )
+            .options(*load_options(Batch, LoadProfile.LIST))
             .where(Batch.quality_status == QualityStatus.PENDING)
             .order_by(Batch.received_date)
         )
         return result.scalars().all()
     
     @staticmethod
-    async def approve_batch(db: AsyncSession, batch_id: int, notes: Optional[str] = None) -> Optional[Batch]:
+    async def approve_batch(
+        db: AsyncSession,
+        batch_id: int,
+        notes: Optional[str] = None,
+        profile: LoadProfile = LoadProfile.LIST
+    ) -> Optional[Batch]:
         """Approve batch for use"""
-        db_batch = await BatchService.get_batch(db, batch_id)
-        if db_batch:
-            db_batch.quality_status = QualityStatus.APPROVED
-            if notes:
-                db_batch.quality_notes = notes
-            await db.commit()
-            await db.refresh(db_batch)
-        return db_batch
+        await QualityControlService.decide(
+            db, BulkQualityDecision(batch_ids=[batch_id], decision=QualityStatus.APPROVED, notes=notes)
+        )
+        return await load_by_id(db, Batch, batch_id, profile, refresh=True)
     
     @staticmethod
-    async def block_batch(db: AsyncSession, batch_id: int, notes: str) -> Optional[Batch]:
+    async def block_batch(
+        db: AsyncSession,
+        batch_id: int,
+        notes: str,
+        profile: LoadProfile = LoadProfile.LIST
+    ) -> Optional[Batch]:
         """Block batch from use"""
-        db_batch = await BatchService.get_batch(db, batch_id)
-        if db_batch:
-            db_batch.quality_status = QualityStatus.BLOCKED
-            db_batch.quality_notes = notes
-            await db.commit()
-            await db.refresh(db_batch)
-        return db_batch
+        await QualityControlService.decide(
+            db, BulkQualityDecision(batch_ids=[batch_id], decision=QualityStatus.BLOCKED, notes=notes)
+        )
+        return await load_by_id(db, Batch, batch_id, profile, refresh=True)
 
 
 class InventoryService:
@@ -332,15 +444,12 @@ class InventoryService:
         warehouse_id: Optional[int] = None,
         material_id: Optional[int] = None,
         skip: int = 0,
-        limit: int = 100
+        limit: int = 100,
+        profile: LoadProfile = LoadProfile.LIST
     ) -> List[InventoryItem]:
         query = (
             select(InventoryItem)
-            .options(
-                selectinload(InventoryItem.warehouse),
-                selectinload(InventoryItem.material),
-                selectinload(InventoryItem.batch)
-            )
+            .options(*load_options(InventoryItem, profile))
             .offset(skip)
             .limit(limit)
             .order_by(InventoryItem.warehouse_id, InventoryItem.material_id)
@@ -356,49 +465,88 @@ class InventoryService:
         return result.scalars().all()
     
     @staticmethod
-    async def get_material_inventory(db: AsyncSession, material_id: int) -> Optional[MaterialInventory]:
-        """Get complete inventory picture for a material"""
-        material = await MaterialService.get_material(db, material_id)
-        if not material:
-            return None
+    async def get_material_inventory(
+        db: AsyncSession,
+        material_id: int,
+        include: Optional[List[MaterialInventoryInclude]] = None,
+        skip: int = 0,
+        limit: int = 100
+    ) -> Optional[MaterialInventory]:
+        """
+        Inventory totals for a material from one aggregate query.
+        
+        Inventory rows and batches are only loaded when listed in include,
+        one page of skip/limit each.
+        """
+        def inventory_total(column):
+            return (
+                select(func.coalesce(func.sum(column), 0.0))
+                .where(InventoryItem.material_id == material_id)
+                .scalar_subquery()
+            )
         
-        # Get all inventory items for this material
-        inventory_items = await InventoryService.get_inventory(db, material_id=material_id, limit=1000)
+        result = await db.execute(
+            select(
+                Material,
+                inventory_total(InventoryItem.quantity).label("total_quantity"),
+                inventory_total(InventoryItem.available_quantity).label("available_quantity"),
+                inventory_total(InventoryItem.reserved_quantity).label("reserved_quantity"),
+                select(func.count()).where(InventoryItem.material_id == material_id)
+                .scalar_subquery().label("inventory_item_count"),
+                select(func.count()).where(Batch.material_id == material_id)
+                .scalar_subquery().label("batch_count"),
+            )
+            .options(*load_options(Material, LoadProfile.LIST))
+            .where(Material.id == material_id)
+        )
+        row = result.one_or_none()
+        if not row:
+            return None
         
-        # Get all batches for this material
-        batches = await BatchService.get_batches(db, material_id=material_id, limit=1000)
+        include = set(include or [])
+        inventory_items = []
+        if MaterialInventoryInclude.WAREHOUSES in include:
+            inventory_items = await InventoryService.get_inventory(
+                db, material_id=material_id, skip=skip, limit=limit, profile=LoadProfile.LIST
+            )
         
-        # Calculate totals
-        total_quantity = sum(item.quantity for item in inventory_items)
-        available_quantity = sum(item.available_quantity for item in inventory_items)
-        reserved_quantity = sum(item.reserved_quantity for item in inventory_items)
+        batches = []
+        if MaterialInventoryInclude.BATCHES in include:
+            batches = await BatchService.get_batches(
+                db, material_id=material_id, skip=skip, limit=limit, profile=LoadProfile.LIST
+            )
         
         return MaterialInventory(
-            material=material,
-            total_quantity=total_quantity,
-            available_quantity=available_quantity,
-            reserved_quantity=reserved_quantity,
+            material=row.Material,
+            total_quantity=row.total_quantity,
+            available_quantity=row.available_quantity,
+            reserved_quantity=row.reserved_quantity,
+            inventory_item_count=row.inventory_item_count,
+            batch_count=row.batch_count,
             warehouses=inventory_items,
             batches=batches
         )
     
     @staticmethod
-    async def create_inventory_item(db: AsyncSession, inventory: InventoryItemCreate) -> InventoryItem:
+    async def create_inventory_item(
+        db: AsyncSession, inventory: InventoryItemCreate, profile: LoadProfile = LoadProfile.LIST
+    ) -> InventoryItem:
         db_inventory = InventoryItem(**inventory.model_dump())
+        db_inventory.reserved_quantity = 0.0
         db_inventory.available_quantity = db_inventory.quantity - db_inventory.reserved_quantity
         db.add(db_inventory)
         await db.commit()
-        await db.refresh(db_inventory)
-        return db_inventory
+        occupancy_map.mark_dirty([db_inventory.id])
+        return await load_by_id(db, InventoryItem, db_inventory.id, profile, refresh=True)
     
     @staticmethod
     async def update_inventory_item(
         db: AsyncSession, 
         inventory_id: int, 
-        inventory: InventoryItemUpdate
+        inventory: InventoryItemUpdate,
+        profile: LoadProfile = LoadProfile.LIST
     ) -> Optional[InventoryItem]:
-        result = await db.execute(select(InventoryItem).where(InventoryItem.id == inventory_id))
-        db_inventory = result.scalar_one_or_none()
+        db_inventory = await load_by_id(db, InventoryItem, inventory_id, LoadProfile.MINIMAL)
         
         if db_inventory:
             for key, value in inventory.model_dump(exclude_unset=True).items():
@@ -409,7 +557,8 @@ class InventoryService:
             db_inventory.last_movement_date = datetime.utcnow()
             
             await db.commit()
-            await db.refresh(db_inventory)
+            occupancy_map.mark_dirty([inventory_id])
+            db_inventory = await load_by_id(db, InventoryItem, inventory_id, profile, refresh=True)
         return db_inventory
     
     @staticmethod
@@ -434,137 +583,257 @@ class InventoryService:
         return db_movement
 
 
-class CSVService:
-    """Service for CSV import/export operations"""
+class UpsertService:
+    """Set-based INSERT ... ON CONFLICT(code) DO UPDATE for master data"""
+    
+    BATCH_SIZE = 500
     
     @staticmethod
-    async def import_materials_csv(
-        db: AsyncSession, 
-        csv_content: str,
-        has_header: bool = True,
-        delimiter: str = ","
-    ) -> CSVImportResult:
-        """Import materials from CSV"""
-        reader = csv.DictReader(io.StringIO(csv_content), delimiter=delimiter)
-        
-        total_rows = 0
-        imported_rows = 0
-        errors = []
+    async def upsert_by_code(
+        db: AsyncSession,
+        model: Type[Any],
+        records: List[Tuple[int, Dict[str, Any], Collection[str]]],
+        update_columns: List[str]
+    ) -> UpsertResult:
+        """
+        Upsert (row_number, values, provided) records keyed by code without committing.
+        
+        New codes are inserted with all their values. An existing row is only
+        overwritten in the columns its record provides, limited to
+        update_columns, so fields missing from the source keep their stored
+        values instead of falling back to defaults. Existing rows are fetched
+        once per batch so the result can report which codes were inserted,
+        updated or left unchanged; only inserted and changed rows are sent to
+        the database.
+        """
         warnings = []
         
+        # Later rows win when the same code appears twice in one payload;
+        # the earlier ones are not written and count as failed
+        by_code: Dict[str, Tuple[Dict[str, Any], Tuple[str, ...]]] = {}
+        for row_num, values, provided in records:
+            if values['code'] in by_code:
+                warnings.append(f"Row {row_num}: Duplicate code {values['code']}, later row wins")
+            by_code[values['code']] = (values, tuple(col for col in update_columns if col in provided))
+        
+        diff = UpsertDiff()
+        compare_columns = [col for col in update_columns if col != 'code']
+        dialect_name = db.get_bind().dialect.name
+        
+        for batch in chunked(list(by_code.values()), UpsertService.BATCH_SIZE):
+            existing_rows = await db.execute(
+                select(model.code, *[getattr(model, col) for col in compare_columns])
+                .where(model.code.in_([values['code'] for values, _ in batch]))
+            )
+            existing = {row[0]: dict(zip(compare_columns, row[1:])) for row in existing_rows.all()}
+            
+            # One statement per set of columns to overwrite; a payload usually has one
+            to_write: Dict[Tuple[str, ...], List[Dict[str, Any]]] = {}
+            for values, columns in batch:
+                current = existing.get(values['code'])
+                if current is None:
+                    diff.inserted.append(values['code'])
+                elif any(current[col] != values.get(col) for col in columns):
+                    diff.updated.append(values['code'])
+                else:
+                    diff.unchanged.append(values['code'])
+                    continue
+                to_write.setdefault(columns, []).append(values)
+            
+            for columns, rows in to_write.items():
+                await db.execute(
+                    upsert_statement(
+                        dialect_name, model.__table__, rows,
+                        index_elements=['code'], update_columns=columns
+                    )
+                )
+            if to_write and model is Material:
+                # Stock levels feed MRP; the flush listener does not see bulk upserts
+                written = [values['code'] for rows in to_write.values() for values in rows]
+                await MRPService.mark_dirty(
+                    db, "material", select(Material.id).where(Material.code.in_(written))
+                )
+        
+        written_rows = len(diff.inserted) + len(diff.updated) + len(diff.unchanged)
+        return UpsertResult(
+            success=True,
+            total_rows=len(records),
+            inserted_rows=len(diff.inserted),
+            updated_rows=len(diff.updated),
+            unchanged_rows=len(diff.unchanged),
+            failed_rows=len(records) - written_rows,
+            diff=diff,
+            warnings=warnings
+        )
+
+
+class CSVService:
+    """Service for CSV import/export operations"""
+    
+    MATERIAL_FIELDS = ['code', 'name', 'type', 'unit', 'description', 'min_stock_level', 'standard_cost']
+    SUPPLIER_FIELDS = ['code', 'name', 'contact_person', 'email', 'phone', 'address']
+    
+    @staticmethod
+    def make_reader(stream, has_header: bool, delimiter: str, fieldnames: List[str]) -> csv.DictReader:
+        """Create a DictReader over any text stream (in-memory string or spooled file)"""
+        reader = csv.DictReader(stream, delimiter=delimiter)
         if not has_header:
             # Assume standard column order if no header
-            fieldnames = ['code', 'name', 'type', 'unit', 'description', 'min_stock_level', 'standard_cost']
             reader.fieldnames = fieldnames
+        return reader
+    
+    @staticmethod
+    def _material_values(row: dict) -> dict:
+        return {
+            'code': row['code'],
+            'name': row['name'],
+            'type': MaterialType(row.get('type') or 'granulate_ldpe'),
+            'unit': row.get('unit') or 'kg',
+            'description': row.get('description') or None,
+            'min_stock_level': float(row['min_stock_level']) if row.get('min_stock_level') else None,
+            'standard_cost': float(row['standard_cost']) if row.get('standard_cost') else None,
+        }
+    
+    @staticmethod
+    def _supplier_values(row: dict) -> dict:
+        return {
+            'code': row['code'],
+            'name': row['name'],
+            'contact_person': row.get('contact_person') or None,
+            'email': row.get('email') or None,
+            'phone': row.get('phone') or None,
+            'address': row.get('address') or None,
+        }
+    
+    @staticmethod
+    async def _import_rows(
+        db: AsyncSession,
+        model: Type[Any],
+        to_values,
+        fieldnames: List[str],
+        rows: List[dict],
+        first_row_num: int,
+        mode: ImportMode
+    ) -> CSVImportResult:
+        """Validate a chunk of parsed rows and add or upsert them without committing"""
+        label = model.__name__
+        records = []
+        errors = []
+        warnings = []
         
-        for row_num, row in enumerate(reader, 1):
-            total_rows += 1
-            
+        for row_num, row in enumerate(rows, first_row_num):
             try:
                 # Validate required fields
                 if not row.get('code') or not row.get('name'):
                     errors.append(f"Row {row_num}: Missing required fields (code, name)")
                     continue
-                
-                # Check if material already exists
-                existing = await db.execute(
-                    select(Material).where(Material.code == row['code'])
-                )
-                if existing.scalar_one_or_none():
-                    warnings.append(f"Row {row_num}: Material {row['code']} already exists, skipping")
-                    continue
-                
-                # Create material
-                material_data = {
-                    'code': row['code'],
-                    'name': row['name'],
-                    'type': MaterialType(row.get('type', 'granulate_ldpe')),
-                    'unit': row.get('unit', 'kg'),
-                    'description': row.get('description'),
-                    'min_stock_level': float(row['min_stock_level']) if row.get('min_stock_level') else None,
-                    'standard_cost': float(row['standard_cost']) if row.get('standard_cost') else None,
-                }
-                
-                db_material = Material(**material_data)
-                db.add(db_material)
-                imported_rows += 1
-                
+                records.append((row_num, to_values(row)))
             except Exception as e:
                 errors.append(f"Row {row_num}: {str(e)}")
         
-        if imported_rows > 0:
-            await db.commit()
+        if mode == ImportMode.UPSERT:
+            # Only columns present in the file are overwritten on existing rows
+            present = set(rows[0]) if rows else set()
+            upserted = await UpsertService.upsert_by_code(
+                db, model, [(row_num, values, present) for row_num, values in records],
+                [col for col in fieldnames if col != 'code']
+            )
+            imported_rows = upserted.inserted_rows
+            updated_rows = upserted.updated_rows
+            unchanged_rows = upserted.unchanged_rows
+            warnings.extend(upserted.warnings)
+            diff = upserted.diff
+        else:
+            imported_rows = 0
+            updated_rows = 0
+            unchanged_rows = 0
+            diff = None
+            for row_num, values in records:
+                # Check if record already exists
+                existing = await db.execute(select(model).where(model.code == values['code']))
+                if existing.scalar_one_or_none():
+                    warnings.append(f"Row {row_num}: {label} {values['code']} already exists, skipping")
+                    continue
+                db.add(model(**values))
+                imported_rows += 1
         
         return CSVImportResult(
             success=len(errors) == 0,
-            total_rows=total_rows,
+            total_rows=len(rows),
             imported_rows=imported_rows,
-            failed_rows=total_rows - imported_rows,
+            failed_rows=len(rows) - imported_rows - updated_rows - unchanged_rows,
             errors=errors,
-            warnings=warnings
+            warnings=warnings,
+            updated_rows=updated_rows,
+            unchanged_rows=unchanged_rows,
+            diff=diff
         )
     
     @staticmethod
-    async def import_suppliers_csv(
+    async def import_material_rows(
         db: AsyncSession,
+        rows: List[dict],
+        first_row_num: int = 1,
+        mode: ImportMode = ImportMode.SKIP
+    ) -> CSVImportResult:
+        """Add a chunk of parsed material rows to the session without committing"""
+        return await CSVService._import_rows(
+            db, Material, CSVService._material_values, CSVService.MATERIAL_FIELDS,
+            rows, first_row_num, mode
+        )
+    
+    @staticmethod
+    async def import_supplier_rows(
+        db: AsyncSession,
+        rows: List[dict],
+        first_row_num: int = 1,
+        mode: ImportMode = ImportMode.SKIP
+    ) -> CSVImportResult:
+        """Add a chunk of parsed supplier rows to the session without committing"""
+        return await CSVService._import_rows(
+            db, Supplier, CSVService._supplier_values, CSVService.SUPPLIER_FIELDS,
+            rows, first_row_num, mode
+        )
+    
+    @staticmethod
+    async def import_materials_csv(
+        db: AsyncSession, 
         csv_content: str,
         has_header: bool = True,
-        delimiter: str = ","
+        delimiter: str = ",",
+        mode: ImportMode = ImportMode.SKIP
     ) -> CSVImportResult:
-        """Import suppliers from CSV"""
-        reader = csv.DictReader(io.StringIO(csv_content), delimiter=delimiter)
-        
-        total_rows = 0
-        imported_rows = 0
-        errors = []
-        warnings = []
+        """Import materials from CSV"""
+        reader = CSVService.make_reader(
+            io.StringIO(csv_content), has_header, delimiter, CSVService.MATERIAL_FIELDS
+        )
+        result = await CSVService.import_material_rows(db, list(reader), mode=mode)
         
-        if not has_header:
-            fieldnames = ['code', 'name', 'contact_person', 'email', 'phone', 'address']
-            reader.fieldnames = fieldnames
+        if result.imported_rows > 0 or result.updated_rows > 0:
+            await db.commit()
+            invalidate_search(Material)
         
-        for row_num, row in enumerate(reader, 1):
-            total_rows += 1
-            
-            try:
-                if not row.get('code') or not row.get('name'):
-                    errors.append(f"Row {row_num}: Missing required fields (code, name)")
-                    continue
-                
-                existing = await db.execute(
-                    select(Supplier).where(Supplier.code == row['code'])
-                )
-                if existing.scalar_one_or_none():
-                    warnings.append(f"Row {row_num}: Supplier {row['code']} already exists, skipping")
-                    continue
-                
-                supplier_data = {
-                    'code': row['code'],
-                    'name': row['name'],
-                    'contact_person': row.get('contact_person'),
-                    'email': row.get('email'),
-                    'phone': row.get('phone'),
-                    'address': row.get('address'),
-                }
-                
-                db_supplier = Supplier(**supplier_data)
-                db.add(db_supplier)
-                imported_rows += 1
-                
-            except Exception as e:
-                errors.append(f"Row {row_num}: {str(e)}")
+        return result
+    
+    @staticmethod
+    async def import_suppliers_csv(
+        db: AsyncSession,
+        csv_content: str,
+        has_header: bool = True,
+        delimiter: str = ",",
+        mode: ImportMode = ImportMode.SKIP
+    ) -> CSVImportResult:
+        """Import suppliers from CSV"""
+        reader = CSVService.make_reader(
+            io.StringIO(csv_content), has_header, delimiter, CSVService.SUPPLIER_FIELDS
+        )
+        result = await CSVService.import_supplier_rows(db, list(reader), mode=mode)
         
-        if imported_rows > 0:
+        if result.imported_rows > 0 or result.updated_rows > 0:
             await db.commit()
+            invalidate_search(Supplier)
         
-        return CSVImportResult(
-            success=len(errors) == 0,
-            total_rows=total_rows,
-            imported_rows=imported_rows,
-            failed_rows=total_rows - imported_rows,
-            errors=errors,
-            warnings=warnings
-        )
+        return result
 
 
 class TraceabilityService:
@@ -575,11 +844,7 @@ class TraceabilityService:
         """Full traceability for a batch"""
         result = await db.execute(
             select(Batch)
-            .options(
-                selectinload(Batch.material),
-                selectinload(Batch.supplier),
-                selectinload(Batch.inventory_items)
-            )
+            .options(*load_options(Batch, LoadProfile.LIST))
             .where(Batch.batch_number == batch_number)
         )
         batch = result.scalar_one_or_none()
@@ -600,21 +865,18 @@ class TraceabilityService:
         if batch.has_cmr:
             source_documents.append("CMR Transport Document")
         
-        # Get usage history (simplified - would need production records)
-        usage_history = []
-        for inventory_item in batch.inventory_items:
-            usage_history.append({
-                "warehouse": inventory_item.warehouse.name,
-                "location": inventory_item.location_code,
-                "quantity_used": batch.received_quantity - batch.available_quantity,
-                "date": inventory_item.last_movement_date
-            })
+        # Usage history: production jobs and output batches that consumed this batch
+        usage_history = await GenealogyService.get_direct_consumption(db, batch.id)
         
         quality_documents = [doc for doc in source_documents if "Certificate" in doc or "Declaration" in doc]
         
+        # Finished goods containing this batch, from the precomputed closure
+        finished_goods = await GenealogyClosureService.get_descendants(db, batch.id)
+        
         return TraceabilityResult(
             batch=batch,
             source_documents=source_documents,
             usage_history=usage_history,
-            quality_documents=quality_documents
+            quality_documents=quality_documents,
+            finished_goods=finished_goods
         )
\ No newline at end of file
@@ -0,0 +1,76 @@
+"""
+Copy-on-write column tables for scenario state
+
+A scenario starts as a view of shared base columns. Reading a column returns
+the base array; the first write to a column copies that column only, and
+appended rows live in a small tail of their own. Ten scenarios touching two
+columns each therefore hold ten copies of two columns, not of the table.
+Base arrays are made read-only, so a write that skips writable() raises
+instead of leaking into every other scenario.
+"""
+
+from typing import Dict, Mapping
+
+import numpy as np
+
+
+def freeze(columns: Mapping[str, np.ndarray]) -> Dict[str, np.ndarray]:
+    """Read-only base columns, checked to be of equal length"""
+    frozen = {}
+    lengths = {len(values) for values in columns.values()}
+    if len(lengths) > 1:
+        raise ValueError("Columns differ in length")
+    for name, values in columns.items():
+        values = np.asarray(values)
+        values.flags.writeable = False
+        frozen[name] = values
+    return frozen
+
+
+class CopyOnWriteColumns:
+    """Equal-length named columns over a shared, read-only base"""
+
+    def __init__(self, base: Mapping[str, np.ndarray]):
+        self._base = base
+        self._own: Dict[str, np.ndarray] = {}
+        self._tail: Dict[str, np.ndarray] = {}
+        self._rows = len(next(iter(base.values()))) if base else 0
+
+    def __len__(self) -> int:
+        return self._rows
+
+    def __getitem__(self, name: str) -> np.ndarray:
+        if name in self._own:
+            return self._own[name]
+        if name in self._tail:
+            return np.concatenate((self._base[name], self._tail[name]))
+        return self._base[name]
+
+    def writable(self, name: str) -> np.ndarray:
+        """The column as an array of this table's own, copied on first use"""
+        if name not in self._own:
+            self._own[name] = np.array(self[name])
+        return self._own[name]
+
+    def append(self, rows: Mapping[str, np.ndarray]) -> np.ndarray:
+        """Add rows (every column given); returns their indices"""
+        if set(rows) != set(self._base):
+            raise ValueError("Appended rows must give every column")
+        first = len(self)
+        count = len(next(iter(rows.values())))
+        for name, values in rows.items():
+            values = np.asarray(values, dtype=self._base[name].dtype)
+            if name in self._own:
+                self._own[name] = np.concatenate((self._own[name], values))
+            else:
+                tail = self._tail.get(name)
+                self._tail[name] = values if tail is None else np.concatenate((tail, values))
+        self._rows += count
+        return np.arange(first, first + count)
+
+    @property
+    def owned_bytes(self) -> int:
+        """Memory held by this table on top of the shared base"""
+        return sum(values.nbytes for values in self._own.values()) + sum(
+            values.nbytes for name, values in self._tail.items() if name not in self._own
+        )
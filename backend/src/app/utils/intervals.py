@@ -0,0 +1,166 @@
+"""
+Interval tree over half-open [start, end) intervals
+
+A treap ordered by start, each node carrying the largest end in its subtree,
+so overlap queries and "next busy interval" lookups skip whole subtrees.
+Insert, remove and both lookups take O(log n) expected time (plus the number
+of intervals reported). Bounds can be anything ordered: numbers, datetimes.
+"""
+
+from typing import Any, Iterator, List, NamedTuple, Optional
+import itertools
+import random
+
+
+class Interval(NamedTuple):
+    start: Any
+    end: Any
+    data: Any = None
+
+
+class _Node:
+    __slots__ = ("interval", "key", "priority", "left", "right", "max_end")
+
+    def __init__(self, interval: Interval, key: tuple, priority: float):
+        self.interval = interval
+        self.key = key
+        self.priority = priority
+        self.left: Optional["_Node"] = None
+        self.right: Optional["_Node"] = None
+        self.max_end = interval.end
+
+    def update(self) -> None:
+        max_end = self.interval.end
+        if self.left is not None and self.left.max_end > max_end:
+            max_end = self.left.max_end
+        if self.right is not None and self.right.max_end > max_end:
+            max_end = self.right.max_end
+        self.max_end = max_end
+
+
+class IntervalTree:
+    """Mutable set of intervals; identical intervals may be stored more than once"""
+
+    def __init__(self, intervals: Optional[List[Interval]] = None, seed: Optional[int] = None):
+        self._root: Optional[_Node] = None
+        self._size = 0
+        self._random = random.Random(seed)
+        self._counter = itertools.count()  # Tie-breaker keeping equal intervals apart
+        for interval in intervals or ():
+            self.add(*interval)
+
+    def __len__(self) -> int:
+        return self._size
+
+    def __iter__(self) -> Iterator[Interval]:
+        """Intervals by start"""
+        stack, node = [], self._root
+        while stack or node is not None:
+            while node is not None:
+                stack.append(node)
+                node = node.left
+            node = stack.pop()
+            yield node.interval
+            node = node.right
+
+    # --- updates -----------------------------------------------------------
+
+    def add(self, start: Any, end: Any, data: Any = None) -> Interval:
+        if not start < end:
+            raise ValueError(f"Empty interval [{start}, {end})")
+        interval = Interval(start, end, data)
+        node = _Node(interval, (start, next(self._counter)), self._random.random())
+        left, right = self._split(self._root, node.key)
+        self._root = self._merge(self._merge(left, node), right)
+        self._size += 1
+        return interval
+
+    def remove(self, interval: Interval) -> bool:
+        """Remove one stored interval equal to the given one; False when absent"""
+        node = self._find(interval)
+        if node is None:
+            return False
+        left, rest = self._split(self._root, node.key)
+        _, right = self._split(rest, (node.key[0], node.key[1] + 1))
+        self._root = self._merge(left, right)
+        self._size -= 1
+        return True
+
+    # --- queries -----------------------------------------------------------
+
+    def overlapping(self, start: Any, end: Any) -> List[Interval]:
+        """Intervals intersecting [start, end), by start"""
+        found: List[Interval] = []
+
+        def visit(node: Optional[_Node]) -> None:
+            if node is None or not node.max_end > start:
+                return
+            visit(node.left)
+            # Everything to the right starts later still
+            if node.interval.start < end:
+                if node.interval.end > start:
+                    found.append(node.interval)
+                visit(node.right)
+
+        visit(self._root)
+        return found
+
+    def first_ending_after(self, point: Any) -> Optional[Interval]:
+        """Earliest-starting interval that has not ended at point (contains it or lies after it)"""
+        node = self._root
+        while node is not None:
+            if node.left is not None and node.left.max_end > point:
+                node = node.left
+            elif node.interval.end > point:
+                return node.interval
+            elif node.right is not None and node.right.max_end > point:
+                node = node.right
+            else:
+                return None
+        return None
+
+    # --- treap internals ---------------------------------------------------
+
+    def _find(self, interval: Interval) -> Optional[_Node]:
+        stack = [self._root]
+        while stack:
+            node = stack.pop()
+            if node is None or not node.max_end >= interval.end:
+                continue
+            if node.interval == interval:
+                return node
+            if interval.start < node.interval.start:
+                stack.append(node.left)
+            elif node.interval.start < interval.start:
+                stack.append(node.right)
+            else:
+                # Equal starts may sit on either side
+                stack.extend((node.left, node.right))
+        return None
+
+    def _split(self, node: Optional[_Node], key: tuple):
+        """(nodes with key < key, nodes with key >= key)"""
+        if node is None:
+            return None, None
+        if node.key < key:
+            left, right = self._split(node.right, key)
+            node.right = left
+            node.update()
+            return node, right
+        left, right = self._split(node.left, key)
+        node.left = right
+        node.update()
+        return left, node
+
+    def _merge(self, left: Optional[_Node], right: Optional[_Node]) -> Optional[_Node]:
+        if left is None:
+            return right
+        if right is None:
+            return left
+        if left.priority > right.priority:
+            left.right = self._merge(left.right, right)
+            left.update()
+            return left
+        right.left = self._merge(left, right.left)
+        right.update()
+        return right
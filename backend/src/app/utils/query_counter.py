@@ -0,0 +1,34 @@
+"""
+Count the SQL statements an engine executes, to pin down N+1 regressions
+
+    with QueryCounter(async_engine) as counter:
+        await BatchService.get_batch(db, batch_id, LoadProfile.LIST)
+    assert counter.count == 1, counter.statements
+"""
+
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from sqlalchemy.ext.asyncio import AsyncEngine
+from typing import List, Union
+
+
+class QueryCounter:
+    """Context manager recording every statement sent to the database"""
+
+    def __init__(self, engine: Union[Engine, AsyncEngine]):
+        self.engine = engine.sync_engine if isinstance(engine, AsyncEngine) else engine
+        self.statements: List[str] = []
+
+    @property
+    def count(self) -> int:
+        return len(self.statements)
+
+    def _before_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+        self.statements.append(statement)
+
+    def __enter__(self) -> "QueryCounter":
+        event.listen(self.engine, "before_cursor_execute", self._before_cursor_execute)
+        return self
+
+    def __exit__(self, exc_type, exc, tb) -> None:
+        event.remove(self.engine, "before_cursor_execute", self._before_cursor_execute)
@@ -0,0 +1,158 @@
+"""
+Finite-capacity scheduling primitives
+
+ShiftCalendar answers when a line works (shifts per weekday); LineTimeline
+combines a calendar with an IntervalTree of busy time (maintenance, running
+and already booked jobs) and finds the earliest slot for a job. A job only
+consumes working time: it pauses over breaks between shifts, but never runs
+across busy time. Nothing here touches the database.
+"""
+
+from typing import Any, Iterable, Iterator, List, Optional, Sequence, Tuple
+from datetime import datetime, time, timedelta
+
+from app.utils.intervals import Interval, IntervalTree
+
+
+def parse_shifts(spec: str) -> List[Tuple[time, time]]:
+    """'06:00-14:00,14:00-22:00' -> [(06:00, 14:00), (14:00, 22:00)]; a shift ending
+    at or before its start runs past midnight"""
+    shifts = []
+    for part in spec.split(","):
+        part = part.strip()
+        if not part:
+            continue
+        try:
+            start, end = (time.fromisoformat(value.strip()) for value in part.split("-"))
+        except ValueError:
+            raise ValueError(f"Invalid shift '{part}', expected HH:MM-HH:MM")
+        shifts.append((start, end))
+    return shifts
+
+
+class ShiftCalendar:
+    """Working windows from daily shifts on working weekdays (0 = Monday); no shifts means 24/7"""
+
+    def __init__(self, shifts: Sequence[Tuple[time, time]] = (), workdays: Iterable[int] = range(7)):
+        self.shifts = list(shifts)
+        self.workdays = frozenset(workdays)
+
+    @property
+    def always_working(self) -> bool:
+        return not self.shifts and len(self.workdays) == 7
+
+    def _day_windows(self, day: datetime) -> List[Tuple[datetime, datetime]]:
+        if day.weekday() not in self.workdays:
+            return []
+        if not self.shifts:
+            return [(day, day + timedelta(days=1))]
+        windows = []
+        for start, end in self.shifts:
+            window_start = datetime.combine(day.date(), start)
+            window_end = datetime.combine(day.date(), end)
+            if window_end <= window_start:
+                window_end += timedelta(days=1)
+            windows.append((window_start, window_end))
+        return windows
+
+    def windows(self, start: datetime, limit: Optional[datetime] = None) -> Iterator[Tuple[datetime, datetime]]:
+        """Merged working windows from start on (clipped to start), in order"""
+        if self.always_working:
+            yield start, limit or datetime.max
+            return
+
+        # Shifts starting the day before may still be running
+        day = datetime.combine(start.date(), time()) - timedelta(days=1)
+        pending: Optional[Tuple[datetime, datetime]] = None
+        empty_days = 0
+        while limit is None or day < limit:
+            day_windows = sorted(self._day_windows(day))
+            empty_days = 0 if day_windows else empty_days + 1
+            if empty_days > 7:
+                break  # No working days at all
+            for window_start, window_end in day_windows:
+                if window_end <= start:
+                    continue
+                window_start = max(window_start, start)
+                if pending is not None and window_start <= pending[1]:
+                    pending = (pending[0], max(pending[1], window_end))
+                    continue
+                if pending is not None:
+                    yield pending
+                pending = (window_start, window_end)
+            day += timedelta(days=1)
+            # Windows of later days start after this day's end, so pending can go once it ended
+            if pending is not None and pending[1] < day:
+                yield pending
+                pending = None
+        if pending is not None:
+            yield pending
+
+    def next_working(self, moment: datetime) -> Optional[datetime]:
+        for window_start, _ in self.windows(moment):
+            return window_start
+        return None
+
+    def advance(self, start: datetime, minutes: float, limit: Optional[datetime] = None) -> Optional[datetime]:
+        """Moment the given working minutes are used up when starting at start"""
+        remaining = timedelta(minutes=minutes)
+        if remaining <= timedelta(0):
+            return start
+        for window_start, window_end in self.windows(start, limit):
+            available = window_end - window_start
+            if available >= remaining:
+                return window_start + remaining
+            remaining -= available
+        return None
+
+    def working_minutes(self, start: datetime, end: datetime) -> float:
+        total = timedelta(0)
+        for window_start, window_end in self.windows(start, end):
+            if window_start >= end:
+                break
+            total += min(window_end, end) - window_start
+        return total.total_seconds() / 60
+
+
+class LineTimeline:
+    """Busy time of one line on top of its calendar"""
+
+    def __init__(self, calendar: ShiftCalendar, busy: Iterable[Interval] = ()):
+        self.calendar = calendar
+        self.busy = IntervalTree(list(busy), seed=0)
+
+    def block(self, start: datetime, end: datetime, data: Any = None) -> Optional[Interval]:
+        if start >= end:
+            return None
+        return self.busy.add(start, end, data)
+
+    def release(self, interval: Interval) -> bool:
+        return self.busy.remove(interval)
+
+    def earliest_slot(
+        self, release: datetime, minutes: float, horizon_end: datetime
+    ) -> Optional[Tuple[datetime, datetime]]:
+        """Earliest (start, end) at or after release holding the given working minutes
+        without running into busy time; None when nothing fits before horizon_end"""
+        moment = release
+        while moment < horizon_end:
+            moment = self.calendar.next_working(moment)
+            if moment is None or moment >= horizon_end:
+                return None
+
+            blocker = self.busy.first_ending_after(moment)
+            if blocker is not None and blocker.start <= moment:
+                moment = blocker.end
+                continue
+
+            limit = blocker.start if blocker is not None else horizon_end
+            end = self.calendar.advance(moment, minutes, limit)
+            if end is not None and end <= limit:
+                return moment, end
+            if blocker is None:
+                return None
+            moment = blocker.end
+        return None
+
+    def intervals(self) -> List[Interval]:
+        return list(self.busy)
@@ -0,0 +1,150 @@
+"""
+In-process trigram index for short catalog texts (codes and names)
+
+Text is folded before indexing: case-folded, diacritics stripped (Polish and
+Cyrillic included, e.g. "Łódź" -> "lodz", "Ёлка" -> "елка") and split into
+tokens. A query token matches a document token exactly, as a prefix, or
+fuzzily by trigram similarity, in that order of preference. Every query token
+has to match for a document to be returned.
+"""
+
+from bisect import bisect_left
+import heapq
+import itertools
+from typing import Dict, Iterable, List, Set, Tuple
+import re
+import unicodedata
+
+# Letters NFKD does not decompose into base letter + combining mark
+_FOLD = str.maketrans({"ł": "l", "đ": "d", "ø": "o", "ß": "ss", "æ": "ae", "œ": "oe"})
+_TOKEN = re.compile(r"\w+")
+
+
+def fold(text: str) -> str:
+    """Lower-case text with diacritics removed"""
+    decomposed = unicodedata.normalize("NFKD", text.casefold().translate(_FOLD))
+    return "".join(ch for ch in decomposed if not unicodedata.combining(ch))
+
+
+def tokenize(text: str) -> List[str]:
+    return _TOKEN.findall(fold(text))
+
+
+def trigrams(token: str) -> Set[str]:
+    padded = f"  {token} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+class TrigramIndex:
+    """Immutable token/trigram index over (doc_id, texts) pairs"""
+
+    EXACT = 1.0
+    PREFIX = 0.9
+    FUZZY = 0.7  # Scale of trigram similarity, so fuzzy matches rank below prefixes
+    FUZZY_BELOW = 100  # Documents already matched exactly or by prefix
+    STOP_GRAM = 2000  # Vocabulary tokens sharing a gram before it stops selecting typo candidates
+
+    def __init__(self, documents: Iterable[Tuple[int, Iterable[str]]], min_similarity: float = 0.3):
+        self.min_similarity = min_similarity
+        postings: Dict[str, Set[int]] = {}
+        self._size = 0
+        for doc_id, texts in documents:
+            self._size += 1
+            for text in texts:
+                if not text:
+                    continue
+                tokens = tokenize(text)
+                # Also index codes without separators, so "MAT001" finds "MAT-001"
+                if len(tokens) > 1 and not any(ch.isspace() for ch in text):
+                    tokens.append("".join(tokens))
+                for token in tokens:
+                    postings.setdefault(token, set()).add(doc_id)
+
+        self._vocabulary: List[str] = sorted(postings)
+        self._postings: List[Set[int]] = [postings[token] for token in self._vocabulary]
+        self._cumulative: List[int] = [0, *itertools.accumulate(len(docs) for docs in self._postings)]
+        self._doc_tokens: Dict[int, List[int]] = {}
+        for token_id, docs in enumerate(self._postings):
+            for doc_id in docs:
+                self._doc_tokens.setdefault(doc_id, []).append(token_id)
+        self._trigram_sizes: List[int] = []
+        self._trigrams: Dict[str, List[int]] = {}
+        for token_id, token in enumerate(self._vocabulary):
+            grams = trigrams(token)
+            self._trigram_sizes.append(len(grams))
+            for gram in grams:
+                self._trigrams.setdefault(gram, []).append(token_id)
+
+    def __len__(self) -> int:
+        return self._size
+
+    def _matches(self, token: str, fuzzy: bool) -> "_TokenMatch":
+        """Vocabulary tokens matching one query token"""
+        start = bisect_left(self._vocabulary, token)
+        end = bisect_left(self._vocabulary, token + "\uffff", start)
+        match = _TokenMatch(token, start, end, self._cumulative[end] - self._cumulative[start])
+
+        # Typo matching only when the token is not already a common word or prefix
+        if fuzzy and len(token) >= 3 and match.covered < self.FUZZY_BELOW:
+            grams = trigrams(token)
+            # Candidates share at least one selective gram; grams common to most of the
+            # vocabulary ("  m", "000") would make every lookup a scan
+            selective = [gram for gram in grams if 0 < len(self._trigrams.get(gram, ())) <= self.STOP_GRAM]
+            candidates = {token_id for gram in selective for token_id in self._trigrams[gram]}
+            for token_id in candidates:
+                if start <= token_id < end:
+                    continue
+                common = len(grams & trigrams(self._vocabulary[token_id]))
+                similarity = common / (len(grams) + self._trigram_sizes[token_id] - common)
+                if similarity >= self.min_similarity:
+                    match.fuzzy[token_id] = self.FUZZY * similarity
+                    match.covered += len(self._postings[token_id])
+
+        return match
+
+    def search(self, query: str, limit: int = 20, fuzzy: bool = True) -> List[Tuple[int, float]]:
+        """(doc_id, score) pairs, best first; score is the mean over query tokens"""
+        tokens = list(dict.fromkeys(tokenize(query)))
+        if not tokens:
+            return []
+
+        # Expand the most selective token into documents, then only score those for the others
+        matches = sorted((self._matches(token, fuzzy) for token in tokens), key=lambda match: match.covered)
+
+        totals: Dict[int, float] = {}
+        first = matches[0]
+        for token_id in itertools.chain(range(first.start, first.end), first.fuzzy):
+            score = first.score(token_id, self._vocabulary)
+            for doc_id in self._postings[token_id]:
+                if score > totals.get(doc_id, 0.0):
+                    totals[doc_id] = score
+
+        for match in matches[1:]:
+            if not totals:
+                return []
+            scored = {}
+            for doc_id, total in totals.items():
+                best = max(match.score(token_id, self._vocabulary) for token_id in self._doc_tokens[doc_id])
+                if best > 0.0:
+                    scored[doc_id] = total + best
+            totals = scored
+
+        ranked = heapq.nsmallest(limit, totals.items(), key=lambda hit: (-hit[1], hit[0]))
+        return [(doc_id, total / len(tokens)) for doc_id, total in ranked]
+
+
+class _TokenMatch:
+    """Vocabulary range sharing the query token as prefix, plus fuzzy matches"""
+    __slots__ = ("token", "start", "end", "covered", "fuzzy")
+
+    def __init__(self, token: str, start: int, end: int, covered: int):
+        self.token = token
+        self.start = start
+        self.end = end
+        self.covered = covered  # Documents matched, counted once per matching token
+        self.fuzzy: Dict[int, float] = {}
+
+    def score(self, token_id: int, vocabulary: List[str]) -> float:
+        if self.start <= token_id < self.end:
+            return TrigramIndex.EXACT if vocabulary[token_id] == self.token else TrigramIndex.PREFIX
+        return self.fuzzy.get(token_id, 0.0)
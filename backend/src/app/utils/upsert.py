@@ -0,0 +1,58 @@
+"""
+Dialect-aware INSERT ... ON CONFLICT helpers
+
+SQLite (development) and PostgreSQL (production) both support
+INSERT ... ON CONFLICT, but SQLAlchemy exposes it through dialect-specific
+insert() constructs. These helpers pick the right one for the session.
+"""
+
+from sqlalchemy import Table, func
+from sqlalchemy.dialects import postgresql, sqlite
+from typing import Any, Dict, Iterable, List, Optional, Sequence
+
+
+def dialect_insert(dialect_name: str, table: Table):
+    """Return the dialect insert() construct that supports on_conflict_* clauses"""
+    if dialect_name == "postgresql":
+        return postgresql.insert(table)
+    if dialect_name == "sqlite":
+        return sqlite.insert(table)
+    raise NotImplementedError(f"Upsert is not supported for dialect '{dialect_name}'")
+
+
+def upsert_statement(
+    dialect_name: str,
+    table: Table,
+    values: Optional[List[Dict[str, Any]]],
+    index_elements: Sequence[str],
+    update_columns: Iterable[str],
+    index_where: Optional[Any] = None,
+    touch_updated_at: bool = True
+):
+    """
+    INSERT ... ON CONFLICT (index_elements) DO UPDATE SET col = excluded.col
+
+    With values=None the statement carries no rows; pass them as executemany
+    parameters instead, which avoids compiling one bind per value on large writes.
+    """
+    stmt = dialect_insert(dialect_name, table)
+    if values is not None:
+        stmt = stmt.values(values)
+    set_ = {col: stmt.excluded[col] for col in update_columns}
+    if touch_updated_at and "updated_at" in table.c:
+        set_["updated_at"] = func.now()
+
+    if not set_:
+        return stmt.on_conflict_do_nothing(index_elements=index_elements, index_where=index_where)
+
+    return stmt.on_conflict_do_update(
+        index_elements=index_elements,
+        index_where=index_where,
+        set_=set_
+    )
+
+
+def chunked(items: List[Any], size: int) -> Iterable[List[Any]]:
+    """Split a list into consecutive slices of at most size items"""
+    for start in range(0, len(items), size):
+        yield items[start:start + size]
@@ -0,0 +1,11 @@
+import os
+import sys
+import tempfile
+from pathlib import Path
+
+# Settings and engines are created at import time: point them at a scratch database first
+_DB_PATH = Path(tempfile.mkdtemp()) / "test.db"
+os.environ["DATABASE_URL"] = f"sqlite:///{_DB_PATH}"
+os.environ["DEBUG"] = "false"
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1] / "src"))
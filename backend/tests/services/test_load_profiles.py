@@ -0,0 +1,97 @@
+"""
+Query counts of warehouse reads: a list read is one SELECT however many rows
+it returns, and serializing the result with the endpoint's response schema
+must not lazy-load anything.
+"""
+
+import asyncio
+from datetime import datetime
+
+import pytest
+from sqlalchemy import delete, insert
+
+import app.db.base  # noqa: F401  registers every model
+from app.db.base import BaseModel
+from app.db.database import engine, async_engine, AsyncSessionLocal
+from app.models.base import MaterialType, WarehouseType
+from app.models.warehouse import Supplier, Material, Batch, InventoryItem, Warehouse
+from app.schemas import warehouse as schemas
+from app.services.load_profiles import LoadProfile
+from app.services.warehouse import InventoryService, BatchService, MaterialService, SupplierService
+from app.utils.query_counter import QueryCounter
+
+
+async def _seed(rows: int) -> None:
+    async with AsyncSessionLocal() as db:
+        for model in (InventoryItem, Batch, Material, Warehouse, Supplier):
+            await db.execute(delete(model))
+        await db.execute(insert(Supplier), [{"id": 1, "code": "S1", "name": "Supplier"}])
+        await db.execute(
+            insert(Warehouse), [{"id": 1, "code": "W1", "name": "Main", "type": list(WarehouseType)[0]}]
+        )
+        await db.execute(insert(Material), [
+            {"id": i, "code": f"M{i}", "name": f"Material {i}", "type": MaterialType.SOLVENT,
+             "unit": "kg", "primary_supplier_id": 1}
+            for i in range(1, rows + 1)
+        ])
+        await db.execute(insert(Batch), [
+            {"id": i, "batch_number": f"B{i}", "material_id": i, "supplier_id": 1, "received_quantity": 10.0,
+             "available_quantity": 10.0, "reserved_quantity": 0.0, "received_date": datetime(2024, 1, 1)}
+            for i in range(1, rows + 1)
+        ])
+        await db.execute(insert(InventoryItem), [
+            {"id": i, "warehouse_id": 1, "material_id": i, "batch_id": i, "quantity": 10.0,
+             "reserved_quantity": 0.0, "available_quantity": 10.0}
+            for i in range(1, rows + 1)
+        ])
+        await db.commit()
+
+
+async def _count(read, schema) -> int:
+    """Statements issued by a read plus serializing its result like the endpoint does"""
+    async with AsyncSessionLocal() as db:
+        with QueryCounter(async_engine) as counter:
+            result = await read(db)
+            for obj in result if isinstance(result, list) else [result]:
+                schema.model_validate(obj)
+    return counter.count
+
+
+def _counts(read, schema):
+    """Query count with 2 rows and with 40 rows"""
+    counts = []
+    for rows in (2, 40):
+        asyncio.run(_seed(rows))
+        counts.append(asyncio.run(_count(read, schema)))
+    return counts
+
+
+@pytest.fixture(scope="module", autouse=True)
+def database():
+    BaseModel.metadata.create_all(engine)
+    yield
+    BaseModel.metadata.drop_all(engine)
+
+
+@pytest.mark.parametrize("name, read, schema", [
+    ("inventory", lambda db: InventoryService.get_inventory(db), schemas.InventoryItem),
+    ("batches", lambda db: BatchService.get_batches(db), schemas.Batch),
+    ("materials", lambda db: MaterialService.get_materials(db), schemas.Material),
+    ("suppliers", lambda db: SupplierService.get_suppliers(db), schemas.Supplier),
+])
+def test_list_reads_are_one_query(name, read, schema):
+    assert _counts(read, schema) == [1, 1], name
+
+
+@pytest.mark.parametrize("name, read, schema", [
+    ("material", lambda db: MaterialService.get_material(db, 1, LoadProfile.LIST), schemas.Material),
+    ("batch", lambda db: BatchService.get_batch(db, 1, LoadProfile.LIST), schemas.Batch),
+])
+def test_single_reads_are_one_query(name, read, schema):
+    assert _counts(read, schema) == [1, 1], name
+
+
+def test_update_reloads_once():
+    read = lambda db: MaterialService.update_material(db, 1, schemas.MaterialUpdate(name="Renamed"))
+    # MINIMAL read, UPDATE, the net-change MRP queue row, reload with the LIST profile
+    assert _counts(read, schemas.Material) == [4, 4]